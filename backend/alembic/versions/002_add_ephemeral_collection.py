@@ -0,0 +1,55 @@
+"""Create t_ephemeral_collection table
+
+Revision ID: 002_add_ephemeral_collection
+Revises: 001_add_user_settings
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '002_add_ephemeral_collection'
+down_revision: Union[str, None] = '001_add_user_settings'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    t_ephemeral_collection テーブルを作成します。
+
+    このテーブルはセッションごとの Ephemeral RAG コレクションと有効期限を保存し、
+    ワーカープロセスを跨いだ共有と期限切れベクトルの一括削除に使用します。
+    """
+    op.create_table(
+        't_ephemeral_collection',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('tenant_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('session_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('collection_name', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['tenant_id'], ['t_tenant.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('collection_name'),
+    )
+    op.create_index(op.f('ix_t_ephemeral_collection_id'), 't_ephemeral_collection', ['id'], unique=False)
+    op.create_index(op.f('ix_t_ephemeral_collection_tenant_id'), 't_ephemeral_collection', ['tenant_id'], unique=False)
+    op.create_index(op.f('ix_t_ephemeral_collection_session_id'), 't_ephemeral_collection', ['session_id'], unique=True)
+    op.create_index(op.f('ix_t_ephemeral_collection_expires_at'), 't_ephemeral_collection', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """
+    t_ephemeral_collection テーブルを削除します（ロールバック）。
+    """
+    op.drop_index(op.f('ix_t_ephemeral_collection_expires_at'), table_name='t_ephemeral_collection')
+    op.drop_index(op.f('ix_t_ephemeral_collection_session_id'), table_name='t_ephemeral_collection')
+    op.drop_index(op.f('ix_t_ephemeral_collection_tenant_id'), table_name='t_ephemeral_collection')
+    op.drop_index(op.f('ix_t_ephemeral_collection_id'), table_name='t_ephemeral_collection')
+    op.drop_table('t_ephemeral_collection')
@@ -0,0 +1,37 @@
+"""Add composite index for chat message history pagination
+
+Revision ID: 003_add_chat_message_history_index
+Revises: 002_add_ephemeral_collection
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '003_add_chat_message_history_index'
+down_revision: Union[str, None] = '002_add_ephemeral_collection'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    t_chat_message に (session_id, created_at, id) の複合インデックスを作成します。
+
+    最新N件の取得とキーセットページネーションを、履歴の長さに依存しないインデックススキャンで行うために使用します。
+    """
+    op.create_index(
+        'ix_t_chat_message_session_id_created_at',
+        't_chat_message',
+        ['session_id', 'created_at', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """
+    複合インデックスを削除します（ロールバック）。
+    """
+    op.drop_index('ix_t_chat_message_session_id_created_at', table_name='t_chat_message')
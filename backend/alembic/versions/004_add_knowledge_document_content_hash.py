@@ -0,0 +1,44 @@
+"""Add content hash to knowledge documents for deduplication
+
+Revision ID: 004_add_knowledge_document_content_hash
+Revises: 003_add_chat_message_history_index
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '004_add_knowledge_document_content_hash'
+down_revision: Union[str, None] = '003_add_chat_message_history_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    t_knowledge_document に content_hash / is_global_indexed カラムと、(tenant_id, content_hash) の一意制約を追加します。
+
+    既存のドキュメントは content_hash が NULL のままとなり、重複排除の対象外です。
+    """
+    op.add_column('t_knowledge_document', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column(
+        't_knowledge_document',
+        sa.Column('is_global_indexed', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.create_unique_constraint(
+        'uq_t_knowledge_document_tenant_id_content_hash',
+        't_knowledge_document',
+        ['tenant_id', 'content_hash'],
+    )
+
+
+def downgrade() -> None:
+    """
+    一意制約とカラムを削除します（ロールバック）。
+    """
+    op.drop_constraint('uq_t_knowledge_document_tenant_id_content_hash', 't_knowledge_document', type_='unique')
+    op.drop_column('t_knowledge_document', 'is_global_indexed')
+    op.drop_column('t_knowledge_document', 'content_hash')
@@ -0,0 +1,62 @@
+"""Add ingestion job table
+
+Revision ID: 005_add_ingestion_job
+Revises: 004_add_knowledge_document_content_hash
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '005_add_ingestion_job'
+down_revision: Union[str, None] = '004_add_knowledge_document_content_hash'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    t_ingestion_job テーブルを作成します。
+
+    アップロードされたドキュメントのテキスト抽出・埋め込みをバックグラウンドで実行するジョブの状態を保持します。
+    """
+    op.create_table(
+        't_ingestion_job',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('tenant_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('document_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('session_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_by_user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['tenant_id'], ['t_tenant.id'], ),
+        sa.ForeignKeyConstraint(['document_id'], ['t_knowledge_document.id'], ),
+        sa.ForeignKeyConstraint(['created_by_user_id'], ['t_user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_t_ingestion_job_id'), 't_ingestion_job', ['id'], unique=False)
+    op.create_index(op.f('ix_t_ingestion_job_tenant_id'), 't_ingestion_job', ['tenant_id'], unique=False)
+    op.create_index(op.f('ix_t_ingestion_job_document_id'), 't_ingestion_job', ['document_id'], unique=False)
+    op.create_index('ix_t_ingestion_job_status_next_attempt_at', 't_ingestion_job', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    """
+    t_ingestion_job テーブルを削除します（ロールバック）。
+    """
+    op.drop_index('ix_t_ingestion_job_status_next_attempt_at', table_name='t_ingestion_job')
+    op.drop_index(op.f('ix_t_ingestion_job_document_id'), table_name='t_ingestion_job')
+    op.drop_index(op.f('ix_t_ingestion_job_tenant_id'), table_name='t_ingestion_job')
+    op.drop_index(op.f('ix_t_ingestion_job_id'), table_name='t_ingestion_job')
+    op.drop_table('t_ingestion_job')
@@ -0,0 +1,42 @@
+"""Add trigram index on PGVector chunks for hybrid retrieval
+
+Revision ID: 006_add_vector_trigram_index
+Revises: 005_add_ingestion_job
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '006_add_vector_trigram_index'
+down_revision: Union[str, None] = '005_add_ingestion_job'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    ハイブリッド検索のキーワード検索（ILIKE '%語%'）で使用する pg_trgm のGINインデックスを
+    langchain_pg_embedding.document に作成します。分かち書きの無い日本語の語句や製品コードの部分一致に使用します。
+    langchain_pg_embedding はPGVectorが初回利用時に作成するため、テーブルが無い場合は作成を省略します
+    （その場合は、アプリがテーブルの作成時に同じインデックスを作成します。TunedPGVector を参照）。
+    """
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('langchain_pg_embedding') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_document_trgm
+                    ON langchain_pg_embedding USING gin (document gin_trgm_ops);
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    """
+    キーワード検索用のインデックスを削除します（ロールバック）。pg_trgm 拡張は他で使われている可能性があるため残します。
+    """
+    op.execute("DROP INDEX IF EXISTS ix_langchain_pg_embedding_document_trgm")
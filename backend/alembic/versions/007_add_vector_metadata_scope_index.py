@@ -0,0 +1,47 @@
+"""Add tenant/scope metadata index on PGVector chunks for single-collection retrieval
+
+Revision ID: 007_add_vector_metadata_scope_index
+Revises: 006_add_vector_trigram_index
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '007_add_vector_metadata_scope_index'
+down_revision: Union[str, None] = '006_add_vector_trigram_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    langchain_pg_embedding のメタデータ (tenant_id, rag_scope) に複合インデックスを作成します。
+
+    単一コレクション構成（RAG_SINGLE_COLLECTION_ENABLED）では、検索時に
+    cmetadata->>'tenant_id' / cmetadata->>'rag_scope' で絞り込み、Ephemeral RAGの削除も rag_scope で行うため、
+    PGVectorが作成する jsonb_path_ops のGINインデックス（@> 専用）では使えない式インデックスを追加します。
+    langchain_pg_embedding はPGVectorが初回利用時に作成するため、テーブルが無い場合は作成を省略します
+    （その場合は、アプリがテーブルの作成時に同じインデックスを作成します。TunedPGVector を参照）。
+    """
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('langchain_pg_embedding') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_tenant_id_rag_scope
+                    ON langchain_pg_embedding ((cmetadata ->> 'tenant_id'), (cmetadata ->> 'rag_scope'));
+                CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_rag_scope
+                    ON langchain_pg_embedding ((cmetadata ->> 'rag_scope'));
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    """
+    メタデータのインデックスを削除します（ロールバック）。
+    """
+    op.execute("DROP INDEX IF EXISTS ix_langchain_pg_embedding_rag_scope")
+    op.execute("DROP INDEX IF EXISTS ix_langchain_pg_embedding_tenant_id_rag_scope")
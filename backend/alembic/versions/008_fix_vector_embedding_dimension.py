@@ -0,0 +1,67 @@
+"""Fix the PGVector embedding column dimension so ANN indexes can be built
+
+Revision ID: 008_fix_vector_embedding_dimension
+Revises: 007_add_vector_metadata_scope_index
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = '008_fix_vector_embedding_dimension'
+down_revision: Union[str, None] = '007_add_vector_metadata_scope_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 埋め込みモデルの次元数（PGVectorの embedding_length と同じ値を使う）
+EMBEDDING_DIMENSION = settings.EMBEDDING_DIMENSION
+
+
+def upgrade() -> None:
+    """
+    langchain_pg_embedding.embedding を次元数固定の vector(EMBEDDING_DIMENSION) に変更します。
+
+    HNSW / IVFFlat インデックス（管理API /admin/vector/indexes で作成）は次元数が固定の列にしか作成できないため、
+    embedding_length を指定せずにPGVectorが作成した vector 列を変換します。
+    次元数は設定（EMBEDDING_DIMENSION）から取得します。
+    テーブルが無い場合・既に次元数が固定の場合・異なる次元数のベクトルが含まれる場合は変更しません。
+    """
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF to_regclass('langchain_pg_embedding') IS NOT NULL
+                AND (SELECT atttypmod FROM pg_attribute
+                     WHERE attrelid = to_regclass('langchain_pg_embedding') AND attname = 'embedding') <= 0
+                AND NOT EXISTS (SELECT 1 FROM langchain_pg_embedding WHERE vector_dims(embedding) <> {int(EMBEDDING_DIMENSION)})
+            THEN
+                ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE vector({int(EMBEDDING_DIMENSION)});
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    """
+    次元数の指定を外します（ロールバック）。次元数の無い列にはANNインデックスを作成できないため、
+    管理APIで作成したインデックス（ix_lpe_*）を先に削除します。
+    """
+    op.execute("""
+        DO $$
+        DECLARE
+            index_name text;
+        BEGIN
+            IF to_regclass('langchain_pg_embedding') IS NOT NULL THEN
+                FOR index_name IN
+                    SELECT c.relname FROM pg_index AS i JOIN pg_class AS c ON c.oid = i.indexrelid
+                    WHERE i.indrelid = to_regclass('langchain_pg_embedding') AND c.relname LIKE 'ix\\_lpe\\_%'
+                LOOP
+                    EXECUTE format('DROP INDEX IF EXISTS %I', index_name);
+                END LOOP;
+                ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE vector;
+            END IF;
+        END $$;
+    """)
@@ -0,0 +1,33 @@
+"""Add token_count column to chat messages
+
+Revision ID: 009_add_chat_message_token_count
+Revises: 008_fix_vector_embedding_dimension
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '009_add_chat_message_token_count'
+down_revision: Union[str, None] = '008_fix_vector_embedding_dimension'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    t_chat_message に token_count 列（content の近似トークン数）を追加します。
+
+    値はメッセージの保存時に計算します。既存のメッセージは NULL のままとし、履歴の組み立て時にその場で計算します。
+    """
+    op.add_column('t_chat_message', sa.Column('token_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """
+    token_count 列を削除します（ロールバック）。
+    """
+    op.drop_column('t_chat_message', 'token_count')
@@ -0,0 +1,53 @@
+"""Allow at most one active global ingestion job per document
+
+Revision ID: 010_add_ingestion_job_active_global_index
+Revises: 009_add_chat_message_token_count
+Create Date: 2026-10-17 18:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '010_add_ingestion_job_active_global_index'
+down_revision: Union[str, None] = '009_add_chat_message_token_count'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    t_ingestion_job に、待機中・実行中のグローバルRAG登録ジョブを document_id ごとに1件に制限する部分ユニークインデックスを作成します。
+
+    同じファイルが続けてアップロードされた場合に、登録ジョブが重複して作成されるのを防ぎます。
+    既に重複している待機中のジョブは、最も古いもの以外を失敗扱いにしてから作成します。
+    """
+    op.execute("""
+        UPDATE t_ingestion_job AS job
+        SET status = 'failed', last_error = 'Superseded by an earlier job for the same document.', finished_at = now()
+        WHERE job.session_id IS NULL
+          AND job.status = 'queued'
+          AND EXISTS (
+              SELECT 1 FROM t_ingestion_job AS other
+              WHERE other.document_id = job.document_id
+                AND other.session_id IS NULL
+                AND other.status IN ('queued', 'running')
+                AND (other.status = 'running' OR (other.created_at, other.id) < (job.created_at, job.id))
+          )
+    """)
+    op.create_index(
+        'ux_t_ingestion_job_active_global_document',
+        't_ingestion_job',
+        ['document_id'],
+        unique=True,
+        postgresql_where=sa.text("session_id IS NULL AND status IN ('queued', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    """
+    部分ユニークインデックスを削除します（ロールバック）。
+    """
+    op.drop_index('ux_t_ingestion_job_active_global_document', table_name='t_ingestion_job')
@@ -4,9 +4,23 @@ from uuid import UUID
 
 from app.schemas.auth import AuthenticatedUser
 from app.schemas.file import FileUploadResponse
-from app.dependencies import get_current_user, get_current_admin_user # 管理者権限が必要
+from app.schemas.admin import (
+    DbPoolStatsResponse,
+    EmbeddingStatsResponse,
+    VectorIndexBuildProgressResponse,
+    VectorIndexBuildResponse,
+    VectorIndexCreateRequest,
+    VectorIndexResponse,
+)
+from app.dependencies import get_current_user, get_current_admin_user, get_current_global_admin_user # 管理者権限が必要
 from app.repositories.knowledge import KnowledgeDocumentRepository
-from app.dependencies import get_knowledge_document_repository
+from app.dependencies import get_knowledge_document_repository, get_vector_index_manager
+from app.core.config import settings
+from app.core.database import engine
+from app.core.db_pool import pool_metrics
+from app.services.embedding_scheduler import embedding_metrics
+from app.services.rag_service import tenant_collection_name
+from app.services.vector_index import VectorIndexError, VectorIndexManager
 
 router = APIRouter()
 
@@ -24,3 +38,206 @@ async def list_knowledge_documents(
     """
     documents = await knowledge_repo.search(query=search_query, skip=skip, limit=limit)
     return [FileUploadResponse.model_validate(doc) for doc in documents]
+
+@router.get("/db/pool", response_model=DbPoolStatsResponse, summary="DBコネクションプールの統計情報 (管理者用)")
+async def get_db_pool_stats(
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_admin_user)],
+):
+    """
+    このプロセス（レプリカ）のDBコネクションプールの使用中・アイドル・オーバーフロー数と、
+    接続取得待ち時間のヒストグラムを返します。プールサイズの調整に使用します。
+    """
+    return DbPoolStatsResponse(**pool_metrics.snapshot(engine.sync_engine.pool))
+
+@router.get("/embeddings/stats", response_model=EmbeddingStatsResponse, summary="埋め込みバッチの統計情報 (管理者用)")
+async def get_embedding_stats(
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_admin_user)],
+):
+    """
+    このプロセス（レプリカ）の埋め込みAPI呼び出しのバッチ数・平均バッチサイズ・スループット・
+    レート制限による再試行回数を返します。バッチサイズや同時実行数の調整に使用します。
+    """
+    return EmbeddingStatsResponse(**embedding_metrics.snapshot())
+
+def _tenant_vector_collection_name(current_admin_user: AuthenticatedUser) -> str:
+    """
+    管理者のテナント専用のベクトルコレクション名を返します。
+    単一コレクション構成（RAG_SINGLE_COLLECTION_ENABLED）ではコレクションを全テナントで共有するため、
+    テナントの管理者にはインデックスを操作させず 409 を返します（共有コレクションは /vector/shared/indexes で操作）。
+    """
+    if settings.RAG_SINGLE_COLLECTION_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Vector indexes cannot be managed per tenant when RAG_SINGLE_COLLECTION_ENABLED is true.",
+        )
+    return tenant_collection_name(current_admin_user.tenant_id)
+
+def _shared_vector_collection_name() -> str:
+    """
+    単一コレクション構成で全テナントが共有するベクトルコレクション名を返します。
+    単一コレクション構成でない場合は共有コレクションが無いため 409 を返します。
+    """
+    if not settings.RAG_SINGLE_COLLECTION_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="There is no shared vector collection when RAG_SINGLE_COLLECTION_ENABLED is false.",
+        )
+    return settings.PG_COLLECTION_NAME
+
+async def _list_collection_indexes(index_manager: VectorIndexManager, collection_name: str) -> List[VectorIndexResponse]:
+    collection_id = await index_manager.get_collection_id(collection_name)
+    if collection_id is None:
+        return []
+    return [VectorIndexResponse(**row) for row in await index_manager.list_indexes(collection_id)]
+
+async def _start_collection_index_build(
+    index_manager: VectorIndexManager, collection_name: str, request: VectorIndexCreateRequest
+) -> VectorIndexBuildResponse:
+    try:
+        build = await index_manager.start_build(
+            collection_name,
+            request.method,
+            m=request.m,
+            ef_construction=request.ef_construction,
+            lists=request.lists,
+        )
+    except VectorIndexError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return VectorIndexBuildResponse.model_validate(build)
+
+async def _collection_index_build_progress(
+    index_manager: VectorIndexManager, collection_name: str
+) -> List[VectorIndexBuildProgressResponse]:
+    collection_id = await index_manager.get_collection_id(collection_name)
+    if collection_id is None:
+        return []
+    return [
+        VectorIndexBuildProgressResponse(**row) for row in await index_manager.build_progress()
+        if row["index_name"] and row["index_name"].endswith(collection_id.hex)
+    ]
+
+async def _drop_collection_index(index_manager: VectorIndexManager, collection_name: str, index_name: str):
+    collection_id = await index_manager.get_collection_id(collection_name)
+    if collection_id is None or not index_name.endswith(collection_id.hex):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vector index not found")
+    try:
+        await index_manager.drop_index(index_name)
+    except VectorIndexError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@router.get("/vector/indexes", response_model=List[VectorIndexResponse], summary="ベクトルインデックスの一覧 (管理者用)")
+async def list_vector_indexes(
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    テナントのベクトルコレクションに作成されているANNインデックス（HNSW / IVFFlat）の
+    種類・有効性・サイズを返します。
+    """
+    return await _list_collection_indexes(index_manager, _tenant_vector_collection_name(current_admin_user))
+
+@router.post(
+    "/vector/indexes",
+    response_model=VectorIndexBuildResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="ベクトルインデックスの作成開始 (管理者用)",
+)
+async def create_vector_index(
+    request: VectorIndexCreateRequest,
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    テナントのベクトルコレクションにANNインデックスの作成をバックグラウンドで開始します。
+    作成中も検索・取り込みは継続でき、進捗は /vector/indexes/progress で確認できます。
+    """
+    return await _start_collection_index_build(index_manager, _tenant_vector_collection_name(current_admin_user), request)
+
+@router.get(
+    "/vector/indexes/progress",
+    response_model=List[VectorIndexBuildProgressResponse],
+    summary="ベクトルインデックス作成の進捗 (管理者用)",
+)
+async def get_vector_index_build_progress(
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    テナントのベクトルコレクションで実行中のインデックス作成のフェーズと処理済みのブロック数・タプル数を返します。
+    """
+    return await _collection_index_build_progress(index_manager, _tenant_vector_collection_name(current_admin_user))
+
+@router.delete(
+    "/vector/indexes/{index_name}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="ベクトルインデックスの削除 (管理者用)",
+)
+async def drop_vector_index(
+    index_name: str,
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    テナントのベクトルコレクションのANNインデックスを削除します（検索は全件走査に戻ります）。
+    """
+    await _drop_collection_index(index_manager, _tenant_vector_collection_name(current_admin_user), index_name)
+
+@router.get(
+    "/vector/shared/indexes",
+    response_model=List[VectorIndexResponse],
+    summary="共有ベクトルコレクションのインデックスの一覧 (全体管理者用)",
+)
+async def list_shared_vector_indexes(
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_global_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    単一コレクション構成で全テナントが共有するベクトルコレクションのANNインデックスの種類・有効性・サイズを返します。
+    """
+    return await _list_collection_indexes(index_manager, _shared_vector_collection_name())
+
+@router.post(
+    "/vector/shared/indexes",
+    response_model=VectorIndexBuildResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="共有ベクトルコレクションのインデックスの作成開始 (全体管理者用)",
+)
+async def create_shared_vector_index(
+    request: VectorIndexCreateRequest,
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_global_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    共有ベクトルコレクションにANNインデックスの作成をバックグラウンドで開始します。
+    全テナントの検索に影響するため、GLOBAL_ADMIN_EMAILS の管理者だけが実行できます。
+    """
+    return await _start_collection_index_build(index_manager, _shared_vector_collection_name(), request)
+
+@router.get(
+    "/vector/shared/indexes/progress",
+    response_model=List[VectorIndexBuildProgressResponse],
+    summary="共有ベクトルコレクションのインデックス作成の進捗 (全体管理者用)",
+)
+async def get_shared_vector_index_build_progress(
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_global_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    共有ベクトルコレクションで実行中のインデックス作成のフェーズと処理済みのブロック数・タプル数を返します。
+    """
+    return await _collection_index_build_progress(index_manager, _shared_vector_collection_name())
+
+@router.delete(
+    "/vector/shared/indexes/{index_name}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="共有ベクトルコレクションのインデックスの削除 (全体管理者用)",
+)
+async def drop_shared_vector_index(
+    index_name: str,
+    current_admin_user: Annotated[AuthenticatedUser, Depends(get_current_global_admin_user)],
+    index_manager: Annotated[VectorIndexManager, Depends(get_vector_index_manager)],
+):
+    """
+    共有ベクトルコレクションのANNインデックスを削除します（検索は全件走査に戻ります）。
+    """
+    await _drop_collection_index(index_manager, _shared_vector_collection_name(), index_name)
@@ -18,6 +18,7 @@ from app.dependencies import (
     get_db_session,
 )
 from app.core.config import settings
+from app.services.auth_cache import session_user_cache, token_digest
 from app.repositories.tenant import TenantRepository
 from app.repositories.user import UserRepository
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -126,6 +127,10 @@ async def dev_callback(
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT, summary="(DEV) ログアウト")
 async def dev_logout(request: Request, response: Response):
+    # キャッシュ済みのセッションも破棄する
+    raw_session = request.cookies.get(SESSION_COOKIE_NAME)
+    if raw_session:
+        await session_user_cache.delete(token_digest(raw_session))
     response = Response(status_code=status.HTTP_204_NO_CONTENT)
     response.delete_cookie(SESSION_COOKIE_NAME, path="/")
     response.delete_cookie(STATE_COOKIE_NAME, path="/")
@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import StreamingResponse
-from typing import Annotated, List, AsyncGenerator
+from typing import Annotated, List, AsyncGenerator, Optional
 from uuid import UUID
 
-from app.schemas.chat import ChatMessageCreate, ChatMessageResponse, ChatSessionResponse, ChatSessionCreate
+from app.core.pagination import encode_cursor, decode_cursor
+from app.schemas.chat import ChatMessageCreate, ChatMessageResponse, ChatMessagePage, ChatSessionResponse, ChatSessionCreate
 from app.schemas.auth import AuthenticatedUser
 from app.dependencies import get_current_user
 from app.repositories.chat import ChatSessionRepository, ChatMessageRepository
 from app.services.dom_orchestrator import DomOrchestratorService
 from app.services.chat_service import ChatService # New import
+from app.services.message_writer import chat_message_writer
 from app.dependencies import get_chat_session_repository, get_chat_message_repository, get_dom_orchestrator_service, get_chat_service
 
 router = APIRouter()
@@ -39,6 +41,48 @@ async def get_chat_sessions(
     sessions = await chat_session_repo.get_by_user_id(current_user.id)
     return sessions
 
+@router.get("/sessions/{session_id}/messages", response_model=ChatMessagePage, summary="チャットセッションのメッセージ履歴をページ単位で取得")
+async def get_chat_messages(
+    session_id: UUID,
+    current_user: Annotated[AuthenticatedUser, Depends(get_current_user)],
+    chat_session_repo: Annotated[ChatSessionRepository, Depends(get_chat_session_repository)],
+    chat_message_repo: Annotated[ChatMessageRepository, Depends(get_chat_message_repository)],
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    """
+    チャットセッションのメッセージ履歴を古い順で返します。
+    カーソルを指定しない場合は最新の `limit` 件を返し、`before` / `after` に前回レスポンスのカーソルを渡すと
+    それより古い / 新しいメッセージを取得できます（キーセットページネーション）。
+    """
+    session = await chat_session_repo.get(session_id)
+    if not session or session.user_id != current_user.id or session.tenant_id != current_user.tenant_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat session not found or not authorized."
+        )
+    if before and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Specify either before or after, not both.")
+    try:
+        before_key = decode_cursor(before) if before else None
+        after_key = decode_cursor(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # 1件多く取得して、取得方向にまだメッセージがあるかを判定する
+    messages = await chat_message_repo.get_page(session_id, limit=limit + 1, before=before_key, after=after_key)
+    has_more = len(messages) > limit
+    if has_more:
+        messages = messages[:limit] if after_key else messages[1:]
+
+    return ChatMessagePage(
+        items=[ChatMessageResponse.model_validate(message) for message in messages],
+        has_more=has_more,
+        before_cursor=encode_cursor(messages[0].created_at, messages[0].id) if messages else None,
+        after_cursor=encode_cursor(messages[-1].created_at, messages[-1].id) if messages else None,
+    )
+
 @router.post("/send", response_model=ChatMessageResponse, summary="チャットメッセージを送信（ユーザーメッセージ保存のみ）")
 async def send_chat_message(
     message_in: ChatMessageCreate,
@@ -87,9 +131,8 @@ async def generate_llm_response_stream(
         yield "ERROR: Unauthorized access or session not found.\n"
         return
 
-    # 最新のユーザーメッセージを取得
-    # NOTE: 実際には、セッション履歴全体をLLMに渡す必要があります。ここでは簡易化しています。
-    messages = await chat_message_repo.get_by_session_id(session_id)
+    # 最新のユーザーメッセージを取得（それ以前の会話履歴はオーケストレーターが予算内で組み立てる）
+    messages = await chat_message_repo.get_latest(session_id, 1)
     if not messages:
         yield "ERROR: No messages in session to respond to.\n"
         return
@@ -104,13 +147,18 @@ async def generate_llm_response_stream(
         yield token # トークンをクライアントに送信
 
     # アシスタントの最終応答をDBに保存
+    # write-behind キューが起動している場合はキューに積むだけで、DBへの書き込みは待たない
     if assistant_response_content:
-        await chat_message_repo.create({
+        assistant_message = {
             "session_id": session_id,
             "role": "assistant",
             "content": assistant_response_content
             # raw_llm_responseは後で実装
-        })
+        }
+        if chat_message_writer.running:
+            await chat_message_writer.enqueue(assistant_message)
+        else:
+            await chat_message_repo.create(assistant_message)
     yield "[STREAM_END]" # フロントエンドがストリーム終了を検知するためのカスタムマーカー
 
 @router.get("/stream/{session_id}", summary="指定されたチャットセッションのLLM応答をストリーミング", response_class=StreamingResponse)
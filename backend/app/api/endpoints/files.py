@@ -1,31 +1,55 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Response, status
+from pathlib import Path
+from sqlalchemy.exc import IntegrityError
 from typing import Annotated, List, Optional
 from uuid import UUID
 
-from app.schemas.file import FileUploadResponse
+from app.schemas.file import FileUploadResponse, IngestionJobResponse
 from app.schemas.auth import AuthenticatedUser
 from app.dependencies import get_current_user
+from app.core.config import settings
 from app.repositories.knowledge import KnowledgeDocumentRepository
+from app.repositories.ingestion_job import IngestionJobRepository
 from app.services.file_service import FileService
-from app.services.rag_service import RagService
-from app.dependencies import get_knowledge_document_repository, get_file_service, get_rag_service
+from app.services.ingestion_service import IngestionWorkerPool
+from app.dependencies import get_knowledge_document_repository, get_file_service
+from app.dependencies import get_ingestion_job_repository, get_ingestion_worker_pool
 
 router = APIRouter()
 
-@router.post("/upload", response_model=FileUploadResponse, summary="ファイルをアップロードし、ナレッジドキュメントとして登録 (任意でEphemeral RAGへ)")
+# DBに保存するKnowledgeDocumentのカラム
+_KNOWLEDGE_DOCUMENT_FIELDS = (
+    "id", "tenant_id", "file_name", "file_path", "file_type", "file_size",
+    "uploaded_by_user_id", "is_active", "content_hash", "is_global_indexed",
+)
+
+
+@router.post(
+    "/upload",
+    response_model=FileUploadResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="ファイルをアップロードし、ナレッジドキュメントとして登録 (任意でEphemeral RAGへ)",
+)
 async def upload_file(
     file: Annotated[UploadFile, File(description="アップロードするファイル")],
+    response: Response,
     current_user: Annotated[AuthenticatedUser, Depends(get_current_user)],
     file_service: Annotated[FileService, Depends(get_file_service)],
     knowledge_repo: Annotated[KnowledgeDocumentRepository, Depends(get_knowledge_document_repository)],
-    rag_service: Annotated[RagService, Depends(get_rag_service)],
+    ingestion_job_repo: Annotated[IngestionJobRepository, Depends(get_ingestion_job_repository)],
+    ingestion_worker_pool: Annotated[IngestionWorkerPool, Depends(get_ingestion_worker_pool)],
     session_id: Annotated[Optional[UUID], None] = None # Optional session_id for ephemeral RAG
 ):
     """
     ファイルをアップロードし、そのメタデータをナレッジドキュメントとしてデータベースに保存します。
-    ファイルからテキストを抽出し、ベクトルストアにインデックス化します。
+    テキスト抽出とベクトルストアへのインデックス化は取り込みジョブとしてバックグラウンドで実行し、
+    ジョブIDを含めて 202 Accepted を返します（状態は `GET /files/jobs/{job_id}` で確認）。
     `session_id`が指定された場合、そのセッションに紐づくEphemeral RAGにドキュメントを追加します。
     指定されない場合、グローバルRAGにドキュメントを追加します。
+
+    同じ内容（SHA-256が一致）のファイルがテナント内に登録済みの場合は既存のドキュメントを返し、
+    グローバルRAGへの登録が済んでいればジョブを作らずに 200 OK を返します。
+    登録ジョブが待機中・実行中の場合は、新しいジョブを作らずにそのジョブIDを返します。
     """
     if not file.filename:
         raise HTTPException(
@@ -35,31 +59,66 @@ async def upload_file(
 
     # ファイルをストレージに保存し、仮のKnowledgeDocumentオブジェクトを取得
     knowledge_doc = await file_service.save_file(file, current_user.tenant_id, current_user.id)
-    
-    # テキストを抽出
-    extracted_text = await file_service.extract_text_from_knowledge_document(knowledge_doc)
 
-    # 抽出したテキストをLangChainのDocument形式に変換
-    from langchain_core.documents import Document as LC_Document
-    lc_document = LC_Document(
-        page_content=extracted_text,
-        metadata={
-            "document_id": str(knowledge_doc.id),
-            "tenant_id": str(knowledge_doc.tenant_id),
-            "file_name": knowledge_doc.file_name,
-            "file_type": knowledge_doc.file_type,
-            "uploaded_by": str(knowledge_doc.uploaded_by_user_id),
-            "session_id": str(session_id) if session_id else None # エフェメラルRAGの場合にセッションIDを追加
-        }
-    )
+    db_knowledge_doc = await knowledge_repo.get_by_content_hash(knowledge_doc.content_hash)
+    if db_knowledge_doc is None:
+        # KnowledgeDocumentメタデータをデータベースに保存
+        try:
+            db_knowledge_doc = await knowledge_repo.create(
+                {field: getattr(knowledge_doc, field) for field in _KNOWLEDGE_DOCUMENT_FIELDS}
+            )
+        except IntegrityError:
+            # 同じ内容のファイルが並行してアップロードされ、先に登録された
+            await knowledge_repo.session.rollback()
+            db_knowledge_doc = await knowledge_repo.get_by_content_hash(knowledge_doc.content_hash)
+            if db_knowledge_doc is None:
+                raise
+
+    if db_knowledge_doc.file_path != knowledge_doc.file_path:
+        # 既存ドキュメントと拡張子が異なる場合などは、今回保存したファイルを残さない
+        await file_service.delete_file_from_storage(Path(knowledge_doc.file_path))
+
+    document_response = FileUploadResponse.model_validate(db_knowledge_doc)
+    if session_id is None and db_knowledge_doc.is_global_indexed:
+        # 同じ内容のドキュメントはグローバルRAGに登録済みのため、抽出と埋め込みは不要
+        response.status_code = status.HTTP_200_OK
+        return document_response
+
+    if session_id is None:
+        active_job = await ingestion_job_repo.get_active_global_job(db_knowledge_doc.id)
+        if active_job is not None:
+            # 同じドキュメントのグローバルRAG登録ジョブが待機中・実行中のため、そのジョブを返す
+            return document_response.model_copy(update={"job_id": active_job.id})
 
-    # Ephemeral RAG または Global RAG にドキュメントを追加
-    if session_id:
-        await rag_service.add_documents_to_ephemeral_rag(session_id, [lc_document])
-    else:
-        await rag_service.add_documents_to_global_rag([lc_document])
+    # テキスト抽出と埋め込みは取り込みジョブとしてワーカーで実行する
+    try:
+        job = await ingestion_job_repo.create({
+            "document_id": db_knowledge_doc.id,
+            "session_id": session_id,
+            "max_attempts": settings.INGESTION_JOB_MAX_ATTEMPTS,
+            "created_by_user_id": current_user.id,
+        })
+    except IntegrityError:
+        # 同じドキュメントのグローバルRAG登録ジョブが並行して作成された
+        await ingestion_job_repo.session.rollback()
+        active_job = await ingestion_job_repo.get_active_global_job(db_knowledge_doc.id) if session_id is None else None
+        if active_job is None:
+            raise
+        return document_response.model_copy(update={"job_id": active_job.id})
+    await ingestion_worker_pool.submit(job.id)
 
-    # KnowledgeDocumentメタデータをデータベースに保存
-    db_knowledge_doc = await knowledge_repo.create(knowledge_doc.model_dump(exclude={"id"}))
-    
-    return FileUploadResponse.model_validate(db_knowledge_doc)
+    return document_response.model_copy(update={"job_id": job.id})
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse, summary="取り込みジョブの状態を取得")
+async def get_ingestion_job(
+    job_id: UUID,
+    ingestion_job_repo: Annotated[IngestionJobRepository, Depends(get_ingestion_job_repository)],
+):
+    """
+    アップロード時に作成した取り込みジョブの状態を返します。他テナントのジョブは参照できません。
+    """
+    job = await ingestion_job_repo.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingestion job not found.")
+    return IngestionJobResponse.model_validate(job)
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, Tuple, TypeVar
+
+ValueType = TypeVar("ValueType")
+
+
+class TTLCache(Generic[ValueType]):
+    """
+    プロセス内で使用する、件数上限付き（LRU）・有効期限付きのキャッシュ。
+
+    - 件数が max_entries を超えた場合、最も長く参照されていないエントリから破棄します。
+    - エントリごとに有効期限（秒）を指定でき、期限切れのエントリは参照時に破棄します。
+    - FastAPIの同期依存関数（スレッドプール）からも使われるため、ロックで保護します。
+    """
+    def __init__(self, max_entries: int, default_ttl_seconds: float):
+        self.max_entries = max_entries
+        self.default_ttl_seconds = default_ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, ValueType]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[ValueType]:
+        """有効期限内の値を返します。無い場合・期限切れの場合は None を返します。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: ValueType, ttl_seconds: Optional[float] = None):
+        """値を保存します。ttl_seconds を省略した場合は default_ttl_seconds を使用します。"""
+        ttl = self.default_ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_redis_client = None
+
+
+def get_redis_client():
+    """
+    共有のRedis非同期クライアントを返します（REDIS_HOST / REDIS_PORT を使用）。
+    redis パッケージはRedis層を有効にした場合のみ必要なため、遅延インポートします。
+    """
+    global _redis_client
+    if _redis_client is None:
+        from redis import asyncio as redis_asyncio
+        from app.core.config import settings
+
+        _redis_client = redis_asyncio.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    return _redis_client
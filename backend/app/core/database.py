@@ -1,12 +1,14 @@
 import asyncio
 import logging
+from functools import lru_cache
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import String, text
+from sqlalchemy import String, create_engine, text
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import DeclarativeBase  # Import DeclarativeBase
 
 from app.core.config import settings
+from app.core.db_pool import InstrumentedAsyncAdaptedQueuePool, register_pool_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +28,19 @@ class Base(DeclarativeBase): # Renamed CustomBase to Base
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not configured")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# プールサイズ等は Settings で調整可能（レプリカごとのプールサイズ設計に使用）
+# SQLログ出力（echo）は同期的に書き出されるため、デフォルトでは無効
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=settings.DB_ECHO,
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+register_pool_metrics(engine.sync_engine.pool)
 
 # 非同期セッションの作成
 AsyncSessionLocal = sessionmaker(
@@ -37,6 +51,23 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+@lru_cache(maxsize=1)
+def get_sync_session_factory() -> sessionmaker:
+    """
+    同期セッション（psycopg2）のファクトリを返します。エンジンは初回の呼び出し時に作成します。
+    LangChainの同期インターフェース（Retriever.invoke など）から検索する場合にのみ使用します。
+    """
+    sync_engine = create_engine(
+        engine.url.set(drivername="postgresql+psycopg2"),
+        echo=settings.DB_ECHO,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return sessionmaker(autocommit=False, autoflush=False, bind=sync_engine, expire_on_commit=False)
+
 # 非同期DBセッションを返す依存性注入用の関数
 async def get_db_session():
     async with AsyncSessionLocal() as session:
@@ -0,0 +1,133 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+
+class PoolMetrics:
+    """
+    DBコネクションプールの利用状況を集計するクラス。
+
+    - チェックアウト/チェックイン/新規接続/無効化/タイムアウトの累計回数
+    - コネクション取得待ち時間のヒストグラム（ミリ秒、Prometheus形式の累積バケット）
+    を保持し、プールの現在値（使用中・アイドル・オーバーフロー）と合わせて返します。
+    プールのイベントは同期スレッド/greenletから呼ばれるため、ロックで保護します。
+    """
+    WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts_total = 0
+            self.checkins_total = 0
+            self.connections_created_total = 0
+            self.invalidations_total = 0
+            self.timeouts_total = 0
+            self.wait_count = 0
+            self.wait_sum_ms = 0.0
+            self.wait_max_ms = 0.0
+            self._wait_bucket_counts = [0] * (len(self.WAIT_BUCKETS_MS) + 1)
+
+    def observe_wait(self, seconds: float):
+        """コネクション取得にかかった時間を記録します。"""
+        wait_ms = seconds * 1000
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            for index, upper_bound in enumerate(self.WAIT_BUCKETS_MS):
+                if wait_ms <= upper_bound:
+                    self._wait_bucket_counts[index] += 1
+                    break
+            else:
+                self._wait_bucket_counts[-1] += 1
+
+    def increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _wait_buckets(self) -> List[Dict[str, Any]]:
+        buckets = []
+        cumulative = 0
+        for upper_bound, count in zip(self.WAIT_BUCKETS_MS + ("+Inf",), self._wait_bucket_counts):
+            cumulative += count
+            buckets.append({"le": str(upper_bound), "count": cumulative})
+        return buckets
+
+    def snapshot(self, pool: Pool) -> Dict[str, Any]:
+        """プールの現在値と累計メトリクスを辞書で返します。"""
+        stats: Dict[str, Any] = {"pool_class": type(pool).__name__}
+        if hasattr(pool, "size"):
+            stats.update(
+                pool_size=pool.size(),
+                max_overflow=getattr(pool, "_max_overflow", 0),
+                checked_out=pool.checkedout(),
+                idle=pool.checkedin(),
+                # QueuePool.overflow() は「-pool_size」から始まるため、使用中のオーバーフロー数に換算
+                overflow=max(pool.overflow(), 0),
+            )
+        with self._lock:
+            stats.update(
+                checkouts_total=self.checkouts_total,
+                checkins_total=self.checkins_total,
+                connections_created_total=self.connections_created_total,
+                invalidations_total=self.invalidations_total,
+                timeouts_total=self.timeouts_total,
+                wait_time_ms={
+                    "count": self.wait_count,
+                    "sum": round(self.wait_sum_ms, 3),
+                    "max": round(self.wait_max_ms, 3),
+                    "buckets": self._wait_buckets(),
+                },
+            )
+        return stats
+
+
+# アプリ共通エンジンのプールメトリクス
+pool_metrics = PoolMetrics()
+
+
+# _do_get の呼び出しの入れ子の深さ。非同期エンジンでは全てのコルーチンが同じスレッドで実行され、
+# 接続待ちの間に他のコルーチンが _do_get を呼ぶため、スレッドではなく呼び出しのコンテキストごとに保持する
+_do_get_depth: ContextVar[int] = ContextVar("pool_do_get_depth", default=0)
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    コネクション取得待ち時間を計測する AsyncAdaptedQueuePool。
+    SQLAlchemyのプールイベントには「取得開始」が無いため、_do_get の所要時間を計測します。
+    _do_get は内部で再帰呼び出しされるため、各チェックアウトの最も外側の呼び出しだけを記録します。
+    """
+    metrics = pool_metrics
+
+    def _do_get(self):
+        depth = _do_get_depth.get()
+        token = _do_get_depth.set(depth + 1)
+        if depth:
+            try:
+                return super()._do_get()
+            finally:
+                _do_get_depth.reset(token)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.increment("timeouts_total")
+            raise
+        finally:
+            _do_get_depth.reset(token)
+            self.metrics.observe_wait(time.perf_counter() - start)
+
+
+def register_pool_metrics(pool: Pool, metrics: PoolMetrics = pool_metrics):
+    """プールのイベントにメトリクス集計用のリスナーを登録します。"""
+    event.listen(pool, "checkout", lambda *args: metrics.increment("checkouts_total"))
+    event.listen(pool, "checkin", lambda *args: metrics.increment("checkins_total"))
+    event.listen(pool, "connect", lambda *args: metrics.increment("connections_created_total"))
+    event.listen(pool, "invalidate", lambda *args: metrics.increment("invalidations_total"))
@@ -0,0 +1,20 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+from uuid import UUID
+
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    """キーセットページネーション用のカーソル（created_at, id）を不透明な文字列に変換します。"""
+    raw = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """encode_cursor で作成したカーソルを（created_at, id）に戻します。不正な値は ValueError を送出します。"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,19 @@
+import re
+from typing import Iterator, Tuple
+
+# CJK文字は1文字≒1トークン、それ以外は英単語・数字の塊と記号を1トークンとして数える。
+# 計算方法を変えた場合は、保存済みの t_chat_message.token_count を再計算するマイグレーションを追加する
+_TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を近似的に数えます。
+    LLMのトークナイザを呼ばずに予算計算（会話履歴・RAGのコンテキスト・チャンク分割）を行うためのもので、正確な値ではありません。
+    """
+    return len(_TOKEN_PATTERN.findall(text or ""))
+
+
+def iter_token_spans(text: str, pos: int = 0) -> Iterator[Tuple[int, int]]:
+    """テキストの pos 以降にある近似トークンの (開始, 終了) 位置を順に返します。"""
+    return (match.span() for match in _TOKEN_PATTERN.finditer(text, pos))
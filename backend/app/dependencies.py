@@ -14,16 +14,21 @@ from app.repositories.tenant import TenantRepository
 from app.repositories.user import UserRepository
 from app.repositories.chat import ChatSessionRepository, ChatMessageRepository
 from app.repositories.knowledge import KnowledgeDocumentRepository
+from app.repositories.ingestion_job import IngestionJobRepository
 from app.repositories.memory import StructuredMemoryRepository, EpisodicMemoryRepository
 from app.repositories.feedback import FeedbackRepository
 from app.schemas.auth import AuthenticatedUser
 from app.services.auth import AuthService
+from app.services.auth_cache import session_user_cache, known_dev_user_ids, token_digest
 from app.services.dom_orchestrator import DomOrchestratorService
 from app.services.answer_composer import AnswerComposerService
-from app.services.rag_service import RagService
+from app.services.rag_service import RagService, rag_service_registry
+from app.services.vector_index import VectorIndexManager, vector_index_manager
 from app.services.file_service import FileService
+from app.services.ingestion_service import IngestionWorkerPool, ingestion_worker_pool
 from app.services.memory_service import MemoryService
 from app.services.chat_service import ChatService
+from app.services.history_service import ConversationHistoryService
 from app.services.feedback_service import FeedbackService
 from app.llm.mock_llm import MockLLMClient
 from fastapi.encoders import jsonable_encoder
@@ -94,7 +99,11 @@ async def _ensure_dev_user_exists(session: AsyncSession, user: AuthenticatedUser
     """
     DEV認証でCookieから復元したユーザーがDBに存在しない場合に備え、
     テナント/ユーザーをidempotentに作成する。
+    存在を確認済みのユーザーは一定時間（AUTH_CACHE_TTL_SECONDS）DBへの確認を省略する。
     """
+    if user.id in known_dev_user_ids:
+        return
+
     tenant_repo = TenantRepository(session, tenant_id=None)
     user_repo = UserRepository(session, tenant_id=None)
 
@@ -113,6 +122,7 @@ async def _ensure_dev_user_exists(session: AsyncSession, user: AuthenticatedUser
                 "is_admin": user.is_admin,
             }
         )
+    known_dev_user_ids.set(user.id, True)
 
 async def get_current_user(
     request: Request,
@@ -128,11 +138,17 @@ async def get_current_user(
     if settings.DEV_AUTH_ENABLED:
         raw_session = request.cookies.get(SESSION_COOKIE_NAME)
         if raw_session:
+            # 署名検証済みのCookieはダイジェストをキーにキャッシュし、定常状態ではDBに触れない
+            session_key = token_digest(raw_session)
+            cached_user = await session_user_cache.get(session_key)
+            if cached_user is not None:
+                return cached_user
             try:
                 payload = _verify_payload(raw_session)
                 user = AuthenticatedUser(**payload)
-                # DevユーザーがDBに存在しない場合に備え、毎リクエスト軽量チェック
+                # DevユーザーがDBに存在しない場合に備え、キャッシュミス時のみ軽量チェック
                 await _ensure_dev_user_exists(session, user)
+                await session_user_cache.set(session_key, user)
                 return user
             except Exception:
                 # セッション破損時は401で再ログインさせる
@@ -170,6 +186,19 @@ async def get_current_admin_user(current_user: Annotated[AuthenticatedUser, Depe
         )
     return current_user
 
+async def get_current_global_admin_user(
+    current_user: Annotated[AuthenticatedUser, Depends(get_current_admin_user)]
+) -> AuthenticatedUser:
+    """
+    テナントを横断する操作を許可された管理者（GLOBAL_ADMIN_EMAILS に含まれる管理者）を返します。
+    """
+    if current_user.email not in settings.GLOBAL_ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough privileges"
+        )
+    return current_user
+
 # 認証済みユーザーのテナントIDでフィルタリングされるリポジトリ
 def get_tenant_repository(
     session: Annotated[AsyncSession, Depends(get_db_session)],
@@ -219,6 +248,15 @@ def get_knowledge_document_repository(
     """
     return KnowledgeDocumentRepository(session, tenant_id=current_user.tenant_id)
 
+def get_ingestion_job_repository(
+    session: Annotated[AsyncSession, Depends(get_db_session)],
+    current_user: Annotated[AuthenticatedUser, Depends(get_current_user)]
+) -> IngestionJobRepository:
+    """
+    IngestionJobRepositoryの依存性注入を提供します。
+    """
+    return IngestionJobRepository(session, tenant_id=current_user.tenant_id)
+
 def get_structured_memory_repository(
     session: Annotated[AsyncSession, Depends(get_db_session)],
     current_user: Annotated[AuthenticatedUser, Depends(get_current_user)]
@@ -265,8 +303,9 @@ def get_rag_service(
 ) -> RagService:
     """
     RagServiceの依存性注入を提供します。
+    テナントごとに生成済みのインスタンスをプロセス共通のレジストリから再利用します。
     """
-    return RagService(tenant_id=current_user.tenant_id, llm_client=llm_client)
+    return rag_service_registry.get(current_user.tenant_id, llm_client)
 
 def get_file_service() -> FileService:
     """
@@ -274,15 +313,42 @@ def get_file_service() -> FileService:
     """
     return FileService()
 
+def get_ingestion_worker_pool() -> IngestionWorkerPool:
+    """
+    取り込みジョブのワーカープール（プロセス共通）の依存性注入を提供します。
+    """
+    return ingestion_worker_pool
+
+def get_vector_index_manager() -> VectorIndexManager:
+    """
+    ベクトルインデックスマネージャー（プロセス共通）の依存性注入を提供します。
+    """
+    return vector_index_manager
+
+def get_conversation_history_service(
+    chat_message_repo: Annotated[ChatMessageRepository, Depends(get_chat_message_repository)],
+    episodic_memory_repo: Annotated[EpisodicMemoryRepository, Depends(get_episodic_memory_repository)]
+) -> ConversationHistoryService:
+    """
+    ConversationHistoryServiceの依存性注入を提供します。
+    """
+    return ConversationHistoryService(
+        chat_message_repo,
+        max_tokens=settings.CHAT_HISTORY_MAX_TOKENS,
+        page_size=settings.CHAT_HISTORY_PAGE_SIZE,
+        episodic_memory_repo=episodic_memory_repo,
+    )
+
 def get_dom_orchestrator_service(
     llm_client: Annotated[MockLLMClient, Depends(get_mock_llm_client)],
     answer_composer: Annotated[AnswerComposerService, Depends(get_answer_composer_service)],
-    rag_service: Annotated[RagService, Depends(get_rag_service)] # Add RagService
+    rag_service: Annotated[RagService, Depends(get_rag_service)], # Add RagService
+    history_service: Annotated[ConversationHistoryService, Depends(get_conversation_history_service)]
 ) -> DomOrchestratorService:
     """
     DomOrchestratorServiceの依存性注入を提供します。
     """
-    return DomOrchestratorService(llm_client, answer_composer, rag_service)
+    return DomOrchestratorService(llm_client, answer_composer, rag_service, history_service)
 
 def get_memory_service(
     structured_memory_repo: Annotated[StructuredMemoryRepository, Depends(get_structured_memory_repository)],
@@ -297,7 +363,8 @@ def get_chat_service(
     chat_session_repo: Annotated[ChatSessionRepository, Depends(get_chat_session_repository)],
     chat_message_repo: Annotated[ChatMessageRepository, Depends(get_chat_message_repository)],
     memory_service: Annotated[MemoryService, Depends(get_memory_service)],
-    dom_orchestrator_service: Annotated[DomOrchestratorService, Depends(get_dom_orchestrator_service)]
+    dom_orchestrator_service: Annotated[DomOrchestratorService, Depends(get_dom_orchestrator_service)],
+    rag_service: Annotated[RagService, Depends(get_rag_service)]
 ) -> ChatService:
     """
     ChatServiceの依存性注入を提供します。
@@ -306,7 +373,8 @@ def get_chat_service(
         chat_session_repo,
         chat_message_repo,
         memory_service,
-        dom_orchestrator_service
+        dom_orchestrator_service,
+        rag_service
     )
 
 def get_feedback_service(
@@ -1,10 +1,17 @@
 from fastapi import FastAPI
+import asyncio
 import logging
 
 from app.core.database import auto_create_tables, backfill_dev_timestamps
 
 from app.api.endpoints import admin, auth, chat, feedback, files, help, user_settings
 from app.core.config import settings  # 設定をインポート
+from app.services.rag_service import run_ephemeral_collection_purger
+from app.services.jwks_cache import close_http_client
+from app.services.message_writer import chat_message_writer
+from app.services.ingestion_service import ingestion_worker_pool
+from app.services.text_extraction import extraction_pool
+from app.services.reranker import rerank_executor
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -34,3 +41,30 @@ async def on_startup():
     # Dev only: create tables when enabled
     await auto_create_tables()
     await backfill_dev_timestamps()
+    # 期限切れ Ephemeral RAG コレクションの定期削除を開始
+    app.state.ephemeral_purger_task = asyncio.create_task(
+        run_ephemeral_collection_purger(settings.EPHEMERAL_RAG_PURGE_INTERVAL_SECONDS)
+    )
+    # アシスタント応答の write-behind 保存を開始
+    if settings.CHAT_MESSAGE_WRITE_BEHIND_ENABLED:
+        chat_message_writer.start()
+    # アップロードされたドキュメントの取り込みワーカーを開始
+    if settings.INGESTION_WORKER_ENABLED:
+        ingestion_worker_pool.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    purger_task = getattr(app.state, "ephemeral_purger_task", None)
+    if purger_task:
+        purger_task.cancel()
+    # 取り込みワーカーを停止する（実行中のジョブは待機中に戻る）
+    await ingestion_worker_pool.stop()
+    # テキスト抽出用の子プロセスを終了する
+    extraction_pool.shutdown()
+    # リランク用のスレッドを終了する
+    rerank_executor.shutdown(wait=False, cancel_futures=True)
+    # 保存待ちのチャットメッセージを全て書き込んでから終了する
+    await chat_message_writer.stop()
+    # OIDCプロバイダ向けの共有HTTPクライアントを閉じる
+    await close_http_client()
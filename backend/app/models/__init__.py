@@ -5,3 +5,5 @@ from .knowledge import KnowledgeDocument
 from .memory import StructuredMemory, EpisodicMemory
 from .feedback import Feedback
 from .user_settings import UserSettings
+from .ephemeral_collection import EphemeralCollection
+from .ingestion_job import IngestionJob
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, DateTime, Boolean, ForeignKey, Text, JSON, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -32,12 +32,18 @@ class ChatMessage(Base):
     """
     チャットメッセージモデル。
     特定のチャットセッションに属する個々のメッセージを保持します。
+    履歴は (session_id, created_at, id) の複合インデックスでキーセットページネーションします。
     """
+    __table_args__ = (
+        Index("ix_t_chat_message_session_id_created_at", "session_id", "created_at", "id"),
+    )
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4, index=True)
     session_id = Column(UUID(as_uuid=True), ForeignKey('t_chat_session.id'), nullable=False, index=True)
     role = Column(String, nullable=False) # 例: "user", "assistant", "system"
     content = Column(Text, nullable=False)
     raw_llm_response = Column(JSON, nullable=True) # LLMからの生の応答（JSON形式）
+    token_count = Column(Integer, nullable=True) # content の近似トークン数（保存時に計算。列の追加前のメッセージは NULL）
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), default=func.now(), server_default=func.now(), onupdate=func.now(), nullable=False)
 
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from uuid import uuid4
+
+from app.core.database import Base
+
+class EphemeralCollection(Base):
+    """
+    Ephemeral RAG用のPGVectorコレクションの登録情報モデル。
+    セッションごとのコレクションをリクエストやワーカープロセスを跨いで共有し、
+    有効期限（expires_at）を過ぎたコレクションのベクトルを一括削除するために使用します。
+    """
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4, index=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey('t_tenant.id'), nullable=False, index=True)
+    session_id = Column(UUID(as_uuid=True), nullable=False, unique=True, index=True) # Ephemeral RAGの対象チャットセッション
+    collection_name = Column(String, nullable=False, unique=True) # langchain_pg_collection.name
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True) # この時刻を過ぎたらベクトルごと削除
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<EphemeralCollection(session_id='{self.session_id}', collection_name='{self.collection_name}')>"
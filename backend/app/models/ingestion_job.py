@@ -0,0 +1,53 @@
+from sqlalchemy import Column, String, DateTime, Text, Integer, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from uuid import uuid4
+
+from app.core.database import Base
+
+# ジョブの状態
+INGESTION_JOB_QUEUED = "queued"
+INGESTION_JOB_RUNNING = "running"
+INGESTION_JOB_SUCCEEDED = "succeeded"
+INGESTION_JOB_FAILED = "failed"
+
+# 待機中・実行中のグローバルRAG登録ジョブ（ドキュメントごとに1件まで）
+_ACTIVE_GLOBAL_JOB_WHERE = text(
+    f"session_id IS NULL AND status IN ('{INGESTION_JOB_QUEUED}', '{INGESTION_JOB_RUNNING}')"
+)
+
+
+class IngestionJob(Base):
+    """
+    ナレッジドキュメントの取り込み（テキスト抽出・埋め込み・ベクトルストア登録）ジョブのモデル。
+    アップロード処理から切り離してワーカーで実行し、状態をポーリングで確認するために使用します。
+    同じドキュメントの待機中・実行中のグローバルRAG登録ジョブは、部分ユニークインデックスで1件に制限します。
+    """
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4, index=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey('t_tenant.id'), nullable=False, index=True)
+    document_id = Column(UUID(as_uuid=True), ForeignKey('t_knowledge_document.id'), nullable=False, index=True)
+    session_id = Column(UUID(as_uuid=True), nullable=True) # 指定時はEphemeral RAG、未指定時はグローバルRAGに登録
+    status = Column(String, nullable=False, default=INGESTION_JOB_QUEUED)
+    attempts = Column(Integer, nullable=False, default=0) # 実行を開始した回数
+    max_attempts = Column(Integer, nullable=False, default=3)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True) # リトリ待ちの場合の次回実行予定時刻
+    created_by_user_id = Column(UUID(as_uuid=True), ForeignKey('t_user.id'), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_t_ingestion_job_status_next_attempt_at", "status", "next_attempt_at"),
+        Index(
+            "ux_t_ingestion_job_active_global_document",
+            "document_id",
+            unique=True,
+            postgresql_where=_ACTIVE_GLOBAL_JOB_WHERE,
+            sqlite_where=_ACTIVE_GLOBAL_JOB_WHERE,
+        ),
+    )
+
+    def __repr__(self):
+        return f"<IngestionJob(id='{self.id}', document_id='{self.document_id}', status='{self.status}')>"
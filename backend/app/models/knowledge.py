@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, String, DateTime, Text, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from uuid import uuid4
@@ -17,8 +17,15 @@ class KnowledgeDocument(Base):
     file_size = Column(String, nullable=True) # バイト単位ではなく文字列で保存
     uploaded_by_user_id = Column(UUID(as_uuid=True), ForeignKey('t_user.id'), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
+    content_hash = Column(String(64), nullable=True) # ファイル内容のSHA-256（テナント内で一意）
+    is_global_indexed = Column(Boolean, default=False, nullable=False) # グローバルRAGへの登録が完了しているか
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        # 同一内容のファイルはテナント内で1つのドキュメントとして扱う（NULLは重複可）
+        UniqueConstraint("tenant_id", "content_hash", name="uq_t_knowledge_document_tenant_id_content_hash"),
+    )
+
     def __repr__(self):
         return f"<KnowledgeDocument(id='{self.id}', file_name='{self.file_name}', tenant_id='{self.tenant_id}')>"
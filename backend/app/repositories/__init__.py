@@ -5,3 +5,4 @@ from .chat import ChatSessionRepository, ChatMessageRepository
 from .knowledge import KnowledgeDocumentRepository
 from .memory import StructuredMemoryRepository, EpisodicMemoryRepository
 from .feedback import FeedbackRepository
+from .ephemeral_collection import EphemeralCollectionRepository
@@ -1,6 +1,6 @@
-from typing import Generic, TypeVar, Type, List, Optional
+from typing import Any, Dict, Generic, TypeVar, Type, List, Optional
 from uuid import UUID
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import Base # Baseをインポート
 
@@ -37,24 +37,33 @@ class BaseRepository(Generic[ModelType]):
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
-    async def create(self, obj_in: dict) -> ModelType:
-        """新しいレコードを作成します。tenant_idが設定されていれば自動で追加します。"""
+    def _assign_tenant(self, obj_in: dict) -> dict:
+        """tenant_idが設定されていて未指定の場合、tenant_idを追加します。"""
         if self.tenant_id and hasattr(self.model, 'tenant_id') and 'tenant_id' not in obj_in:
             obj_in['tenant_id'] = self.tenant_id
-        db_obj = self.model(**obj_in)
+        return obj_in
+
+    async def create(self, obj_in: dict, refresh: bool = True) -> ModelType:
+        """
+        新しいレコードを作成します。tenant_idが設定されていれば自動で追加します。
+        refresh=False の場合、コミット後の再読み込み（サーバー側デフォルト値の取得）を省略します。
+        """
+        db_obj = self.model(**self._assign_tenant(obj_in))
         self.session.add(db_obj)
         await self.session.commit()
-        await self.session.refresh(db_obj)
+        if refresh:
+            await self.session.refresh(db_obj)
         return db_obj
 
-    async def update(self, db_obj: ModelType, obj_in: dict) -> ModelType:
-        """既存のレコードを更新します。"""
+    async def update(self, db_obj: ModelType, obj_in: dict, refresh: bool = True) -> ModelType:
+        """既存のレコードを更新します。refresh=False の場合、コミット後の再読み込みを省略します。"""
         # tenant_idが変更されないように保護するロジックを追加することも可能
         for field, value in obj_in.items():
             setattr(db_obj, field, value)
         self.session.add(db_obj)
         await self.session.commit()
-        await self.session.refresh(db_obj)
+        if refresh:
+            await self.session.refresh(db_obj)
         return db_obj
 
     async def delete(self, id: UUID) -> Optional[ModelType]:
@@ -64,3 +73,51 @@ class BaseRepository(Generic[ModelType]):
             await self.session.delete(db_obj)
             await self.session.commit()
         return db_obj
+
+    async def bulk_create(self, objs_in: List[dict], returning: bool = True, commit: bool = True) -> List[ModelType]:
+        """
+        複数のレコードを1回の INSERT ... VALUES で作成します。tenant_idが設定されていれば自動で追加します。
+        returning=True の場合は RETURNING で作成したレコードを返し、False の場合は空リストを返します。
+        commit=False の場合はコミットせず、呼び出し側のトランザクションに含めます。
+        """
+        if not objs_in:
+            return []
+        rows = [self._assign_tenant(dict(obj_in)) for obj_in in objs_in]
+        stmt = insert(self.model).values(rows)
+        created: List[ModelType] = []
+        if returning:
+            result = await self.session.execute(stmt.returning(self.model))
+            created = result.scalars().all()
+        else:
+            await self.session.execute(stmt)
+        if commit:
+            await self.session.commit()
+        return created
+
+    async def bulk_update(self, values: Dict[str, Any], *where, commit: bool = True) -> int:
+        """
+        条件に一致するレコードを1回の UPDATE 文で更新し、更新件数を返します。テナントIDでフィルタリングします。
+        例: await repo.bulk_update({"is_active": False}, Model.user_id == user_id)
+        """
+        if not where:
+            raise ValueError("bulk_update requires at least one condition.")
+        stmt = update(self.model).where(*where).values(**values)
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        if commit:
+            await self.session.commit()
+        return result.rowcount
+
+    async def bulk_delete_where(self, *where, commit: bool = True) -> int:
+        """
+        条件に一致するレコードを1回の DELETE 文で削除し、削除件数を返します。テナントIDでフィルタリングします。
+        全件削除を防ぐため、条件は1つ以上必須です。
+        """
+        if not where:
+            raise ValueError("bulk_delete_where requires at least one condition.")
+        stmt = delete(self.model).where(*where)
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        if commit:
+            await self.session.commit()
+        return result.rowcount
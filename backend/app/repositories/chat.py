@@ -1,8 +1,12 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.chat import ChatSession, ChatMessage
 from app.repositories.base import BaseRepository
+from datetime import datetime
 from uuid import UUID
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+from app.core.tokens import estimate_tokens
+from sqlalchemy import select, tuple_
 
 class ChatSessionRepository(BaseRepository[ChatSession]):
     """
@@ -22,10 +26,25 @@ class ChatSessionRepository(BaseRepository[ChatSession]):
 class ChatMessageRepository(BaseRepository[ChatMessage]):
     """
     チャットメッセージモデルのためのリポジトリクラス。
+    保存時に content の近似トークン数を token_count に記録し、履歴の組み立て時に再計算しないようにします。
     """
     def __init__(self, session: AsyncSession, tenant_id: Optional[UUID] = None):
         super().__init__(ChatMessage, session, tenant_id)
 
+    @staticmethod
+    def _with_token_count(obj_in: dict) -> dict:
+        if obj_in.get("token_count") is None:
+            return {**obj_in, "token_count": estimate_tokens(obj_in.get("content", ""))}
+        return obj_in
+
+    async def create(self, obj_in: dict, refresh: bool = True) -> ChatMessage:
+        return await super().create(self._with_token_count(obj_in), refresh=refresh)
+
+    async def bulk_create(self, objs_in: List[dict], returning: bool = True, commit: bool = True) -> List[ChatMessage]:
+        return await super().bulk_create(
+            [self._with_token_count(obj_in) for obj_in in objs_in], returning=returning, commit=commit
+        )
+
     async def get_by_session_id(self, session_id: UUID) -> List[ChatMessage]:
         """セッションIDに基づいてチャットメッセージのリストを取得します。"""
         from sqlalchemy import select
@@ -33,3 +52,47 @@ class ChatMessageRepository(BaseRepository[ChatMessage]):
         stmt = self._add_tenant_filter(stmt) # tenant_idフィルタも適用
         result = await self.session.execute(stmt)
         return result.scalars().all()
+
+    async def get_latest(self, session_id: UUID, n: int = 1) -> List[ChatMessage]:
+        """
+        セッションの最新n件のメッセージを古い順で取得します。
+        複合インデックスを末尾から読むため、履歴の長さに関係なく一定のコストで取得できます。
+        """
+        stmt = (
+            select(self.model)
+            .where(self.model.session_id == session_id)
+            .order_by(self.model.created_at.desc(), self.model.id.desc())
+            .limit(n)
+        )
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return list(reversed(result.scalars().all()))
+
+    async def get_page(
+        self,
+        session_id: UUID,
+        limit: int = 50,
+        before: Optional[Tuple[datetime, UUID]] = None,
+        after: Optional[Tuple[datetime, UUID]] = None,
+    ) -> List[ChatMessage]:
+        """
+        (created_at, id) をキーとするキーセットページネーションでメッセージを古い順で取得します。
+
+        - before を指定した場合: カーソルより古いメッセージのうち、直前の limit 件
+        - after を指定した場合: カーソルより新しいメッセージのうち、直後の limit 件
+        - どちらも指定しない場合: 最新の limit 件
+        """
+        if before is not None and after is not None:
+            raise ValueError("before and after cannot be specified together.")
+        key = tuple_(self.model.created_at, self.model.id)
+        stmt = select(self.model).where(self.model.session_id == session_id)
+        if after is not None:
+            stmt = stmt.where(key > tuple(after)).order_by(self.model.created_at, self.model.id)
+        else:
+            if before is not None:
+                stmt = stmt.where(key < tuple(before))
+            stmt = stmt.order_by(self.model.created_at.desc(), self.model.id.desc())
+        stmt = self._add_tenant_filter(stmt).limit(limit)
+        result = await self.session.execute(stmt)
+        messages = result.scalars().all()
+        return list(messages) if after is not None else list(reversed(messages))
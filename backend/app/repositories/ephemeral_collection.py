@@ -0,0 +1,54 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.ephemeral_collection import EphemeralCollection
+from app.repositories.base import BaseRepository
+from datetime import datetime
+from uuid import UUID
+from typing import Optional, List
+
+class EphemeralCollectionRepository(BaseRepository[EphemeralCollection]):
+    """
+    Ephemeral RAGコレクション登録情報のためのリポジトリクラス。
+    """
+    def __init__(self, session: AsyncSession, tenant_id: Optional[UUID] = None):
+        super().__init__(EphemeralCollection, session, tenant_id)
+
+    async def get_by_session_id(self, session_id: UUID) -> Optional[EphemeralCollection]:
+        """セッションIDに基づいてコレクション登録情報を取得します。"""
+        stmt = select(self.model).where(self.model.session_id == session_id)
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def get_active_by_session_id(self, session_id: UUID, now: datetime) -> Optional[EphemeralCollection]:
+        """有効期限内のコレクション登録情報をセッションIDに基づいて取得します。"""
+        stmt = select(self.model).where(self.model.session_id == session_id, self.model.expires_at > now)
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def touch(self, session_id: UUID, collection_name: str, expires_at: datetime) -> EphemeralCollection:
+        """
+        コレクション登録情報を作成、または既存レコードの有効期限を延長します。
+        """
+        existing = await self.get_by_session_id(session_id)
+        if existing:
+            return await self.update(existing, {"expires_at": expires_at})
+        return await self.create({
+            "session_id": session_id,
+            "collection_name": collection_name,
+            "expires_at": expires_at,
+        })
+
+    async def get_expired(self, now: datetime, limit: int = 100) -> List[EphemeralCollection]:
+        """有効期限切れのコレクション登録情報を取得します。"""
+        stmt = select(self.model).where(self.model.expires_at <= now).order_by(self.model.expires_at).limit(limit)
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
+    async def delete_by_session_ids(self, session_ids: List[UUID]) -> int:
+        """セッションIDのリストに該当する登録情報を一括削除し、削除件数を返します。"""
+        if not session_ids:
+            return 0
+        return await self.bulk_delete_where(self.model.session_id.in_(session_ids))
@@ -0,0 +1,72 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_
+from app.models.ingestion_job import (
+    IngestionJob,
+    INGESTION_JOB_QUEUED,
+    INGESTION_JOB_RUNNING,
+)
+from app.repositories.base import BaseRepository
+from datetime import datetime
+from uuid import UUID
+from typing import Optional, List
+
+class IngestionJobRepository(BaseRepository[IngestionJob]):
+    """
+    取り込みジョブのためのリポジトリクラス。
+    """
+    def __init__(self, session: AsyncSession, tenant_id: Optional[UUID] = None):
+        super().__init__(IngestionJob, session, tenant_id)
+
+    async def claim(self, job_id: UUID, now: datetime) -> bool:
+        """
+        実行予定時刻を過ぎた待機中のジョブを実行中に変更し、実行回数を1増やします。
+        条件付きUPDATEで行うため、同じジョブを複数のワーカー（プロセス）が同時に実行することはありません。
+        """
+        claimed = await self.bulk_update(
+            {
+                "status": INGESTION_JOB_RUNNING,
+                "attempts": self.model.attempts + 1,
+                "started_at": now,
+                "next_attempt_at": None,
+            },
+            self.model.id == job_id,
+            self.model.status == INGESTION_JOB_QUEUED,
+            or_(self.model.next_attempt_at.is_(None), self.model.next_attempt_at <= now),
+        )
+        return claimed == 1
+
+    async def get_active_global_job(self, document_id: UUID) -> Optional[IngestionJob]:
+        """ドキュメントのグローバルRAG登録ジョブのうち、待機中または実行中のものを取得します。"""
+        stmt = (
+            select(self.model)
+            .where(
+                self.model.document_id == document_id,
+                self.model.session_id.is_(None),
+                self.model.status.in_((INGESTION_JOB_QUEUED, INGESTION_JOB_RUNNING)),
+            )
+            .order_by(self.model.created_at)
+            .limit(1)
+        )
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def get_queued(self, limit: int = 1000) -> List[IngestionJob]:
+        """待機中のジョブを作成順に取得します。"""
+        stmt = (
+            select(self.model)
+            .where(self.model.status == INGESTION_JOB_QUEUED)
+            .order_by(self.model.created_at)
+            .limit(limit)
+        )
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
+    async def requeue_stale(self, stale_before: datetime) -> int:
+        """stale_before より前に開始したまま終わっていないジョブを待機中に戻し、件数を返します。"""
+        return await self.bulk_update(
+            {"status": INGESTION_JOB_QUEUED},
+            self.model.status == INGESTION_JOB_RUNNING,
+            self.model.started_at < stale_before,
+        )
@@ -33,3 +33,11 @@ class KnowledgeDocumentRepository(BaseRepository[KnowledgeDocument]):
         
         result = await self.session.execute(stmt)
         return result.scalars().all()
+
+    async def get_by_content_hash(self, content_hash: str) -> Optional[KnowledgeDocument]:
+        """ファイル内容のハッシュ（SHA-256）に基づいてナレッジドキュメントを取得します。"""
+        from sqlalchemy import select
+        stmt = select(self.model).where(self.model.content_hash == content_hash)
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
@@ -49,3 +49,20 @@ class EpisodicMemoryRepository(BaseRepository[EpisodicMemory]):
         stmt = self._add_tenant_filter(stmt)
         result = await self.session.execute(stmt)
         return result.scalars().all()
+
+    async def get_latest_for_session_owner(self, session_id: UUID) -> Optional[EpisodicMemory]:
+        """
+        指定セッションの所有ユーザーの、最新のエピソード記憶を取得します（1回のクエリで取得）。
+        """
+        from sqlalchemy import select
+        from app.models.chat import ChatSession
+        owner_id = select(ChatSession.user_id).where(ChatSession.id == session_id).scalar_subquery()
+        stmt = (
+            select(self.model)
+            .where(self.model.user_id == owner_id)
+            .order_by(self.model.created_at.desc())
+            .limit(1)
+        )
+        stmt = self._add_tenant_filter(stmt)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
@@ -1,13 +1,18 @@
+from sqlalchemy import delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
 from app.repositories.base import BaseRepository
 from uuid import UUID
-from typing import Optional
+from typing import Any, Dict, Iterable, Optional
 
 class UserRepository(BaseRepository[User]):
     """
     ユーザーモデルのためのリポジトリクラス。
     ユーザー固有のデータ操作をここに定義します。
+
+    ユーザーの無効化・削除（単一・バルクとも）では、対象ユーザーの認証キャッシュを破棄します。
+    AUTH_CACHE_REDIS_ENABLED が false（既定）の場合に破棄されるのはこのプロセスのキャッシュだけで、
+    他のワーカー・レプリカは最大 AUTH_CACHE_TTL_SECONDS の間、無効化前の認証結果を使い続けます。
     """
     def __init__(self, session: AsyncSession, tenant_id: Optional[UUID] = None):
         super().__init__(User, session, tenant_id)
@@ -20,3 +25,54 @@ class UserRepository(BaseRepository[User]):
         stmt = self._add_tenant_filter(stmt)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
+
+    async def update(self, db_obj: User, obj_in: dict, refresh: bool = True) -> User:
+        """ユーザーを更新します。無効化した場合は認証キャッシュも破棄します。"""
+        from app.services.auth_cache import invalidate_user  # app.services との循環インポートを避ける
+        db_obj = await super().update(db_obj, obj_in, refresh=refresh)
+        if obj_in.get("is_active") is False:
+            await invalidate_user(db_obj.id)
+        return db_obj
+
+    async def delete(self, id: UUID) -> Optional[User]:
+        """ユーザーを削除し、認証キャッシュも破棄します。"""
+        from app.services.auth_cache import invalidate_user  # app.services との循環インポートを避ける
+        db_obj = await super().delete(id)
+        if db_obj:
+            await invalidate_user(db_obj.id)
+        return db_obj
+
+    async def bulk_update(self, values: Dict[str, Any], *where, commit: bool = True) -> int:
+        """
+        条件に一致するユーザーを1回の UPDATE 文で更新し、更新件数を返します。
+        無効化（is_active=False）の場合は、更新したユーザーの認証キャッシュも破棄します。
+        """
+        if values.get("is_active") is not False:
+            return await super().bulk_update(values, *where, commit=commit)
+        if not where:
+            raise ValueError("bulk_update requires at least one condition.")
+        stmt = self._add_tenant_filter(update(self.model).where(*where).values(**values)).returning(self.model.id)
+        user_ids = (await self.session.execute(stmt)).scalars().all()
+        if commit:
+            await self.session.commit()
+        await self._invalidate_auth_cache(user_ids)
+        return len(user_ids)
+
+    async def bulk_delete_where(self, *where, commit: bool = True) -> int:
+        """
+        条件に一致するユーザーを1回の DELETE 文で削除し、削除件数を返します。
+        削除したユーザーの認証キャッシュも破棄します。
+        """
+        if not where:
+            raise ValueError("bulk_delete_where requires at least one condition.")
+        stmt = self._add_tenant_filter(delete(self.model).where(*where)).returning(self.model.id)
+        user_ids = (await self.session.execute(stmt)).scalars().all()
+        if commit:
+            await self.session.commit()
+        await self._invalidate_auth_cache(user_ids)
+        return len(user_ids)
+
+    async def _invalidate_auth_cache(self, user_ids: Iterable[UUID]):
+        from app.services.auth_cache import invalidate_user  # app.services との循環インポートを避ける
+        for user_id in user_ids:
+            await invalidate_user(user_id)
@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class HistogramBucket(BaseModel):
+    """
+    累積ヒストグラムの1バケット（le 以下の観測数）。
+    """
+    le: str = Field(..., description="バケットの上限（ミリ秒）。最後のバケットは '+Inf'")
+    count: int
+
+
+class WaitTimeHistogram(BaseModel):
+    """
+    コネクション取得待ち時間のヒストグラム（ミリ秒）。
+    """
+    count: int
+    sum: float
+    max: float
+    buckets: List[HistogramBucket]
+
+
+class DbPoolStatsResponse(BaseModel):
+    """
+    DBコネクションプールの統計情報のレスポンスに使用するPydanticスキーマ。
+    """
+    pool_class: str
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    checked_out: Optional[int] = Field(None, description="使用中の接続数")
+    idle: Optional[int] = Field(None, description="プール内のアイドル接続数")
+    overflow: Optional[int] = Field(None, description="pool_size を超えて作成されている接続数")
+    checkouts_total: int
+    checkins_total: int
+    connections_created_total: int
+    invalidations_total: int
+    timeouts_total: int
+    wait_time_ms: WaitTimeHistogram
+
+
+class EmbeddingStatsResponse(BaseModel):
+    """
+    埋め込みバッチスケジューラーの統計情報のレスポンスに使用するPydanticスキーマ。
+    """
+    requests_total: int = Field(..., description="埋め込みの呼び出し数（取り込みのバッチ単位）")
+    texts_total: int = Field(..., description="埋め込んだテキスト数")
+    batches_total: int = Field(..., description="埋め込みAPIの呼び出し数（成功分）")
+    retries_total: int
+    rate_limited_total: int
+    failed_batches_total: int
+    max_batch_size: int
+    avg_batch_size: float
+    embed_seconds_total: float
+    texts_per_second: float
+
+
+class VectorIndexCreateRequest(BaseModel):
+    """
+    ベクトルインデックス（HNSW / IVFFlat）の作成リクエストに使用するPydanticスキーマ。
+    """
+    method: Literal["hnsw", "ivfflat"] = "hnsw"
+    m: int = Field(16, ge=2, le=100, description="HNSW: 各ノードの最大接続数")
+    ef_construction: int = Field(64, ge=4, le=1000, description="HNSW: 作成時の候補リストのサイズ")
+    lists: int = Field(100, ge=1, le=32768, description="IVFFlat: クラスタ数（目安は行数/1000、100万行超は√行数）")
+
+
+class VectorIndexResponse(BaseModel):
+    """
+    ベクトルインデックスの状態のレスポンスに使用するPydanticスキーマ。
+    """
+    index_name: str
+    method: str
+    is_valid: bool = Field(..., description="作成が完了し検索に使用できるか（CONCURRENTLY で作成中・失敗時は false）")
+    size_bytes: int
+    build_status: str = Field(..., description="作成の状態（running / succeeded / failed）。pg_index と pg_stat_progress_create_index から判定")
+
+
+class VectorIndexBuildResponse(BaseModel):
+    """
+    ベクトルインデックスの作成開始のレスポンスに使用するPydanticスキーマ。
+    """
+    index_name: str
+    collection_name: str
+    method: str
+    status: str
+    started_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class VectorIndexBuildProgressResponse(BaseModel):
+    """
+    実行中のインデックス作成の進捗（pg_stat_progress_create_index）のレスポンスに使用するPydanticスキーマ。
+    """
+    pid: int
+    index_name: Optional[str] = None
+    phase: str
+    blocks_done: int
+    blocks_total: int
+    tuples_done: int
+    tuples_total: int
@@ -27,6 +27,16 @@ class ChatMessageResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ChatMessagePage(BaseModel):
+    """
+    チャット履歴のページ（キーセットページネーション）のレスポンスに使用するPydanticスキーマ。
+    items は古い順に並びます。
+    """
+    items: list[ChatMessageResponse]
+    has_more: bool = Field(..., description="取得方向（before/after）にさらにメッセージがあるかどうか")
+    before_cursor: str | None = Field(None, description="これより古いメッセージを取得するためのカーソル（先頭のメッセージ）")
+    after_cursor: str | None = Field(None, description="これより新しいメッセージを取得するためのカーソル（末尾のメッセージ）")
+
 class ChatSessionCreate(BaseModel):
     """
     新しいチャットセッションを作成するためのPydanticスキーマ。
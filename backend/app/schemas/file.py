@@ -1,5 +1,6 @@
 from uuid import UUID
 from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel, Field
 
 class FileUploadResponse(BaseModel):
@@ -14,8 +15,31 @@ class FileUploadResponse(BaseModel):
     file_size: str | None = None # string representation like "10MB"
     uploaded_by_user_id: UUID | None = None
     is_active: bool
+    content_hash: str | None = None # ファイル内容のSHA-256
     created_at: datetime
-    updated_at: datetime
+    updated_at: datetime | None = None
+    job_id: Optional[UUID] = None # 取り込みジョブのID（GET /files/jobs/{job_id} で状態を確認）
+
+    class Config:
+        from_attributes = True
+
+class IngestionJobResponse(BaseModel):
+    """
+    取り込みジョブ（テキスト抽出・埋め込み）の状態のレスポンスに使用するPydanticスキーマ。
+    status は queued / running / succeeded / failed のいずれかです。
+    """
+    id: UUID
+    document_id: UUID
+    session_id: Optional[UUID] = None
+    status: str
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
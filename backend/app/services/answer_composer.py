@@ -1,6 +1,124 @@
-from typing import Dict, AsyncGenerator
+from typing import Dict, AsyncGenerator, List, Optional, Tuple
 import re
 
+# IC-5ライトのセクション定義: (キー, 見出しラベル, 本文の終端となる区切り文字列)
+# compose_ic5_light_response の正規表現と同じ区切りを表現しています。
+IC5_LIGHT_SECTIONS: Tuple[Tuple[str, str, Tuple[str, ...]], ...] = (
+    ("Decision", "Decision:", ("\nWhy:", "\nNext 3 Actions:")),
+    ("Why", "Why:", ("\nNext 3 Actions:",)),
+    ("Next 3 Actions", "Next 3 Actions:", ()),
+)
+
+
+class IC5LightStreamParser:
+    """
+    LLMトークンを逐次受け取り、IC-5ライト形式のMarkdownチャンクを返すステートマシン。
+
+    compose_ic5_light_response（一括パース）と連結結果がバイト単位で一致するように、
+    以下のルールで本文を確定させながら出力します。
+    - 見出しラベルはバッファ全体での最初の出現位置を採用する（re.searchと同じ）。
+    - ラベル直後の空白は読み飛ばし、終端の区切り文字列の手前までを本文とする。
+    - 区切り文字列の途中かもしれない末尾や、末尾の空白は確定するまで保留する。
+    - 本文が空のセクションは見出しごと出力しない。
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._section_index = 0
+        self._reset_section_state()
+
+    def _reset_section_state(self):
+        self._scan_from = 0
+        self._label_end: Optional[int] = None
+        self._content_start: Optional[int] = None
+        self._emitted = 0
+        self._header_emitted = False
+
+    def feed(self, token: str) -> List[str]:
+        """トークンを追加し、確定した出力チャンクを返します。"""
+        self._buffer += token
+        return self._drain(final=False)
+
+    def close(self) -> List[str]:
+        """ストリーム終了時に呼び出し、残りの出力チャンクを返します。"""
+        return self._drain(final=True)
+
+    def _emit(self, key: str, text: str, out: List[str]):
+        if not text:
+            return
+        if not self._header_emitted:
+            out.append(f"**{key}**\n")
+            self._header_emitted = True
+        out.append(text)
+
+    def _finish_section(self, out: List[str]):
+        if self._header_emitted:
+            out.append("\n\n")
+        self._section_index += 1
+        self._reset_section_state()
+
+    @staticmethod
+    def _pending_prefix_length(buffer: str, terminators: Tuple[str, ...]) -> int:
+        """バッファ末尾が区切り文字列の先頭部分と一致する最大長を返します。"""
+        pending = 0
+        for terminator in terminators:
+            for length in range(len(terminator) - 1, pending, -1):
+                if buffer.endswith(terminator[:length]):
+                    pending = length
+                    break
+        return pending
+
+    def _drain(self, final: bool) -> List[str]:
+        out: List[str] = []
+        buffer = self._buffer
+        while self._section_index < len(IC5_LIGHT_SECTIONS):
+            key, label, terminators = IC5_LIGHT_SECTIONS[self._section_index]
+
+            if self._content_start is None:
+                # 1. 見出しラベルを探す
+                if self._label_end is None:
+                    position = buffer.find(label, self._scan_from)
+                    if position < 0:
+                        if not final:
+                            self._scan_from = max(0, len(buffer) - len(label) + 1)
+                            return out
+                        # ストリーム終了までラベルが現れなければセクションなし
+                        self._finish_section(out)
+                        continue
+                    self._label_end = position + len(label)
+
+                # 2. ラベル直後の空白を読み飛ばして本文の開始位置を決める
+                index = self._label_end
+                while index < len(buffer) and buffer[index].isspace():
+                    index += 1
+                if index == len(buffer) and not final:
+                    self._label_end = index
+                    return out
+                self._content_start = self._emitted = self._scan_from = index
+
+            # 3. 本文の終端（区切り文字列）を探す
+            end = None
+            for terminator in terminators:
+                position = buffer.find(terminator, self._scan_from)
+                if position >= 0 and (end is None or position < end):
+                    end = position
+
+            if end is None and not final:
+                limit = len(buffer) - self._pending_prefix_length(buffer, terminators)
+                ready = buffer[self._emitted:limit].rstrip()
+                self._emit(key, ready, out)
+                self._emitted += len(ready)
+                if terminators:
+                    longest = max(len(terminator) for terminator in terminators)
+                    self._scan_from = max(self._content_start, len(buffer) - longest + 1)
+                return out
+
+            if end is None:
+                end = len(buffer)
+            self._emit(key, buffer[self._emitted:end].rstrip(), out)
+            self._finish_section(out)
+        return out
+
+
 class AnswerComposerService:
     """
     LLMの最終出力を「Decision」「Why」「Next 3 Actions」のMarkdownセクションに整形するサービス。
@@ -29,24 +147,19 @@ class AnswerComposerService:
             match = re.search(pattern, raw_llm_output, re.DOTALL)
             if match:
                 composed_response[key] = match.group(1).strip()
-        
+
         return composed_response
 
     async def stream_composed_ic5_light_response(self, raw_llm_token_stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
         """
         LLMトークンストリームを受け取り、IC-5ライト形式に整形しながらストリームします。
-        これはより複雑な実装となり、トークンをバッファリングして
-        セクションの区切りを検出する必要があります。
-        PoCでは、一旦全ての出力を受け取ってから整形する方式を想定し、
-        このメソッドは非同期ジェネレータの例として残します。
+        IC5LightStreamParserでセクションの区切りをトークン分割を跨いで検出し、
+        見出しと本文を確定した時点で順次返します。
+        連結した出力は compose_ic5_light_response の結果をMarkdown化したものと一致します。
         """
-        full_output = ""
+        parser = IC5LightStreamParser()
         async for token in raw_llm_token_stream:
-            full_output += token
-            # ここで部分的なパースを試みることも可能だが、複雑性が増す
-            yield token # とりあえずは受け取ったトークンをそのまま流す
-
-        # ストリームが終了した後で整形する場合の例
-        # composed = await self.compose_ic5_light_response(full_output)
-        # for key, value in composed.items():
-        #     yield f"**{key}**\n{value}\n\n"
+            for chunk in parser.feed(token):
+                yield chunk
+        for chunk in parser.close():
+            yield chunk
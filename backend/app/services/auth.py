@@ -1,12 +1,13 @@
 from typing import Optional
 import logging
+import time
 from uuid import UUID
 
 from fastapi import Depends, HTTPException, status
 from starlette.requests import Request
 
 from authlib.integrations.starlette_client import OAuth
-from authlib.jose import JsonWebKey, JsonWebToken, jwk, jwt
+from authlib.jose import JsonWebKey, JsonWebToken, KeySet, jwk, jwt
 from authlib.jose.errors import MissingClaimError, InvalidClaimError
 from jose import jwt as python_jose_jwt  # python-jose の jwt
 
@@ -14,6 +15,8 @@ from app.core.config import settings
 from app.schemas.auth import AuthenticatedUser
 from app.repositories.user import UserRepository
 from app.repositories.tenant import TenantRepository
+from app.services.jwks_cache import JwksCache, get_jwks_cache
+from app.services.auth_cache import token_digest, token_user_cache
 
 logger = logging.getLogger(__name__)
 
@@ -25,60 +28,34 @@ class AuthService:
     def __init__(self, user_repository: UserRepository, tenant_repository: TenantRepository):
         self.user_repository = user_repository
         self.tenant_repository = tenant_repository
-        self._jwks_client = None
-        self._jwks_uri: Optional[str] = None
         self._jwt_decoder = JsonWebToken(["RS256"]) # RS256アルゴリズムを使用
 
+    @property
+    def jwks_cache(self) -> JwksCache:
+        """
+        プロセス共有のJWKSキャッシュ。
+        AuthService はリクエストごとに生成されるため、ディスカバリ情報と鍵セットはインスタンスに持たせません。
+        """
+        return get_jwks_cache(settings.OIDC_ISSUER)
+
     async def get_jwks_uri(self) -> str:
         """
         OIDCプロバイダのメタデータからJWKS URIを取得します。
         """
-        if self._jwks_uri:
-            return self._jwks_uri
+        return await self.jwks_cache.get_jwks_uri()
 
-        # well-known endpointから設定を取得
-        discovery_url = f"{settings.OIDC_ISSUER}/.well-known/openid-configuration"
-        try:
-            # authlibのAsyncOAuthClientを使用
-            # from authlib.integrations.base_client import AsyncOAuthClient # if needed
-            # client = AsyncOAuthClient() # if needed
-
-            # 通常は直接フェッチ
-            import httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.get(discovery_url)
-                response.raise_for_status()
-                config = response.json()
-                self._jwks_uri = config.get("jwks_uri")
-                if not self._jwks_uri:
-                    raise ValueError("jwks_uri not found in OIDC discovery configuration.")
-            return self._jwks_uri
-        except Exception as e:
-            logger.error(f"Failed to fetch OIDC discovery configuration from {discovery_url}: {e}")
-            raise
+    async def get_jwks_client(self) -> KeySet:
+        """
+        JWKS（公開鍵セット）を取得します。キャッシュが有効な間はネットワークにアクセスしません。
+        """
+        return await self.jwks_cache.get_key_set()
 
-    async def get_jwks_client(self):
+    async def get_signing_key(self, kid: str):
         """
-        JWKSクライアントを取得します。JWKS URIから公開鍵をフェッチします。
+        kidに対応する公開鍵を取得します。未知のkidの場合はJWKSを再取得してから探します。
         """
-        if self._jwks_client:
-            return self._jwks_client
+        return await self.jwks_cache.get_key(kid)
 
-        jwks_uri = await self.get_jwks_uri()
-        
-        try:
-             import httpx
-             async with httpx.AsyncClient() as client:
-                 response = await client.get(jwks_uri)
-                 response.raise_for_status()
-                 jwks_data = response.json()
-                 
-             self._jwks_client = jwk.JsonWebKey.import_key_set(jwks_data) # JWKSデータから鍵セットをインポート
-             return self._jwks_client
-        except Exception as e:
-             logger.error(f"Failed to fetch JWKS from {jwks_uri}: {e}")
-             raise
-             
     async def verify_id_token(self, token: str) -> AuthenticatedUser:
         """
         IDトークンを検証し、認証済みユーザー情報を返します。
@@ -86,8 +63,11 @@ class AuthService:
         if not settings.OIDC_CLIENT_ID:
             raise ValueError("OIDC_CLIENT_ID is not configured.")
 
-        # JWKSクライアントをフェッチ
-        jwks_client = await self.get_jwks_client()
+        # 検証済みのトークンは署名検証とDBアクセスを省略する（exp まで・AUTH_CACHE_TTL_SECONDS 以内）
+        cache_key = token_digest(token)
+        cached_user = await token_user_cache.get(cache_key)
+        if cached_user is not None:
+            return cached_user
 
         # JWTヘッダーをデコードしてkidを取得
         header = python_jose_jwt.get_unverified_header(token)
@@ -96,9 +76,7 @@ class AuthService:
             raise ValueError("ID Token is missing 'kid' in header.")
 
         # kidに基づいて公開鍵を取得
-        public_key = jwks_client.find_by_kid(kid)
-        if not public_key:
-            raise ValueError(f"No matching public key found for kid: {kid}")
+        public_key = await self.get_signing_key(kid)
 
         # IDトークンを検証
         try:
@@ -141,10 +119,12 @@ class AuthService:
             logger.info(f"Created new user: {user.email} for tenant: {tenant.name}")
         
         # AuthenticatedUserスキーマに変換
-        return AuthenticatedUser(
+        authenticated_user = AuthenticatedUser(
             id=user.id,
             tenant_id=user.tenant_id,
             email=user.email,
             is_active=user.is_active,
             is_admin=user.is_admin
         )
+        await token_user_cache.set(cache_key, authenticated_user, ttl_seconds=claims["exp"] - time.time())
+        return authenticated_user
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+from uuid import UUID
+
+from app.core.cache import TTLCache, get_redis_client
+from app.core.config import settings
+from app.schemas.auth import AuthenticatedUser
+
+logger = logging.getLogger(__name__)
+
+
+def token_digest(token: str) -> str:
+    """トークンそのものをキーとして保持しないよう、SHA-256ダイジェストに変換します。"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class AuthenticatedUserCache:
+    """
+    検証済みの認証情報（AuthenticatedUser）をキャッシュするクラス。
+
+    - L1: プロセス内のTTLCache（件数上限付き）
+    - L2: Redis（use_redis=True の場合のみ。ワーカー/レプリカ間で共有）
+    Redisの障害時はログを出してL1のみで動作し、認証処理自体は失敗させません。
+    ユーザーの無効化時に invalidate_user で該当ユーザーのエントリをまとめて破棄できるよう、
+    ユーザーID → キーの索引も保持します。
+
+    Redis使用時は、ユーザーごとのバージョン（invalidate_user で加算）をRedisに保持し、
+    L1・L2のエントリには保存時のバージョンを記録します。参照時にバージョンが異なるエントリは使わないため、
+    他のワーカーで無効化されたユーザーのL1エントリも次のリクエストから使われません。
+    L2のエントリには有効期限（時刻）も保存し、L1へ補充する際は残りの期間だけ保持します。
+    """
+    def __init__(self, namespace: str, max_entries: int, ttl_seconds: float, use_redis: bool = False):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.use_redis = use_redis
+        # 値は (AuthenticatedUser, 保存時のユーザーバージョン)。Redisを使用しない場合のバージョンは常に0
+        self._local: TTLCache[Tuple[AuthenticatedUser, int]] = TTLCache(max_entries, ttl_seconds)
+        self._user_keys: Dict[UUID, Set[str]] = {}
+        self._index_lock = threading.Lock()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redis_user_index_key(self, user_id: UUID) -> str:
+        return f"{self.namespace}:user:{user_id}"
+
+    def _redis_user_version_key(self, user_id: UUID) -> str:
+        return f"{self.namespace}:user_version:{user_id}"
+
+    async def _user_version(self, user_id: UUID) -> int:
+        raw = await get_redis_client().get(self._redis_user_version_key(user_id))
+        return int(raw) if raw is not None else 0
+
+    def _index(self, user_id: UUID, key: str):
+        with self._index_lock:
+            # LRU/TTLで破棄済みのキーは索引からも取り除く
+            live_keys = {k for k in self._user_keys.get(user_id, ()) if k in self._local}
+            live_keys.add(key)
+            self._user_keys[user_id] = live_keys
+
+    async def get(self, key: str) -> Optional[AuthenticatedUser]:
+        entry = self._local.get(key)
+        if not self.use_redis:
+            return entry[0] if entry is not None else None
+        if entry is not None:
+            user, version = entry
+            try:
+                if await self._user_version(user.id) == version:
+                    return user
+            except Exception as e:
+                logger.warning(f"Auth cache redis version lookup failed: {e}")
+                return user
+            # 他のワーカーで無効化されたユーザー。L2に新しいエントリがあればそれを使う
+            self._local.delete(key)
+        try:
+            raw = await get_redis_client().get(self._redis_key(key))
+            if raw is None:
+                return None
+            payload = json.loads(raw)
+            user = AuthenticatedUser.model_validate(payload["user"])
+            version = await self._user_version(user.id)
+        except Exception as e:
+            logger.warning(f"Auth cache redis lookup failed: {e}")
+            return None
+        remaining = payload["expires_at"] - time.time()
+        if remaining <= 0 or payload["version"] != version:
+            return None
+        self._local.set(key, (user, version), min(remaining, self.ttl_seconds))
+        self._index(user.id, key)
+        return user
+
+    async def set(self, key: str, user: AuthenticatedUser, ttl_seconds: Optional[float] = None):
+        """ttl_seconds を指定した場合も、設定上のTTLを超えて保持しません。"""
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        if not self.use_redis:
+            self._local.set(key, (user, 0), ttl)
+            self._index(user.id, key)
+            return
+        try:
+            redis = get_redis_client()
+            version = await self._user_version(user.id)
+        except Exception as e:
+            logger.warning(f"Auth cache redis store failed: {e}")
+            # バージョンが分からないため、Redisの復旧後は使われない（再検証される）値で保存
+            self._local.set(key, (user, -1), ttl)
+            self._index(user.id, key)
+            return
+        self._local.set(key, (user, version), ttl)
+        self._index(user.id, key)
+        try:
+            payload = {"user": user.model_dump(mode="json"), "expires_at": time.time() + ttl, "version": version}
+            index_key = self._redis_user_index_key(user.id)
+            await redis.set(self._redis_key(key), json.dumps(payload), ex=max(math.ceil(ttl), 1))
+            await redis.sadd(index_key, key)
+            await redis.expire(index_key, max(int(self.ttl_seconds), 1))
+        except Exception as e:
+            logger.warning(f"Auth cache redis store failed: {e}")
+
+    async def delete(self, key: str):
+        self._local.delete(key)
+        if self.use_redis:
+            try:
+                await get_redis_client().delete(self._redis_key(key))
+            except Exception as e:
+                logger.warning(f"Auth cache redis delete failed: {e}")
+
+    async def invalidate_user(self, user_id: UUID):
+        """指定ユーザーのエントリを全て破棄します（ユーザーの無効化・削除時に呼び出し）。"""
+        with self._index_lock:
+            keys = self._user_keys.pop(user_id, set())
+        for key in keys:
+            self._local.delete(key)
+        if self.use_redis:
+            try:
+                redis = get_redis_client()
+                # バージョンを進め、他のワーカーのL1に残っているエントリを使われなくする
+                # （バージョンのキーは、無効化前に保存されたエントリが全て失効するまで保持）
+                version_key = self._redis_user_version_key(user_id)
+                await redis.incr(version_key)
+                await redis.expire(version_key, max(math.ceil(self.ttl_seconds), 1))
+                index_key = self._redis_user_index_key(user_id)
+                members = await redis.smembers(index_key)
+                redis_keys = [self._redis_key(k.decode() if isinstance(k, bytes) else k) for k in members]
+                await redis.delete(index_key, *redis_keys)
+            except Exception as e:
+                logger.warning(f"Auth cache redis invalidation failed: {e}")
+
+    def clear(self):
+        """プロセス内のキャッシュを破棄します（Redis層は各エントリのTTLで失効）。"""
+        self._local.clear()
+        with self._index_lock:
+            self._user_keys.clear()
+
+
+# DEVセッションCookie（署名検証済み）→ AuthenticatedUser
+session_user_cache = AuthenticatedUserCache(
+    namespace="auth:session",
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    use_redis=settings.AUTH_CACHE_REDIS_ENABLED,
+)
+
+# 検証済みのOIDC IDトークン → AuthenticatedUser（トークンの exp を超えて保持しない）
+token_user_cache = AuthenticatedUserCache(
+    namespace="auth:token",
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    use_redis=settings.AUTH_CACHE_REDIS_ENABLED,
+)
+
+# DBに存在することを確認済みのDEVユーザーID（_ensure_dev_user_exists の省略に使用）
+known_dev_user_ids: TTLCache[bool] = TTLCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    default_ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+)
+
+
+async def invalidate_user(user_id: UUID):
+    """
+    ユーザーに紐づく認証キャッシュを全て破棄します。
+    ユーザーの無効化・削除時に呼び出し、次のリクエストから再検証させます。
+    Redisを使用する場合は、他のワーカーのキャッシュも次のリクエストから使われなくなります。
+    Redisを使用しない場合（AUTH_CACHE_REDIS_ENABLED=false、既定）はこのプロセスのキャッシュだけが破棄され、
+    他のワーカーのキャッシュは最大 AUTH_CACHE_TTL_SECONDS の間残ります。
+    """
+    await session_user_cache.invalidate_user(user_id)
+    await token_user_cache.invalidate_user(user_id)
+    known_dev_user_ids.delete(user_id)
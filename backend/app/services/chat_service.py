@@ -4,6 +4,7 @@ from typing import List, Optional
 from app.repositories.chat import ChatSessionRepository, ChatMessageRepository
 from app.services.memory_service import MemoryService
 from app.services.dom_orchestrator import DomOrchestratorService
+from app.services.rag_service import RagService
 from app.models.chat import ChatSession, ChatMessage
 from app.schemas.chat import ChatSessionResponse # ChatSessionResponseをインポート
 
@@ -16,12 +17,14 @@ class ChatService:
         chat_session_repo: ChatSessionRepository,
         chat_message_repo: ChatMessageRepository,
         memory_service: MemoryService,
-        dom_orchestrator_service: DomOrchestratorService
+        dom_orchestrator_service: DomOrchestratorService,
+        rag_service: Optional[RagService] = None
     ):
         self.chat_session_repo = chat_session_repo
         self.chat_message_repo = chat_message_repo
         self.memory_service = memory_service
         self.dom_orchestrator_service = dom_orchestrator_service
+        self.rag_service = rag_service
 
     async def reset_session(self, session_id: UUID, user_id: UUID, tenant_id: UUID) -> ChatSessionResponse:
         """
@@ -49,13 +52,14 @@ class ChatService:
                 assumptions=[] # TODO: 実際の前提起因抽出ロジック
             )
             
-            # 4. 保存が成功した場合のみ、短期記憶（チャットメッセージ）をクリア
-            # （実際にはメッセージを削除するリポジトリメソッドが必要）
-            # for message in messages:
-            #     await self.chat_message_repo.delete(message.id)
-            # 現在のBaseRepositoryにはバルク削除がないため、一旦メッセージを非アクティブにするか、
-            # 新しいセッションIDを発行して古いセッションを非アクティブにするロジックを検討。
-            # ここでは簡単のため、新しいセッションを作成する形を取る。
+            # 4. 保存が成功した場合のみ、短期記憶（Ephemeral RAGのベクトル）を一括削除
+            if self.rag_service:
+                await self.rag_service.purge_ephemeral_session(session_id)
+
+            # 保存が成功した場合のみ、短期記憶（チャットメッセージ）をクリア
+            # メッセージを物理削除する場合は1回のDELETE文で行える:
+            #     await self.chat_message_repo.bulk_delete_where(ChatMessage.session_id == session_id)
+            # ここでは履歴を監査用に残すため、新しいセッションを作成して古いセッションを非アクティブにする。
             
             # 古いセッションを非アクティブ化
             await self.chat_session_repo.update(session, {"is_active": False})
@@ -1,8 +1,10 @@
-from typing import AsyncGenerator, List
+from typing import AsyncGenerator, List, Optional
 from uuid import UUID
+from app.core.config import settings
 from app.llm.mock_llm import MockLLMClient
 from app.services.answer_composer import AnswerComposerService
 from app.services.rag_service import RagService
+from app.services.history_service import ConversationHistoryService, split_within_budget
 from app.models.chat import ChatMessage # ChatMessageモデルをインポート
 import json
 
@@ -13,61 +15,119 @@ class DomOrchestratorService:
     LLM応答をIC-5ライト形式に整形してストリーミングします。
     Agentic Researchモードをサポートします。
     """
-    def __init__(self, llm_client: MockLLMClient, answer_composer: AnswerComposerService, rag_service: RagService):
+    def __init__(
+        self,
+        llm_client: MockLLMClient,
+        answer_composer: AnswerComposerService,
+        rag_service: RagService,
+        history_service: Optional[ConversationHistoryService] = None
+    ):
         self.llm_client = llm_client
         self.answer_composer = answer_composer
         self.rag_service = rag_service
+        self.history_service = history_service
 
     async def process_chat_message(self, user_message: str, session_id: str, is_research_mode: bool = False) -> AsyncGenerator[str, None]:
         """
         ユーザーからのチャットメッセージを処理し、アシスタントの応答をIC-5ライト形式に整形して
         トークンごとにストリーミングします。
-        is_research_modeがTrueの場合、RAGサービスを呼び出してコンテキストを強化します。
+        is_research_modeがTrueの場合、RAGサービスで関連するチャンクを検索してプロンプトに含めます。
+        回答の生成はこのメソッドのLLM呼び出し1回だけで行い、ストリーミングします。
+        会話履歴の無い最初の質問は、近い質問の回答を回答キャッシュから返し、生成した回答をキャッシュに保存します
+        （履歴に依存する質問は、同じ文面でも回答が変わるためキャッシュを使いません）。
         """
+        # トークン予算内の直近の会話履歴をプロンプトに含める
+        history = ""
+        if self.history_service:
+            history = (await self.history_service.build_context(UUID(session_id))).render()
+
         augmented_prompt = user_message
+        cache_lookup = None
 
         if is_research_mode:
-            # RAGサービスを呼び出して関連情報を取得
-            retrieved_context = await self.rag_service.query_rag(user_message, session_id=UUID(session_id))
-            if retrieved_context and retrieved_context != "分かりません":
-                augmented_prompt = f"ユーザーの質問: {user_message}\n\n関連情報: {retrieved_context}\n\nこの情報に基づいて質問に答えてください。"
+            if not history:
+                cache_lookup = await self.rag_service.lookup_cached_answer(user_message, session_id=UUID(session_id))
+                if cache_lookup is not None and cache_lookup.answer is not None:
+                    async for chunk in self.answer_composer.stream_composed_ic5_light_response(self._replay(cache_lookup.answer)):
+                        yield chunk
+                    return
+
+            # 検索のみを行い、取得したチャンクを関連情報としてプロンプトに含める（キャッシュの確認で解決したセッションと埋め込みを再利用）
+            retrieved_context = await self.rag_service.retrieve_context(
+                user_message, session_id=UUID(session_id), cache_lookup=cache_lookup
+            )
+            if retrieved_context:
+                augmented_prompt = (
+                    f"ユーザーの質問: {user_message}\n\n関連情報: {retrieved_context}\n\n"
+                    "この情報に基づいて質問に答えてください。関連情報から分からない場合は「分かりません」と答えてください。"
+                )
             else:
+                # 関連情報なしの回答はキャッシュしない
+                cache_lookup = None
                 yield "**Warning**: No relevant information found for research mode. Proceeding without RAG context.\n\n"
-        
-        full_llm_output = ""
-        async for token in self.llm_client.stream_chat_response(augmented_prompt):
+
+        if history:
+            augmented_prompt = f"{history}\n\n{augmented_prompt}"
+
+        # LLMトークンをIC-5ライト形式に逐次整形し、セクションが確定した部分から順にストリーム
+        # （全トークンを待たずに最初の見出しを返せるため、初回バイトまでの時間が短縮される）
+        answer_tokens: List[str] = []
+        token_stream = self._stream_llm_tokens(augmented_prompt, collected=answer_tokens)
+        async for chunk in self.answer_composer.stream_composed_ic5_light_response(token_stream):
+            yield chunk
+
+        # 最後までストリームできた回答だけを保存する（途中で切断された場合はここに到達しない）
+        if cache_lookup is not None:
+            self.rag_service.store_answer(cache_lookup, "".join(answer_tokens).strip())
+
+    async def _replay(self, text: str) -> AsyncGenerator[str, None]:
+        """
+        キャッシュした回答を、LLMのトークンストリームと同じ形で返します。
+        """
+        yield text
+
+    async def _stream_llm_tokens(self, prompt: str, collected: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
+        """
+        LLMクライアントのトークンストリームを、終了トークン "[END]" の手前まで返します。
+        collected を指定した場合は、返したトークンをそのリストにも追加します。
+        """
+        async for token in self.llm_client.stream_chat_response(prompt):
             if token == "[END]":
                 break
-            full_llm_output += token
-        
-        # LLMの生出力をIC-5ライト形式に整形
-        composed_response = await self.answer_composer.compose_ic5_light_response(full_llm_output.strip())
-
-        # 整形された応答をMarkdown形式でストリーム
-        if composed_response["Decision"]:
-            yield f"**Decision**\n{composed_response['Decision']}\n\n"
-        if composed_response["Why"]:
-            yield f"**Why**\n{composed_response['Why']}\n\n"
-        if composed_response["Next 3 Actions"]:
-            yield f"**Next 3 Actions**\n{composed_response['Next 3 Actions']}\n\n"
+            if collected is not None:
+                collected.append(token)
+            yield token
 
     async def summarize_chat_history(self, messages: List[ChatMessage]) -> str:
         """
         チャット履歴のリストを受け取り、LLMクライアントを使用して要約を生成します。
+        プロンプトが肥大化しないよう、履歴を CHAT_SUMMARY_MAX_TOKENS に収まる区間に分けて区間ごとに要約し、
+        区間が複数ある場合は部分要約をまとめて最終的な要約にします（古いメッセージも要約に含まれます）。
         """
         if not messages:
             return "No chat history to summarize."
 
-        history_text = "\n".join([f"{msg.role}: {msg.content}" for msg in messages])
-        summary_prompt = f"以下のチャット履歴を要約してください。\n\n{history_text}\n\n要約:"
-        
-        # LLMクライアントから直接要約を取得 (ストリーミングではなく完了を待つ)
-        # MockLLMClientにはstream_chat_responseしかないため、ここではその出力を収集する
-        full_summary_response = ""
-        async for token in self.llm_client.stream_chat_response(summary_prompt):
-            if token == "[END]":
-                break
-            full_summary_response += token
-        
+        chunks = split_within_budget(messages, settings.CHAT_SUMMARY_MAX_TOKENS)
+        partial_summaries = []
+        for chunk in chunks:
+            history_text = "\n".join([f"{msg.role}: {msg.content}" for msg in chunk])
+            partial_summaries.append(await self._complete(f"以下のチャット履歴を要約してください。\n\n{history_text}\n\n要約:"))
+        if len(partial_summaries) == 1:
+            return partial_summaries[0]
+
+        summaries_text = "\n\n".join(f"({i}) {summary}" for i, summary in enumerate(partial_summaries, start=1))
+        return await self._complete(
+            f"以下はチャット履歴を古い順に区切って作成した部分要約です。ひとつの要約にまとめてください。\n\n{summaries_text}\n\n要約:"
+        )
+
+    async def _complete(self, prompt: str) -> str:
+        """
+        LLMクライアントから直接応答を取得します（ストリーミングではなく完了を待つ）。
+        MockLLMClientにはstream_chat_responseしかないため、ここではその出力を収集します。
+        """
+        full_response = ""
+        async for token in self._stream_llm_tokens(prompt):
+            full_response += token
+
         # ここで、LLMの応答がIC-5ライト形式でない可能性もあるため、生の応答を返す
-        return full_summary_response.strip()
+        return full_response.strip()
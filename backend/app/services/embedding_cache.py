@@ -0,0 +1,161 @@
+import hashlib
+import logging
+from array import array
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.cache import TTLCache, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# 文書用とクエリ用でベクトルが異なるモデルがあるため（Geminiの task_type など）、キーで区別する
+_KIND_DOCUMENT = "document"
+_KIND_QUERY = "query"
+
+
+def text_digest(text: str) -> str:
+    """テキストのSHA-256ダイジェストを返します（キャッシュキーに本文を含めないため）。"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    埋め込みベクトルを (モデル名, テキストのSHA-256) をキーにキャッシュする Embeddings。
+
+    - L1: プロセス内のTTLCache（LRU、件数上限付き）。ベクトルは array('d') で保持してメモリを抑えます。
+    - L2: Redis（use_redis=True の場合のみ。ワーカー/レプリカ間で共有）。
+    - aembed_documents は、L1 → L2（MGETで一括）の順に引き、残りの重複を除いたテキストだけを
+      まとめて埋め込みモデルに渡し、結果を両方の層に書き戻します。
+    - Redisの障害時はログを出してL1のみで動作し、埋め込み処理自体は失敗させません。
+    同じ定型文や再アップロードされた文書のチャンク、繰り返される質問の埋め込みをAPIに送らずに済みます。
+    """
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        max_entries: int = 10000,
+        ttl_seconds: float = 604800,
+        use_redis: bool = False,
+        namespace: str = "embedding",
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.use_redis = use_redis
+        self.namespace = namespace
+        self._local: TTLCache[array] = TTLCache(max_entries, ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        return f"{self.namespace}:{self.model}:{kind}:{text_digest(text)}"
+
+    # --- 同期API（L1のみ） ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(_KIND_DOCUMENT, text) for text in texts]
+        found = self._get_local(keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            found.update(self._store_local(list(missing.keys()), vectors))
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(_KIND_QUERY, text)
+        vector = self._local.get(key)
+        if vector is not None:
+            self.hits += 1
+            return list(vector)
+        self.misses += 1
+        return list(self._store_local([key], [self.embeddings.embed_query(text)])[key])
+
+    # --- 非同期API（L1 → L2 → 埋め込みモデル） ---
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        keys = [self._key(_KIND_DOCUMENT, text) for text in texts]
+        found = self._get_local(keys)
+        found.update(await self._get_redis([key for key in dict.fromkeys(keys) if key not in found]))
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            stored = self._store_local(list(missing.keys()), vectors)
+            await self._set_redis(stored)
+            found.update(stored)
+        return [list(found[key]) for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(_KIND_QUERY, text)
+        vector = self._local.get(key)
+        if vector is None:
+            vector = (await self._get_redis([key])).get(key)
+            if vector is not None:
+                self._local.set(key, vector)
+        if vector is not None:
+            self.hits += 1
+            return list(vector)
+        self.misses += 1
+        stored = self._store_local([key], [await self.embeddings.aembed_query(text)])
+        await self._set_redis(stored)
+        return list(stored[key])
+
+    # --- 内部処理 ---
+
+    def _get_local(self, keys: List[str]) -> Dict[str, array]:
+        found: Dict[str, array] = {}
+        for key in keys:
+            vector = self._local.get(key)
+            if vector is not None:
+                found[key] = vector
+        return found
+
+    def _missing(self, texts: List[str], keys: List[str], found: Dict[str, array]) -> Dict[str, str]:
+        """キャッシュに無いテキストを、重複を除いてキー → テキストの辞書で返します。"""
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        return missing
+
+    def _store_local(self, keys: List[str], vectors: List[List[float]]) -> Dict[str, array]:
+        stored = {key: array("d", vector) for key, vector in zip(keys, vectors)}
+        for key, vector in stored.items():
+            self._local.set(key, vector)
+        return stored
+
+    async def _get_redis(self, keys: List[str]) -> Dict[str, array]:
+        if not self.use_redis or not keys:
+            return {}
+        try:
+            values = await get_redis_client().mget(keys)
+        except Exception as e:
+            logger.warning(f"Embedding cache redis lookup failed: {e}")
+            return {}
+        found: Dict[str, array] = {}
+        for key, raw in zip(keys, values):
+            if raw is not None:
+                vector = array("d")
+                vector.frombytes(raw)
+                found[key] = vector
+                self._local.set(key, vector)
+        return found
+
+    async def _set_redis(self, stored: Dict[str, array]):
+        if not self.use_redis or not stored:
+            return
+        try:
+            pipeline = get_redis_client().pipeline(transaction=False)
+            for key, vector in stored.items():
+                pipeline.set(key, vector.tobytes(), ex=max(int(self.ttl_seconds), 1))
+            await pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Embedding cache redis store failed: {e}")
+
+    def clear(self):
+        """プロセス内のキャッシュを破棄します（Redis層は各エントリのTTLで失効）。"""
+        self._local.clear()
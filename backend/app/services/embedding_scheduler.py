@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# レート制限を表す例外のクラス名（google.api_core / openai / httpx などの代表的なもの）
+_RATE_LIMIT_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """埋め込みAPIのレート制限（HTTP 429 / クォータ超過）による例外かどうかを判定します。"""
+    if type(exc).__name__ in _RATE_LIMIT_ERROR_NAMES:
+        return True
+    for attr in ("status_code", "code"):
+        if getattr(exc, attr, None) == 429:
+            return True
+    message = str(exc).lower()
+    return "429" in message or "rate limit" in message or "resource exhausted" in message
+
+
+def jittered_backoff_seconds(attempt: int, base_seconds: float, max_seconds: float) -> float:
+    """
+    attempt 回目の再試行までの待機秒数を返します。
+    指数バックオフの値の半分を固定、残り半分をランダムにし、複数ワーカーの再試行が同時に集中しないようにします。
+    """
+    delay = min(base_seconds * (2 ** max(attempt - 1, 0)), max_seconds)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class EmbeddingMetrics:
+    """
+    埋め込みバッチスケジューラーの処理量を集計するクラス。
+    複数のイベントループ（スレッド）から更新される可能性があるため、ロックで保護します。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests_total = 0
+            self.texts_total = 0
+            self.batches_total = 0
+            self.retries_total = 0
+            self.rate_limited_total = 0
+            self.failed_batches_total = 0
+            self.embed_seconds_total = 0.0
+            self.max_batch_size = 0
+
+    def increment(self, counter: str, value: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def observe_batch(self, size: int, seconds: float):
+        """成功したバッチのテキスト数と、API呼び出しにかかった時間を記録します。"""
+        with self._lock:
+            self.batches_total += 1
+            self.texts_total += size
+            self.embed_seconds_total += seconds
+            self.max_batch_size = max(self.max_batch_size, size)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """累計値と、平均バッチサイズ・スループット（テキスト/秒）を辞書で返します。"""
+        with self._lock:
+            return {
+                "requests_total": self.requests_total,
+                "texts_total": self.texts_total,
+                "batches_total": self.batches_total,
+                "retries_total": self.retries_total,
+                "rate_limited_total": self.rate_limited_total,
+                "failed_batches_total": self.failed_batches_total,
+                "max_batch_size": self.max_batch_size,
+                "avg_batch_size": round(self.texts_total / self.batches_total, 3) if self.batches_total else 0.0,
+                "embed_seconds_total": round(self.embed_seconds_total, 3),
+                "texts_per_second": (
+                    round(self.texts_total / self.embed_seconds_total, 3) if self.embed_seconds_total else 0.0
+                ),
+            }
+
+
+# アプリ共通の埋め込みメトリクス
+embedding_metrics = EmbeddingMetrics()
+
+
+class _EmbedRequest:
+    """1回の aembed_documents 呼び出し。複数のバッチにまたがって埋め込まれる場合があります。"""
+    def __init__(self, texts: List[str], future: "asyncio.Future[List[List[float]]]"):
+        self.texts = texts
+        self.vectors: List[Optional[List[float]]] = [None] * len(texts)
+        self.remaining = len(texts)
+        self.future = future
+        self.offset = 0 # まだバッチに割り当てていない先頭のテキストの位置
+
+
+class EmbeddingBatchScheduler(Embeddings):
+    """
+    埋め込みモデルの前段で、同時に実行中の取り込みからのテキストを束ねてAPIを呼び出すスケジューラー。
+
+    - aembed_documents の呼び出しはキューに積まれ、max_wait_seconds の間に届いた他の呼び出しのテキストと
+      合わせて max_batch_size 件ずつのバッチにまとめます（上限に達した場合は待たずに送信します）。
+    - 同時に実行するバッチは max_concurrent_batches 件までです。
+    - レート制限で失敗したバッチは、ジッター付きの指数バックオフで max_retries 回まで再試行します。
+      それ以外のエラーや再試行の上限に達した場合は、バッチに含まれる呼び出しすべてに例外を返します。
+    - 呼び出し側がキャンセルした場合、未送信のテキストはバッチに含めません。
+    - 検索クエリの埋め込み（embed_query）は応答時間を優先し、束ねずにそのまま呼び出します。
+    Embeddings を実装しているため、PGVector にそのまま渡せます。
+    """
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 100,
+        max_wait_seconds: float = 0.02,
+        max_concurrent_batches: int = 4,
+        max_retries: int = 5,
+        retry_backoff_seconds: float = 1.0,
+        retry_backoff_max_seconds: float = 30.0,
+        metrics: EmbeddingMetrics = embedding_metrics,
+    ):
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive.")
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_concurrent_batches = max_concurrent_batches
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.retry_backoff_max_seconds = retry_backoff_max_seconds
+        self.metrics = metrics
+        self._pending: Deque[_EmbedRequest] = deque()
+        self._pending_texts = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._batch_tasks: set = set()
+
+    # --- 同期API（束ねずに max_batch_size 件ずつ呼び出す） ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.max_batch_size):
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + self.max_batch_size]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+    # --- 非同期API（束ねて呼び出す） ---
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        self._bind_loop()
+        request = _EmbedRequest(list(texts), asyncio.get_running_loop().create_future())
+        self._pending.append(request)
+        self._pending_texts += len(texts)
+        self.metrics.increment("requests_total")
+        if self._pending_texts >= self.max_batch_size:
+            self._batch_full.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        return await request.future
+
+    def _bind_loop(self):
+        """イベントループごとに待機用のオブジェクトを作り直します（テストなどでループが変わる場合）。"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending.clear()
+            self._pending_texts = 0
+            self._batch_full = asyncio.Event()
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+            self._dispatcher = None
+            self._batch_tasks = set()
+
+    async def _dispatch(self):
+        """キューにテキストが残っている間、バッチを作って送信し続けます。"""
+        while self._pending:
+            if self._pending_texts < self.max_batch_size:
+                # 他の呼び出しのテキストが届くのを少し待つ（上限に達したら即座に送信）
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.max_wait_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            await self._semaphore.acquire()
+            batch = self._take_batch()
+            if not batch:
+                self._semaphore.release()
+                continue
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    def _take_batch(self) -> List[Tuple[_EmbedRequest, int, int]]:
+        """キューの先頭から最大 max_batch_size 件のテキストを取り出します。"""
+        batch: List[Tuple[_EmbedRequest, int, int]] = []
+        size = 0
+        while self._pending and size < self.max_batch_size:
+            request = self._pending[0]
+            if request.future.done():
+                # キャンセルされた呼び出しの未送信分は捨てる
+                self._pending.popleft()
+                self._pending_texts -= len(request.texts) - request.offset
+                continue
+            end = min(len(request.texts), request.offset + self.max_batch_size - size)
+            batch.append((request, request.offset, end))
+            size += end - request.offset
+            self._pending_texts -= end - request.offset
+            request.offset = end
+            if end == len(request.texts):
+                self._pending.popleft()
+        if self._pending_texts < self.max_batch_size:
+            self._batch_full.clear()
+        return batch
+
+    async def _run_batch(self, batch: List[Tuple[_EmbedRequest, int, int]]):
+        try:
+            texts = [text for request, start, end in batch for text in request.texts[start:end]]
+            try:
+                vectors = await self._embed_with_retry(texts)
+            except Exception as exc:
+                self.metrics.increment("failed_batches_total")
+                for request, _, _ in batch:
+                    if not request.future.done():
+                        request.future.set_exception(exc)
+                return
+            position = 0
+            for request, start, end in batch:
+                request.vectors[start:end] = vectors[position:position + end - start]
+                position += end - start
+                request.remaining -= end - start
+                if request.remaining == 0 and not request.future.done():
+                    request.future.set_result(request.vectors)
+        finally:
+            self._semaphore.release()
+
+    async def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            started_at = time.perf_counter()
+            try:
+                vectors = await self.embeddings.aembed_documents(texts)
+            except Exception as exc:
+                if not is_rate_limit_error(exc):
+                    raise
+                self.metrics.increment("rate_limited_total")
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = jittered_backoff_seconds(attempt, self.retry_backoff_seconds, self.retry_backoff_max_seconds)
+                logger.warning(f"Embedding batch of {len(texts)} texts was rate limited; retrying in {delay:.2f}s")
+                self.metrics.increment("retries_total")
+                await asyncio.sleep(delay)
+                continue
+            self.metrics.observe_batch(len(texts), time.perf_counter() - started_at)
+            return vectors
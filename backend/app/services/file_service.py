@@ -1,7 +1,10 @@
+import asyncio
+import hashlib
 import os
+from dataclasses import dataclass
 from pathlib import Path
-from typing import BinaryIO, Optional
-from uuid import UUID
+from typing import AsyncIterator, BinaryIO, Optional
+from uuid import UUID, uuid4
 import mimetypes
 
 from fastapi import UploadFile, HTTPException, status
@@ -9,27 +12,45 @@ from langchain_core.documents import Document
 
 from app.core.config import settings
 from app.models.knowledge import KnowledgeDocument # KnowledgeDocument modelをインポート
+from app.services.text_extraction import PAGED_FILE_EXTENSIONS, extraction_pool
+
+# PDF / DOCX / XLSX / PPTX のテキスト抽出
+# 解析はCPUバウンドのため、イベントループを止めないよう抽出用プロセスプールでページ単位に実行する
+async def _extract_text_by_pages(file_path: Path, file_extension: str) -> str:
+    return "\n\n".join([page async for page in extraction_pool.iter_pages(file_path, file_extension)])
 
-# テキスト抽出のモック/プレースホルダー
 async def extract_text_from_pdf(file_path: Path) -> str:
-    # PDF抽出ライブラリ (例: pypdf, pdfminer.six) を使用する
-    # PoCではダミーを返す
-    return f"Extracted text from PDF: {file_path.name}. (Placeholder content)"
+    return await _extract_text_by_pages(file_path, "pdf")
 
 async def extract_text_from_docx(file_path: Path) -> str:
-    # DOCX抽出ライブラリ (例: python-docx) を使用する
-    # PoCではダミーを返す
-    return f"Extracted text from DOCX: {file_path.name}. (Placeholder content)"
+    return await _extract_text_by_pages(file_path, "docx")
 
 async def extract_text_from_xlsx(file_path: Path) -> str:
-    # XLSX抽出ライブラリ (例: openpyxl) を使用する
-    # PoCではダミーを返す
-    return f"Extracted text from XLSX: {file_path.name}. (Placeholder content)"
+    return await _extract_text_by_pages(file_path, "xlsx")
 
 async def extract_text_from_pptx(file_path: Path) -> str:
-    # PPTX抽出ライブラリ (例: python-pptx) を使用する
-    # PoCではダミーを返す
-    return f"Extracted text from PPTX: {file_path.name}. (Placeholder content)"
+    return await _extract_text_by_pages(file_path, "pptx")
+
+
+# アップロードを読み書きする単位（1MB）
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# テキストファイルを少しずつ読み込む単位（文字数）
+TEXT_READ_CHUNK_CHARS = 64 * 1024
+
+
+@dataclass
+class StoredFile:
+    """ストレージに書き込んだアップロードファイルの情報。"""
+    path: Path
+    size_bytes: int
+    sha256: str
+
+
+def _write_chunk(buffer: BinaryIO, digest, chunk: bytes):
+    # hashlib は大きなデータの処理中にGILを解放するため、書き込みと合わせてスレッドで実行する
+    digest.update(chunk)
+    buffer.write(chunk)
 
 
 class FileService:
@@ -43,20 +64,21 @@ class FileService:
     async def _get_file_extension(self, filename: str) -> Optional[str]:
         return Path(filename).suffix.lstrip('.').lower()
 
-    async def validate_file(self, file: UploadFile):
+    @staticmethod
+    def _file_too_large() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size exceeds the limit of {settings.MAX_FILE_SIZE_MB}MB."
+        )
+
+    async def validate_file(self, file: UploadFile) -> str:
         """
-        ファイルのサイズと拡張子をバリデーションします。
+        ファイルの拡張子をバリデーションし、拡張子を返します。
+        サイズは書き込み時に逐次チェックしますが、サイズが分かっている場合はここで先に拒否します。
         """
-        file.file.seek(0, os.SEEK_END)
-        file_size = file.file.tell()
-        file.file.seek(0) # ファイルポインタを先頭に戻す
+        if file.size is not None and file.size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+            raise self._file_too_large()
 
-        if file_size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File size exceeds the limit of {settings.MAX_FILE_SIZE_MB}MB."
-            )
-        
         file_extension = await self._get_file_extension(file.filename)
         if file_extension not in settings.ALLOWED_FILE_EXTENSIONS:
             raise HTTPException(
@@ -64,26 +86,57 @@ class FileService:
                 detail=f"File type '{file_extension}' not allowed. Allowed types are: {', '.join(settings.ALLOWED_FILE_EXTENSIONS)}"
             )
         
-        return file_size, file_extension
+        return file_extension
+
+    async def store_upload(self, file: UploadFile, file_path: Path) -> StoredFile:
+        """
+        アップロードを1回の読み込みで保存しつつ、サイズの上限チェックとSHA-256の計算を行います。
+        ファイルI/Oはスレッドで実行するため、大きなファイルでもイベントループを止めません。
+        上限を超えた時点で中断し、書きかけのファイルは削除します。
+        """
+        max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+        digest = hashlib.sha256()
+        size_bytes = 0
+        buffer = await asyncio.to_thread(open, file_path, "wb")
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size_bytes += len(chunk)
+                if size_bytes > max_bytes:
+                    raise self._file_too_large()
+                await asyncio.to_thread(_write_chunk, buffer, digest, chunk)
+        except BaseException:
+            await asyncio.to_thread(buffer.close)
+            await asyncio.to_thread(file_path.unlink, True)
+            raise
+        await asyncio.to_thread(buffer.close)
+        return StoredFile(path=file_path, size_bytes=size_bytes, sha256=digest.hexdigest())
 
     async def save_file(self, file: UploadFile, tenant_id: UUID, user_id: UUID) -> KnowledgeDocument:
         """
         アップロードされたファイルを保存し、KnowledgeDocumentメタデータを返します。
+        ファイルは内容のSHA-256をファイル名とするパス（<テナント>/<sha256>.<拡張子>）に保存するため、
+        同じ内容のファイルはテナント内で1つの実体を共有します。
         """
-        file_size, file_extension = await self.validate_file(file)
+        file_extension = await self.validate_file(file)
 
-        # テナントとユーザーごとにサブディレクトリを作成し、ファイル名をUUIDで保存
+        # テナントごとにサブディレクトリを作成し、一時ファイルに書き込んでからハッシュ名に移動する
         tenant_dir = self.upload_dir / str(tenant_id)
-        tenant_dir.mkdir(parents=True, exist_ok=True)
-        
-        unique_filename = f"{uuid4()}.{file_extension}"
-        file_path = tenant_dir / unique_filename
+        await asyncio.to_thread(tenant_dir.mkdir, parents=True, exist_ok=True)
+
+        temp_path = tenant_dir / f".{uuid4()}.part"
 
         try:
-            with open(file_path, "wb") as buffer:
-                while chunk := await file.read(1024 * 1024): # 1MBずつ読み込み
-                    buffer.write(chunk)
+            stored = await self.store_upload(file, temp_path)
+            file_path = tenant_dir / f"{stored.sha256}.{file_extension}"
+            if await asyncio.to_thread(file_path.exists):
+                # 同じ内容のファイルが保存済みのため、今回の書き込みは破棄する
+                await asyncio.to_thread(temp_path.unlink, True)
+            else:
+                await asyncio.to_thread(os.replace, temp_path, file_path)
+        except HTTPException:
+            raise
         except Exception as e:
+            await asyncio.to_thread(temp_path.unlink, True)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not save file: {e}")
 
         mime_type = mimetypes.guess_type(file.filename)[0]
@@ -95,9 +148,11 @@ class FileService:
             file_name=file.filename,
             file_path=str(file_path),
             file_type=mime_type if mime_type else f"application/{file_extension}",
-            file_size=str(file_size), # バイト数を文字列として保存
+            file_size=str(stored.size_bytes), # バイト数を文字列として保存
             uploaded_by_user_id=user_id,
-            is_active=True
+            is_active=True,
+            content_hash=stored.sha256,
+            is_global_indexed=False
         )
         return knowledge_doc
 
@@ -117,10 +172,37 @@ class FileService:
         elif file_extension == "pptx":
             return await extract_text_from_pptx(file_path)
         elif file_extension in ["txt", "md"]:
-            return file_path.read_text(encoding='utf-8')
+            return await asyncio.to_thread(file_path.read_text, encoding='utf-8')
         else:
             return "" # 未対応のファイル形式
 
+    async def iter_text_from_knowledge_document(self, knowledge_doc: KnowledgeDocument) -> AsyncIterator[str]:
+        """
+        KnowledgeDocumentのテキストを先頭から少しずつ返します。
+        テキスト形式（txt / md）は TEXT_READ_CHUNK_CHARS 文字ずつ読み込み、PDF / DOCX / XLSX / PPTX は
+        子プロセスで解析できたページから順に返すため、大きなファイルでもテキスト全体を保持しません。
+        """
+        file_path = Path(knowledge_doc.file_path)
+        file_extension = await self._get_file_extension(file_path.name)
+
+        if file_extension in PAGED_FILE_EXTENSIONS:
+            is_first_page = True
+            async for page in extraction_pool.iter_pages(file_path, file_extension):
+                if not is_first_page:
+                    yield "\n\n" # extract_text_from_knowledge_document と同じくページ間を空行で区切る
+                is_first_page = False
+                yield page
+            return
+        if file_extension not in ["txt", "md"]:
+            return # 未対応のファイル形式
+
+        reader = await asyncio.to_thread(open, file_path, "r", encoding="utf-8")
+        try:
+            while text := await asyncio.to_thread(reader.read, TEXT_READ_CHUNK_CHARS):
+                yield text
+        finally:
+            await asyncio.to_thread(reader.close)
+
     async def delete_file_from_storage(self, file_path: Path):
         """
         指定されたパスのファイルをストレージから削除します。
@@ -0,0 +1,136 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+from uuid import UUID
+
+from app.core.tokens import estimate_tokens
+from app.models.chat import ChatMessage
+from app.repositories.chat import ChatMessageRepository
+from app.repositories.memory import EpisodicMemoryRepository
+
+# メッセージごとの区切り（"role: " と改行）に相当するトークン数
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_token_count(message: ChatMessage) -> int:
+    """
+    メッセージのトークン数（区切りを含む）を返します。
+    保存時に計算した token_count があればそれを使い、無い場合（列の追加前に保存されたメッセージ）は計算します。
+    読み取り時に計算した値は保存しません。
+    """
+    content_tokens = message.token_count if message.token_count is not None else estimate_tokens(message.content)
+    return content_tokens + _MESSAGE_OVERHEAD_TOKENS
+
+
+def split_within_budget(messages: Sequence[ChatMessage], max_tokens: int) -> List[List[ChatMessage]]:
+    """
+    古い順のメッセージを、それぞれの合計トークン数が max_tokens 以内に収まる連続した区間に分割します。
+    1件で予算を超えるメッセージは、単独の区間にします。
+    """
+    chunks: List[List[ChatMessage]] = []
+    current: List[ChatMessage] = []
+    used = 0
+    for message in messages:
+        tokens = message_token_count(message)
+        if current and used + tokens > max_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(message)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@dataclass
+class ConversationContext:
+    """プロンプトに含める会話履歴（古い順）と、予算に収まらなかった古いターンの代わりに含める要約。"""
+    messages: List[ChatMessage] = field(default_factory=list)
+    summary: Optional[str] = None
+    token_count: int = 0
+    truncated: bool = False
+
+    def render(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"これまでの会話の要約:\n{self.summary}")
+        if self.messages:
+            parts.append("会話履歴:\n" + "\n".join(f"{m.role}: {m.content}" for m in self.messages))
+        return "\n\n".join(parts)
+
+
+class ConversationHistoryService:
+    """
+    トークン予算内で直近の会話履歴を組み立てるサービス。
+
+    - 最新のメッセージ（応答対象の現在のターン）を除き、新しい順にページ単位で遡って予算まで詰めます。
+    - 予算に収まらない古いターンがある場合は、セッションの所有ユーザーの最新の EpisodicMemory の要約
+      （セッションのリセット時に保存）で置き換えます。要約の分も予算に含め、必要なら古いターンをさらに除きます。
+    - メッセージごとのトークン数は保存時に計算した token_count を使います（読み取り時には書き込みません）。
+    """
+    def __init__(
+        self,
+        chat_message_repo: ChatMessageRepository,
+        max_tokens: int,
+        page_size: int = 20,
+        episodic_memory_repo: Optional[EpisodicMemoryRepository] = None,
+    ):
+        self.chat_message_repo = chat_message_repo
+        self.max_tokens = max_tokens
+        self.page_size = page_size
+        self.episodic_memory_repo = episodic_memory_repo
+
+    async def build_context(self, session_id: UUID) -> ConversationContext:
+        """セッションの会話履歴を予算内で組み立てます。"""
+        context = ConversationContext()
+        budget = self.max_tokens
+        cursor = None
+        is_first_page = True
+
+        while not context.truncated:
+            page = await self.chat_message_repo.get_page(session_id, limit=self.page_size, before=cursor)
+            if not page:
+                break
+            has_older = len(page) == self.page_size
+            cursor = (page[0].created_at, page[0].id)
+            if is_first_page:
+                # 最新のメッセージは応答対象の現在のターンのため履歴に含めない
+                page = page[:-1]
+                is_first_page = False
+
+            for message in reversed(page):
+                tokens = message_token_count(message)
+                if tokens > budget:
+                    context.truncated = True
+                    break
+                context.messages.append(message)
+                context.token_count += tokens
+                budget -= tokens
+            if not has_older:
+                break
+        context.messages.reverse()
+        if context.truncated:
+            await self._add_summary(context, session_id)
+        return context
+
+    async def _add_summary(self, context: ConversationContext, session_id: UUID):
+        """予算に収まらなかった古いターンの代わりに、EpisodicMemory の要約を含めます。"""
+        if self.episodic_memory_repo is None:
+            return
+        memory = await self.episodic_memory_repo.get_latest_for_session_owner(session_id)
+        if memory is None or not memory.summary:
+            return
+        summary_tokens = estimate_tokens(memory.summary) + _MESSAGE_OVERHEAD_TOKENS
+        if summary_tokens > self.max_tokens:
+            return
+        # 要約が予算に収まるまで、残した履歴の古い側から除く
+        while context.messages and context.token_count + summary_tokens > self.max_tokens:
+            context.token_count -= message_token_count(context.messages.pop(0))
+        context.summary = memory.summary
+        context.token_count += summary_tokens
+
+    async def build_prompt(self, session_id: UUID, prompt: str) -> str:
+        """会話履歴をプロンプトの前に付加します。履歴が無い場合はプロンプトをそのまま返します。"""
+        history = (await self.build_context(session_id)).render()
+        if not history:
+            return prompt
+        return f"{history}\n\n{prompt}"
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import re
+from typing import Callable, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from sqlalchemy import JSON, case, column, or_, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.database import AsyncSessionLocal, get_sync_session_factory
+
+logger = logging.getLogger(__name__)
+
+# RRFの定数 k の既定値（Cormack et al. 2009 で使われている値）
+DEFAULT_RRF_K = 60
+
+# PGVectorのチャンクテーブル（langchain_postgres が管理）
+_embedding_table = table(
+    "langchain_pg_embedding", column("id"), column("collection_id"), column("document"), column("cmetadata", JSON)
+)
+_collection_table = table("langchain_pg_collection", column("uuid"), column("name"))
+
+# キーワードとして扱う文字列（英数字の語・製品コード / カタカナ語 / 漢字語）。ひらがなは助詞などが多いため除く
+_KEYWORD_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-_.]*[A-Za-z0-9]|[\u30A0-\u30FFー]{2,}|[\u4E00-\u9FFF々]{2,}")
+MAX_KEYWORDS = 8
+
+
+def extract_keywords(query: str) -> List[str]:
+    """
+    質問からキーワード検索に使う語を取り出します（出現順、重複なし、最大 MAX_KEYWORDS 語）。
+    日本語は分かち書きされないため、文字種の連続（カタカナ・漢字・英数字）を1語とみなします。
+    """
+    keywords = dict.fromkeys(match.group(0).lower() for match in _KEYWORD_PATTERN.finditer(query))
+    return list(keywords)[:MAX_KEYWORDS]
+
+
+def _like_pattern(keyword: str) -> str:
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def document_key(document: Document) -> str:
+    """ドキュメントを同一視するキー（id、無い場合は本文）を返します。"""
+    return document.id or document.page_content
+
+
+def chunk_key(document: Document) -> str:
+    """
+    別のコレクションに保存された同じチャンクを同一視するキーを返します。
+    取り込み時のメタデータ（document_id / chunk_index）があればそれを、無ければ document_key を使用します。
+    """
+    metadata = document.metadata or {}
+    if metadata.get("document_id") is not None:
+        return f"{metadata['document_id']}:{metadata.get('chunk_index')}"
+    return document_key(document)
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[List[Document]],
+    weights: Optional[Sequence[float]] = None,
+    k: int = DEFAULT_RRF_K,
+    key: Callable[[Document], str] = document_key,
+) -> List[Document]:
+    """
+    複数の検索結果を Reciprocal Rank Fusion で1つの順位に統合します。
+
+    各ドキュメントのスコアは Σ weight_i / (k + rank_i)（rank は1始まり）で、スコアの高い順に返します。
+    ドキュメントは key（既定は id、無い場合は本文）で同一視し、同点の場合は先に現れた順を保ちます。
+    """
+    weights = weights or [1.0] * len(result_lists)
+    if len(weights) != len(result_lists):
+        raise ValueError("weights must have the same length as result_lists.")
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, document in enumerate(results, 1):
+            document_id = key(document)
+            scores[document_id] = scores.get(document_id, 0.0) + weight / (k + rank)
+            documents.setdefault(document_id, document)
+    ranked = sorted(scores, key=lambda document_id: scores[document_id], reverse=True)
+    return [documents[document_id] for document_id in ranked]
+
+
+class PgKeywordRetriever(BaseRetriever):
+    """
+    PGVectorのコレクションに対して、質問に含まれるキーワード（製品コード・固有名詞など）を含むチャンクを
+    部分一致で検索するリトリーバー。多くのキーワードに一致したチャンクほど上位に返します。
+    """
+    collection_name: str
+    # メタデータの項目 → 許可する値のリスト（単一コレクション構成でのテナント・範囲の絞り込み）
+    metadata_filter: Optional[Dict[str, List[str]]] = None
+    k: int = 20
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal
+    # 同期インターフェース（invoke）で使うセッションファクトリ。未指定の場合は get_sync_session_factory() を使う
+    sync_session_factory: Optional[Callable[[], Session]] = None
+
+    def _statement(self, keywords: List[str]):
+        # 一致したキーワードの数（長い語ほど重く）でスコア付けする。
+        # ILIKE '%語%' は pg_trgm のGINインデックス（マイグレーション 006）で絞り込まれる
+        matches = [_embedding_table.c.document.ilike(_like_pattern(keyword), escape="\\") for keyword in keywords]
+        score = sum(case((match, len(keyword)), else_=0) for match, keyword in zip(matches, keywords))
+        return (
+            select(_embedding_table.c.id, _embedding_table.c.document, _embedding_table.c.cmetadata)
+            .select_from(_embedding_table.join(
+                _collection_table, _embedding_table.c.collection_id == _collection_table.c.uuid
+            ))
+            .where(_collection_table.c.name == self.collection_name, or_(*matches))
+            .where(*(
+                _embedding_table.c.cmetadata[field].as_string().in_(values)
+                for field, values in (self.metadata_filter or {}).items()
+            ))
+            .order_by(score.desc())
+            .limit(self.k)
+        )
+
+    @staticmethod
+    def _to_documents(rows) -> List[Document]:
+        return [Document(id=str(row.id), page_content=row.document, metadata=row.cmetadata or {}) for row in rows]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        keywords = extract_keywords(query)
+        if not keywords:
+            return []
+        session_factory = self.sync_session_factory or get_sync_session_factory()
+        with session_factory() as session:
+            rows = session.execute(self._statement(keywords)).all()
+        return self._to_documents(rows)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        keywords = extract_keywords(query)
+        if not keywords:
+            return []
+        async with self.session_factory() as session:
+            rows = (await session.execute(self._statement(keywords))).all()
+        return self._to_documents(rows)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    ベクトル検索（ANN）とキーワード検索を並行して実行し、RRFで統合した上位 k 件を返すリトリーバー。
+
+    製品コードや固有名詞を含む日本語の質問は、埋め込みの近さだけでは取りこぼしやすいため、
+    キーワード一致の結果を合わせて順位付けします。各検索は fetch_k 件ずつ取得し、
+    vector_weight / keyword_weight で重み付けします。
+    """
+    vector_retriever: BaseRetriever
+    keyword_retriever: BaseRetriever
+    k: int = 4
+    rrf_k: int = DEFAULT_RRF_K
+    vector_weight: float = 1.0
+    keyword_weight: float = 1.0
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        callbacks = run_manager.get_child()
+        vector_results = self.vector_retriever.invoke(query, config={"callbacks": callbacks})
+        keyword_results = self.keyword_retriever.invoke(query, config={"callbacks": callbacks})
+        return self._fuse(vector_results, keyword_results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        callbacks = run_manager.get_child()
+        vector_results, keyword_results = await asyncio.gather(
+            self.vector_retriever.ainvoke(query, config={"callbacks": callbacks}),
+            self.keyword_retriever.ainvoke(query, config={"callbacks": callbacks}),
+        )
+        return self._fuse(vector_results, keyword_results)
+
+    def _fuse(self, vector_results: List[Document], keyword_results: List[Document]) -> List[Document]:
+        fused = reciprocal_rank_fusion(
+            [vector_results, keyword_results],
+            weights=[self.vector_weight, self.keyword_weight],
+            k=self.rrf_k,
+        )
+        return fused[:self.k]
+
+
+class FanOutRetriever(BaseRetriever):
+    """
+    複数のコレクション（セッションのEphemeralとテナントのグローバルなど）を並行して検索し、
+    重複を除いて1つの順位に統合した上位 k 件を返すリトリーバー。
+
+    - 各検索は asyncio.gather で同時に実行するため、全体の待ち時間は最も遅い検索の時間になります。
+    - 各検索は timeout_seconds で打ち切り、失敗・タイムアウトした検索は除いて統合します
+      （すべての検索が失敗した場合は最初の例外を送出します）。
+    - 同じチャンクは chunk_key（document_id / chunk_index）で同一視し、RRFスコアの高い順に並べます。
+      ベクトル検索とハイブリッド検索でスコアの尺度が異なるため、順位に基づくRRFスコアで比較します。
+      同点の場合は先に指定したリトリーバーの結果を優先します。
+    """
+    retrievers: List[BaseRetriever]
+    k: int = 4
+    timeout_seconds: Optional[float] = None
+    rrf_k: int = DEFAULT_RRF_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        callbacks = run_manager.get_child()
+        return self._merge([retriever.invoke(query, config={"callbacks": callbacks}) for retriever in self.retrievers])
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        callbacks = run_manager.get_child()
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(retriever.ainvoke(query, config={"callbacks": callbacks}), self.timeout_seconds)
+                for retriever in self.retrievers
+            ),
+            return_exceptions=True,
+        )
+        succeeded = [result for result in results if not isinstance(result, BaseException)]
+        failures = [result for result in results if isinstance(result, BaseException)]
+        if failures and not succeeded:
+            raise failures[0]
+        for retriever, result in zip(self.retrievers, results):
+            if isinstance(result, BaseException):
+                # 一部の検索の失敗・タイムアウトでは回答を止めず、残りの結果で回答する
+                logger.warning(f"Retrieval source {type(retriever).__name__} skipped: {result!r}")
+        return self._merge(succeeded)
+
+    def _merge(self, result_lists: List[List[Document]]) -> List[Document]:
+        return reciprocal_rank_fusion(result_lists, k=self.rrf_k, key=chunk_key)[:self.k]
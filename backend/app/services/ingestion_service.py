@@ -0,0 +1,316 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, List, Optional, Set
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from langchain_core.documents import Document
+
+from app.core.cache import get_redis_client
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.llm.mock_llm import MockLLMClient
+from app.models.ingestion_job import (
+    INGESTION_JOB_FAILED,
+    INGESTION_JOB_QUEUED,
+    INGESTION_JOB_SUCCEEDED,
+)
+from app.models.knowledge import KnowledgeDocument
+from app.repositories.ingestion_job import IngestionJobRepository
+from app.repositories.knowledge import KnowledgeDocumentRepository
+from app.services.file_service import FileService
+from app.services.rag_service import RagService, rag_service_registry
+from app.services.text_chunker import TextChunk, TextChunker
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_id(knowledge_doc: KnowledgeDocument, chunk_index: int, session_id: Optional[UUID] = None) -> str:
+    """
+    チャンクのベクトルストア上のIDを (ドキュメントID, チャンク番号) から決定的に生成します。
+    ジョブの再実行では同じIDで上書き（upsert）されるため、途中まで登録済みのチャンクが重複しません。
+    langchain_pg_embedding のIDはコレクションをまたいで一意のため、Ephemeral RAGのチャンクはセッションIDも含めます。
+    """
+    key = f"{knowledge_doc.id}:{chunk_index}" if session_id is None else f"{knowledge_doc.id}:{session_id}:{chunk_index}"
+    return str(uuid5(NAMESPACE_URL, key))
+
+
+def to_lc_document(knowledge_doc: KnowledgeDocument, chunk: TextChunk, session_id: Optional[UUID]) -> Document:
+    """分割したチャンクをLangChainのDocument形式に変換します。"""
+    return Document(
+        id=chunk_id(knowledge_doc, chunk.index, session_id),
+        page_content=chunk.text,
+        metadata={
+            "document_id": str(knowledge_doc.id),
+            "tenant_id": str(knowledge_doc.tenant_id),
+            "file_name": knowledge_doc.file_name,
+            "file_type": knowledge_doc.file_type,
+            "uploaded_by": str(knowledge_doc.uploaded_by_user_id),
+            "session_id": str(session_id) if session_id else None, # エフェメラルRAGの場合にセッションIDを追加
+            **chunk.metadata(),
+        }
+    )
+
+
+def chunker_for(knowledge_doc: KnowledgeDocument) -> TextChunker:
+    """ドキュメントの形式に応じたチャンク分割器を返します（Markdownは見出し単位で区切る）。"""
+    markdown = settings.CHUNK_MARKDOWN_HEADINGS and Path(knowledge_doc.file_path).suffix.lower() == ".md"
+    return TextChunker(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        length_unit=settings.CHUNK_LENGTH_UNIT,
+        markdown=markdown,
+    )
+
+
+async def ingest_document(
+    file_service: FileService,
+    rag_service: RagService,
+    knowledge_doc: KnowledgeDocument,
+    session_id: Optional[UUID] = None,
+    batch_size: int = 64,
+) -> int:
+    """
+    ナレッジドキュメントのテキストをチャンクに分割し、ベクトルストアに登録して、登録したチャンク数を返します。
+    session_id が指定された場合はEphemeral RAG、指定されない場合はグローバルRAGに追加します。
+    テキストの読み込み・分割・登録を batch_size チャンクずつ進めるため、大きなファイルでもメモリ使用量は一定です。
+    チャンクのIDは決定的（chunk_id）なため、途中で失敗したジョブを再実行しても登録済みのチャンクは重複しません。
+    """
+    async def _add(documents: List[Document]):
+        if session_id:
+            await rag_service.add_documents_to_ephemeral_rag(session_id, documents)
+        else:
+            await rag_service.add_documents_to_global_rag(documents)
+
+    chunk_count = 0
+    batch: List[Document] = []
+    segments = file_service.iter_text_from_knowledge_document(knowledge_doc)
+    async for chunk in chunker_for(knowledge_doc).aiter_chunks(segments):
+        batch.append(to_lc_document(knowledge_doc, chunk, session_id))
+        chunk_count += 1
+        if len(batch) >= batch_size:
+            await _add(batch)
+            batch = []
+    if batch:
+        await _add(batch)
+    return chunk_count
+
+
+def retry_delay_seconds(attempts: int, base_seconds: float, max_seconds: float) -> float:
+    """attempts 回目の失敗後に待つ秒数（指数バックオフ、上限あり）を返します。"""
+    return min(base_seconds * (2 ** max(attempts - 1, 0)), max_seconds)
+
+
+def _default_rag_service_factory(tenant_id: UUID) -> RagService:
+    return rag_service_registry.get(tenant_id, MockLLMClient())
+
+
+class IngestionWorkerPool:
+    """
+    取り込みジョブ（t_ingestion_job）をバックグラウンドで実行するワーカープール。
+
+    - concurrency 個のワーカータスクがキューからジョブIDを取り出して実行します。
+      アップロードのリクエストは登録後すぐに返るため、処理量はリクエスト数ではなくワーカー数で決まります。
+    - use_redis=True の場合はRedisのリストをキューとして使い、複数プロセスのワーカーでジョブを分担します。
+    - ジョブの状態はDBが正であり、実行開始は条件付きUPDATE（claim）で行うため、
+      同じジョブIDがキューに重複して積まれても実行は1回です。
+    - 失敗したジョブは max_attempts 回まで指数バックオフで再実行します。
+    - 起動時に、待機中のジョブと停止したワーカーが実行中のまま残したジョブをキューに積み直します。
+    """
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        concurrency: int = 4,
+        use_redis: bool = False,
+        redis_key: str = "ingestion:jobs",
+        retry_backoff_seconds: float = 2.0,
+        retry_backoff_max_seconds: float = 300.0,
+        stale_job_seconds: float = 1800.0,
+        embed_batch_size: int = 64,
+        file_service_factory: Callable[[], FileService] = FileService,
+        rag_service_factory: Callable[[UUID], RagService] = _default_rag_service_factory,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.use_redis = use_redis
+        self.redis_key = redis_key
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.retry_backoff_max_seconds = retry_backoff_max_seconds
+        self.stale_job_seconds = stale_job_seconds
+        self.embed_batch_size = embed_batch_size
+        self.file_service_factory = file_service_factory
+        self.rag_service_factory = rag_service_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    def start(self):
+        """ワーカータスクを開始し、未完了のジョブをキューに積み直します。"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._track(asyncio.create_task(self.recover()))
+
+    async def stop(self):
+        """
+        ワーカータスクを終了します。
+        実行中だったジョブは待機中に戻すため、次回起動時（または他のプロセス）で再実行されます。
+        """
+        tasks = self._workers + list(self._background_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._background_tasks.clear()
+
+    def _track(self, task: asyncio.Task):
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def submit(self, job_id: UUID):
+        """
+        ジョブIDを実行キューに積みます。
+        キューへの投入に失敗しても、ジョブはDB上で待機中のまま残り、次回起動時に再投入されます。
+        """
+        if self.use_redis:
+            try:
+                await get_redis_client().rpush(self.redis_key, str(job_id))
+            except Exception as e:
+                logger.error(f"Failed to push ingestion job {job_id} to Redis: {e}")
+        elif self._queue is not None:
+            self._queue.put_nowait(job_id)
+
+    def _submit_later(self, job_id: UUID, delay_seconds: float):
+        async def _delayed():
+            await asyncio.sleep(delay_seconds)
+            await self.submit(job_id)
+        self._track(asyncio.create_task(_delayed()))
+
+    async def recover(self):
+        """待機中のジョブと、stale_job_seconds を超えて実行中のままのジョブをキューに積み直します。"""
+        now = datetime.now(timezone.utc)
+        try:
+            async with self.session_factory() as session:
+                repo = IngestionJobRepository(session)
+                requeued = await repo.requeue_stale(now - timedelta(seconds=self.stale_job_seconds))
+                if requeued:
+                    logger.warning(f"Requeued {requeued} stale ingestion jobs.")
+                jobs = await repo.get_queued()
+        except Exception as e:
+            logger.error(f"Failed to recover ingestion jobs: {e}")
+            return
+        for job in jobs:
+            delay = (_as_utc(job.next_attempt_at) - now).total_seconds() if job.next_attempt_at else 0
+            if delay > 0:
+                self._submit_later(job.id, delay)
+            else:
+                await self.submit(job.id)
+
+    async def _next_job_id(self) -> UUID:
+        if not self.use_redis:
+            return await self._queue.get()
+        while True:
+            try:
+                item = await get_redis_client().blpop([self.redis_key], timeout=1)
+            except Exception as e:
+                logger.error(f"Failed to pop ingestion job from Redis: {e}")
+                await asyncio.sleep(1)
+                continue
+            if item:
+                value = item[1]
+                return UUID(value.decode() if isinstance(value, bytes) else value)
+
+    async def _work(self):
+        while True:
+            job_id = await self._next_job_id()
+            try:
+                await self.run_job(job_id)
+            except Exception as e:
+                logger.error(f"Unexpected error while running ingestion job {job_id}: {e}")
+
+    async def run_job(self, job_id: UUID) -> bool:
+        """
+        ジョブを1回実行します。他のワーカーが実行中・完了済み・実行予定時刻前の場合は何もせず False を返します。
+        """
+        async with self.session_factory() as session:
+            repo = IngestionJobRepository(session)
+            if not await repo.claim(job_id, datetime.now(timezone.utc)):
+                return False
+            job = await repo.get(job_id)
+            try:
+                await self._ingest(session, job)
+            except asyncio.CancelledError:
+                # 停止時に中断したジョブは待機中に戻す（実行回数はそのまま）
+                await session.rollback()
+                await repo.bulk_update({"status": INGESTION_JOB_QUEUED}, repo.model.id == job_id)
+                raise
+            except Exception as e:
+                await session.rollback()
+                await self._record_failure(repo, job_id, e)
+                return True
+            await repo.update(job, {
+                "status": INGESTION_JOB_SUCCEEDED,
+                "last_error": None,
+                "finished_at": datetime.now(timezone.utc),
+            }, refresh=False)
+            return True
+
+    async def _ingest(self, session, job):
+        knowledge_repo = KnowledgeDocumentRepository(session, tenant_id=job.tenant_id)
+        knowledge_doc = await knowledge_repo.get(job.document_id)
+        if knowledge_doc is None:
+            raise ValueError(f"Knowledge document {job.document_id} not found.")
+        if job.session_id is None and knowledge_doc.is_global_indexed:
+            # 同じドキュメントの別ジョブでグローバルRAGへの登録が済んでいる
+            return
+        await ingest_document(
+            self.file_service_factory(),
+            self.rag_service_factory(job.tenant_id),
+            knowledge_doc,
+            job.session_id,
+            batch_size=self.embed_batch_size,
+        )
+        if job.session_id is None:
+            await knowledge_repo.update(knowledge_doc, {"is_global_indexed": True}, refresh=False)
+
+    async def _record_failure(self, repo: IngestionJobRepository, job_id: UUID, error: Exception):
+        job = await repo.get(job_id)
+        now = datetime.now(timezone.utc)
+        if job.attempts < job.max_attempts:
+            delay = retry_delay_seconds(job.attempts, self.retry_backoff_seconds, self.retry_backoff_max_seconds)
+            logger.warning(f"Ingestion job {job_id} failed (attempt {job.attempts}/{job.max_attempts}), retrying in {delay}s: {error}")
+            await repo.update(job, {
+                "status": INGESTION_JOB_QUEUED,
+                "last_error": str(error),
+                "next_attempt_at": now + timedelta(seconds=delay),
+            }, refresh=False)
+            self._submit_later(job_id, delay)
+        else:
+            logger.error(f"Ingestion job {job_id} failed after {job.attempts} attempts: {error}")
+            await repo.update(job, {
+                "status": INGESTION_JOB_FAILED,
+                "last_error": str(error),
+                "finished_at": now,
+            }, refresh=False)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLiteなどタイムゾーンを保持しないDBから読み込んだ値はUTCとみなす
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+# アプリ共通の取り込みワーカープール
+ingestion_worker_pool = IngestionWorkerPool(
+    concurrency=settings.INGESTION_WORKER_CONCURRENCY,
+    use_redis=settings.INGESTION_QUEUE_REDIS_ENABLED,
+    retry_backoff_seconds=settings.INGESTION_RETRY_BACKOFF_SECONDS,
+    retry_backoff_max_seconds=settings.INGESTION_RETRY_BACKOFF_MAX_SECONDS,
+    stale_job_seconds=settings.INGESTION_JOB_STALE_SECONDS,
+    embed_batch_size=settings.INGESTION_EMBED_BATCH_SIZE,
+)
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+from authlib.jose import JsonWebKey, KeySet
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_PATTERN = re.compile(r"max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    OIDCプロバイダへのリクエストで共有するHTTPクライアントを返します。
+    リクエストごとにクライアントを作らず、コネクションプールを再利用します。
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=settings.JWKS_HTTP_TIMEOUT_SECONDS)
+    return _http_client
+
+
+async def close_http_client():
+    """共有HTTPクライアントを閉じます（アプリ終了時に呼び出し）。"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def cache_ttl_from_headers(headers: httpx.Headers) -> float:
+    """
+    Cache-Control の max-age からキャッシュ秒数を求めます。
+    no-cache / no-store / max-age 未指定の場合は既定値を使い、上下限で丸めます。
+    """
+    cache_control = headers.get("cache-control", "")
+    match = _MAX_AGE_PATTERN.search(cache_control)
+    if match and "no-cache" not in cache_control.lower() and "no-store" not in cache_control.lower():
+        ttl = float(match.group(1))
+    else:
+        ttl = float(settings.JWKS_CACHE_DEFAULT_TTL_SECONDS)
+    return min(max(ttl, settings.JWKS_CACHE_MIN_TTL_SECONDS), settings.JWKS_CACHE_MAX_TTL_SECONDS)
+
+
+class JwksCache:
+    """
+    OIDCプロバイダ（issuer）ごとのディスカバリ情報とJWKS鍵セットをプロセス全体で共有するキャッシュ。
+
+    - 鍵セットは Cache-Control の max-age に従って保持します。
+    - 有効期限の JWKS_REFRESH_AHEAD_SECONDS 前を過ぎた参照では、現在の鍵を返しつつ
+      バックグラウンドで再取得します（トークン検証の経路でネットワークI/Oを発生させない）。
+    - 未知の kid を受け取った場合は鍵ローテーションとみなして再取得しますが、
+      同時リクエストは1回の取得を共有し（single-flight）、最小間隔で連続取得を抑止します。
+    """
+    def __init__(self, issuer: str, client_factory: Callable[[], httpx.AsyncClient] = get_http_client):
+        self.issuer = issuer.rstrip("/")
+        self._client_factory = client_factory
+        self._jwks_uri: Optional[str] = None
+        self._key_set: Optional[KeySet] = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def _get_json(self, url: str) -> httpx.Response:
+        response = await self._client_factory().get(url)
+        response.raise_for_status()
+        return response
+
+    async def get_jwks_uri(self) -> str:
+        """ディスカバリ情報からJWKS URIを取得します（取得後はプロセス内で再利用）。"""
+        if self._jwks_uri:
+            return self._jwks_uri
+
+        discovery_url = f"{self.issuer}/.well-known/openid-configuration"
+        try:
+            config = (await self._get_json(discovery_url)).json()
+        except Exception as e:
+            logger.error(f"Failed to fetch OIDC discovery configuration from {discovery_url}: {e}")
+            raise
+        jwks_uri = config.get("jwks_uri")
+        if not jwks_uri:
+            raise ValueError("jwks_uri not found in OIDC discovery configuration.")
+        self._jwks_uri = jwks_uri
+        return jwks_uri
+
+    async def _fetch_key_set(self) -> KeySet:
+        jwks_uri = await self.get_jwks_uri()
+        try:
+            response = await self._get_json(jwks_uri)
+            key_set = JsonWebKey.import_key_set(response.json())
+        except Exception as e:
+            logger.error(f"Failed to fetch JWKS from {jwks_uri}: {e}")
+            raise
+        now = time.monotonic()
+        self._key_set = key_set
+        self._fetched_at = now
+        self._expires_at = now + cache_ttl_from_headers(response.headers)
+        return key_set
+
+    def _start_refresh(self) -> asyncio.Task:
+        """進行中の取得があれば共有し、無ければ新たに取得を開始します（single-flight）。"""
+        inflight = self._inflight
+        if inflight is None or inflight.done() or inflight.get_loop() is not asyncio.get_running_loop():
+            inflight = asyncio.ensure_future(self._fetch_key_set())
+            # 失敗は取得処理内でログ出力済み。バックグラウンド更新の例外を未回収のまま残さない
+            inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self._inflight = inflight
+        return inflight
+
+    async def _refresh(self) -> KeySet:
+        # 待機側がキャンセルされても、共有している取得処理は継続させる
+        return await asyncio.shield(self._start_refresh())
+
+    async def get_key_set(self) -> KeySet:
+        """
+        鍵セットを返します。
+        期限切れ（または未取得）の場合のみ取得を待ち、期限が近い場合はバックグラウンドで更新します。
+        """
+        now = time.monotonic()
+        if self._key_set is None or now >= self._expires_at:
+            return await self._refresh()
+        if now >= self._expires_at - settings.JWKS_REFRESH_AHEAD_SECONDS:
+            self._start_refresh()
+        return self._key_set
+
+    async def get_key(self, kid: str):
+        """kid に対応する公開鍵を返します。見つからない場合は ValueError を送出します。"""
+        key_set = await self.get_key_set()
+        try:
+            return key_set.find_by_kid(kid)
+        except ValueError:
+            pass
+
+        # 鍵ローテーション直後の可能性があるため再取得する（短時間での連続取得は抑止）
+        if time.monotonic() - self._fetched_at >= settings.JWKS_UNKNOWN_KID_MIN_INTERVAL_SECONDS \
+                or (self._inflight is not None and not self._inflight.done()):
+            key_set = await self._refresh()
+        try:
+            return key_set.find_by_kid(kid)
+        except ValueError:
+            raise ValueError(f"No matching public key found for kid: {kid}")
+
+
+_jwks_caches: Dict[str, JwksCache] = {}
+
+
+def get_jwks_cache(issuer: str) -> JwksCache:
+    """issuer ごとのプロセス共有 JwksCache を返します。"""
+    key = issuer.rstrip("/")
+    cache = _jwks_caches.get(key)
+    if cache is None:
+        cache = _jwks_caches[key] = JwksCache(key)
+    return cache
+
+
+def clear_jwks_caches():
+    """全ての JwksCache を破棄します（テストや設定変更時に使用）。"""
+    _jwks_caches.clear()
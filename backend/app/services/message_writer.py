@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.repositories.chat import ChatMessageRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageWriter:
+    """
+    チャットメッセージを非同期にまとめて保存する write-behind キュー。
+
+    - enqueue したメッセージは asyncio.Queue に積まれ、バックグラウンドタスクが
+      最大 batch_size 件ずつ1回の INSERT ... VALUES とコミットで保存します。
+    - キューが max_queue_size に達した場合、enqueue は空きが出るまで待機します（バックプレッシャー）。
+    - stop() はキューに残ったメッセージを全て保存してから終了します。
+    id と created_at は enqueue 時点で確定させるため、保存が遅れても並び順は変わりません。
+    """
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = 100,
+        flush_interval_seconds: float = 0.05,
+        max_queue_size: int = 10000,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._drain_task is not None and not self._drain_task.done()
+
+    def start(self):
+        """キューを作成し、バックグラウンドの保存タスクを開始します。"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._drain_task = asyncio.create_task(self._drain())
+
+    async def stop(self):
+        """キューに残ったメッセージを全て保存してから、保存タスクを終了します。"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._drain_task.cancel()
+        try:
+            await self._drain_task
+        except asyncio.CancelledError:
+            pass
+        self._drain_task = None
+
+    async def enqueue(self, message_in: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        メッセージを保存キューに積みます。DBへの書き込みは待ちません。
+        保存される値（id / created_at を補完したもの）を返します。
+        """
+        if not self.running:
+            raise RuntimeError("ChatMessageWriter is not running.")
+        values = {"id": uuid4(), "created_at": datetime.now(timezone.utc), **message_in}
+        values.setdefault("updated_at", values["created_at"])
+        await self._queue.put(values)
+        return values
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """1件目を待ってから、flush_interval_seconds の間に届いた分を batch_size 件までまとめます。"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _drain(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        try:
+            async with self.session_factory() as session:
+                await ChatMessageRepository(session).bulk_create(batch, returning=False)
+            return
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} chat messages in batch, retrying one by one: {e}")
+
+        # 1件の不正なメッセージでバッチ全体を失わないよう、1件ずつ保存し直す
+        for values in batch:
+            try:
+                async with self.session_factory() as session:
+                    await ChatMessageRepository(session).bulk_create([values], returning=False)
+            except Exception as e:
+                logger.error(f"Dropping chat message {values.get('id')} for session {values.get('session_id')}: {e}")
+
+
+# アプリ共通の write-behind キュー（CHAT_MESSAGE_WRITE_BEHIND_ENABLED=true の場合のみ起動）
+chat_message_writer = ChatMessageWriter(
+    batch_size=settings.CHAT_MESSAGE_WRITE_BATCH_SIZE,
+    flush_interval_seconds=settings.CHAT_MESSAGE_WRITE_FLUSH_INTERVAL_SECONDS,
+    max_queue_size=settings.CHAT_MESSAGE_WRITE_MAX_QUEUE_SIZE,
+)
@@ -1,122 +1,521 @@
-from typing import List, AsyncGenerator, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
 from uuid import UUID
+import asyncio
+import logging
+import threading
+import time
 from langchain_core.documents import Document
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.embeddings import Embeddings
 from langchain_postgres.vectorstores import PGVector
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.retrievers import BaseRetriever
+from sqlalchemy import JSON, column, delete, table
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.database import engine, AsyncSessionLocal
 from app.llm.mock_llm import MockLLMClient # Embeddingsは別途モックする必要があるかもしれない
+from app.repositories.ephemeral_collection import EphemeralCollectionRepository
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.embedding_scheduler import EmbeddingBatchScheduler
+from app.services.hybrid_retrieval import FanOutRetriever, HybridRetriever, PgKeywordRetriever
+from app.services.reranker import Reranker, RerankingRetriever, get_default_reranker
+from app.services.semantic_cache import SemanticAnswerCache
+from app.services.vector_index import TunedPGVector, precomputed_query_embedding, vector_search_settings
+
+logger = logging.getLogger(__name__)
+
+# langchain_postgres が管理するコレクションテーブル。
+# langchain_pg_embedding は collection_id に ON DELETE CASCADE を持つため、
+# コレクション行を削除すると紐づくベクトルもまとめて削除されます。
+_vector_collection_table = table("langchain_pg_collection", column("name"))
+_vector_embedding_table = table("langchain_pg_embedding", column("cmetadata", JSON))
+
+# 単一コレクション構成でチャンクの属する範囲を表すメタデータ（"global" またはセッションID）
+RAG_SCOPE_METADATA_KEY = "rag_scope"
+RAG_SCOPE_GLOBAL = "global"
+
+
+def tenant_collection_name(tenant_id: UUID) -> str:
+    """テナントのグローバルRAG用コレクション名を返します。"""
+    return f"{settings.PG_COLLECTION_NAME}_{str(tenant_id).replace('-', '_')}"
+
+
+def vector_collection_name_for(tenant_id: UUID) -> str:
+    """テナントのグローバルRAGのチャンクを保存するコレクション名（単一コレクション構成では共通）を返します。"""
+    if settings.RAG_SINGLE_COLLECTION_ENABLED:
+        return settings.PG_COLLECTION_NAME
+    return tenant_collection_name(tenant_id)
+
+
+async def delete_vector_collections(session: AsyncSession, collection_names: List[str]) -> None:
+    """
+    指定した名前のPGVectorコレクションとそのベクトルを1文で削除します（コミットは呼び出し側）。
+    """
+    if not collection_names:
+        return
+    await session.execute(
+        delete(_vector_collection_table).where(_vector_collection_table.c.name.in_(collection_names))
+    )
+
+
+async def delete_vector_chunks_by_scope(session: AsyncSession, scopes: List[str]) -> None:
+    """
+    単一コレクション構成で、指定した範囲（セッションID）のチャンクを1文で削除します（コミットは呼び出し側）。
+    """
+    if not scopes:
+        return
+    scope = _vector_embedding_table.c.cmetadata[RAG_SCOPE_METADATA_KEY].as_string()
+    await session.execute(delete(_vector_embedding_table).where(scope.in_(scopes)))
+
+
+async def _delete_ephemeral_vectors(session: AsyncSession, entries) -> None:
+    """Ephemeral RAGのベクトルを、コレクションの構成に応じて削除します。"""
+    if settings.RAG_SINGLE_COLLECTION_ENABLED:
+        await delete_vector_chunks_by_scope(session, [str(entry.session_id) for entry in entries])
+    else:
+        await delete_vector_collections(session, [entry.collection_name for entry in entries])
+
+
+async def purge_expired_ephemeral_collections(
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+    batch_size: int = 100,
+) -> int:
+    """
+    有効期限切れのEphemeral RAGコレクションを、ベクトルと登録情報ごと一括削除します。
+    削除したコレクション数を返します。
+    """
+    purged = 0
+    while True:
+        async with session_factory() as session:
+            repo = EphemeralCollectionRepository(session, tenant_id=None)
+            expired = await repo.get_expired(datetime.now(timezone.utc), limit=batch_size)
+            if not expired:
+                return purged
+            await _delete_ephemeral_vectors(session, expired)
+            await repo.delete_by_session_ids([entry.session_id for entry in expired])
+        purged += len(expired)
+        if len(expired) < batch_size:
+            return purged
+
+
+async def run_ephemeral_collection_purger(interval_seconds: float):
+    """
+    期限切れEphemeral RAGコレクションの削除を一定間隔で実行し続けるバックグラウンドタスク。
+    """
+    while True:
+        try:
+            purged = await purge_expired_ephemeral_collections()
+            if purged:
+                logger.info("Purged %s expired ephemeral collections", purged)
+        except Exception:
+            logger.exception("Ephemeral collection purge failed")
+        await asyncio.sleep(interval_seconds)
+
 
 class RagService:
     """
     RAG (Retrieval Augmented Generation) サービス。
-    PGVectorを利用したベクトルストアの管理と、LCELによるRAGチェーンの構築を行います。
+    PGVectorを利用したベクトルストアの管理と、質問に関連するチャンクの検索を行います（回答の生成はオーケストレーターが行います）。
     グローバルRAGとEphemeral RAGの両方をサポートします。
+    PGVectorストアはアプリ共通の非同期エンジン（コネクションプール）を共有します。
+
+    RAG_SINGLE_COLLECTION_ENABLED が true の場合は、全テナント共通の1つのコレクションにチャンクを保存し、
+    メタデータ（tenant_id / rag_scope）で絞り込みます。セッション数に比例してコレクションが増えず、
+    グローバルとEphemeralのチャンクを1回の検索でまとめて取得できます。
     """
-    def __init__(self, tenant_id: UUID, llm_client: MockLLMClient):
+    def __init__(
+        self,
+        tenant_id: UUID,
+        llm_client: MockLLMClient,
+        embeddings: Optional[Embeddings] = None,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        reranker: Optional[Reranker] = None,
+    ):
         self.tenant_id = tenant_id
         self.llm_client = llm_client
-        self.global_collection_name = f"{settings.PG_COLLECTION_NAME}_{str(tenant_id).replace('-', '_')}"
+        # Ephemeralコレクション登録情報（DB）へのアクセスに使用するセッションファクトリ
+        self._session_factory = session_factory
+        self.global_collection_name = tenant_collection_name(tenant_id)
+
+        # Embeddingモデルの初期化 (RagServiceRegistryからは全テナント共通のインスタンスが渡される)
+        self.embeddings = embeddings or GoogleGenerativeAIEmbeddings(model="models/embedding-001")
 
-        # Embeddingモデルの初期化 (ここではダミー/モック)
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        self.single_collection = settings.RAG_SINGLE_COLLECTION_ENABLED
+        # チャンクを保存するPGVectorコレクション（単一コレクション構成では全テナント共通）
+        self.vector_collection_name = vector_collection_name_for(tenant_id)
+
+        # 検索した候補を並べ替えるリランカー（RAG_RERANKER、無効の場合は None）。
+        # リランクする場合は RAG_RERANK_FETCH_K 件の候補を取得し、リランク後に RAG_TOP_K 件に絞る
+        self.reranker = reranker or get_default_reranker()
+        self.candidate_k = settings.RAG_RERANK_FETCH_K if self.reranker else settings.RAG_TOP_K
 
         # グローバルPGVectorストアの初期化
-        self.global_vectorstore = PGVector(
-            collection_name=self.global_collection_name,
-            connection=settings.DATABASE_URL,
+        self.global_vectorstore = TunedPGVector(
+            collection_name=self.vector_collection_name,
+            connection=engine,
             embeddings=self.embeddings,
+            embedding_length=settings.EMBEDDING_DIMENSION,
         )
-        self.global_retriever = self.global_vectorstore.as_retriever()
+        self.global_retriever = self._make_retriever(self.global_vectorstore, self.vector_collection_name)
 
         # Ephemeral Vector Stores (セッションIDごとに管理)
-        self._ephemeral_vectorstores = {} # session_id -> PGVectorインスタンス
-
-        # RAGプロンプトの定義
-        self.rag_prompt = ChatPromptTemplate.from_messages([
-            ("system", """あなたは、提供されたコンテキストに基づいて質問に答えるAIアシスタントです。
-             質問に直接関連する情報のみを、簡潔に、日本語で回答してください。
-             不明な場合は「分かりません」と答えてください。
-             ---
-             コンテキスト: {context}
-             ---"""),
-            ("human", "{question}")
-        ])
-
-        # LLM
-        self.llm = ChatGoogleGenerativeAI(model="gemini-pro")
+        # ここで保持するのはプロセス内のハンドルのみで、コレクションの有無と有効期限は
+        # t_ephemeral_collection（DB）を正としてリクエスト・ワーカー間で共有します。
+        self._ephemeral_vectorstores: Dict[UUID, PGVector] = {} # session_id -> PGVectorインスタンス
+        self._ephemeral_last_used: Dict[UUID, float] = {} # session_id -> 最終利用時刻 (time.monotonic)
+
+        # リサーチモードの回答キャッシュ（キーはグローバルコレクションなら None、EphemeralならセッションID）
+        if answer_cache is None and settings.SEMANTIC_CACHE_ENABLED:
+            answer_cache = SemanticAnswerCache(
+                similarity_threshold=settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                max_collections=settings.SEMANTIC_CACHE_MAX_COLLECTIONS,
+                ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS,
+            )
+        self.answer_cache = answer_cache
 
     def _get_ephemeral_collection_name(self, session_id: UUID) -> str:
         return f"{self.global_collection_name}_ephemeral_{str(session_id).replace('-', '_')}"
 
+    def _scopes_for(self, ephemeral_session_id: Optional[UUID]) -> List[str]:
+        """単一コレクション構成で検索対象とする範囲（グローバルと、あればセッション）を返します。"""
+        scopes = [RAG_SCOPE_GLOBAL]
+        if ephemeral_session_id:
+            scopes.append(str(ephemeral_session_id))
+        return scopes
+
+    def _make_retriever(
+        self, vectorstore: PGVector, collection_name: str, scopes: Optional[List[str]] = None
+    ) -> BaseRetriever:
+        """
+        コレクションのリトリーバーを作成します。RAG_RETRIEVAL_MODE が "hybrid" の場合は、
+        ベクトル検索と全文検索を並行して実行し、RRFで統合するリトリーバーを返します。
+        単一コレクション構成では、テナントと scopes（既定はグローバルのみ）のチャンクに絞り込みます。
+        """
+        metadata_filter = None
+        search_filter = {}
+        if self.single_collection:
+            metadata_filter = {"tenant_id": [str(self.tenant_id)], RAG_SCOPE_METADATA_KEY: scopes or [RAG_SCOPE_GLOBAL]}
+            search_filter = {"filter": {field: {"$in": values} for field, values in metadata_filter.items()}}
+        if settings.RAG_RETRIEVAL_MODE != "hybrid":
+            return vectorstore.as_retriever(search_kwargs={"k": self.candidate_k, **search_filter})
+        return HybridRetriever(
+            vector_retriever=vectorstore.as_retriever(search_kwargs={"k": settings.RAG_HYBRID_FETCH_K, **search_filter}),
+            keyword_retriever=PgKeywordRetriever(
+                collection_name=collection_name,
+                metadata_filter=metadata_filter,
+                k=settings.RAG_HYBRID_FETCH_K,
+                session_factory=self._session_factory,
+            ),
+            k=self.candidate_k,
+            rrf_k=settings.RAG_RRF_K,
+            vector_weight=settings.RAG_RRF_VECTOR_WEIGHT,
+            keyword_weight=settings.RAG_RRF_KEYWORD_WEIGHT,
+        )
+
     def get_ephemeral_vectorstore(self, session_id: UUID) -> PGVector:
         """
         指定されたセッションIDに紐づくEphemeral PGVectorストアを取得または作成します。
         """
         if session_id not in self._ephemeral_vectorstores:
             ephemeral_collection_name = self._get_ephemeral_collection_name(session_id)
-            self._ephemeral_vectorstores[session_id] = PGVector(
+            self._ephemeral_vectorstores[session_id] = TunedPGVector(
                 collection_name=ephemeral_collection_name,
-                connection=settings.DATABASE_URL,
+                connection=engine,
                 embeddings=self.embeddings,
+                embedding_length=settings.EMBEDDING_DIMENSION,
             )
+        self._ephemeral_last_used[session_id] = time.monotonic()
         return self._ephemeral_vectorstores[session_id]
 
+    def evict_idle_ephemeral_vectorstores(self, max_idle_seconds: float) -> int:
+        """
+        一定時間利用されていないEphemeral PGVectorストアのハンドルを破棄します。
+        （ベクトルデータ自体は削除しません。）破棄した件数を返します。
+        """
+        now = time.monotonic()
+        idle_session_ids = [
+            session_id for session_id, last_used in self._ephemeral_last_used.items()
+            if now - last_used > max_idle_seconds
+        ]
+        for session_id in idle_session_ids:
+            self._ephemeral_vectorstores.pop(session_id, None)
+            self._ephemeral_last_used.pop(session_id, None)
+        return len(idle_session_ids)
+
+    def _with_scope(self, documents: List[Document], scope: str) -> List[Document]:
+        """単一コレクション構成での絞り込みに使うテナントID・範囲をメタデータに付与したドキュメントを返します。"""
+        return [
+            Document(
+                id=document.id,
+                page_content=document.page_content,
+                metadata={**document.metadata, "tenant_id": str(self.tenant_id), RAG_SCOPE_METADATA_KEY: scope},
+            )
+            for document in documents
+        ]
+
     async def add_documents_to_global_rag(self, documents: List[Document]):
         """
         ドキュメントをグローバルPGVectorストアに追加します。
         """
+        if self.single_collection:
+            documents = self._with_scope(documents, RAG_SCOPE_GLOBAL)
         await self.global_vectorstore.aadd_documents(documents)
+        # セッションの検索結果にもグローバルのチャンクが含まれるため、すべての回答を破棄する
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
 
     async def add_documents_to_ephemeral_rag(self, session_id: UUID, documents: List[Document]):
         """
-        ドキュメントをEphemeral PGVectorストアに追加します。
+        ドキュメントをEphemeral PGVectorストアに追加し、コレクションを有効期限付きで登録します。
         """
-        ephemeral_vectorstore = self.get_ephemeral_vectorstore(session_id)
-        await ephemeral_vectorstore.aadd_documents(documents)
+        if self.single_collection:
+            await self.global_vectorstore.aadd_documents(self._with_scope(documents, str(session_id)))
+        else:
+            await self.get_ephemeral_vectorstore(session_id).aadd_documents(documents)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(session_id)
+
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.EPHEMERAL_RAG_TTL_SECONDS)
+        async with self._session_factory() as session:
+            repo = EphemeralCollectionRepository(session, tenant_id=self.tenant_id)
+            await repo.touch(session_id, self._get_ephemeral_collection_name(session_id), expires_at)
 
-    def _get_retriever_for_session(self, session_id: Optional[UUID] = None) -> BaseRetriever:
+    async def has_active_ephemeral_collection(self, session_id: UUID) -> bool:
         """
-        セッションIDに基づいて適切なリトリーバー（グローバルまたはEphemeral）を返します。
-        複数のリトリーバーを結合することも可能ですが、ここではEphemeral優先とします。
+        セッションに有効期限内のEphemeralコレクションが登録されているかを返します。
         """
-        if session_id and session_id in self._ephemeral_vectorstores:
-            return self._ephemeral_vectorstores[session_id].as_retriever()
-        return self.global_retriever
+        async with self._session_factory() as session:
+            repo = EphemeralCollectionRepository(session, tenant_id=self.tenant_id)
+            entry = await repo.get_active_by_session_id(session_id, datetime.now(timezone.utc))
+            return entry is not None
+
+    async def purge_ephemeral_session(self, session_id: UUID):
+        """
+        セッションのEphemeralコレクションを、ベクトルと登録情報ごと削除します。
+        登録情報がない場合（Ephemeral RAG未使用のセッション）は何もしません。
+        """
+        self._ephemeral_vectorstores.pop(session_id, None)
+        self._ephemeral_last_used.pop(session_id, None)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(session_id)
+        async with self._session_factory() as session:
+            repo = EphemeralCollectionRepository(session, tenant_id=self.tenant_id)
+            entry = await repo.get_by_session_id(session_id)
+            if not entry:
+                return
+            await _delete_ephemeral_vectors(session, [entry])
+            await repo.delete_by_session_ids([session_id])
+
+    async def _resolve_ephemeral_session(self, session_id: Optional[UUID] = None) -> Optional[UUID]:
+        """
+        セッションに有効なEphemeralコレクションがあればそのセッションIDを、無ければ None（グローバル）を返します。
+        Ephemeralコレクションの有無は登録情報（DB）で判定するため、別リクエスト・別ワーカーで
+        アップロードされたドキュメントも参照できます。
+        """
+        if session_id:
+            if await self.has_active_ephemeral_collection(session_id):
+                return session_id
+            # 期限切れ・削除済みのコレクションのハンドルは破棄
+            self._ephemeral_vectorstores.pop(session_id, None)
+            self._ephemeral_last_used.pop(session_id, None)
+        return None
 
-    def _create_rag_chain(self, session_id: Optional[UUID] = None):
+    async def _get_retriever_for_session(self, session_id: Optional[UUID] = None) -> BaseRetriever:
         """
-        指定されたセッションIDに対応するリトリーバーを使用してRAGチェーンを構築します。
+        セッションIDに基づいて適切なリトリーバーを返します。
+        セッションに有効なEphemeralコレクションがある場合は、グローバルとEphemeralのチャンクをまとめて検索します
+        （コレクションを分ける構成では両方を並行して検索して統合し、単一コレクション構成では1回の絞り込み検索）。
         """
-        retriever = self._get_retriever_for_session(session_id)
-        
-        return (
-            RunnablePassthrough.assign(context=(lambda x: x["question"]) | retriever | self._format_docs)
-            | self.rag_prompt
-            | self.llm
-            | StrOutputParser()
+        return self._retriever_for(await self._resolve_ephemeral_session(session_id))
+
+    def _retriever_for(self, ephemeral_session_id: Optional[UUID]) -> BaseRetriever:
+        return self._with_reranker(self._candidate_retriever_for(ephemeral_session_id))
+
+    def _with_reranker(self, retriever: BaseRetriever) -> BaseRetriever:
+        """リランカーが有効な場合、候補をリランクしてトークン予算内の上位 RAG_TOP_K 件に絞るリトリーバーを返します。"""
+        if self.reranker is None:
+            return retriever
+        return RerankingRetriever(
+            base_retriever=retriever,
+            reranker=self.reranker,
+            k=settings.RAG_TOP_K,
+            max_context_tokens=settings.RAG_CONTEXT_MAX_TOKENS,
         )
 
+    def _candidate_retriever_for(self, ephemeral_session_id: Optional[UUID]) -> BaseRetriever:
+        if self.single_collection:
+            if not ephemeral_session_id:
+                return self.global_retriever
+            # グローバルとセッションのチャンクを1回の絞り込み検索で取得する
+            return self._make_retriever(
+                self.global_vectorstore, self.vector_collection_name, self._scopes_for(ephemeral_session_id)
+            )
+        if ephemeral_session_id:
+            # セッションとテナントのコレクションを並行して検索する（同順位ではセッションのチャンクを優先）
+            ephemeral_retriever = self._make_retriever(
+                self.get_ephemeral_vectorstore(ephemeral_session_id),
+                self._get_ephemeral_collection_name(ephemeral_session_id),
+            )
+            return FanOutRetriever(
+                retrievers=[ephemeral_retriever, self.global_retriever],
+                k=self.candidate_k,
+                timeout_seconds=settings.RAG_SOURCE_TIMEOUT_SECONDS,
+                rrf_k=settings.RAG_RRF_K,
+            )
+        return self.global_retriever
+
     def _format_docs(self, docs: List[Document]) -> str:
         """取得したドキュメントを結合して文字列に整形します。"""
         return "\n\n".join(doc.page_content for doc in docs)
 
-    async def query_rag(self, question: str, session_id: Optional[UUID] = None) -> str:
+    async def retrieve_context(
+        self,
+        question: str,
+        session_id: Optional[UUID] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        cache_lookup: Optional["AnswerCacheLookup"] = None,
+    ) -> str:
         """
-        RAGチェーンを使用して質問に対する応答を生成します。
+        質問に関連するチャンクを検索し、プロンプトに含めるコンテキスト文字列を返します（LLMは呼び出しません）。
+        関連するチャンクが無い場合は空文字列を返します。
+        ef_search / probes を指定した場合は、この検索のベクトル検索にだけ hnsw.ef_search / ivfflat.probes を適用します
+        （省略時は VECTOR_HNSW_EF_SEARCH / VECTOR_IVFFLAT_PROBES）。
+        cache_lookup（同じ質問の lookup_cached_answer の結果）を渡した場合は、そこで解決済みのEphemeralセッションと
+        質問の埋め込みを使い、Ephemeralコレクションの確認（DB）と埋め込みの計算を繰り返しません。
         """
-        rag_chain = self._create_rag_chain(session_id)
-        return await rag_chain.ainvoke({"question": question})
+        if cache_lookup is not None:
+            retriever = self._retriever_for(cache_lookup.ephemeral_session_id)
+            question_vector = cache_lookup.question_vector
+        else:
+            retriever = await self._get_retriever_for_session(session_id)
+            question_vector = None
+        with vector_search_settings(ef_search=ef_search, probes=probes), \
+                precomputed_query_embedding(question, question_vector):
+            return self._format_docs(await retriever.ainvoke(question))
 
-    async def stream_rag_response(self, question: str, session_id: Optional[UUID] = None) -> AsyncGenerator[str, None]:
+    async def lookup_cached_answer(self, question: str, session_id: Optional[UUID] = None) -> Optional["AnswerCacheLookup"]:
+        """
+        同じコレクションに対する近い質問の回答を回答キャッシュから探します。
+        回答キャッシュが無効な場合は None を返します。見つからない場合は answer が None の結果を返し、
+        生成した回答はその結果を渡して store_answer で保存します。
+        続く検索では、この結果を retrieve_context に渡して解決済みのセッションと埋め込みを再利用します。
         """
-        RAGチェーンを使用して質問に対する応答をストリーミングで生成します。
+        if self.answer_cache is None:
+            return None
+        ephemeral_session_id = await self._resolve_ephemeral_session(session_id)
+        question_vector = await self.embeddings.aembed_query(question)
+        return AnswerCacheLookup(
+            ephemeral_session_id=ephemeral_session_id,
+            question=question,
+            question_vector=question_vector,
+            generation=self.answer_cache.generation,
+            answer=self.answer_cache.get(ephemeral_session_id, question_vector),
+        )
+
+    def store_answer(self, lookup: "AnswerCacheLookup", answer: str):
         """
-        rag_chain = self._create_rag_chain(session_id)
-        stream = rag_chain.astream({"question": question})
-        async for chunk in stream:
-            yield chunk
\ No newline at end of file
+        lookup_cached_answer で見つからなかった質問の回答を保存します。
+        検索後にコレクションが更新された（回答キャッシュが無効化された）場合は保存しません。
+        """
+        if self.answer_cache is None or not answer:
+            return
+        self.answer_cache.put(
+            lookup.ephemeral_session_id, lookup.question, lookup.question_vector, answer, lookup.generation
+        )
+
+
+@dataclass
+class AnswerCacheLookup:
+    """回答キャッシュの検索結果。answer が None の場合はキャッシュに無く、生成した回答を保存できます。"""
+    ephemeral_session_id: Optional[UUID]
+    question: str
+    question_vector: List[float]
+    generation: int
+    answer: Optional[str] = None
+
+
+class RagServiceRegistry:
+    """
+    テナントごとのRagServiceをプロセス内で再利用するためのLRUレジストリ。
+
+    RagServiceの生成（Embeddingクライアント・PGVectorストアの構築）を
+    リクエストごとに行わないよう、生成済みインスタンスをテナントIDをキーに保持します。
+    - Embedding クライアントは全テナントで共有します。
+    - 保持数が max_tenants を超えた場合、最も長く使われていないテナントから破棄します。
+    - 取得のたびに、アイドル状態のEphemeralストアのハンドルを破棄します。
+    FastAPIの同期依存関数はスレッドプールで実行されるため、ロックで保護します。
+    """
+    def __init__(self, max_tenants: int, collection_idle_ttl_seconds: float):
+        self.max_tenants = max_tenants
+        self.collection_idle_ttl_seconds = collection_idle_ttl_seconds
+        self._services: "OrderedDict[UUID, RagService]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._embeddings: Optional[Embeddings] = None
+
+    @staticmethod
+    def _create_embeddings() -> Embeddings:
+        """
+        全テナント共通のEmbeddingを作成します。
+        キャッシュに無いテキストだけを、バッチスケジューラーで他の取り込みのテキストと束ねてAPIに送ります。
+        """
+        model = "models/embedding-001"
+        embeddings: Embeddings = EmbeddingBatchScheduler(
+            GoogleGenerativeAIEmbeddings(model=model),
+            max_batch_size=settings.EMBED_BATCH_MAX_SIZE,
+            max_wait_seconds=settings.EMBED_BATCH_MAX_WAIT_MS / 1000,
+            max_concurrent_batches=settings.EMBED_MAX_CONCURRENT_BATCHES,
+            max_retries=settings.EMBED_RATE_LIMIT_MAX_RETRIES,
+            retry_backoff_seconds=settings.EMBED_RETRY_BACKOFF_SECONDS,
+            retry_backoff_max_seconds=settings.EMBED_RETRY_BACKOFF_MAX_SECONDS,
+        )
+        if settings.EMBEDDING_CACHE_ENABLED:
+            embeddings = CachedEmbeddings(
+                embeddings,
+                model=model,
+                max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+                use_redis=settings.EMBEDDING_CACHE_REDIS_ENABLED,
+            )
+        return embeddings
+
+    def get(self, tenant_id: UUID, llm_client: MockLLMClient) -> RagService:
+        """テナントIDに対応するRagServiceを取得します。未生成の場合は生成して登録します。"""
+        with self._lock:
+            service = self._services.get(tenant_id)
+            if service is None:
+                if self._embeddings is None:
+                    self._embeddings = self._create_embeddings()
+                service = RagService(
+                    tenant_id=tenant_id,
+                    llm_client=llm_client,
+                    embeddings=self._embeddings,
+                )
+                self._services[tenant_id] = service
+                while len(self._services) > self.max_tenants:
+                    self._services.popitem(last=False)
+            else:
+                self._services.move_to_end(tenant_id)
+            service.evict_idle_ephemeral_vectorstores(self.collection_idle_ttl_seconds)
+            return service
+
+    def clear(self):
+        """保持しているRagServiceをすべて破棄します。"""
+        with self._lock:
+            self._services.clear()
+
+    def __len__(self) -> int:
+        return len(self._services)
+
+
+# プロセス全体で共有するRagServiceレジストリ
+rag_service_registry = RagServiceRegistry(
+    max_tenants=settings.RAG_SERVICE_POOL_MAX_TENANTS,
+    collection_idle_ttl_seconds=settings.RAG_COLLECTION_IDLE_TTL_SECONDS,
+)
@@ -0,0 +1,184 @@
+import asyncio
+import math
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.config import settings
+from app.core.tokens import estimate_tokens
+
+RERANKER_NONE = "none"
+RERANKER_BM25 = "bm25"
+RERANKER_CROSS_ENCODER = "cross-encoder"
+
+# 英数字の語と、CJK文字の連続（BM25では文字バイグラムに分解する）
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-_.]*|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff々]+")
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff々]")
+
+
+def bm25_terms(text: str) -> List[str]:
+    """
+    BM25の索引語を返します。英数字は語単位（小文字）、日本語は分かち書きされないため文字バイグラムとします。
+    """
+    terms: List[str] = []
+    for match in _WORD_PATTERN.finditer(text or ""):
+        word = match.group(0).lower()
+        if not _CJK_PATTERN.match(word):
+            terms.append(word)
+        elif len(word) == 1:
+            terms.append(word)
+        else:
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+class Reranker(ABC):
+    """質問と候補チャンクの関連度を計算するリランカー。CPUで実行するため、スレッドプールから呼び出します。"""
+
+    @abstractmethod
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        """各テキストの関連度（大きいほど関連が高い）を texts と同じ順で返します。"""
+
+
+class BM25Reranker(Reranker):
+    """
+    候補チャンクの集合を文書集合とみなした Okapi BM25 で並べ替えるリランカー。
+    モデルを使わないため軽量で、製品コードや固有名詞の一致を重視した順位になります。
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        query_terms = set(bm25_terms(query))
+        documents = [Counter(bm25_terms(text)) for text in texts]
+        if not query_terms or not documents:
+            return [0.0] * len(documents)
+        lengths = [sum(terms.values()) for terms in documents]
+        avg_length = (sum(lengths) / len(lengths)) or 1.0
+        idf = {}
+        for term in query_terms:
+            df = sum(1 for terms in documents if term in terms)
+            idf[term] = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+        scores = []
+        for terms, length in zip(documents, lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores.append(sum(
+                idf[term] * terms[term] * (self.k1 + 1) / (terms[term] + norm)
+                for term in query_terms if term in terms
+            ))
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    ローカルのクロスエンコーダーモデル（sentence-transformers）で質問とチャンクの組を採点するリランカー。
+    候補は batch_size 件ずつまとめて推論します。モデルは初回の採点時に読み込み、プロセス内で共有します。
+    sentence-transformers は任意の依存関係です（poetry install -E rerank）。
+    """
+    def __init__(self, model_name: str, batch_size: int = 16, max_length: int = 512):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._model: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                except ImportError as e:
+                    raise RuntimeError(
+                        "RAG_RERANKER='cross-encoder' requires sentence-transformers (poetry install -E rerank)."
+                    ) from e
+                self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            return self._model
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        if not texts:
+            return []
+        scores = self._get_model().predict(
+            [(query, text) for text in texts], batch_size=self.batch_size, show_progress_bar=False
+        )
+        return [float(score) for score in scores]
+
+
+def select_within_budget(documents: Sequence[Document], k: int, max_tokens: Optional[int]) -> List[Document]:
+    """
+    順位の高い順に、合計トークン数（近似）が max_tokens 以内に収まるチャンクを最大 k 件選びます。
+    予算を超えるチャンクは飛ばし、次の順位のチャンクを試します。
+    """
+    selected: List[Document] = []
+    used = 0
+    for document in documents:
+        if len(selected) >= k:
+            break
+        tokens = estimate_tokens(document.page_content)
+        if max_tokens is not None and used + tokens > max_tokens:
+            continue
+        selected.append(document)
+        used += tokens
+    return selected
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    base_retriever で多めに取得した候補（RAG_RERANK_FETCH_K 件）をリランカーで並べ替え、
+    上位 k 件のうちコンテキストのトークン予算（max_context_tokens）に収まるものを返すリトリーバー。
+
+    リランカーはCPU処理のため、イベントループを止めないよう executor（スレッドプール）で実行します。
+    各チャンクの metadata["rerank_score"] に採点結果を付与します。
+    """
+    base_retriever: BaseRetriever
+    reranker: Reranker
+    k: int = 4
+    max_context_tokens: Optional[int] = None
+    executor: Optional[Executor] = None
+
+    def _rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        scores = self.reranker.score(query, [document.page_content for document in documents])
+        # 同点の場合は元の検索順を保つ（sorted は安定ソート）
+        ranked = sorted(zip(scores, documents), key=lambda item: item[0], reverse=True)
+        reranked = [
+            Document(id=document.id, page_content=document.page_content, metadata={**document.metadata, "rerank_score": score})
+            for score, document in ranked
+        ]
+        return select_within_budget(reranked, self.k, self.max_context_tokens)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._rerank(query, documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = await self.base_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        if not documents:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor or rerank_executor, self._rerank, query, documents)
+
+
+@lru_cache(maxsize=1)
+def get_default_reranker() -> Optional[Reranker]:
+    """設定（RAG_RERANKER）に応じたプロセス共通のリランカーを返します。無効の場合は None を返します。"""
+    if settings.RAG_RERANKER == RERANKER_BM25:
+        return BM25Reranker()
+    if settings.RAG_RERANKER == RERANKER_CROSS_ENCODER:
+        return CrossEncoderReranker(settings.RAG_RERANK_MODEL, batch_size=settings.RAG_RERANK_BATCH_SIZE)
+    if settings.RAG_RERANKER != RERANKER_NONE:
+        raise ValueError(f"Unsupported RAG_RERANKER: {settings.RAG_RERANKER}")
+    return None
+
+
+# アプリ共通のリランク用スレッドプール（スレッドは初回の実行時に起動）
+rerank_executor = ThreadPoolExecutor(max_workers=settings.RAG_RERANK_MAX_WORKERS, thread_name_prefix="rerank")
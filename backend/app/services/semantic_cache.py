@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class _CachedAnswer:
+    question: str
+    vector: np.ndarray # 正規化済みの質問の埋め込み
+    answer: str
+    expires_at: float
+
+
+class SemanticAnswerCache:
+    """
+    質問の埋め込みが近い過去の質問の回答を再利用する、テナント単位のセマンティックキャッシュ。
+
+    - 回答はコレクション（グローバル / セッションのEphemeral）ごとに保持し、
+      質問の埋め込みとのコサイン類似度が similarity_threshold 以上の回答のうち最も近いものを返します。
+    - コレクションごとに max_entries 件まで（古いものから破棄）、保持するコレクションは max_collections 件まで（LRU）。
+    - 各回答は ttl_seconds で失効します。
+    - コレクションにドキュメントが追加・削除された場合は invalidate で破棄します。
+      他のプロセスでの更新は検知できないため、その場合の古い回答は ttl_seconds で失効します。
+    イベントループ内からのみ使用するため、ロックは使用しません。
+    """
+    def __init__(
+        self,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 256,
+        max_collections: int = 64,
+        ttl_seconds: float = 3600,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_collections = max_collections
+        self.ttl_seconds = ttl_seconds
+        self._collections: "OrderedDict[Hashable, List[_CachedAnswer]]" = OrderedDict()
+        # invalidate のたびに増える世代番号（生成中に無効化された回答を保存しないために使用）
+        self.generation = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def get(self, collection: Hashable, vector: Sequence[float]) -> Optional[str]:
+        """類似度がしきい値以上の過去の回答のうち、最も近いものを返します。無い場合は None を返します。"""
+        entries = self._collections.get(collection)
+        if not entries:
+            return None
+        now = time.monotonic()
+        entries[:] = [entry for entry in entries if entry.expires_at > now]
+        if not entries:
+            del self._collections[collection]
+            return None
+        self._collections.move_to_end(collection)
+        similarities = np.stack([entry.vector for entry in entries]) @ self._normalize(vector)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return entries[best].answer
+
+    def put(self, collection: Hashable, question: str, vector: Sequence[float], answer: str, generation: int):
+        """
+        回答を保存します。generation は回答の生成を開始した時点の世代番号で、
+        その後に invalidate された場合（生成中にドキュメントが追加された場合）は保存しません。
+        """
+        if generation != self.generation or self.ttl_seconds <= 0:
+            return
+        entries = self._collections.setdefault(collection, [])
+        entries.append(_CachedAnswer(question, self._normalize(vector), answer, time.monotonic() + self.ttl_seconds))
+        del entries[:-self.max_entries]
+        self._collections.move_to_end(collection)
+        while len(self._collections) > self.max_collections:
+            self._collections.popitem(last=False)
+
+    def invalidate(self, collection: Hashable):
+        """コレクションの回答をすべて破棄します（ドキュメントの追加・削除時に呼び出し）。"""
+        self._collections.pop(collection, None)
+        self.generation += 1
+
+    def clear(self):
+        self._collections.clear()
+        self.generation += 1
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._collections.values())
@@ -0,0 +1,211 @@
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.tokens import iter_token_spans
+
+# 長さの単位
+LENGTH_UNIT_CHARS = "chars"
+LENGTH_UNIT_TOKENS = "tokens"
+
+# チャンクの区切りとして優先する位置（段落 > 行 > 文 > 単語）
+_SEPARATORS = ("\n\n", "\n", "。", "．", ". ", "！", "？", "! ", "? ", " ")
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t]*#*[ \t]*$")
+_FENCE_PATTERN = re.compile(r"^[ \t]*(```|~~~)")
+
+
+@dataclass
+class TextChunk:
+    """分割したテキストの1チャンク。start / end は文書先頭からの文字オフセット（end は含まない）。"""
+    text: str
+    index: int
+    start: int
+    end: int
+    headings: List[str] = field(default_factory=list)
+
+    def metadata(self) -> Dict[str, Any]:
+        """ベクトルストアに保存するメタデータを返します。"""
+        metadata: Dict[str, Any] = {"chunk_index": self.index, "start_offset": self.start, "end_offset": self.end}
+        if self.headings:
+            metadata["headings"] = " > ".join(self.headings)
+        return metadata
+
+
+class TextChunker:
+    """
+    テキストを重なり（オーバーラップ）付きのチャンクに分割します。
+
+    - 長さは文字数（chars）または近似トークン数（tokens）で数えます。
+    - チャンクの末尾は段落・行・文・単語の区切りを優先し、見つからない場合は上限の位置で切ります。
+    - markdown=True の場合、見出しの前で必ず区切り、チャンクが属する見出しの階層をメタデータに含めます
+      （コードブロック内の # は見出しとみなしません）。
+    - テキストは断片のイテレータとして受け取り、チャンクをジェネレータで返すため、
+      巨大なファイルでも保持するのは1チャンク分程度のテキストだけです。
+    """
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 150,
+        length_unit: str = LENGTH_UNIT_CHARS,
+        markdown: bool = False,
+    ):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be non-negative and smaller than chunk_size.")
+        if length_unit not in (LENGTH_UNIT_CHARS, LENGTH_UNIT_TOKENS):
+            raise ValueError(f"Unsupported length unit: {length_unit}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_unit = length_unit
+        self.markdown = markdown
+
+    def chunk(self, text: str) -> Iterator[TextChunk]:
+        """1つの文字列を分割します。"""
+        return self.iter_chunks([text])
+
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[TextChunk]:
+        """テキストの断片を順に受け取り、確定したチャンクから順に返します。"""
+        state = _ChunkingState(self)
+        for segment in segments:
+            yield from state.feed(segment)
+        yield from state.finish()
+
+    async def aiter_chunks(self, segments: AsyncIterable[str]) -> AsyncIterator[TextChunk]:
+        """iter_chunks の非同期版。ファイルを読みながら分割する場合に使用します。"""
+        state = _ChunkingState(self)
+        async for segment in segments:
+            for chunk in state.feed(segment):
+                yield chunk
+        for chunk in state.finish():
+            yield chunk
+
+
+class _ChunkingState:
+    """1文書分の分割状態。buffer には未確定のテキスト（現在のセクション内）だけを保持します。"""
+    def __init__(self, chunker: TextChunker):
+        self.chunker = chunker
+        self.buffer = ""
+        self.offset = 0 # buffer[0] の文書内オフセット
+        self.emitted_end = 0 # 出力済みチャンクの末尾の文書内オフセット
+        self.index = 0
+        self.pending_line = "" # markdown: 改行がまだ届いていない行
+        self.headings: List[Tuple[int, str]] = []
+        self.in_fence = False
+
+    def feed(self, text: str) -> List[TextChunk]:
+        if not self.chunker.markdown:
+            self.buffer += text
+            return self._cut()
+
+        chunks: List[TextChunk] = []
+        lines = (self.pending_line + text).splitlines(keepends=True)
+        self.pending_line = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        section: List[str] = []
+        for line in lines:
+            if _FENCE_PATTERN.match(line):
+                self.in_fence = not self.in_fence
+            elif not self.in_fence:
+                heading = _HEADING_PATTERN.match(line)
+                if heading:
+                    # 見出しの前で区切り、以降のチャンクは新しい見出しに属する
+                    self.buffer += "".join(section)
+                    section = []
+                    chunks.extend(self._cut(final=True))
+                    level = len(heading.group(1))
+                    self.headings = [h for h in self.headings if h[0] < level] + [(level, heading.group(2))]
+            section.append(line)
+        self.buffer += "".join(section)
+        chunks.extend(self._cut())
+        return chunks
+
+    def finish(self) -> List[TextChunk]:
+        self.buffer += self.pending_line
+        self.pending_line = ""
+        return self._cut(final=True)
+
+    def _cut(self, final: bool = False) -> List[TextChunk]:
+        chunks: List[TextChunk] = []
+        start = 0
+        while True:
+            limit = self._limit(start)
+            if limit is None:
+                break
+            end = self._boundary(start, limit)
+            chunk = self._make(start, end)
+            if chunk:
+                chunks.append(chunk)
+            start = self._next_start(start, end)
+
+        if final:
+            # 最後の残り（オーバーラップ部分以外に新しい内容がある場合のみ）
+            new_from = max(start, self.emitted_end - self.offset)
+            if self.buffer[new_from:].strip():
+                chunk = self._make(start, len(self.buffer))
+                if chunk:
+                    chunks.append(chunk)
+            start = len(self.buffer)
+        self.offset += start
+        self.buffer = self.buffer[start:]
+        return chunks
+
+    def _limit(self, start: int) -> Optional[int]:
+        """start から chunk_size 分の位置を返します。その先にまだテキストが無い場合は None を返します。"""
+        size = self.chunker.chunk_size
+        if self.chunker.length_unit == LENGTH_UNIT_CHARS:
+            limit = start + size
+        else:
+            limit = None
+            for count, (_, token_end) in enumerate(iter_token_spans(self.buffer, start), 1):
+                if count == size:
+                    limit = token_end
+                    break
+            if limit is None:
+                return None
+        # 上限の直後まで届いていない場合は、単語が途中で切れている可能性があるため続きを待つ
+        return limit if limit < len(self.buffer) else None
+
+    def _boundary(self, start: int, limit: int) -> int:
+        """チャンクの後半にある最も優先度の高い区切りの直後を返します。無ければ limit を返します。"""
+        min_end = start + (limit - start) // 2
+        for separator in _SEPARATORS:
+            position = self.buffer.rfind(separator, min_end, limit)
+            if position != -1:
+                return position + len(separator)
+        return limit
+
+    def _next_start(self, start: int, end: int) -> int:
+        """次のチャンクの開始位置（末尾から chunk_overlap 分戻った位置）を返します。"""
+        overlap = self.chunker.chunk_overlap
+        if overlap == 0:
+            return end
+        if self.chunker.length_unit == LENGTH_UNIT_CHARS:
+            next_start = end - overlap
+        else:
+            token_starts = deque(maxlen=overlap)
+            for token_start, token_end in iter_token_spans(self.buffer, start):
+                if token_end > end:
+                    break
+                token_starts.append(token_start)
+            next_start = token_starts[0] if len(token_starts) == overlap else start
+        # 区切りの都合でチャンクが短くなり、戻ると前に進まない場合は重ねない
+        return next_start if next_start > start else end
+
+    def _make(self, start: int, end: int) -> Optional[TextChunk]:
+        raw = self.buffer[start:end]
+        self.emitted_end = max(self.emitted_end, self.offset + end)
+        text = raw.strip()
+        if not text:
+            return None
+        chunk_start = self.offset + start + (len(raw) - len(raw.lstrip()))
+        chunk = TextChunk(
+            text=text,
+            index=self.index,
+            start=chunk_start,
+            end=chunk_start + len(text),
+            headings=[title for _, title in self.headings],
+        )
+        self.index += 1
+        return chunk
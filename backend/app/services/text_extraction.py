@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import multiprocessing
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# ページ単位で抽出する形式（いずれも解析がCPUバウンドのため子プロセスで実行する）
+PAGED_FILE_EXTENSIONS = ("pdf", "docx", "xlsx", "pptx")
+
+# DOCXにはページの概念が無いため、この段落数を1ページとして扱う
+DOCX_PARAGRAPHS_PER_PAGE = 50
+
+
+class ExtractionTimeoutError(TimeoutError):
+    """1ファイルのテキスト抽出が制限時間を超えた場合に送出されます。"""
+
+
+class ExtractionWorkerError(RuntimeError):
+    """抽出中に子プロセスが異常終了した場合に送出されます。"""
+
+
+# --- 子プロセスで実行する抽出処理 ---
+# 各関数はファイルを1回だけ解析し、ページのテキストを解析できた順に1件ずつ返します。
+# パーサーはこの形式を扱う場合にのみ必要なため、関数内でインポートします。
+
+def _read_pdf(file_path: str) -> Iterator[str]:
+    from pypdf import PdfReader
+
+    for page in PdfReader(file_path).pages:
+        yield page.extract_text() or ""
+
+
+def _read_docx(file_path: str) -> Iterator[str]:
+    from docx import Document
+
+    page: List[str] = []
+    for paragraph in Document(file_path).paragraphs:
+        page.append(paragraph.text)
+        if len(page) == DOCX_PARAGRAPHS_PER_PAGE:
+            yield "\n".join(page)
+            page = []
+    if page:
+        yield "\n".join(page)
+
+
+def _read_xlsx(file_path: str) -> Iterator[str]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        # シートごとに1ページとし、行をタブ区切りのテキストにする
+        for sheet in workbook.worksheets:
+            yield f"# {sheet.title}\n" + "\n".join(
+                "\t".join("" if value is None else str(value) for value in row)
+                for row in sheet.iter_rows(values_only=True)
+            )
+    finally:
+        workbook.close()
+
+
+def _read_pptx(file_path: str) -> Iterator[str]:
+    from pptx import Presentation
+
+    for slide in Presentation(file_path).slides:
+        yield "\n".join(shape.text_frame.text for shape in slide.shapes if shape.has_text_frame)
+
+
+_PAGE_READERS = {
+    "pdf": _read_pdf,
+    "docx": _read_docx,
+    "xlsx": _read_xlsx,
+    "pptx": _read_pptx,
+}
+
+
+def extract_pages(file_path: str, file_extension: str) -> Iterator[str]:
+    """
+    ファイルを1回だけ解析し、ページのテキストをページ順に返すイテレーターを返します。
+    ExtractionProcessPool から子プロセスで呼び出されます。
+    """
+    reader = _PAGE_READERS.get(file_extension)
+    if reader is None:
+        raise ValueError(f"Unsupported file type for extraction: {file_extension}")
+    return reader(file_path)
+
+
+def _run_worker(conn):
+    """
+    抽出用の子プロセスのメインループ。
+    依頼ごとにファイルを解析し、ページを解析できた順に1件ずつ親プロセスへ送ります。
+    パイプが詰まっている間（親プロセスが前のページを処理している間）は送信で待つため、解析もそこで止まります。
+    """
+    # 起動（このモジュールのインポート）が終わったことを知らせる
+    conn.send(("ready", None))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        page_reader, file_path, file_extension = task
+        try:
+            for page in page_reader(file_path, file_extension):
+                conn.send(("page", page))
+        except Exception as e:
+            try:
+                conn.send(("error", e))
+            except Exception:
+                # 例外をpickleできない場合は内容だけを送る
+                conn.send(("error", RuntimeError(repr(e))))
+        else:
+            conn.send(("done", None))
+
+
+# --- 親プロセス側 ---
+
+# 子プロセスの起動（インタプリタとこのモジュールの読み込み）を待つ最大秒数
+_WORKER_START_TIMEOUT_SECONDS = 60
+
+
+class _ExtractionWorker:
+    """抽出用の子プロセスと、親プロセス側のパイプの端。"""
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_run_worker, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # 起動にかかる時間を抽出の制限時間に含めないよう、ここで起動の完了を待つ
+        try:
+            started = self.receive(_WORKER_START_TIMEOUT_SECONDS) is not None
+        except EOFError:
+            started = False
+        if not started:
+            self.stop()
+            raise ExtractionWorkerError("Text extraction worker did not start")
+
+    def receive(self, timeout: float):
+        """timeout 秒以内に届いたメッセージを返します。届かない場合は None を返します。"""
+        if timeout <= 0 or not self.conn.poll(timeout):
+            return None
+        return self.conn.recv()
+
+    def stop(self):
+        """
+        子プロセスを停止します。
+        受信待ちのスレッドがパイプを使っている可能性があるため、パイプは閉じずに破棄時に閉じます。
+        """
+        self.process.terminate()
+
+
+class ExtractionProcessPool:
+    """
+    テキスト抽出を上限付きの子プロセスで実行します。
+
+    - 同時に実行する抽出は max_workers 件までで、それ以上は子プロセスに依頼せず待機します。
+    - 1ファイルにつき子プロセスへの依頼は1回で、ファイルの解析も1回だけ行います。
+      子プロセスは解析できたページから順にパイプで送り、親プロセスはそれを受け取った順に返すため、
+      最初のページは解析の完了を待たずに返り、親プロセスは文書全体のテキストを保持しません。
+      （子プロセスでの解析は、パーサーによってはファイル全体を読み込みます。）
+    - 制限時間は、子プロセスからのページを待っている時間の合計に適用されます
+      （呼び出し側がページを処理している時間は含みません）。
+      超えた場合はその抽出の子プロセスだけを停止し、ExtractionTimeoutError を送出します。
+    - 呼び出し側が途中で読むのをやめた場合（キャンセルを含む）も、その抽出の子プロセスを停止します。
+      他の抽出には影響しません。正常に終わった子プロセスは次の抽出で再利用します。
+    """
+    def __init__(
+        self,
+        max_workers: int = 2,
+        timeout_seconds: float = 120.0,
+        page_reader: Callable[[str, str], Iterable[str]] = extract_pages,
+    ):
+        self.max_workers = max_workers
+        self.timeout_seconds = timeout_seconds
+        self.page_reader = page_reader
+        self._idle_workers: List[_ExtractionWorker] = []
+        self._workers: Set[_ExtractionWorker] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _acquire_worker(self) -> _ExtractionWorker:
+        while self._idle_workers:
+            worker = self._idle_workers.pop()
+            if worker.process.is_alive():
+                return worker
+            self._workers.discard(worker)
+        # 子プロセスにイベントループやスレッドの状態を引き継がないよう spawn で起動する
+        worker = await asyncio.to_thread(_ExtractionWorker, multiprocessing.get_context("spawn"))
+        self._workers.add(worker)
+        return worker
+
+    def _stop_worker(self, worker: _ExtractionWorker):
+        self._workers.discard(worker)
+        worker.stop()
+
+    def shutdown(self):
+        """子プロセスを全て停止します（アプリ終了時に呼び出し）。"""
+        self._idle_workers.clear()
+        for worker in list(self._workers):
+            self._stop_worker(worker)
+
+    async def iter_pages(self, file_path: Path, file_extension: str) -> AsyncIterator[str]:
+        """ファイルのテキストを、子プロセスで解析できたページから先頭から順に返します。"""
+        loop = asyncio.get_running_loop()
+        async with self._get_semaphore():
+            worker = await self._acquire_worker()
+            finished = False
+            try:
+                worker.conn.send((self.page_reader, str(file_path), file_extension))
+                remaining = self.timeout_seconds
+                while True:
+                    started_at = loop.time()
+                    try:
+                        message = await asyncio.to_thread(worker.receive, remaining)
+                    except EOFError:
+                        raise ExtractionWorkerError(f"Text extraction worker exited unexpectedly: {Path(file_path).name}")
+                    remaining -= loop.time() - started_at
+                    if message is None:
+                        logger.error(f"Text extraction timed out after {self.timeout_seconds}s: {file_path}")
+                        raise ExtractionTimeoutError(f"Text extraction timed out: {Path(file_path).name}")
+                    kind, value = message
+                    if kind == "page":
+                        yield value
+                        continue
+                    # 解析が終わった（失敗を含む）子プロセスは再利用できる
+                    finished = True
+                    if kind == "error":
+                        raise value
+                    return
+            finally:
+                if finished:
+                    self._idle_workers.append(worker)
+                else:
+                    self._stop_worker(worker)
+
+
+# アプリ共通の抽出用プロセスプール（初回の抽出時に子プロセスを起動）
+extraction_pool = ExtractionProcessPool(
+    max_workers=settings.EXTRACTION_MAX_WORKERS,
+    timeout_seconds=settings.EXTRACTION_TIMEOUT_SECONDS,
+)
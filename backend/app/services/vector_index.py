@@ -0,0 +1,335 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set
+from uuid import UUID
+
+from langchain_core.documents import Document
+from langchain_postgres.vectorstores import PGVector
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.config import settings
+from app.core.database import engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+INDEX_METHOD_HNSW = "hnsw"
+INDEX_METHOD_IVFFLAT = "ivfflat"
+INDEX_METHODS = (INDEX_METHOD_HNSW, INDEX_METHOD_IVFFLAT)
+
+# 管理対象のインデックス名の接頭辞（ix_lpe_<method>_<collection uuid>）
+INDEX_NAME_PREFIX = "ix_lpe_"
+
+_EMBEDDING_TABLE = "langchain_pg_embedding"
+
+
+class VectorIndexError(Exception):
+    """ベクトルインデックスを作成・削除できない場合に送出されます。"""
+
+
+# --- 検索時のパラメーター（hnsw.ef_search / ivfflat.probes） ---
+
+_search_settings: ContextVar[Dict[str, int]] = ContextVar("vector_search_settings", default={})
+
+
+@contextmanager
+def vector_search_settings(ef_search: Optional[int] = None, probes: Optional[int] = None) -> Iterator[None]:
+    """
+    このコンテキスト内で実行するベクトル検索の hnsw.ef_search / ivfflat.probes を指定します。
+    指定しない値は設定（VECTOR_HNSW_EF_SEARCH / VECTOR_IVFFLAT_PROBES）またはサーバーの既定値を使用します。
+    値を大きくすると再現率が上がり、検索は遅くなります。
+    """
+    overrides = dict(_search_settings.get())
+    if ef_search is not None:
+        overrides["hnsw.ef_search"] = ef_search
+    if probes is not None:
+        overrides["ivfflat.probes"] = probes
+    token = _search_settings.set(overrides)
+    try:
+        yield
+    finally:
+        _search_settings.reset(token)
+
+
+def current_search_settings() -> Dict[str, int]:
+    """現在のコンテキストで適用する検索パラメーターを返します。"""
+    values: Dict[str, int] = {}
+    if settings.VECTOR_HNSW_EF_SEARCH:
+        values["hnsw.ef_search"] = settings.VECTOR_HNSW_EF_SEARCH
+    if settings.VECTOR_IVFFLAT_PROBES:
+        values["ivfflat.probes"] = settings.VECTOR_IVFFLAT_PROBES
+    values.update(_search_settings.get())
+    return values
+
+
+# 埋め込みを計算済みの検索クエリ（クエリ → ベクトル）
+_query_embeddings: ContextVar[Dict[str, List[float]]] = ContextVar("vector_query_embeddings", default={})
+
+
+@contextmanager
+def precomputed_query_embedding(query: str, embedding: Optional[List[float]]) -> Iterator[None]:
+    """
+    このコンテキスト内で query をベクトル検索する際に、埋め込みを計算せずに embedding を使います。
+    embedding が None の場合は何もしません。
+    """
+    if embedding is None:
+        yield
+        return
+    token = _query_embeddings.set({**_query_embeddings.get(), query: embedding})
+    try:
+        yield
+    finally:
+        _query_embeddings.reset(token)
+
+
+async def apply_search_settings(session: AsyncSession):
+    """検索パラメーターを現在のトランザクションに限って（SET LOCAL）設定します。"""
+    for name, value in current_search_settings().items():
+        await session.execute(text(f"SET LOCAL {name} = {int(value)}"))
+
+
+# チャンクテーブルの検索用インデックス（マイグレーション 006 / 007 と同じ定義）。
+# langchain_pg_embedding はPGVectorが初回利用時に作成するため、マイグレーションの時点でテーブルが無かった場合に
+# テーブルの作成と同時に作成します。複数のプロセスが同時に作成しても失敗しないよう、既に存在する場合は何もしません。
+SEARCH_INDEX_SQL = """
+DO $$
+BEGIN
+    IF to_regclass('ix_langchain_pg_embedding_document_trgm') IS NULL
+       AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        BEGIN
+            CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_document_trgm
+                ON langchain_pg_embedding USING gin (document gin_trgm_ops);
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN NULL;
+        END;
+    END IF;
+    IF to_regclass('ix_langchain_pg_embedding_tenant_id_rag_scope') IS NULL THEN
+        BEGIN
+            CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_tenant_id_rag_scope
+                ON langchain_pg_embedding ((cmetadata ->> 'tenant_id'), (cmetadata ->> 'rag_scope'));
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN NULL;
+        END;
+    END IF;
+    IF to_regclass('ix_langchain_pg_embedding_rag_scope') IS NULL THEN
+        BEGIN
+            CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_rag_scope
+                ON langchain_pg_embedding ((cmetadata ->> 'rag_scope'));
+        EXCEPTION WHEN duplicate_table OR unique_violation THEN NULL;
+        END;
+    END IF;
+END $$;
+"""
+
+
+class TunedPGVector(PGVector):
+    """
+    セッションの開始時に検索パラメーター（hnsw.ef_search / ivfflat.probes）を設定する PGVector。
+    SET LOCAL のため、同じトランザクションで実行される検索にだけ適用されます。
+    precomputed_query_embedding で埋め込みを渡されたクエリは、埋め込みを計算せずに検索します。
+    テーブルの作成時（初回利用時）に、キーワード検索・メタデータ絞り込み用のインデックスも作成します。
+    """
+    async def acreate_tables_if_not_exists(self) -> None:
+        await super().acreate_tables_if_not_exists()
+        async with self._async_engine.begin() as conn:
+            await conn.execute(text(SEARCH_INDEX_SQL))
+
+    async def asimilarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        embedding = _query_embeddings.get().get(query)
+        if embedding is None:
+            return await super().asimilarity_search(query, k=k, filter=filter, **kwargs)
+        return await self.asimilarity_search_by_vector(embedding, k=k, filter=filter, **kwargs)
+
+    @asynccontextmanager
+    async def _make_async_session(self):
+        async with super()._make_async_session() as session:
+            await apply_search_settings(session)
+            yield session
+
+
+# --- インデックスの作成・状態確認 ---
+
+def index_name_for(collection_id: UUID, method: str) -> str:
+    return f"{INDEX_NAME_PREFIX}{method}_{collection_id.hex}"
+
+
+def build_create_index_sql(
+    index_name: str,
+    collection_id: UUID,
+    method: str,
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: int = 100,
+) -> str:
+    """
+    コレクションのチャンクだけを対象にした部分インデックス（コサイン距離）の作成SQLを返します。
+    検索を止めないよう CONCURRENTLY で作成します。
+    """
+    if method == INDEX_METHOD_HNSW:
+        options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    elif method == INDEX_METHOD_IVFFLAT:
+        options = f"lists = {int(lists)}"
+    else:
+        raise VectorIndexError(f"Unsupported index method: {method}")
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {_EMBEDDING_TABLE} "
+        f"USING {method} (embedding vector_cosine_ops) WITH ({options}) "
+        f"WHERE collection_id = '{collection_id}'"
+    )
+
+
+# インデックス作成の状態（pg_index と pg_stat_progress_create_index から判定）
+BUILD_STATUS_RUNNING = "running"
+BUILD_STATUS_SUCCEEDED = "succeeded"
+BUILD_STATUS_FAILED = "failed"
+
+# CREATE INDEX CONCURRENTLY は作成中・失敗時ともに indisvalid = false のため、
+# 作成中の進捗が無い無効なインデックスを失敗とみなす
+_BUILD_STATUS_SQL = f"""
+    CASE
+        WHEN i.indisvalid THEN '{BUILD_STATUS_SUCCEEDED}'
+        WHEN EXISTS (SELECT 1 FROM pg_stat_progress_create_index AS p WHERE p.index_relid = i.indexrelid)
+            THEN '{BUILD_STATUS_RUNNING}'
+        ELSE '{BUILD_STATUS_FAILED}'
+    END
+"""
+
+
+@dataclass
+class IndexBuild:
+    """インデックス作成の開始時の状態。"""
+    index_name: str
+    collection_name: str
+    method: str
+    status: str = BUILD_STATUS_RUNNING # running / succeeded
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class VectorIndexManager:
+    """
+    PGVectorのチャンクテーブル（langchain_pg_embedding）に、コレクションごとのANNインデックス
+    （HNSW / IVFFlat）を作成・削除し、作成の状態・進捗とサイズを返します。
+
+    - インデックスはコレクション（テナント）ごとの部分インデックスで、CREATE INDEX CONCURRENTLY で
+      バックグラウンドに作成します（作成中も検索・追加は止まりません）。
+    - 作成の状態はプロセスのメモリに持たず、pg_index の indisvalid と pg_stat_progress_create_index から判定します
+      （どのプロセス・レプリカから開始した作成も、再起動後も同じ状態を返します）。
+    - 進捗は pg_stat_progress_create_index、サイズは pg_relation_size から取得します。
+    - HNSW / IVFFlat は次元数が固定の列にしか作成できないため、embedding 列に次元数が無い場合は作成しません。
+    """
+    def __init__(self, engine: AsyncEngine = default_engine):
+        self.engine = engine
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get_collection_id(self, collection_name: str) -> Optional[UUID]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT uuid FROM langchain_pg_collection WHERE name = :name"), {"name": collection_name}
+            )
+            return result.scalar_one_or_none()
+
+    async def _embedding_dimension(self, conn) -> Optional[int]:
+        result = await conn.execute(text(
+            "SELECT atttypmod FROM pg_attribute "
+            f"WHERE attrelid = to_regclass('{_EMBEDDING_TABLE}') AND attname = 'embedding'"
+        ))
+        typmod = result.scalar_one_or_none()
+        return typmod if typmod and typmod > 0 else None
+
+    async def _build_status(self, conn, index_name: str) -> Optional[str]:
+        """インデックスの作成状態を返します。インデックスが無い場合は None を返します。"""
+        result = await conn.execute(text(f"""
+            SELECT {_BUILD_STATUS_SQL}
+            FROM pg_index AS i
+            WHERE i.indexrelid = to_regclass(:index_name)
+        """), {"index_name": index_name})
+        return result.scalar_one_or_none()
+
+    async def start_build(
+        self,
+        collection_name: str,
+        method: str,
+        m: int = 16,
+        ef_construction: int = 64,
+        lists: int = 100,
+    ) -> IndexBuild:
+        """
+        インデックスの作成をバックグラウンドで開始し、作成状態を返します。
+        作成中・作成済みの場合は新たに開始せず、その状態を返します。失敗して残った無効なインデックスは削除して作り直します。
+        """
+        collection_id = await self.get_collection_id(collection_name)
+        if collection_id is None:
+            raise VectorIndexError(f"Vector collection not found: {collection_name}")
+        index_name = index_name_for(collection_id, method)
+        sql = build_create_index_sql(index_name, collection_id, method, m, ef_construction, lists)
+        async with self.engine.connect() as conn:
+            if await self._embedding_dimension(conn) is None:
+                raise VectorIndexError(
+                    "The embedding column has no fixed dimension; run "
+                    f"'ALTER TABLE {_EMBEDDING_TABLE} ALTER COLUMN embedding TYPE vector(<dim>)' first."
+                )
+            status = await self._build_status(conn, index_name)
+        if status in (BUILD_STATUS_RUNNING, BUILD_STATUS_SUCCEEDED):
+            return IndexBuild(index_name=index_name, collection_name=collection_name, method=method, status=status)
+        build = IndexBuild(index_name=index_name, collection_name=collection_name, method=method)
+        task = asyncio.create_task(self._build(build, sql, drop_invalid=status == BUILD_STATUS_FAILED))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return build
+
+    async def _build(self, build: IndexBuild, sql: str, drop_invalid: bool = False):
+        try:
+            # CONCURRENTLY はトランザクション内で実行できないため、自動コミットの接続を使う
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                if drop_invalid:
+                    # IF NOT EXISTS は失敗して残った無効なインデックスも「存在する」とみなすため、先に削除する
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {build.index_name}"))
+                await conn.execute(text(sql))
+        except Exception:
+            # 状態は pg_index から判定するため、ここではログのみ出力する
+            logger.exception(f"Vector index build failed: {build.index_name}")
+
+    async def list_indexes(self, collection_id: Optional[UUID] = None) -> List[Dict[str, Any]]:
+        """管理対象のインデックスの種類・有効性・サイズを返します（collection_id で絞り込み可能）。"""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(f"""
+                SELECT c.relname AS index_name, am.amname AS method, i.indisvalid AS is_valid,
+                       pg_relation_size(i.indexrelid) AS size_bytes, {_BUILD_STATUS_SQL} AS build_status
+                FROM pg_index AS i
+                JOIN pg_class AS c ON c.oid = i.indexrelid
+                JOIN pg_am AS am ON am.oid = c.relam
+                WHERE i.indrelid = to_regclass('{_EMBEDDING_TABLE}') AND c.relname LIKE '{INDEX_NAME_PREFIX}%'
+                ORDER BY c.relname
+            """))
+            rows = [dict(row._mapping) for row in result]
+        if collection_id is not None:
+            rows = [row for row in rows if row["index_name"].endswith(collection_id.hex)]
+        return rows
+
+    async def build_progress(self) -> List[Dict[str, Any]]:
+        """実行中のインデックス作成の進捗（フェーズ・処理済みブロック数/タプル数）を返します。"""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(text(f"""
+                SELECT p.pid, p.index_relid::regclass::text AS index_name, p.phase,
+                       p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+                FROM pg_stat_progress_create_index AS p
+                WHERE p.relid = to_regclass('{_EMBEDDING_TABLE}')
+            """))
+            return [dict(row._mapping) for row in result]
+
+    async def drop_index(self, index_name: str):
+        """管理対象のインデックスを削除します（CONCURRENTLY）。"""
+        if not index_name.startswith(INDEX_NAME_PREFIX) or not index_name.replace("_", "").isalnum():
+            raise VectorIndexError(f"Not a managed vector index: {index_name}")
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+
+
+# アプリ共通のインデックスマネージャー
+vector_index_manager = VectorIndexManager()
@@ -0,0 +1,71 @@
+import pytest
+
+from app.services.answer_composer import AnswerComposerService, IC5LightStreamParser
+from app.llm.mock_llm import MockLLMClient
+
+@pytest.fixture
+def answer_composer_service():
+    return AnswerComposerService()
+
+async def _batch_markdown(service: AnswerComposerService, raw_output: str) -> str:
+    """従来の一括整形（全トークン収集 → compose → Markdown化）の出力を再現します。"""
+    composed = await service.compose_ic5_light_response(raw_output.strip())
+    markdown = ""
+    for key in ("Decision", "Why", "Next 3 Actions"):
+        if composed[key]:
+            markdown += f"**{key}**\n{composed[key]}\n\n"
+    return markdown
+
+async def _stream_markdown(service: AnswerComposerService, tokens) -> str:
+    async def token_stream():
+        for token in tokens:
+            yield token
+    return "".join([chunk async for chunk in service.stream_composed_ic5_light_response(token_stream())])
+
+RAW_OUTPUTS = [
+    "Decision: Go.\nWhy: Cheap.\nNext 3 Actions:\n1. A\n2. B\n3. C",
+    "\nDecision:   Go ahead.  \n\nWhy:\n  Because.\nNext 3 Actions: 1. X\n",
+    "Decision: Test Decision. Why: Test Why. Next 3 Actions: Test Action 1.",
+    "Decision: only decision",
+    "Why: reason first\nDecision: later\nNext 3 Actions: act",
+    "Decision:\nWhy: empty decision",
+    "Decision: a\nNext 3 Actions: skip why\nWhy: late",
+    "no sections at all",
+    "Decision: x\nWhy:   \nNext 3 Actions:   ",
+    "Decision: 日本語の決定\nWhy: 理由です。\nNext 3 Actions: 1. 対応",
+    "",
+]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("raw_output", RAW_OUTPUTS)
+async def test_stream_matches_batch_for_every_token_split(answer_composer_service, raw_output):
+    """1文字単位・単語単位・任意の2分割のいずれでも一括整形と完全一致することのテスト"""
+    expected = await _batch_markdown(answer_composer_service, raw_output)
+
+    assert await _stream_markdown(answer_composer_service, list(raw_output)) == expected
+    assert await _stream_markdown(answer_composer_service, [w + " " for w in raw_output.split(" ")]) == \
+        await _batch_markdown(answer_composer_service, "".join(w + " " for w in raw_output.split(" ")))
+    for split in range(len(raw_output) + 1):
+        assert await _stream_markdown(answer_composer_service, [raw_output[:split], raw_output[split:]]) == expected
+
+@pytest.mark.asyncio
+async def test_stream_matches_batch_for_mock_llm_output(answer_composer_service):
+    """MockLLMClientの実際の応答で一括整形と完全一致することのテスト"""
+    client = MockLLMClient()
+    tokens = []
+    async for token in client.stream_chat_response("prompt"):
+        if token == "[END]":
+            break
+        tokens.append(token)
+
+    expected = await _batch_markdown(answer_composer_service, "".join(tokens))
+    assert await _stream_markdown(answer_composer_service, tokens) == expected
+
+def test_parser_emits_decision_before_stream_ends():
+    """区切りが確定した時点で見出しと本文を返し、区切りの途中は保留することのテスト"""
+    parser = IC5LightStreamParser()
+    assert parser.feed("Decision:") == []
+    assert parser.feed(" Adopt") == ["**Decision**\n", "Adopt"]
+    assert parser.feed(" plan\nWh") == [" plan"]
+    assert parser.feed("y: Risk") == ["\n\n", "**Why**\n", "Risk"]
+    assert parser.close() == ["\n\n"]
@@ -0,0 +1,205 @@
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+
+import pytest
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app import dependencies
+from app.dependencies import SESSION_COOKIE_NAME, _sign_payload, get_current_user
+from app.schemas.auth import AuthenticatedUser
+from app.services.auth_cache import (
+    AuthenticatedUserCache,
+    invalidate_user,
+    known_dev_user_ids,
+    session_user_cache,
+    token_digest,
+    token_user_cache,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_auth_caches():
+    session_user_cache.clear()
+    token_user_cache.clear()
+    known_dev_user_ids.clear()
+    yield
+    session_user_cache.clear()
+    token_user_cache.clear()
+    known_dev_user_ids.clear()
+
+
+@pytest.fixture
+def dev_user():
+    return AuthenticatedUser(id=uuid4(), tenant_id=uuid4(), email="dev@example.com", is_admin=True)
+
+
+def _request_with_cookie(value: str) -> MagicMock:
+    request = MagicMock()
+    request.cookies = {SESSION_COOKIE_NAME: value}
+    return request
+
+
+def test_ttl_cache_expires_and_evicts_lru():
+    """期限切れのエントリは返さず、上限超過時は最も古いエントリから破棄することのテスト"""
+    cache = TTLCache(max_entries=2, default_ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a を最近使用にする
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    with patch("app.core.cache.time.monotonic", return_value=time.monotonic() + 61):
+        assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_authenticated_user_cache_falls_back_when_redis_fails(dev_user):
+    """Redis層が失敗してもプロセス内キャッシュで動作することのテスト"""
+    failing_redis = MagicMock()
+    failing_redis.get = AsyncMock(side_effect=ConnectionError("down"))
+    failing_redis.set = AsyncMock(side_effect=ConnectionError("down"))
+    cache = AuthenticatedUserCache("test", max_entries=10, ttl_seconds=60, use_redis=True)
+
+    with patch("app.services.auth_cache.get_redis_client", return_value=failing_redis):
+        await cache.set("key", dev_user)
+        assert await cache.get("key") == dev_user
+        assert await cache.get("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_verifies_cookie_and_upserts_once(monkeypatch, dev_user):
+    """同じCookieでの2回目以降は署名検証とDBチェックを省略することのテスト"""
+    monkeypatch.setattr(settings, "DEV_AUTH_ENABLED", True)
+    cookie = _sign_payload(dev_user.model_dump())
+    ensure_mock = AsyncMock()
+
+    with patch.object(dependencies, "_ensure_dev_user_exists", ensure_mock), \
+         patch.object(dependencies, "_verify_payload", wraps=dependencies._verify_payload) as verify_mock:
+        for _ in range(3):
+            user = await get_current_user(_request_with_cookie(cookie), None, AsyncMock(), AsyncMock())
+            assert user == dev_user
+
+    assert verify_mock.call_count == 1
+    assert ensure_mock.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_rejects_tampered_cookie(monkeypatch, dev_user):
+    """改ざんされたCookieはキャッシュされず401になることのテスト"""
+    monkeypatch.setattr(settings, "DEV_AUTH_ENABLED", True)
+    cookie = _sign_payload(dev_user.model_dump())
+    tampered = cookie[:-1] + ("0" if cookie[-1] != "0" else "1")
+
+    with pytest.raises(Exception) as exc_info:
+        await get_current_user(_request_with_cookie(tampered), None, AsyncMock(), AsyncMock())
+    assert getattr(exc_info.value, "status_code", None) == 401
+    assert await session_user_cache.get(token_digest(tampered)) is None
+
+
+@pytest.mark.asyncio
+async def test_ensure_dev_user_exists_skips_known_users(dev_user):
+    """存在確認済みのユーザーはDBに問い合わせないことのテスト"""
+    known_dev_user_ids.set(dev_user.id, True)
+    session = AsyncMock()
+    with patch.object(dependencies, "TenantRepository") as tenant_repo_cls:
+        await dependencies._ensure_dev_user_exists(session, dev_user)
+    tenant_repo_cls.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_authenticated_user_cache_ttl_is_bounded_by_caller(dev_user):
+    """呼び出し側の有効期限（トークンのexp）が短い場合はそれを超えて保持しないことのテスト"""
+    cache = AuthenticatedUserCache("test", max_entries=10, ttl_seconds=300)
+    await cache.set("expired", dev_user, ttl_seconds=-1)
+    await cache.set("short", dev_user, ttl_seconds=5)
+    assert await cache.get("expired") is None
+
+    with patch("app.core.cache.time.monotonic", return_value=time.monotonic() + 6):
+        assert await cache.get("short") is None
+
+
+@pytest.mark.asyncio
+async def test_invalidate_user_clears_all_auth_caches(dev_user):
+    """invalidate_user でセッション・トークン・存在確認済みの各キャッシュが破棄されることのテスト"""
+    await session_user_cache.set("session", dev_user)
+    await token_user_cache.set("token", dev_user)
+    known_dev_user_ids.set(dev_user.id, True)
+
+    await invalidate_user(dev_user.id)
+
+    assert await session_user_cache.get("session") is None
+    assert await token_user_cache.get("token") is None
+    assert dev_user.id not in known_dev_user_ids
+
+
+class FakeRedis:
+    """認証キャッシュが使うコマンドだけを持つインメモリのRedis（有効期限は扱わない）"""
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    async def incr(self, key):
+        self.store[key] = int(self.store.get(key, 0)) + 1
+        return self.store[key]
+
+    async def sadd(self, key, *members):
+        self.store.setdefault(key, set()).update(members)
+
+    async def smembers(self, key):
+        return self.store.get(key, set())
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_invalidate_user_reaches_other_workers_through_redis(dev_user):
+    """Redis使用時、別のワーカー（インスタンス）で無効化したユーザーのL1エントリも使われないことのテスト"""
+    redis = FakeRedis()
+    worker_a = AuthenticatedUserCache("test", max_entries=10, ttl_seconds=300, use_redis=True)
+    worker_b = AuthenticatedUserCache("test", max_entries=10, ttl_seconds=300, use_redis=True)
+
+    with patch("app.services.auth_cache.get_redis_client", return_value=redis):
+        await worker_a.set("token", dev_user)
+        # worker_b はRedisからL1に補充する
+        assert await worker_b.get("token") == dev_user
+        assert "token" in worker_b._local
+
+        await worker_a.invalidate_user(dev_user.id)
+
+        assert await worker_b.get("token") is None
+        assert await worker_a.get("token") is None
+        # 無効化後に保存し直したエントリは使われる
+        await worker_a.set("token", dev_user)
+        assert await worker_b.get("token") == dev_user
+
+
+@pytest.mark.asyncio
+async def test_redis_refill_keeps_remaining_ttl_and_indexes_user(dev_user):
+    """RedisからL1へ補充したエントリは残りの有効期間だけ保持し、invalidate_user の索引にも登録されることのテスト"""
+    redis = FakeRedis()
+    writer = AuthenticatedUserCache("test", max_entries=10, ttl_seconds=300, use_redis=True)
+    reader = AuthenticatedUserCache("test", max_entries=10, ttl_seconds=300, use_redis=True)
+
+    with patch("app.services.auth_cache.get_redis_client", return_value=redis):
+        await writer.set("token", dev_user, ttl_seconds=5)
+        assert await reader.get("token") == dev_user
+        assert reader._user_keys[dev_user.id] == {"token"}
+
+        with patch("app.core.cache.time.monotonic", return_value=time.monotonic() + 6), \
+             patch("app.services.auth_cache.time.time", return_value=time.time() + 6):
+            # L1は残りの期間（約5秒）で失効し、Redisのエントリも有効期限切れとして扱う
+            assert await reader.get("token") is None
@@ -1,9 +1,20 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
 import pytest
+import pytest_asyncio
+from authlib.jose import JsonWebKey, jwt as authlib_jwt
 from unittest.mock import AsyncMock, MagicMock, patch
 from uuid import uuid4
 from jose import jwt as python_jose_jwt
 
 from app.services.auth import AuthService
+from app.services.jwks_cache import cache_ttl_from_headers, clear_jwks_caches, close_http_client
+from app.services.auth_cache import token_user_cache
 from app.schemas.auth import AuthenticatedUser
 from app.repositories.user import UserRepository
 from app.repositories.tenant import TenantRepository
@@ -40,40 +51,191 @@ def mock_settings():
         mock_s.PROJECT_NAME = "DOM Enterprise Gateway" # PROJECT_NAMEも必要
         yield mock_s
 
+class StandInOidcProvider:
+    """
+    テスト用のローカルOIDCプロバイダ（ディスカバリとJWKSのみ）。
+    別スレッドのHTTPサーバーで応答し、パスごとのリクエスト回数を記録します。
+    """
+    def __init__(self):
+        self.keys = [self.generate_key("key-1")]
+        self.cache_control = "public, max-age=3600"
+        self.jwks_delay_seconds = 0.0
+        self.discovery_body = None
+        self.hits = {"/.well-known/openid-configuration": 0, "/jwks": 0}
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                provider.hits[self.path] = provider.hits.get(self.path, 0) + 1
+                if self.path == "/.well-known/openid-configuration":
+                    body = provider.discovery_body if provider.discovery_body is not None else {"jwks_uri": f"{provider.url}/jwks"}
+                    headers = {}
+                elif self.path == "/jwks":
+                    time.sleep(provider.jwks_delay_seconds)
+                    body = {"keys": [key.as_dict(is_private=False) for key in provider.keys]}
+                    headers = {"Cache-Control": provider.cache_control}
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def generate_key(kid: str):
+        return JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": kid})
+
+    def issue_token(self, email: str, key=None) -> str:
+        key = key or self.keys[0]
+        now = int(time.time())
+        claims = {"iss": self.url, "aud": "mock_client_id", "sub": "sub-1", "email": email, "iat": now, "exp": now + 300}
+        return authlib_jwt.encode({"alg": "RS256", "kid": key.kid}, claims, key).decode()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope="module")
+def oidc_provider():
+    provider = StandInOidcProvider()
+    yield provider
+    provider.stop()
+
+@pytest_asyncio.fixture(autouse=True)
+async def reset_jwks_cache(oidc_provider):
+    """テストごとにプロセス共有のJWKSキャッシュとスタンドインの状態を初期化するフィクスチャ"""
+    clear_jwks_caches()
+    token_user_cache.clear()
+    oidc_provider.keys = oidc_provider.keys[:1]
+    oidc_provider.cache_control = "public, max-age=3600"
+    oidc_provider.jwks_delay_seconds = 0.0
+    oidc_provider.discovery_body = None
+    for path in oidc_provider.hits:
+        oidc_provider.hits[path] = 0
+    yield
+    clear_jwks_caches()
+    token_user_cache.clear()
+    await close_http_client()
+
+@pytest.fixture
+def provider_settings(mock_settings, oidc_provider):
+    mock_settings.OIDC_ISSUER = oidc_provider.url
+    return mock_settings
+
 # テストケース
 @pytest.mark.asyncio
-async def test_get_jwks_uri_success(auth_service, mock_settings):
-    """JWKS URIの取得成功テスト"""
-    with patch('httpx.AsyncClient') as MockAsyncClient:
-        # Clientのモック
-        mock_client_instance = MockAsyncClient.return_value.__aenter__.return_value
-        
-        # Responseのモック (AsyncMockではなくMagicMockを使うか、明示的にメソッドを定義)
-        mock_response = MagicMock()
-        mock_response.json.return_value = {"jwks_uri": "https://mock-issuer.com/jwks"}
-        mock_response.raise_for_status.return_value = None
-        
-        # getメソッドの戻り値を設定
-        mock_client_instance.get.return_value = mock_response
-
-        jwks_uri = await auth_service.get_jwks_uri()
-        assert jwks_uri == "https://mock-issuer.com/jwks"
-        mock_client_instance.get.assert_awaited_once()
+async def test_get_jwks_uri_success(auth_service, provider_settings, oidc_provider):
+    """JWKS URIの取得成功テスト（2回目以降はディスカバリにアクセスしない）"""
+    assert await auth_service.get_jwks_uri() == f"{oidc_provider.url}/jwks"
+    assert await auth_service.get_jwks_uri() == f"{oidc_provider.url}/jwks"
+    assert oidc_provider.hits["/.well-known/openid-configuration"] == 1
 
 @pytest.mark.asyncio
-async def test_get_jwks_uri_failure(auth_service, mock_settings):
+async def test_get_jwks_uri_failure(auth_service, provider_settings, oidc_provider):
     """JWKS URIの取得失敗テスト"""
-    with patch('httpx.AsyncClient') as MockAsyncClient:
-        mock_client_instance = MockAsyncClient.return_value.__aenter__.return_value
-        
-        mock_response = MagicMock()
-        mock_response.json.return_value = {} # jwks_uriがない場合
-        mock_response.raise_for_status.return_value = None
-        
-        mock_client_instance.get.return_value = mock_response
-
-        with pytest.raises(ValueError, match="jwks_uri not found"):
-            await auth_service.get_jwks_uri()
+    oidc_provider.discovery_body = {} # jwks_uriがない場合
+
+    with pytest.raises(ValueError, match="jwks_uri not found"):
+        await auth_service.get_jwks_uri()
+
+@pytest.mark.asyncio
+async def test_verify_id_token_reuses_jwks_across_service_instances(mock_user_repository, mock_tenant_repository, provider_settings, oidc_provider):
+    """リクエストごとにAuthServiceを生成しても、ディスカバリとJWKSの取得は1回だけであることのテスト"""
+    tenant = Tenant(id=uuid4(), name=provider_settings.PROJECT_NAME)
+    mock_tenant_repository.get_by_name.return_value = tenant
+    mock_user_repository.get_by_email.return_value = User(
+        id=uuid4(), tenant_id=tenant.id, email="test@example.com",
+        hashed_password="OIDC_USER_DUMMY_PASSWORD", is_active=True, is_admin=False
+    )
+    token = oidc_provider.issue_token("test@example.com")
+
+    for _ in range(3):
+        user = await AuthService(mock_user_repository, mock_tenant_repository).verify_id_token(token)
+        assert user.email == "test@example.com"
+
+    assert oidc_provider.hits == {"/.well-known/openid-configuration": 1, "/jwks": 1}
+
+@pytest.mark.asyncio
+async def test_verify_id_token_caches_verified_user_until_invalidated(mock_user_repository, mock_tenant_repository, provider_settings, oidc_provider):
+    """検証済みトークンの2回目以降は署名検証とDBアクセスを省略し、無効化後は再検証することのテスト"""
+    tenant = Tenant(id=uuid4(), name=provider_settings.PROJECT_NAME)
+    db_user = User(
+        id=uuid4(), tenant_id=tenant.id, email="test@example.com",
+        hashed_password="OIDC_USER_DUMMY_PASSWORD", is_active=True, is_admin=False
+    )
+    mock_tenant_repository.get_by_name.return_value = tenant
+    mock_user_repository.get_by_email.return_value = db_user
+    token = oidc_provider.issue_token("test@example.com")
+
+    for _ in range(3):
+        service = AuthService(mock_user_repository, mock_tenant_repository)
+        with patch.object(service, "_jwt_decoder", wraps=service._jwt_decoder) as decoder:
+            assert (await service.verify_id_token(token)).id == db_user.id
+    assert mock_user_repository.get_by_email.await_count == 1
+    decoder.decode.assert_not_called()
+
+    await token_user_cache.invalidate_user(db_user.id)
+    await AuthService(mock_user_repository, mock_tenant_repository).verify_id_token(token)
+    assert mock_user_repository.get_by_email.await_count == 2
+
+@pytest.mark.asyncio
+async def test_get_signing_key_refetches_once_for_rotated_kid(auth_service, provider_settings, oidc_provider, monkeypatch):
+    """未知のkidでは同時リクエストでも再取得は1回に集約されることのテスト"""
+    monkeypatch.setattr(settings, "JWKS_UNKNOWN_KID_MIN_INTERVAL_SECONDS", 0)
+    await auth_service.get_jwks_client()
+    rotated_key = StandInOidcProvider.generate_key("key-2")
+    oidc_provider.keys.append(rotated_key)
+    oidc_provider.jwks_delay_seconds = 0.1
+
+    keys = await asyncio.gather(*[auth_service.get_signing_key("key-2") for _ in range(10)])
+
+    assert all(key.kid == "key-2" for key in keys)
+    assert oidc_provider.hits["/jwks"] == 2
+
+@pytest.mark.asyncio
+async def test_get_signing_key_throttles_unknown_kid_refetch(auth_service, provider_settings, oidc_provider):
+    """取得直後の未知のkidでは再取得せずにエラーとすることのテスト"""
+    await auth_service.get_jwks_client()
+
+    with pytest.raises(ValueError, match="No matching public key found for kid: unknown"):
+        await auth_service.get_signing_key("unknown")
+    assert oidc_provider.hits["/jwks"] == 1
+
+@pytest.mark.asyncio
+async def test_jwks_refreshes_in_background_before_expiry(auth_service, provider_settings, oidc_provider, monkeypatch):
+    """有効期限が近づいたら現在の鍵を返しつつバックグラウンドで再取得することのテスト"""
+    oidc_provider.cache_control = "max-age=120"
+    monkeypatch.setattr(settings, "JWKS_CACHE_MIN_TTL_SECONDS", 60)
+    monkeypatch.setattr(settings, "JWKS_REFRESH_AHEAD_SECONDS", 300)
+    cache = auth_service.jwks_cache
+
+    first = await cache.get_key_set()
+    assert await cache.get_key_set() is first  # 期限前は待たずに現在の鍵セットを返す
+    await cache._inflight
+    assert oidc_provider.hits["/jwks"] == 2
+    assert cache._key_set is not first
+
+def test_cache_ttl_from_headers_respects_cache_control():
+    """Cache-Controlのmax-ageを上下限付きで使用することのテスト"""
+    assert cache_ttl_from_headers(httpx.Headers({"Cache-Control": "public, max-age=600"})) == 600
+    assert cache_ttl_from_headers(httpx.Headers({"Cache-Control": "max-age=1"})) == settings.JWKS_CACHE_MIN_TTL_SECONDS
+    assert cache_ttl_from_headers(httpx.Headers({"Cache-Control": "no-store"})) == settings.JWKS_CACHE_DEFAULT_TTL_SECONDS
+    assert cache_ttl_from_headers(httpx.Headers({})) == settings.JWKS_CACHE_DEFAULT_TTL_SECONDS
 
 @pytest.mark.asyncio
 async def test_verify_id_token_no_client_id(auth_service, mock_settings):
@@ -100,12 +262,10 @@ async def test_verify_id_token_success_new_user_and_tenant(auth_service, mock_us
     )
     mock_user_repository.create.return_value = created_user
 
-    # get_jwks_client自体をモックしてHTTP通信をスキップ
-    mock_jwks_client = MagicMock()
-    mock_jwks_client.find_by_kid.return_value = "mock_public_key"
+    # get_signing_key自体をモックしてHTTP通信をスキップ
     
-    with patch.object(auth_service, 'get_jwks_client', new_callable=AsyncMock) as mock_get_jwks_client:
-        mock_get_jwks_client.return_value = mock_jwks_client
+    with patch.object(auth_service, 'get_signing_key', new_callable=AsyncMock) as mock_get_signing_key:
+        mock_get_signing_key.return_value = "mock_public_key"
 
         # JWTモック
         with patch('app.services.auth.python_jose_jwt') as mock_python_jose_jwt, \
@@ -157,11 +317,9 @@ async def test_verify_id_token_success_existing_user_and_tenant(auth_service, mo
     mock_tenant_repository.get_by_name.return_value = existing_tenant
     mock_user_repository.get_by_email.return_value = existing_user
 
-    mock_jwks_client = MagicMock()
-    mock_jwks_client.find_by_kid.return_value = "mock_public_key"
 
-    with patch.object(auth_service, 'get_jwks_client', new_callable=AsyncMock) as mock_get_jwks_client:
-        mock_get_jwks_client.return_value = mock_jwks_client
+    with patch.object(auth_service, 'get_signing_key', new_callable=AsyncMock) as mock_get_signing_key:
+        mock_get_signing_key.return_value = "mock_public_key"
 
         # JWTモック
         with patch('app.services.auth.python_jose_jwt') as mock_python_jose_jwt, \
@@ -207,11 +365,9 @@ async def test_verify_id_token_admin_user_creation(auth_service, mock_user_repos
     )
     mock_user_repository.create.return_value = created_user
 
-    mock_jwks_client = MagicMock()
-    mock_jwks_client.find_by_kid.return_value = "mock_public_key"
 
-    with patch.object(auth_service, 'get_jwks_client', new_callable=AsyncMock) as mock_get_jwks_client:
-        mock_get_jwks_client.return_value = mock_jwks_client
+    with patch.object(auth_service, 'get_signing_key', new_callable=AsyncMock) as mock_get_signing_key:
+        mock_get_signing_key.return_value = "mock_public_key"
 
         with patch('app.services.auth.python_jose_jwt') as mock_python_jose_jwt, \
              patch('app.services.auth.JsonWebToken') as MockJsonWebToken:
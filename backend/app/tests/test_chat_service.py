@@ -7,6 +7,7 @@ from app.services.chat_service import ChatService
 from app.repositories.chat import ChatSessionRepository, ChatMessageRepository
 from app.services.memory_service import MemoryService
 from app.services.dom_orchestrator import DomOrchestratorService
+from app.services.rag_service import RagService
 from app.models.chat import ChatSession, ChatMessage
 from app.schemas.auth import AuthenticatedUser
 from app.schemas.chat import ChatSessionResponse
@@ -27,18 +28,24 @@ def mock_memory_service():
 def mock_dom_orchestrator_service():
     return AsyncMock(spec=DomOrchestratorService)
 
+@pytest.fixture
+def mock_rag_service():
+    return AsyncMock(spec=RagService)
+
 @pytest.fixture
 def chat_service(
     mock_chat_session_repo,
     mock_chat_message_repo,
     mock_memory_service,
-    mock_dom_orchestrator_service
+    mock_dom_orchestrator_service,
+    mock_rag_service
 ):
     return ChatService(
         mock_chat_session_repo,
         mock_chat_message_repo,
         mock_memory_service,
-        mock_dom_orchestrator_service
+        mock_dom_orchestrator_service,
+        mock_rag_service
     )
 
 @pytest.fixture
@@ -71,6 +78,7 @@ async def test_reset_session_success(
     mock_chat_message_repo,
     mock_memory_service,
     mock_dom_orchestrator_service,
+    mock_rag_service,
     mock_user,
     mock_session,
     mock_messages
@@ -101,6 +109,7 @@ async def test_reset_session_success(
     mock_chat_message_repo.get_by_session_id.assert_awaited_once_with(mock_session.id)
     mock_dom_orchestrator_service.summarize_chat_history.assert_awaited_once_with(mock_messages)
     mock_memory_service.create_episodic_memory.assert_awaited_once()
+    mock_rag_service.purge_ephemeral_session.assert_awaited_once_with(mock_session.id)
     mock_chat_session_repo.update.assert_awaited_once_with(mock_session, {"is_active": False})
     mock_chat_session_repo.create.assert_awaited_once()
     
@@ -130,6 +139,7 @@ async def test_reset_session_summary_save_failure(
     mock_chat_message_repo,
     mock_memory_service,
     mock_dom_orchestrator_service,
+    mock_rag_service,
     mock_user,
     mock_session,
     mock_messages
@@ -147,5 +157,6 @@ async def test_reset_session_summary_save_failure(
     mock_chat_message_repo.get_by_session_id.assert_awaited_once()
     mock_dom_orchestrator_service.summarize_chat_history.assert_awaited_once()
     mock_memory_service.create_episodic_memory.assert_awaited_once()
+    mock_rag_service.purge_ephemeral_session.assert_not_awaited() # 保存失敗時はEphemeralベクトルも削除しない
     mock_chat_session_repo.update.assert_not_awaited() # 保存失敗時は古いセッションは更新されない
     mock_chat_session_repo.create.assert_not_awaited() # 新しいセッションも作成されない
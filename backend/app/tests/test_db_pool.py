@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.db_pool import InstrumentedAsyncAdaptedQueuePool, PoolMetrics, register_pool_metrics
+
+def test_pool_metrics_wait_histogram_is_cumulative():
+    """待ち時間ヒストグラムが累積バケットとして集計されることのテスト"""
+    metrics = PoolMetrics()
+    metrics.observe_wait(0.0005) # 0.5ms
+    metrics.observe_wait(0.02)   # 20ms
+    metrics.observe_wait(10.0)   # 10s (+Inf)
+
+    snapshot = metrics.snapshot(pool=object())
+    buckets = {bucket["le"]: bucket["count"] for bucket in snapshot["wait_time_ms"]["buckets"]}
+    assert buckets["1"] == 1
+    assert buckets["25"] == 2
+    assert buckets["5000"] == 2
+    assert buckets["+Inf"] == 3
+    assert snapshot["wait_time_ms"]["count"] == 3
+    assert snapshot["wait_time_ms"]["max"] == pytest.approx(10000.0)
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_records_checkouts_and_waits(tmp_path, monkeypatch):
+    """計測付きプールでチェックアウト数・使用中接続数・取得待ち時間が記録されることのテスト"""
+    metrics = PoolMetrics()
+    monkeypatch.setattr(InstrumentedAsyncAdaptedQueuePool, "metrics", metrics)
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        pool_size=2,
+        max_overflow=1,
+    )
+    register_pool_metrics(engine.sync_engine.pool, metrics)
+    try:
+        async with engine.connect() as first, engine.connect() as second:
+            await first.execute(text("SELECT 1"))
+            await second.execute(text("SELECT 1"))
+            in_use = metrics.snapshot(engine.sync_engine.pool)
+        after = metrics.snapshot(engine.sync_engine.pool)
+    finally:
+        await engine.dispose()
+
+    assert in_use["checked_out"] == 2
+    assert in_use["pool_size"] == 2
+    assert after["checked_out"] == 0
+    assert after["idle"] == 2
+    assert after["checkouts_total"] == 2
+    assert after["checkins_total"] == 2
+    assert after["connections_created_total"] == 2
+    assert after["wait_time_ms"]["count"] == 2
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_records_each_contended_wait(tmp_path, monkeypatch):
+    """プールが埋まっている間に並行して接続を待つ各チェックアウトの待ち時間が、すべて記録されることのテスト"""
+    metrics = PoolMetrics()
+    monkeypatch.setattr(InstrumentedAsyncAdaptedQueuePool, "metrics", metrics)
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=10,
+    )
+    register_pool_metrics(engine.sync_engine.pool, metrics)
+    hold_seconds = 0.05
+
+    async def hold_connection():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await asyncio.sleep(hold_seconds)
+
+    try:
+        await asyncio.gather(*(hold_connection() for _ in range(5)))
+        snapshot = metrics.snapshot(engine.sync_engine.pool)
+    finally:
+        await engine.dispose()
+
+    assert snapshot["checkouts_total"] == 5
+    assert snapshot["wait_time_ms"]["count"] == 5
+    # 最後のチェックアウトは先の4件が接続を返すまで待つ
+    assert snapshot["wait_time_ms"]["max"] >= hold_seconds * 1000 * 3
@@ -6,7 +6,9 @@ from uuid import UUID, uuid4
 from app.services.dom_orchestrator import DomOrchestratorService
 from app.llm.mock_llm import MockLLMClient
 from app.services.answer_composer import AnswerComposerService
-from app.services.rag_service import RagService # New import
+from app.services.rag_service import AnswerCacheLookup, RagService # New import
+from app.services.history_service import ConversationContext, ConversationHistoryService
+from app.models.chat import ChatMessage
 
 @pytest.fixture
 def mock_llm_client():
@@ -14,12 +16,16 @@ def mock_llm_client():
 
 @pytest.fixture
 def mock_answer_composer_service():
-    return AsyncMock(spec=AnswerComposerService)
+    """ストリーミング整形はパーサ自体の挙動を検証するため実物を使用"""
+    return AnswerComposerService()
 
 @pytest.fixture
 def mock_rag_service():
-    """RagServiceのモックフィクスチャ"""
-    return AsyncMock(spec=RagService)
+    """RagServiceのモックフィクスチャ（回答キャッシュは無効）"""
+    rag_service = AsyncMock(spec=RagService)
+    rag_service.lookup_cached_answer.return_value = None
+    rag_service.store_answer = MagicMock()
+    return rag_service
 
 @pytest.fixture
 def dom_orchestrator_service(mock_llm_client, mock_answer_composer_service, mock_rag_service):
@@ -39,7 +45,7 @@ async def test_process_chat_message_ic5_light_streaming(
     """
     test_prompt = "Test prompt for IC-5"
     test_session_id = str(uuid4()) # strに変換
-    raw_llm_output_mock = "Decision: Test Decision. Why: Test Why. Next 3 Actions: Test Action 1, Test Action 2, Test Action 3."
+    raw_llm_output_mock = "Decision: Test Decision.\nWhy: Test Why.\nNext 3 Actions: Test Action 1, Test Action 2, Test Action 3."
     
     # Mock LLM Client to stream tokens
     async def mock_llm_stream():
@@ -48,13 +54,6 @@ async def test_process_chat_message_ic5_light_streaming(
         yield "[END]"
     mock_llm_client.stream_chat_response.return_value = mock_llm_stream()
 
-    # Mock AnswerComposerService to return formatted dictionary
-    mock_answer_composer_service.compose_ic5_light_response.return_value = {
-        "Decision": "Test Decision.",
-        "Why": "Test Why.",
-        "Next 3 Actions": "Test Action 1, Test Action 2, Test Action 3."
-    }
-
     # ストリーミング応答の収集
     streamed_output = ""
     async for chunk in dom_orchestrator_service.process_chat_message(test_prompt, test_session_id, is_research_mode=False):
@@ -62,8 +61,7 @@ async def test_process_chat_message_ic5_light_streaming(
 
     # 検証
     mock_llm_client.stream_chat_response.assert_called_once_with(test_prompt) # RAGなしなので元のプロンプト
-    mock_answer_composer_service.compose_ic5_light_response.assert_awaited_once_with(raw_llm_output_mock.strip())
-    mock_rag_service.query_rag.assert_not_awaited() # Research Mode OFFなので呼ばれない
+    mock_rag_service.retrieve_context.assert_not_awaited() # Research Mode OFFなので呼ばれない
 
     expected_output_parts = [
         "**Decision**\nTest Decision.\n\n",
@@ -88,26 +86,23 @@ async def test_process_chat_message_research_mode_on_with_rag_context(
     """
     test_prompt = "RAG Test Question"
     test_session_id = str(uuid4())
-    rag_context_mock = "RAG retrieved: Some relevant document content."
-    llm_output_with_rag = "Decision: Answer based on RAG. Why: Explained by RAG. Next 3 Actions: Check RAG, Verify RAG, Use RAG."
+    rag_context_mock = "Some relevant document content.\n\nAnother relevant chunk."
+    llm_output_with_rag = "Decision: Answer based on RAG.\nWhy: Explained by RAG.\nNext 3 Actions: Check RAG, Verify RAG, Use RAG."
 
-    mock_rag_service.query_rag.return_value = rag_context_mock
+    mock_rag_service.retrieve_context.return_value = rag_context_mock
     async def mock_llm_stream():
         for token in llm_output_with_rag.split(" "):
             yield token + " "
         yield "[END]"
     mock_llm_client.stream_chat_response.return_value = mock_llm_stream()
-    mock_answer_composer_service.compose_ic5_light_response.return_value = {
-        "Decision": "Answer based on RAG.",
-        "Why": "Explained by RAG.",
-        "Next 3 Actions": "Check RAG, Verify RAG, Use RAG."
-    }
 
     streamed_output = ""
     async for chunk in dom_orchestrator_service.process_chat_message(test_prompt, test_session_id, is_research_mode=True):
         streamed_output += chunk
 
-    mock_rag_service.query_rag.assert_awaited_once_with(test_prompt, session_id=UUID(test_session_id))
+    # 検索のみを行い、回答の生成はLLMクライアントのストリーミング1回だけ
+    mock_rag_service.retrieve_context.assert_awaited_once_with(test_prompt, session_id=UUID(test_session_id), cache_lookup=None)
+    mock_llm_client.stream_chat_response.assert_called_once()
     expected_augmented_prompt_prefix = f"ユーザーの質問: {test_prompt}\n\n関連情報: {rag_context_mock}"
     assert expected_augmented_prompt_prefix in mock_llm_client.stream_chat_response.call_args[0][0]
     assert "**Decision**\nAnswer based on RAG.\n\n" in streamed_output
@@ -124,25 +119,174 @@ async def test_process_chat_message_research_mode_on_no_rag_context(
     """
     test_prompt = "No RAG context question"
     test_session_id = str(uuid4())
-    llm_output_no_rag = "Decision: Answer without RAG. Why: No RAG data. Next 3 Actions: None."
+    llm_output_no_rag = "Decision: Answer without RAG.\nWhy: No RAG data.\nNext 3 Actions: None."
 
-    mock_rag_service.query_rag.return_value = "分かりません" # またはNone
+    mock_rag_service.retrieve_context.return_value = "" # 関連するチャンクが無い
     async def mock_llm_stream():
         for token in llm_output_no_rag.split(" "):
             yield token + " "
         yield "[END]"
     mock_llm_client.stream_chat_response.return_value = mock_llm_stream()
-    mock_answer_composer_service.compose_ic5_light_response.return_value = {
-        "Decision": "Answer without RAG.",
-        "Why": "No RAG data.",
-        "Next 3 Actions": "None."
-    }
 
     streamed_output = ""
     async for chunk in dom_orchestrator_service.process_chat_message(test_prompt, test_session_id, is_research_mode=True):
         streamed_output += chunk
 
-    mock_rag_service.query_rag.assert_awaited_once_with(test_prompt, session_id=UUID(test_session_id))
-    assert f"ユーザーの質問: {test_prompt}\n\n関連情報: {mock_rag_service.query_rag.return_value}" not in mock_llm_client.stream_chat_response.call_args[0][0]
+    mock_rag_service.retrieve_context.assert_awaited_once_with(test_prompt, session_id=UUID(test_session_id), cache_lookup=None)
+    assert "関連情報:" not in mock_llm_client.stream_chat_response.call_args[0][0]
     assert "Proceeding without RAG context" in streamed_output # 警告メッセージを確認
     assert "**Decision**\nAnswer without RAG.\n\n" in streamed_output
+
+@pytest.mark.asyncio
+async def test_process_chat_message_streams_first_section_before_llm_completes(
+    dom_orchestrator_service,
+    mock_llm_client
+):
+    """
+    LLMストリームの完了を待たずにDecisionセクションが返されることのテスト。
+    """
+    llm_finished = False
+
+    async def mock_llm_stream():
+        nonlocal llm_finished
+        for token in ["Decision: ", "Ship ", "it.", "\nWhy: ", "Because."]:
+            yield token
+        llm_finished = True
+        yield "[END]"
+    mock_llm_client.stream_chat_response.return_value = mock_llm_stream()
+
+    stream = dom_orchestrator_service.process_chat_message("prompt", str(uuid4()))
+    first_chunk = await stream.__anext__()
+    assert first_chunk == "**Decision**\n"
+    assert llm_finished is False
+
+    rest = "".join([chunk async for chunk in stream])
+    assert first_chunk + rest == "**Decision**\nShip it.\n\n**Why**\nBecause.\n\n"
+
+@pytest.mark.asyncio
+async def test_process_chat_message_includes_conversation_history(
+    mock_llm_client,
+    mock_answer_composer_service,
+    mock_rag_service
+):
+    """
+    ConversationHistoryServiceが設定されている場合、会話履歴を付加したプロンプトでLLMを呼び出すテスト。
+    """
+    history_service = AsyncMock(spec=ConversationHistoryService)
+    history_service.build_context.return_value = ConversationContext(messages=[ChatMessage(role="user", content="前の質問")])
+    service = DomOrchestratorService(mock_llm_client, mock_answer_composer_service, mock_rag_service, history_service)
+    session_id = uuid4()
+
+    async def mock_llm_stream():
+        yield "Decision: OK"
+        yield "[END]"
+    mock_llm_client.stream_chat_response.return_value = mock_llm_stream()
+
+    output = "".join([chunk async for chunk in service.process_chat_message("Test prompt", str(session_id))])
+
+    assert output == "**Decision**\nOK\n\n"
+    history_service.build_context.assert_awaited_once_with(session_id)
+    mock_llm_client.stream_chat_response.assert_called_once_with("会話履歴:\nuser: 前の質問\n\nTest prompt")
+
+def _cache_lookup(answer=None):
+    return AnswerCacheLookup(ephemeral_session_id=None, question="Q", question_vector=[1.0], generation=0, answer=answer)
+
+@pytest.mark.asyncio
+async def test_process_chat_message_research_mode_returns_cached_answer(
+    dom_orchestrator_service,
+    mock_llm_client,
+    mock_rag_service
+):
+    """
+    回答キャッシュに近い質問の回答がある場合、検索とLLM呼び出しを省略してその回答を整形して返すテスト。
+    """
+    session_id = uuid4()
+    mock_rag_service.lookup_cached_answer.return_value = _cache_lookup("Decision: Cached.\nWhy: Reused.")
+
+    output = "".join([chunk async for chunk in dom_orchestrator_service.process_chat_message("Q", str(session_id), is_research_mode=True)])
+
+    assert output == "**Decision**\nCached.\n\n**Why**\nReused.\n\n"
+    mock_rag_service.lookup_cached_answer.assert_awaited_once_with("Q", session_id=session_id)
+    mock_rag_service.retrieve_context.assert_not_awaited()
+    mock_llm_client.stream_chat_response.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_chat_message_research_mode_stores_streamed_answer(
+    dom_orchestrator_service,
+    mock_llm_client,
+    mock_rag_service
+):
+    """
+    回答キャッシュに無い質問は、ストリーミングを最後まで終えた生の回答を回答キャッシュに保存するテスト。
+    """
+    lookup = _cache_lookup()
+    mock_rag_service.lookup_cached_answer.return_value = lookup
+    mock_rag_service.retrieve_context.return_value = "context"
+
+    async def mock_llm_stream():
+        for token in ["Decision: ", "Ship ", "it."]:
+            yield token
+        yield "[END]"
+    mock_llm_client.stream_chat_response.return_value = mock_llm_stream()
+
+    stream = dom_orchestrator_service.process_chat_message("Q", str(uuid4()), is_research_mode=True)
+    await stream.__anext__()
+    mock_rag_service.store_answer.assert_not_called()
+    [chunk async for chunk in stream]
+
+    mock_rag_service.store_answer.assert_called_once_with(lookup, "Decision: Ship it.")
+    # キャッシュの確認で解決したセッションと質問の埋め込みを検索でも使う
+    assert mock_rag_service.retrieve_context.await_args.kwargs["cache_lookup"] is lookup
+
+@pytest.mark.asyncio
+async def test_process_chat_message_skips_answer_cache_with_history_or_without_context(
+    mock_llm_client,
+    mock_answer_composer_service,
+    mock_rag_service
+):
+    """
+    会話履歴がある場合は回答キャッシュを使わず、関連情報が無い場合は回答を保存しないテスト。
+    """
+    history_service = AsyncMock(spec=ConversationHistoryService)
+    history_service.build_context.return_value = ConversationContext(messages=[ChatMessage(role="user", content="前の質問")])
+    mock_rag_service.retrieve_context.return_value = "context"
+    service = DomOrchestratorService(mock_llm_client, mock_answer_composer_service, mock_rag_service, history_service)
+
+    async def mock_llm_stream():
+        yield "Decision: OK"
+        yield "[END]"
+    mock_llm_client.stream_chat_response.side_effect = lambda prompt: mock_llm_stream()
+
+    [chunk async for chunk in service.process_chat_message("Q", str(uuid4()), is_research_mode=True)]
+    mock_rag_service.lookup_cached_answer.assert_not_awaited()
+
+    history_service.build_context.return_value = ConversationContext()
+    mock_rag_service.lookup_cached_answer.return_value = _cache_lookup()
+    mock_rag_service.retrieve_context.return_value = ""
+    [chunk async for chunk in service.process_chat_message("Q", str(uuid4()), is_research_mode=True)]
+    mock_rag_service.lookup_cached_answer.assert_awaited_once()
+    mock_rag_service.store_answer.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_summarize_chat_history_covers_messages_beyond_budget(dom_orchestrator_service, mock_llm_client, monkeypatch):
+    """
+    履歴が CHAT_SUMMARY_MAX_TOKENS を超える場合、区間ごとの部分要約をまとめ、古いメッセージも要約に含めるテスト。
+    """
+    monkeypatch.setattr("app.services.dom_orchestrator.settings.CHAT_SUMMARY_MAX_TOKENS", 10)
+    messages = [ChatMessage(role="user", content=f"m{i}") for i in range(4)]
+    prompts = []
+
+    def fake_stream(prompt):
+        prompts.append(prompt)
+        async def stream():
+            yield f"summary{len(prompts)}"
+            yield "[END]"
+        return stream()
+    mock_llm_client.stream_chat_response.side_effect = fake_stream
+
+    summary = await dom_orchestrator_service.summarize_chat_history(messages)
+
+    assert summary == "summary3"
+    assert "user: m0\nuser: m1" in prompts[0]
+    assert "user: m2\nuser: m3" in prompts[1]
+    assert "(1) summary1" in prompts[2] and "(2) summary2" in prompts[2]
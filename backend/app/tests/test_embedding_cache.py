@@ -0,0 +1,99 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.embedding_cache import CachedEmbeddings
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """埋め込みモデルに渡されたテキストを記録する決定的な埋め込みモデル"""
+    document_calls: list = []
+    query_calls: list = []
+
+    async def aembed_documents(self, texts):
+        self.document_calls.append(list(texts))
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        self.query_calls.append(text)
+        return self.embed_query(text)
+
+
+class FakeRedis:
+    """MGET / パイプラインSETだけを持つインメモリのRedis"""
+    def __init__(self):
+        self.store = {}
+
+    async def mget(self, keys):
+        return [self.store.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        pipeline = MagicMock()
+        pipeline.set = lambda key, value, ex=None: self.store.__setitem__(key, value)
+        pipeline.execute = AsyncMock()
+        return pipeline
+
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbedding(size=8, document_calls=[], query_calls=[])
+
+
+@pytest.mark.asyncio
+async def test_only_unique_misses_are_embedded(embeddings):
+    """キャッシュに無いテキストだけを重複を除いてまとめて埋め込み、結果の順序は入力どおりであることのテスト"""
+    cache = CachedEmbeddings(embeddings, model="test-model", max_entries=100)
+
+    first = await cache.aembed_documents(["disclaimer", "intro", "disclaimer"])
+    second = await cache.aembed_documents(["intro", "body", "disclaimer"])
+
+    assert embeddings.document_calls == [["disclaimer", "intro"], ["body"]]
+    assert first == embeddings.embed_documents(["disclaimer", "intro", "disclaimer"])
+    assert second == embeddings.embed_documents(["intro", "body", "disclaimer"])
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+@pytest.mark.asyncio
+async def test_query_embeddings_are_cached_separately_from_documents(embeddings):
+    """繰り返しの質問の埋め込みがキャッシュから返り、文書用のベクトルとは別に保持されることのテスト"""
+    cache = CachedEmbeddings(embeddings, model="test-model", max_entries=100)
+
+    await cache.aembed_documents(["What is the leave policy?"])
+    for _ in range(3):
+        assert await cache.aembed_query("What is the leave policy?") == embeddings.embed_query("What is the leave policy?")
+
+    assert embeddings.query_calls == ["What is the leave policy?"]
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_is_shared_between_processes(embeddings):
+    """Redis層に書いたベクトルを別プロセス（別インスタンス）のキャッシュが一括取得で使えることのテスト"""
+    redis = FakeRedis()
+    with patch("app.services.embedding_cache.get_redis_client", return_value=redis):
+        writer = CachedEmbeddings(embeddings, model="test-model", use_redis=True)
+        reader = CachedEmbeddings(embeddings, model="test-model", use_redis=True)
+        other_model = CachedEmbeddings(embeddings, model="other-model", use_redis=True)
+
+        vectors = await writer.aembed_documents(["a", "b"])
+        assert await reader.aembed_documents(["b", "a"]) == vectors[::-1]
+        assert len(embeddings.document_calls) == 1
+
+        # モデルが異なる場合は共有しない
+        await other_model.aembed_documents(["a"])
+        assert embeddings.document_calls[-1] == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_falls_back_to_local_cache(embeddings):
+    """Redis層が失敗しても埋め込み処理は成功することのテスト"""
+    failing_redis = MagicMock()
+    failing_redis.mget = AsyncMock(side_effect=ConnectionError("down"))
+    failing_redis.pipeline.side_effect = ConnectionError("down")
+    cache = CachedEmbeddings(embeddings, model="test-model", use_redis=True)
+
+    with patch("app.services.embedding_cache.get_redis_client", return_value=failing_redis):
+        assert len(await cache.aembed_documents(["a"])) == 1
+        assert len(await cache.aembed_documents(["a"])) == 1
+
+    assert embeddings.document_calls == [["a"]]
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.services.embedding_scheduler import (
+    EmbeddingBatchScheduler,
+    EmbeddingMetrics,
+    is_rate_limit_error,
+    jittered_backoff_seconds,
+)
+
+
+class ResourceExhausted(Exception):
+    """google.api_core のレート制限例外を模したクラス"""
+
+
+class RecordingEmbedding(DeterministicFakeEmbedding):
+    """API呼び出しごとのテキスト数を記録し、指定回数だけレート制限で失敗する決定的な埋め込みモデル"""
+    batch_sizes: list = []
+    rate_limited_calls: int = 0
+
+    async def aembed_documents(self, texts):
+        if self.rate_limited_calls:
+            self.rate_limited_calls -= 1
+            raise ResourceExhausted("429 Quota exceeded")
+        self.batch_sizes.append(len(texts))
+        return self.embed_documents(texts)
+
+
+@pytest.fixture
+def embeddings():
+    return RecordingEmbedding(size=8, batch_sizes=[])
+
+
+@pytest.fixture
+def make_scheduler(embeddings):
+    def _make(**kwargs):
+        kwargs.setdefault("max_wait_seconds", 0.05)
+        return EmbeddingBatchScheduler(embeddings, metrics=EmbeddingMetrics(), **kwargs)
+    return _make
+
+
+def test_rate_limit_detection_and_jittered_backoff():
+    """レート制限の判定と、ジッター付きバックオフの範囲のテスト"""
+    assert is_rate_limit_error(ResourceExhausted("quota"))
+    assert is_rate_limit_error(RuntimeError("HTTP 429 Too Many Requests"))
+    assert not is_rate_limit_error(ValueError("invalid input"))
+    for attempt, full_delay in [(1, 1.0), (3, 4.0), (10, 5.0)]:
+        delay = jittered_backoff_seconds(attempt, 1.0, 5.0)
+        assert full_delay / 2 <= delay <= full_delay
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_coalesced_into_capped_batches(make_scheduler, embeddings):
+    """同時の呼び出しが上限サイズのバッチにまとめられ、各呼び出しに自分のテキストのベクトルが返ることのテスト"""
+    scheduler = make_scheduler(max_batch_size=10)
+    requests = [[f"doc{i}-chunk{j}" for j in range(count)] for i, count in enumerate([3, 4, 12, 5])]
+
+    results = await asyncio.gather(*(scheduler.aembed_documents(texts) for texts in requests))
+
+    for texts, vectors in zip(requests, results):
+        assert vectors == embeddings.embed_documents(texts)
+    assert embeddings.batch_sizes == [10, 10, 4]
+    snapshot = scheduler.metrics.snapshot()
+    assert (snapshot["requests_total"], snapshot["texts_total"], snapshot["batches_total"]) == (4, 24, 3)
+    assert snapshot["max_batch_size"] == 10
+    assert snapshot["avg_batch_size"] == 8.0
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_batch_is_retried(make_scheduler, embeddings):
+    """レート制限で失敗したバッチが再試行されて成功することのテスト"""
+    embeddings.rate_limited_calls = 2
+    scheduler = make_scheduler(retry_backoff_seconds=0.001, retry_backoff_max_seconds=0.01)
+
+    vectors = await scheduler.aembed_documents(["a", "b"])
+
+    assert vectors == embeddings.embed_documents(["a", "b"])
+    snapshot = scheduler.metrics.snapshot()
+    assert (snapshot["rate_limited_total"], snapshot["retries_total"], snapshot["batches_total"]) == (2, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_is_returned_to_every_caller(make_scheduler, embeddings):
+    """再試行の上限を超えたバッチの例外が、バッチに含まれるすべての呼び出しに返ることのテスト"""
+    embeddings.rate_limited_calls = 10
+    scheduler = make_scheduler(max_retries=1, retry_backoff_seconds=0.001)
+
+    results = await asyncio.gather(
+        scheduler.aembed_documents(["a"]), scheduler.aembed_documents(["b"]), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ResourceExhausted) for result in results)
+    assert scheduler.metrics.snapshot()["failed_batches_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_is_not_embedded(make_scheduler, embeddings):
+    """送信前にキャンセルされた呼び出しのテキストはバッチに含まれないことのテスト"""
+    scheduler = make_scheduler(max_wait_seconds=0.1)
+    cancelled = asyncio.create_task(scheduler.aembed_documents(["x"] * 5))
+    kept = asyncio.create_task(scheduler.aembed_documents(["y"] * 2))
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+
+    assert len(await kept) == 2
+    assert embeddings.batch_sizes == [2]
@@ -5,11 +5,13 @@ from uuid import uuid4
 from datetime import datetime
 
 from app.main import app
+from app.core.config import settings
 from app.schemas.auth import AuthenticatedUser
 from app.schemas.file import FileUploadResponse
 from app.dependencies import get_current_user, get_current_admin_user
 from app.repositories.knowledge import KnowledgeDocumentRepository
-from app.dependencies import get_knowledge_document_repository
+from app.dependencies import get_knowledge_document_repository, get_vector_index_manager
+from app.services.vector_index import IndexBuild, VectorIndexError, VectorIndexManager
 
 # TestClientインスタンス
 client = TestClient(app)
@@ -127,3 +129,199 @@ async def test_list_knowledge_documents_unauthorized(
     assert response.status_code == 403
     assert "Not enough privileges" in response.json()["detail"]
     mock_knowledge_document_repository.search.assert_not_awaited() # searchは呼ばれない
+
+@pytest.mark.asyncio
+async def test_get_db_pool_stats_success(override_get_current_admin_user):
+    """
+    管理者によるDBコネクションプール統計取得の成功ケースをテストします。
+    """
+    from app.core.config import settings
+
+    response = client.get("/api/v1/admin/db/pool")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["pool_size"] == settings.DB_POOL_SIZE
+    assert body["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert {"checked_out", "idle", "overflow", "timeouts_total"} <= body.keys()
+    assert body["wait_time_ms"]["buckets"][-1]["le"] == "+Inf"
+
+@pytest.mark.asyncio
+async def test_get_db_pool_stats_unauthorized(override_get_current_user_non_admin):
+    """
+    非管理者ユーザーによるDBコネクションプール統計取得の失敗ケースをテストします。
+    """
+    response = client.get("/api/v1/admin/db/pool")
+    assert response.status_code == 403
+
+@pytest.mark.asyncio
+async def test_get_embedding_stats_success(override_get_current_admin_user):
+    """
+    管理者による埋め込みバッチ統計取得の成功ケースをテストします。
+    """
+    response = client.get("/api/v1/admin/embeddings/stats")
+    assert response.status_code == 200
+    assert {"batches_total", "avg_batch_size", "texts_per_second", "retries_total"} <= response.json().keys()
+
+@pytest.mark.asyncio
+async def test_get_embedding_stats_unauthorized(override_get_current_user_non_admin):
+    """
+    非管理者ユーザーによる埋め込みバッチ統計取得の失敗ケースをテストします。
+    """
+    response = client.get("/api/v1/admin/embeddings/stats")
+    assert response.status_code == 403
+
+
+@pytest.fixture
+def mock_vector_index_manager():
+    manager = AsyncMock(spec=VectorIndexManager)
+    app.dependency_overrides[get_vector_index_manager] = lambda: manager
+    yield manager
+    app.dependency_overrides.clear()
+
+@pytest.mark.asyncio
+async def test_create_vector_index_success(override_get_current_admin_user, mock_vector_index_manager, mock_admin_user):
+    """
+    管理者によるベクトルインデックス作成開始の成功ケースをテストします。
+    """
+    mock_vector_index_manager.start_build.return_value = IndexBuild(
+        index_name="ix_lpe_hnsw_abc", collection_name="dom_rag", method="hnsw"
+    )
+
+    response = client.post("/api/v1/admin/vector/indexes", json={"method": "hnsw", "m": 32})
+
+    assert response.status_code == 202
+    assert response.json()["status"] == "running"
+    args, kwargs = mock_vector_index_manager.start_build.await_args
+    assert args[0].endswith(str(mock_admin_user.tenant_id).replace("-", "_"))
+    assert args[1] == "hnsw"
+    assert kwargs["m"] == 32
+
+@pytest.mark.asyncio
+async def test_create_vector_index_conflict(override_get_current_admin_user, mock_vector_index_manager):
+    """
+    インデックスを作成できない場合（コレクションが無い等）に409を返すことをテストします。
+    """
+    mock_vector_index_manager.start_build.side_effect = VectorIndexError("Vector collection not found")
+
+    response = client.post("/api/v1/admin/vector/indexes", json={"method": "ivfflat", "lists": 50})
+
+    assert response.status_code == 409
+
+@pytest.mark.asyncio
+async def test_list_vector_indexes_success(override_get_current_admin_user, mock_vector_index_manager):
+    """
+    管理者によるベクトルインデックス一覧取得の成功ケースをテストします。
+    """
+    collection_id = uuid4()
+    mock_vector_index_manager.get_collection_id.return_value = collection_id
+    mock_vector_index_manager.list_indexes.return_value = [{
+        "index_name": f"ix_lpe_hnsw_{collection_id.hex}", "method": "hnsw",
+        "is_valid": True, "size_bytes": 8192, "build_status": "succeeded",
+    }]
+
+    response = client.get("/api/v1/admin/vector/indexes")
+
+    assert response.status_code == 200
+    assert response.json()[0]["size_bytes"] == 8192
+    mock_vector_index_manager.list_indexes.assert_awaited_once_with(collection_id)
+
+@pytest.mark.asyncio
+async def test_drop_vector_index_of_other_collection_not_found(override_get_current_admin_user, mock_vector_index_manager):
+    """
+    他のコレクション（テナント）のインデックスは削除できないことをテストします。
+    """
+    mock_vector_index_manager.get_collection_id.return_value = uuid4()
+
+    response = client.delete(f"/api/v1/admin/vector/indexes/ix_lpe_hnsw_{uuid4().hex}")
+
+    assert response.status_code == 404
+    mock_vector_index_manager.drop_index.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_create_vector_index_unauthorized(override_get_current_user_non_admin):
+    """
+    非管理者ユーザーによるベクトルインデックス作成の失敗ケースをテストします。
+    """
+    response = client.post("/api/v1/admin/vector/indexes", json={"method": "hnsw"})
+    assert response.status_code == 403
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method,path", [
+    ("get", "/api/v1/admin/vector/indexes"),
+    ("post", "/api/v1/admin/vector/indexes"),
+    ("get", "/api/v1/admin/vector/indexes/progress"),
+    ("delete", "/api/v1/admin/vector/indexes/ix_lpe_hnsw_abc"),
+])
+async def test_vector_index_endpoints_rejected_in_single_collection_mode(
+    override_get_current_admin_user, mock_vector_index_manager, monkeypatch, method, path
+):
+    """
+    単一コレクション構成では共有コレクションのインデックスをテナントの管理者が操作できないことをテストします。
+    """
+    monkeypatch.setattr("app.api.endpoints.admin.settings.RAG_SINGLE_COLLECTION_ENABLED", True)
+
+    kwargs = {"json": {"method": "hnsw"}} if method == "post" else {}
+    response = getattr(client, method)(path, **kwargs)
+
+    assert response.status_code == 409
+    mock_vector_index_manager.start_build.assert_not_called()
+    mock_vector_index_manager.drop_index.assert_not_called()
+    mock_vector_index_manager.get_collection_id.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_vector_index_progress_is_limited_to_tenant_collection(override_get_current_admin_user, mock_vector_index_manager):
+    """
+    インデックス作成の進捗は、管理者のテナントのコレクションのものだけを返すことをテストします。
+    """
+    collection_id = uuid4()
+    mock_vector_index_manager.get_collection_id.return_value = collection_id
+    progress = {"phase": "building index", "blocks_done": 1, "blocks_total": 2, "tuples_done": 0, "tuples_total": 0}
+    mock_vector_index_manager.build_progress.return_value = [
+        {"pid": 1, "index_name": f"ix_lpe_hnsw_{collection_id.hex}", **progress},
+        {"pid": 2, "index_name": f"ix_lpe_hnsw_{uuid4().hex}", **progress},
+    ]
+
+    response = client.get("/api/v1/admin/vector/indexes/progress")
+
+    assert response.status_code == 200
+    assert [row["pid"] for row in response.json()] == [1]
+
+@pytest.mark.asyncio
+async def test_shared_vector_index_endpoints_for_global_admin(
+    override_get_current_admin_user, mock_vector_index_manager, mock_admin_user, monkeypatch
+):
+    """
+    単一コレクション構成の共有コレクションのインデックスを、GLOBAL_ADMIN_EMAILS の管理者が操作できることをテストします。
+    """
+    monkeypatch.setattr("app.api.endpoints.admin.settings.RAG_SINGLE_COLLECTION_ENABLED", True)
+    monkeypatch.setattr("app.dependencies.settings.GLOBAL_ADMIN_EMAILS", [mock_admin_user.email])
+    collection_id = uuid4()
+    mock_vector_index_manager.get_collection_id.return_value = collection_id
+    mock_vector_index_manager.start_build.return_value = IndexBuild(
+        index_name=f"ix_lpe_hnsw_{collection_id.hex}", collection_name=settings.PG_COLLECTION_NAME, method="hnsw"
+    )
+
+    response = client.post("/api/v1/admin/vector/shared/indexes", json={"method": "hnsw"})
+    assert response.status_code == 202
+    assert mock_vector_index_manager.start_build.await_args.args[:2] == (settings.PG_COLLECTION_NAME, "hnsw")
+
+    response = client.delete(f"/api/v1/admin/vector/shared/indexes/ix_lpe_hnsw_{collection_id.hex}")
+    assert response.status_code == 204
+    mock_vector_index_manager.drop_index.assert_awaited_once_with(f"ix_lpe_hnsw_{collection_id.hex}")
+    mock_vector_index_manager.get_collection_id.assert_awaited_with(settings.PG_COLLECTION_NAME)
+
+@pytest.mark.asyncio
+async def test_shared_vector_index_endpoints_rejected(
+    override_get_current_admin_user, mock_vector_index_manager, mock_admin_user, monkeypatch
+):
+    """
+    GLOBAL_ADMIN_EMAILS に含まれない管理者は403、単一コレクション構成でない場合は409になることをテストします。
+    """
+    monkeypatch.setattr("app.api.endpoints.admin.settings.RAG_SINGLE_COLLECTION_ENABLED", True)
+    monkeypatch.setattr("app.dependencies.settings.GLOBAL_ADMIN_EMAILS", [])
+    assert client.post("/api/v1/admin/vector/shared/indexes", json={"method": "hnsw"}).status_code == 403
+
+    monkeypatch.setattr("app.dependencies.settings.GLOBAL_ADMIN_EMAILS", [mock_admin_user.email])
+    monkeypatch.setattr("app.api.endpoints.admin.settings.RAG_SINGLE_COLLECTION_ENABLED", False)
+    assert client.get("/api/v1/admin/vector/shared/indexes").status_code == 409
+    mock_vector_index_manager.start_build.assert_not_called()
@@ -6,6 +6,7 @@ from datetime import datetime
 import json
 
 from app.main import app
+from app.core.pagination import decode_cursor
 from app.schemas.auth import AuthenticatedUser
 from app.schemas.chat import ChatSessionResponse, ChatMessageResponse
 from app.repositories.chat import ChatSessionRepository, ChatMessageRepository
@@ -202,6 +203,62 @@ async def test_send_chat_message_unauthorized_session(
     assert "Chat session not found or not authorized." in response.json()["detail"]
     mock_chat_session_repo.get.assert_awaited_once_with(session_id)
 
+def test_get_chat_messages_pages_with_cursors(
+    override_get_current_user,
+    override_get_chat_session_repository,
+    override_get_chat_message_repository,
+    mock_current_user,
+    mock_chat_session_repo,
+    mock_chat_message_repo
+):
+    """
+    メッセージ履歴APIが limit+1 件で続きの有無を判定し、カーソルを返すことをテストします。
+    """
+    session_id = uuid4()
+    mock_chat_session_repo.get.return_value = ChatSessionResponse(
+        id=session_id, user_id=mock_current_user.id, tenant_id=mock_current_user.tenant_id, title="Existing Session", is_active=True, created_at=datetime.now(), updated_at=datetime.now()
+    )
+    messages = [
+        ChatMessageResponse(id=uuid4(), session_id=session_id, role="user", content=f"m{i}", created_at=datetime(2026, 1, 1, 0, 0, i))
+        for i in range(3)
+    ]
+    mock_chat_message_repo.get_page.return_value = messages
+
+    response = client.get(f"/api/v1/chat/sessions/{session_id}/messages?limit=2")
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["content"] for item in body["items"]] == ["m1", "m2"]
+    assert body["has_more"] is True
+    assert decode_cursor(body["before_cursor"]) == (messages[1].created_at, messages[1].id)
+    mock_chat_message_repo.get_page.assert_awaited_once_with(session_id, limit=3, before=None, after=None)
+
+    mock_chat_message_repo.get_page.reset_mock()
+    mock_chat_message_repo.get_page.return_value = messages[:1]
+    response = client.get(f"/api/v1/chat/sessions/{session_id}/messages?limit=2&before={body['before_cursor']}")
+    assert response.json()["has_more"] is False
+    mock_chat_message_repo.get_page.assert_awaited_once_with(
+        session_id, limit=3, before=(messages[1].created_at, messages[1].id), after=None
+    )
+
+def test_get_chat_messages_rejects_invalid_cursor(
+    override_get_current_user,
+    override_get_chat_session_repository,
+    override_get_chat_message_repository,
+    mock_current_user,
+    mock_chat_session_repo,
+    mock_chat_message_repo
+):
+    """
+    不正なカーソルは400になることをテストします。
+    """
+    session_id = uuid4()
+    mock_chat_session_repo.get.return_value = ChatSessionResponse(
+        id=session_id, user_id=mock_current_user.id, tenant_id=mock_current_user.tenant_id, title="Existing Session", is_active=True, created_at=datetime.now(), updated_at=datetime.now()
+    )
+    response = client.get(f"/api/v1/chat/sessions/{session_id}/messages?before=not-a-cursor")
+    assert response.status_code == 400
+    mock_chat_message_repo.get_page.assert_not_awaited()
+
 @pytest.mark.asyncio
 async def test_stream_chat_response_success(
     override_get_current_user,
@@ -222,7 +279,7 @@ async def test_stream_chat_response_success(
         id=session_id, user_id=mock_current_user.id, tenant_id=mock_current_user.tenant_id, title="Existing Session", is_active=True, created_at=datetime.now(), updated_at=datetime.now()
     )
     # Mock for last user message
-    mock_chat_message_repo.get_by_session_id.return_value = [
+    mock_chat_message_repo.get_latest.return_value = [
         ChatMessageResponse(id=uuid4(), session_id=session_id, role="user", content="Test prompt", created_at=datetime.now(), updated_at=datetime.now())
     ]
     
@@ -257,7 +314,7 @@ async def test_stream_chat_response_success(
     assert full_response_content == expected_stream
 
     mock_chat_session_repo.get.assert_awaited_once_with(session_id)
-    mock_chat_message_repo.get_by_session_id.assert_awaited_once_with(session_id)
+    mock_chat_message_repo.get_latest.assert_awaited_once_with(session_id, 1)
     mock_dom_orchestrator_service.process_chat_message.assert_called_once_with("Test prompt", str(session_id), False) # Falseを検証
     mock_chat_message_repo.create.assert_awaited_once_with({
         "session_id": session_id,
@@ -265,6 +322,46 @@ async def test_stream_chat_response_success(
         "content": expected_stream.replace("[STREAM_END]", "")
     })
 
+@pytest.mark.asyncio
+async def test_stream_chat_response_enqueues_assistant_message_when_write_behind_enabled(
+    override_get_current_user,
+    override_get_chat_session_repository,
+    override_get_chat_message_repository,
+    override_get_dom_orchestrator_service,
+    mock_current_user,
+    mock_chat_session_repo,
+    mock_chat_message_repo,
+    mock_dom_orchestrator_service
+):
+    """
+    write-behind キューが起動している場合、ストリーム終了時にDBへ直接保存せずキューに積むことをテストします。
+    """
+    session_id = uuid4()
+    mock_chat_session_repo.get.return_value = ChatSessionResponse(
+        id=session_id, user_id=mock_current_user.id, tenant_id=mock_current_user.tenant_id, title="Existing Session", is_active=True, created_at=datetime.now(), updated_at=datetime.now()
+    )
+    mock_chat_message_repo.get_latest.return_value = [
+        ChatMessageResponse(id=uuid4(), session_id=session_id, role="user", content="Test prompt", created_at=datetime.now(), updated_at=datetime.now())
+    ]
+
+    async def mock_orchestrator_stream():
+        yield "**Decision**\nTest Decision.\n\n"
+    mock_dom_orchestrator_service.process_chat_message.return_value = mock_orchestrator_stream()
+
+    with patch("app.api.endpoints.chat.chat_message_writer") as mock_writer:
+        mock_writer.running = True
+        mock_writer.enqueue = AsyncMock()
+        response = client.get(f"/api/v1/chat/stream/{session_id}")
+
+    assert response.status_code == 200
+    assert response.text.endswith("[STREAM_END]")
+    mock_writer.enqueue.assert_awaited_once_with({
+        "session_id": session_id,
+        "role": "assistant",
+        "content": "**Decision**\nTest Decision.\n\n"
+    })
+    mock_chat_message_repo.create.assert_not_awaited()
+
 @pytest.mark.asyncio
 async def test_stream_chat_response_research_mode_on(
     override_get_current_user,
@@ -285,7 +382,7 @@ async def test_stream_chat_response_research_mode_on(
         id=session_id, user_id=mock_current_user.id, tenant_id=mock_current_user.tenant_id, title="Existing Session", is_active=True, created_at=datetime.now(), updated_at=datetime.now()
     )
     # Mock for last user message
-    mock_chat_message_repo.get_by_session_id.return_value = [
+    mock_chat_message_repo.get_latest.return_value = [
         ChatMessageResponse(id=uuid4(), session_id=session_id, role="user", content="Research prompt", created_at=datetime.now(), updated_at=datetime.now())
     ]
     
@@ -320,7 +417,7 @@ async def test_stream_chat_response_research_mode_on(
     assert full_response_content == expected_stream
 
     mock_chat_session_repo.get.assert_awaited_once_with(session_id)
-    mock_chat_message_repo.get_by_session_id.assert_awaited_once_with(session_id)
+    mock_chat_message_repo.get_latest.assert_awaited_once_with(session_id, 1)
     mock_dom_orchestrator_service.process_chat_message.assert_called_once_with("Research prompt", str(session_id), True) # Trueを検証
     mock_chat_message_repo.create.assert_awaited_once_with({
         "session_id": session_id,
@@ -5,16 +5,19 @@ from unittest.mock import AsyncMock, patch, MagicMock
 from uuid import UUID, uuid4
 from io import BytesIO
 from datetime import datetime
+from types import SimpleNamespace
 import unittest
 
 from app.main import app
 from app.schemas.auth import AuthenticatedUser
 from app.schemas.file import FileUploadResponse
 from app.repositories.knowledge import KnowledgeDocumentRepository
+from app.repositories.ingestion_job import IngestionJobRepository
 from app.services.file_service import FileService
-from app.services.rag_service import RagService
+from app.services.ingestion_service import IngestionWorkerPool
 from app.dependencies import get_current_user
-from app.dependencies import get_knowledge_document_repository, get_file_service, get_rag_service
+from app.dependencies import get_knowledge_document_repository, get_file_service
+from app.dependencies import get_ingestion_job_repository, get_ingestion_worker_pool
 from app.core.config import settings
 
 # TestClientインスタンス
@@ -58,12 +61,25 @@ def override_get_knowledge_document_repository(mock_knowledge_document_repositor
     app.dependency_overrides.clear()
 
 @pytest.fixture
-def mock_rag_service():
-    return AsyncMock(spec=RagService)
+def mock_ingestion_job_repository():
+    repo = AsyncMock(spec=IngestionJobRepository)
+    repo.create.side_effect = lambda obj_in: SimpleNamespace(id=uuid4(), **obj_in)
+    repo.get_active_global_job.return_value = None
+    return repo
 
 @pytest.fixture
-def override_get_rag_service(mock_rag_service):
-    app.dependency_overrides[get_rag_service] = lambda: mock_rag_service
+def override_get_ingestion_job_repository(mock_ingestion_job_repository):
+    app.dependency_overrides[get_ingestion_job_repository] = lambda: mock_ingestion_job_repository
+    yield
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def mock_ingestion_worker_pool():
+    return AsyncMock(spec=IngestionWorkerPool)
+
+@pytest.fixture
+def override_get_ingestion_worker_pool(mock_ingestion_worker_pool):
+    app.dependency_overrides[get_ingestion_worker_pool] = lambda: mock_ingestion_worker_pool
     yield
     app.dependency_overrides.clear()
 
@@ -73,11 +89,13 @@ async def test_upload_file_global_rag_success(
     override_get_current_user,
     override_get_file_service,
     override_get_knowledge_document_repository,
-    override_get_rag_service,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
     mock_current_user,
     mock_file_service,
     mock_knowledge_document_repository,
-    mock_rag_service
+    mock_ingestion_job_repository,
+    mock_ingestion_worker_pool
 ):
     """
     ファイルをアップロードし、グローバルRAGに登録する成功ケースをテストします。
@@ -97,8 +115,8 @@ async def test_upload_file_global_rag_success(
         uploaded_by_user_id=mock_current_user.id,
         is_active=True
     )
-    mock_file_service.extract_text_from_knowledge_document.return_value = file_content.decode("utf-8")
-    mock_knowledge_document_repository.create.return_value = FileUploadResponse(
+    mock_knowledge_document_repository.get_by_content_hash.return_value = None
+    mock_knowledge_document_repository.create.return_value = SimpleNamespace(
         id=file_id,
         tenant_id=mock_current_user.tenant_id,
         file_name=file_name,
@@ -107,34 +125,41 @@ async def test_upload_file_global_rag_success(
         file_size=str(len(file_content)),
         uploaded_by_user_id=mock_current_user.id,
         is_active=True,
+        content_hash="a" * 64,
+        is_global_indexed=False,
         created_at=datetime.now(),
         updated_at=datetime.now()
     )
-    mock_rag_service.add_documents_to_global_rag.return_value = None
 
     response = client.post(
         "/api/v1/files/upload",
         files={"file": (file_name, mock_file, "text/plain")}
     )
 
-    assert response.status_code == 200
+    assert response.status_code == 202
     assert response.json()["file_name"] == file_name
     mock_file_service.save_file.assert_awaited_once()
-    mock_file_service.extract_text_from_knowledge_document.assert_awaited_once()
-    mock_rag_service.add_documents_to_global_rag.assert_awaited_once()
+    mock_file_service.extract_text_from_knowledge_document.assert_not_awaited() # 抽出・埋め込みはワーカーで実行
     mock_knowledge_document_repository.create.assert_awaited_once()
-    mock_rag_service.add_documents_to_ephemeral_rag.assert_not_awaited() # Ephemeralは呼ばれないことを確認
+    mock_ingestion_job_repository.create.assert_awaited_once()
+    job_values = mock_ingestion_job_repository.create.await_args.args[0]
+    assert job_values["document_id"] == file_id
+    assert job_values["session_id"] is None # グローバルRAGへの登録ジョブ
+    mock_ingestion_worker_pool.submit.assert_awaited_once()
+    assert response.json()["job_id"] == str(mock_ingestion_worker_pool.submit.await_args.args[0])
 
 @pytest.mark.asyncio
 async def test_upload_file_ephemeral_rag_success(
     override_get_current_user,
     override_get_file_service,
     override_get_knowledge_document_repository,
-    override_get_rag_service,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
     mock_current_user,
     mock_file_service,
     mock_knowledge_document_repository,
-    mock_rag_service
+    mock_ingestion_job_repository,
+    mock_ingestion_worker_pool
 ):
     """
     ファイルをアップロードし、Ephemeral RAGに登録する成功ケースをテストします。
@@ -155,8 +180,8 @@ async def test_upload_file_ephemeral_rag_success(
         uploaded_by_user_id=mock_current_user.id,
         is_active=True
     )
-    mock_file_service.extract_text_from_knowledge_document.return_value = file_content.decode("utf-8")
-    mock_knowledge_document_repository.create.return_value = FileUploadResponse(
+    mock_knowledge_document_repository.get_by_content_hash.return_value = None
+    mock_knowledge_document_repository.create.return_value = SimpleNamespace(
         id=file_id,
         tenant_id=mock_current_user.tenant_id,
         file_name=file_name,
@@ -165,35 +190,198 @@ async def test_upload_file_ephemeral_rag_success(
         file_size=str(len(file_content)),
         uploaded_by_user_id=mock_current_user.id,
         is_active=True,
+        content_hash="b" * 64,
+        is_global_indexed=False,
         created_at=datetime.now(),
         updated_at=datetime.now()
     )
-    mock_rag_service.add_documents_to_ephemeral_rag.return_value = None
 
     response = client.post(
         f"/api/v1/files/upload?session_id={session_id}",
         files={"file": (file_name, mock_file, "text/markdown")}
     )
 
-    assert response.status_code == 200
+    assert response.status_code == 202
     assert response.json()["file_name"] == file_name
     mock_file_service.save_file.assert_awaited_once()
-    mock_file_service.extract_text_from_knowledge_document.assert_awaited_once()
-    mock_rag_service.add_documents_to_ephemeral_rag.assert_awaited_once_with(
-        session_id, pytest.approx(unittest.mock.ANY, abs=0) 
-    )
-    # Use ANY from unittest.mock
-    from unittest.mock import ANY
-    mock_rag_service.add_documents_to_ephemeral_rag.assert_awaited_once_with(session_id, ANY)
+    mock_file_service.extract_text_from_knowledge_document.assert_not_awaited()
     mock_knowledge_document_repository.create.assert_awaited_once()
-    mock_rag_service.add_documents_to_global_rag.assert_not_awaited() # Globalは呼ばれないことを確認
+    job_values = mock_ingestion_job_repository.create.await_args.args[0]
+    assert job_values["session_id"] == session_id # Ephemeral RAGへの登録ジョブ
+    mock_ingestion_worker_pool.submit.assert_awaited_once()
+
+def _existing_document(mock_current_user, file_path, is_global_indexed=True):
+    return SimpleNamespace(
+        id=uuid4(),
+        tenant_id=mock_current_user.tenant_id,
+        file_name="handbook.txt",
+        file_path=file_path,
+        file_type="text/plain",
+        file_size="24",
+        uploaded_by_user_id=mock_current_user.id,
+        is_active=True,
+        content_hash="c" * 64,
+        is_global_indexed=is_global_indexed,
+        created_at=datetime.now(),
+        updated_at=datetime.now()
+    )
+
+@pytest.mark.asyncio
+async def test_upload_file_duplicate_skips_extraction_and_embedding(
+    override_get_current_user,
+    override_get_file_service,
+    override_get_knowledge_document_repository,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
+    mock_current_user,
+    mock_file_service,
+    mock_knowledge_document_repository,
+    mock_ingestion_job_repository,
+    mock_ingestion_worker_pool
+):
+    """
+    同じ内容のファイルがグローバルRAGに登録済みの場合、ドキュメントの登録も取り込みジョブの作成も行わず
+    既存のドキュメントを返すことのテスト
+    """
+    existing = _existing_document(mock_current_user, "/uploads/tenant/" + "c" * 64 + ".txt")
+    mock_file_service.save_file.return_value = MagicMock(file_path=existing.file_path, content_hash=existing.content_hash)
+    mock_knowledge_document_repository.get_by_content_hash.return_value = existing
+
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": ("copy_of_handbook.txt", BytesIO(b"This is a test document."), "text/plain")}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["id"] == str(existing.id)
+    mock_knowledge_document_repository.get_by_content_hash.assert_awaited_once_with(existing.content_hash)
+    mock_knowledge_document_repository.create.assert_not_awaited()
+    mock_ingestion_job_repository.create.assert_not_awaited() # 抽出・埋め込みは行わない
+    mock_ingestion_worker_pool.submit.assert_not_awaited()
+    mock_file_service.delete_file_from_storage.assert_not_awaited() # 実体は既存ドキュメントと共有
+
+@pytest.mark.asyncio
+async def test_upload_file_duplicate_for_session_reuses_document(
+    override_get_current_user,
+    override_get_file_service,
+    override_get_knowledge_document_repository,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
+    mock_current_user,
+    mock_file_service,
+    mock_knowledge_document_repository,
+    mock_ingestion_job_repository,
+    mock_ingestion_worker_pool
+):
+    """
+    同じ内容のファイルをセッションにアップロードした場合、ドキュメントは再登録せずEphemeral RAGへの取り込みジョブのみ作成し、
+    パスの異なる新しいファイルは削除することのテスト
+    """
+    existing = _existing_document(mock_current_user, "/uploads/tenant/" + "c" * 64 + ".txt")
+    new_path = "/uploads/tenant/" + "c" * 64 + ".md"
+    mock_file_service.save_file.return_value = MagicMock(file_path=new_path, content_hash=existing.content_hash)
+    mock_knowledge_document_repository.get_by_content_hash.return_value = existing
+    session_id = uuid4()
+
+    response = client.post(
+        f"/api/v1/files/upload?session_id={session_id}",
+        files={"file": ("handbook.md", BytesIO(b"This is a test document."), "text/markdown")}
+    )
+
+    assert response.status_code == 202
+    assert response.json()["id"] == str(existing.id)
+    mock_knowledge_document_repository.create.assert_not_awaited()
+    mock_file_service.delete_file_from_storage.assert_awaited_once()
+    assert str(mock_file_service.delete_file_from_storage.await_args.args[0]) == new_path
+    job_values = mock_ingestion_job_repository.create.await_args.args[0]
+    assert job_values["document_id"] == existing.id and job_values["session_id"] == session_id
+    mock_ingestion_worker_pool.submit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_upload_file_back_to_back_reuses_active_global_job(
+    override_get_current_user,
+    override_get_file_service,
+    override_get_knowledge_document_repository,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
+    mock_current_user,
+    mock_file_service,
+    mock_knowledge_document_repository,
+    mock_ingestion_job_repository,
+    mock_ingestion_worker_pool
+):
+    """
+    同じファイルが続けてアップロードされた場合、グローバルRAG登録ジョブは1件だけ作成し、
+    2件目のアップロードには待機中のジョブIDを返すことのテスト
+    """
+    existing = _existing_document(mock_current_user, "/uploads/tenant/" + "c" * 64 + ".txt", is_global_indexed=False)
+    mock_file_service.save_file.return_value = MagicMock(file_path=existing.file_path, content_hash=existing.content_hash)
+    mock_knowledge_document_repository.get_by_content_hash.return_value = existing
+    jobs = []
+
+    async def create_job(obj_in):
+        jobs.append(SimpleNamespace(id=uuid4(), status="queued", **obj_in))
+        return jobs[-1]
+
+    async def get_active_global_job(document_id):
+        return next((job for job in jobs if job.document_id == document_id and job.session_id is None), None)
+
+    mock_ingestion_job_repository.create.side_effect = create_job
+    mock_ingestion_job_repository.get_active_global_job.side_effect = get_active_global_job
+
+    responses = [
+        client.post("/api/v1/files/upload", files={"file": ("handbook.txt", BytesIO(b"This is a test document."), "text/plain")})
+        for _ in range(2)
+    ]
+
+    assert [r.status_code for r in responses] == [202, 202]
+    assert responses[0].json()["job_id"] == responses[1].json()["job_id"] == str(jobs[0].id)
+    mock_ingestion_job_repository.create.assert_awaited_once()
+    mock_ingestion_worker_pool.submit.assert_awaited_once_with(jobs[0].id)
+
+@pytest.mark.asyncio
+async def test_upload_file_concurrent_job_creation_returns_existing_job(
+    override_get_current_user,
+    override_get_file_service,
+    override_get_knowledge_document_repository,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
+    mock_current_user,
+    mock_file_service,
+    mock_knowledge_document_repository,
+    mock_ingestion_job_repository,
+    mock_ingestion_worker_pool
+):
+    """
+    並行したアップロードが先に登録ジョブを作成した場合（部分ユニークインデックス違反）、
+    ロールバックして先に作成されたジョブIDを返すことのテスト
+    """
+    from sqlalchemy.exc import IntegrityError
+    existing = _existing_document(mock_current_user, "/uploads/tenant/" + "c" * 64 + ".txt", is_global_indexed=False)
+    mock_file_service.save_file.return_value = MagicMock(file_path=existing.file_path, content_hash=existing.content_hash)
+    mock_knowledge_document_repository.get_by_content_hash.return_value = existing
+    concurrent_job = SimpleNamespace(id=uuid4(), document_id=existing.id, session_id=None, status="queued")
+    mock_ingestion_job_repository.get_active_global_job.side_effect = [None, concurrent_job]
+    mock_ingestion_job_repository.create.side_effect = IntegrityError("INSERT", {}, Exception("duplicate key"))
+    mock_ingestion_job_repository.session = AsyncMock()
+
+    response = client.post(
+        "/api/v1/files/upload",
+        files={"file": ("handbook.txt", BytesIO(b"This is a test document."), "text/plain")}
+    )
+
+    assert response.status_code == 202
+    assert response.json()["job_id"] == str(concurrent_job.id)
+    mock_ingestion_job_repository.session.rollback.assert_awaited_once()
+    mock_ingestion_worker_pool.submit.assert_not_awaited()
 
 @pytest.mark.asyncio
 async def test_upload_file_no_filename(
     override_get_current_user,
     override_get_file_service,
     override_get_knowledge_document_repository,
-    override_get_rag_service,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
 ):
     """
     ファイル名がない場合のアップロード失敗ケースをテストします。
@@ -210,7 +398,8 @@ async def test_upload_file_validation_error(
     override_get_current_user,
     override_get_file_service,
     override_get_knowledge_document_repository,
-    override_get_rag_service,
+    override_get_ingestion_job_repository,
+    override_get_ingestion_worker_pool,
     mock_file_service
 ):
     """
@@ -228,4 +417,39 @@ async def test_upload_file_validation_error(
     assert "File size exceeds the limit." in response.json()["detail"]
     mock_file_service.save_file.assert_awaited_once() # validate_fileはsave_file内で呼ばれる
 
+@pytest.mark.asyncio
+async def test_get_ingestion_job_status(
+    override_get_current_user,
+    override_get_ingestion_job_repository,
+    mock_ingestion_job_repository
+):
+    """
+    取り込みジョブの状態を取得できること、存在しない（他テナントの）ジョブは404になることのテスト
+    """
+    job = SimpleNamespace(
+        id=uuid4(),
+        document_id=uuid4(),
+        session_id=None,
+        status="failed",
+        attempts=3,
+        max_attempts=3,
+        last_error="embedding API timeout",
+        next_attempt_at=None,
+        started_at=datetime.now(),
+        finished_at=datetime.now(),
+        created_at=datetime.now(),
+        updated_at=datetime.now()
+    )
+    mock_ingestion_job_repository.get.return_value = job
+
+    response = client.get(f"/api/v1/files/jobs/{job.id}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "failed"
+    assert response.json()["last_error"] == "embedding API timeout"
+    mock_ingestion_job_repository.get.assert_awaited_once_with(job.id)
+
+    mock_ingestion_job_repository.get.return_value = None
+    response = client.get(f"/api/v1/files/jobs/{uuid4()}")
+    assert response.status_code == 404
+
 # TODO: unauthorized access (get_current_user)のテストはtest_endpoints_authに任せる
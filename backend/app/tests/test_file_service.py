@@ -0,0 +1,115 @@
+import hashlib
+import io
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+from app.services import file_service as file_service_module
+from app.models.knowledge import KnowledgeDocument
+from app.services.file_service import FileService
+
+
+@pytest.fixture
+def file_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE_MB", 1)
+    monkeypatch.setattr(file_service_module, "UPLOAD_CHUNK_SIZE", 64 * 1024)
+    return FileService()
+
+
+def _upload(content: bytes, filename: str = "doc.txt", size=None) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename, size=size)
+
+
+@pytest.mark.asyncio
+async def test_save_file_hashes_and_sizes_in_one_pass(file_service, tmp_path):
+    """保存と同時にサイズとSHA-256が求まり、内容がそのまま書き込まれることのテスト"""
+    content = b"0123456789" * 50_000  # 複数チャンクにまたがるサイズ
+    tenant_id = uuid4()
+
+    stored = await file_service.store_upload(_upload(content), tmp_path / "out.txt")
+    assert stored.size_bytes == len(content)
+    assert stored.sha256 == hashlib.sha256(content).hexdigest()
+    assert (tmp_path / "out.txt").read_bytes() == content
+
+    knowledge_doc = await file_service.save_file(_upload(content), tenant_id, uuid4())
+    assert knowledge_doc.file_size == str(len(content))
+    assert knowledge_doc.file_path.startswith(str(tmp_path / str(tenant_id)))
+
+
+@pytest.mark.asyncio
+async def test_store_upload_aborts_when_limit_exceeded(file_service, tmp_path):
+    """上限を超えた時点で413を返し、残りを読まずに書きかけのファイルを削除することのテスト"""
+    upload = _upload(b"x" * (3 * 1024 * 1024))
+
+    with pytest.raises(HTTPException) as exc_info:
+        await file_service.store_upload(upload, tmp_path / "big.txt")
+
+    assert exc_info.value.status_code == 413
+    assert not (tmp_path / "big.txt").exists()
+    assert upload.file.tell() < 2 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_validate_file_rejects_known_size_and_extension(file_service):
+    """サイズが分かっている場合は読み込み前に拒否し、許可されない拡張子も拒否することのテスト"""
+    with pytest.raises(HTTPException) as exc_info:
+        await file_service.validate_file(_upload(b"", size=2 * 1024 * 1024))
+    assert exc_info.value.status_code == 413
+
+    with pytest.raises(HTTPException) as exc_info:
+        await file_service.validate_file(_upload(b"data", filename="malware.exe"))
+    assert exc_info.value.status_code == 400
+
+    assert await file_service.validate_file(_upload(b"data", filename="notes.md")) == "md"
+
+
+@pytest.mark.asyncio
+async def test_save_file_stores_identical_content_once(file_service, tmp_path):
+    """同じ内容のファイルは内容のハッシュ名の1ファイルに保存され、一時ファイルが残らないことのテスト"""
+    content = b"same corporate handbook"
+    tenant_id = uuid4()
+
+    first = await file_service.save_file(_upload(content, filename="handbook.txt"), tenant_id, uuid4())
+    second = await file_service.save_file(_upload(content, filename="copy.txt"), tenant_id, uuid4())
+
+    digest = hashlib.sha256(content).hexdigest()
+    assert first.content_hash == second.content_hash == digest
+    assert first.file_path == second.file_path == str(tmp_path / str(tenant_id) / f"{digest}.txt")
+    assert [p.name for p in (tmp_path / str(tenant_id)).iterdir()] == [f"{digest}.txt"]
+
+
+@pytest.mark.asyncio
+async def test_iter_text_reads_text_files_in_pieces(file_service, tmp_path, monkeypatch):
+    """テキストファイルは一定の文字数ずつ読み込まれ、つなげると元の内容になることのテスト"""
+    monkeypatch.setattr(file_service_module, "TEXT_READ_CHUNK_CHARS", 10)
+    content = "見出し\n" + "text " * 20
+    path = tmp_path / "notes.md"
+    path.write_text(content, encoding="utf-8")
+    knowledge_doc = KnowledgeDocument(file_path=str(path))
+
+    pieces = [piece async for piece in file_service.iter_text_from_knowledge_document(knowledge_doc)]
+
+    assert len(pieces) > 1
+    assert all(len(piece) <= 10 for piece in pieces)
+    assert "".join(pieces) == content
+
+
+@pytest.mark.asyncio
+async def test_iter_text_streams_pages_from_extraction_pool(file_service, tmp_path, monkeypatch):
+    """PDFなどはプロセスプールで抽出したページを順に返し、ページ間を空行で区切ることのテスト"""
+    class StubExtractionPool:
+        async def iter_pages(self, file_path, file_extension):
+            assert file_extension == "pdf"
+            for page in ("page 1", "page 2"):
+                yield page
+
+    monkeypatch.setattr(file_service_module, "extraction_pool", StubExtractionPool())
+    knowledge_doc = KnowledgeDocument(file_path=str(tmp_path / "report.pdf"))
+
+    pieces = [piece async for piece in file_service.iter_text_from_knowledge_document(knowledge_doc)]
+
+    assert "".join(pieces) == "page 1\n\npage 2"
+    assert await file_service.extract_text_from_knowledge_document(knowledge_doc) == "page 1\n\npage 2"
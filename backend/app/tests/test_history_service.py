@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.tokens import estimate_tokens
+from app.models.chat import ChatMessage, ChatSession
+from app.models.memory import EpisodicMemory
+from app.repositories.chat import ChatMessageRepository
+from app.repositories.memory import EpisodicMemoryRepository
+from app.services.history_service import ConversationHistoryService, split_within_budget
+
+
+@pytest.fixture
+def session_factory(async_engine):
+    return sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+
+
+async def _seed_messages(session_factory, session_id, contents):
+    base_time = datetime(2026, 1, 1)
+    async with session_factory() as session:
+        await ChatMessageRepository(session).bulk_create([
+            {"session_id": session_id, "role": "user" if i % 2 == 0 else "assistant",
+             "content": content, "created_at": base_time + timedelta(seconds=i)}
+            for i, content in enumerate(contents)
+        ], returning=False)
+
+
+def _history_service(session, max_tokens, page_size=3):
+    return ConversationHistoryService(ChatMessageRepository(session), max_tokens=max_tokens, page_size=page_size)
+
+
+def test_estimate_tokens_counts_words_and_cjk_characters():
+    assert estimate_tokens("Hello, world!") == 4
+    assert estimate_tokens("日本語です。") == 6
+    assert estimate_tokens("") == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_message_repository_stores_token_count_on_write(session_factory):
+    """メッセージの保存時（create / bulk_create）にトークン数が token_count に記録されることのテスト"""
+    session_id = uuid4()
+    await _seed_messages(session_factory, session_id, ["Hello, world!"])
+    async with session_factory() as session:
+        created = await ChatMessageRepository(session).create(
+            {"session_id": session_id, "role": "assistant", "content": "日本語です。", "raw_llm_response": ["raw"]}
+        )
+        stored = (await session.execute(
+            select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at)
+        )).scalars().all()
+
+    assert created.token_count == 6
+    assert [m.token_count for m in stored] == [4, 6]
+    assert created.raw_llm_response == ["raw"]
+
+
+@pytest.mark.asyncio
+async def test_build_context_keeps_recent_turns_within_budget(session_factory):
+    """現在のターンを除く直近の履歴を予算内で古い順に返し、読み取り時には書き込まないことのテスト"""
+    session_id = uuid4()
+    # 各メッセージは "word" 1トークン + 区切り4トークン = 5トークン
+    await _seed_messages(session_factory, session_id, [f"m{i}" for i in range(8)])
+
+    async with session_factory() as session:
+        context = await _history_service(session, max_tokens=16).build_context(session_id)
+        assert not session.dirty
+
+    assert [m.content for m in context.messages] == ["m4", "m5", "m6"]
+    assert context.truncated and context.token_count == 15
+    assert all(m.raw_llm_response is None for m in context.messages)
+
+
+@pytest.mark.asyncio
+async def test_build_context_uses_stored_token_counts(session_factory):
+    """保存済みのトークン数を再計算せずに使い、未記録（NULL）のメッセージはその場で計算することのテスト"""
+    session_id = uuid4()
+    await _seed_messages(session_factory, session_id, ["old", "large", "current"])
+    async with session_factory() as session:
+        messages = (await session.execute(
+            select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at)
+        )).scalars().all()
+        messages[0].token_count = None  # 列の追加前に保存されたメッセージ
+        messages[1].token_count = 1000
+        await session.commit()
+
+    async with session_factory() as session:
+        context = await _history_service(session, max_tokens=100).build_context(session_id)
+    assert context.messages == [] and context.truncated
+
+    async with session_factory() as session:
+        messages = (await session.execute(select(ChatMessage).where(ChatMessage.session_id == session_id))).scalars().all()
+        for message in messages:
+            if message.content == "large":
+                message.token_count = 1
+        await session.commit()
+
+    async with session_factory() as session:
+        service = _history_service(session, max_tokens=100)
+        context = await service.build_context(session_id)
+        prompt = await service.build_prompt(session_id, "ユーザーの質問")
+    assert [m.content for m in context.messages] == ["old", "large"]
+    assert context.token_count == (1 + 4) + (1 + 4)
+    assert prompt == "会話履歴:\nuser: old\nassistant: large\n\nユーザーの質問"
+
+
+@pytest.mark.asyncio
+async def test_build_context_replaces_older_turns_with_episodic_summary(session_factory):
+    """予算に収まらない古いターンを、ユーザーの最新のエピソード記憶の要約で置き換え、要約の後に直近の履歴を続けることのテスト"""
+    tenant_id, user_id, previous_session_id, session_id = uuid4(), uuid4(), uuid4(), uuid4()
+    async with session_factory() as session:
+        session.add_all([
+            ChatSession(id=previous_session_id, user_id=user_id, tenant_id=tenant_id, is_active=False),
+            ChatSession(id=session_id, user_id=user_id, tenant_id=tenant_id),
+            EpisodicMemory(tenant_id=tenant_id, user_id=user_id, session_id=previous_session_id,
+                           summary="old", created_at=datetime(2025, 1, 1)),
+            EpisodicMemory(tenant_id=tenant_id, user_id=user_id, session_id=previous_session_id,
+                           summary="休暇申請", created_at=datetime(2025, 6, 1)),
+            EpisodicMemory(tenant_id=tenant_id, user_id=uuid4(), session_id=uuid4(),
+                           summary="別ユーザー", created_at=datetime(2026, 1, 1)),
+        ])
+        await session.commit()
+    await _seed_messages(session_factory, session_id, [f"m{i}" for i in range(8)])
+
+    async with session_factory() as session:
+        service = ConversationHistoryService(
+            ChatMessageRepository(session), max_tokens=16, page_size=3,
+            episodic_memory_repo=EpisodicMemoryRepository(session),
+        )
+        context = await service.build_context(session_id)
+
+    # 要約（4文字 + 区切り4 = 8トークン）の分、予算内の直近の履歴は m4〜m6 から m6 の1件に減る
+    assert context.summary == "休暇申請"
+    assert [m.content for m in context.messages] == ["m6"]
+    assert context.token_count == 8 + 5
+    assert context.render() == "これまでの会話の要約:\n休暇申請\n\n会話履歴:\nuser: m6"
+
+
+def test_split_within_budget_covers_all_messages_in_order():
+    """全メッセージを古い順のまま、予算内の連続した区間に分割することのテスト"""
+    messages = [ChatMessage(role="user", content=f"m{i}") for i in range(5)]
+    messages.append(ChatMessage(role="user", content="x " * 50))
+    chunks = split_within_budget(messages, 10)
+    assert [[m.content for m in chunk] for chunk in chunks] == [["m0", "m1"], ["m2", "m3"], ["m4"], ["x " * 50]]
@@ -0,0 +1,202 @@
+import asyncio
+from typing import List
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.services.hybrid_retrieval import (
+    FanOutRetriever,
+    HybridRetriever,
+    PgKeywordRetriever,
+    extract_keywords,
+    reciprocal_rank_fusion,
+)
+
+
+def _docs(*ids):
+    return [Document(id=id, page_content=f"content {id}") for id in ids]
+
+
+def _chunk(id, document_id, chunk_index):
+    return Document(id=id, page_content=f"content {id}", metadata={"document_id": document_id, "chunk_index": chunk_index})
+
+
+class FailingRetriever(BaseRetriever):
+    """常に例外を送出するリトリーバー"""
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        raise ConnectionError("vector store unavailable")
+
+
+class StaticRetriever(BaseRetriever):
+    """固定の結果を、指定秒数待ってから返すリトリーバー"""
+    results: List[Document]
+    delay: float = 0.0
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.results
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        await asyncio.sleep(self.delay)
+        return self.results
+
+
+def test_reciprocal_rank_fusion_scores_and_weights():
+    """両方の結果に現れるドキュメントが上位になり、重みで順位が変わることのテスト"""
+    vector_results = _docs("a", "b", "c")
+    keyword_results = _docs("c", "d")
+
+    assert [doc.id for doc in reciprocal_rank_fusion([vector_results, keyword_results])] == ["c", "a", "b", "d"]
+    # キーワード検索を重視すると、キーワード検索の1位・2位が上がる
+    fused = reciprocal_rank_fusion([vector_results, keyword_results], weights=[0.5, 1.0], k=1)
+    assert [doc.id for doc in fused] == ["c", "d", "a", "b"]
+    with pytest.raises(ValueError):
+        reciprocal_rank_fusion([vector_results], weights=[1.0, 1.0])
+
+
+@pytest.mark.asyncio
+async def test_hybrid_retriever_runs_searches_concurrently_and_returns_top_k():
+    """ベクトル検索と全文検索を並行して実行し、統合した上位 k 件を返すことのテスト"""
+    retriever = HybridRetriever(
+        vector_retriever=StaticRetriever(results=_docs("a", "b", "c"), delay=0.2),
+        keyword_retriever=StaticRetriever(results=_docs("SKU-1234", "a"), delay=0.2),
+        k=2,
+    )
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    documents = await retriever.ainvoke("SKU-1234 の仕様")
+
+    assert loop.time() - started_at < 0.35
+    assert [doc.id for doc in documents] == ["a", "SKU-1234"]
+    assert [doc.id for doc in retriever.invoke("SKU-1234 の仕様")] == ["a", "SKU-1234"]
+
+
+@pytest.mark.asyncio
+async def test_fan_out_retriever_merges_sources_concurrently_and_dedupes_chunks():
+    """セッションとテナントのコレクションを並行して検索し、同じチャンクを1件にまとめて統合することのテスト"""
+    session_results = [_chunk("s1", "doc-session", 0), _chunk("s2", "doc-shared", 3)]
+    tenant_results = [_chunk("t1", "doc-shared", 3), _chunk("t2", "doc-tenant", 0), _chunk("t3", "doc-tenant", 1)]
+    retriever = FanOutRetriever(
+        retrievers=[StaticRetriever(results=session_results, delay=0.2), StaticRetriever(results=tenant_results, delay=0.2)],
+        k=3,
+    )
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    documents = await retriever.ainvoke("保証期間")
+
+    # 待ち時間は2つの検索の合計ではなく、遅い方の時間になる
+    assert loop.time() - started_at < 0.35
+    # 両方に現れたチャンク（doc-shared:3）が1件にまとまって最上位になり、同順位ではセッション側が優先される
+    assert [doc.id for doc in documents] == ["s2", "s1", "t2"]
+
+
+@pytest.mark.asyncio
+async def test_fan_out_retriever_skips_slow_and_failing_sources():
+    """タイムアウト・失敗した検索を除いて残りの結果を返し、すべて失敗した場合は例外を送出することのテスト"""
+    tenant_results = _docs("t1", "t2")
+    retriever = FanOutRetriever(
+        retrievers=[
+            StaticRetriever(results=_docs("slow"), delay=1.0),
+            FailingRetriever(),
+            StaticRetriever(results=tenant_results),
+        ],
+        k=4,
+        timeout_seconds=0.1,
+    )
+
+    documents = await retriever.ainvoke("質問")
+
+    assert [doc.id for doc in documents] == ["t1", "t2"]
+    with pytest.raises(ConnectionError):
+        await FanOutRetriever(retrievers=[FailingRetriever(), FailingRetriever()]).ainvoke("質問")
+
+
+def test_extract_keywords_splits_japanese_by_script():
+    """日本語の質問から製品コード・カタカナ語・漢字語を取り出し、助詞などのひらがなを除くことのテスト"""
+    assert extract_keywords("SKU-1234のバッテリー保証期間は？sku-1234") == ["sku-1234", "バッテリー", "保証期間"]
+    assert extract_keywords("これはなに？") == []
+
+
+# PGVectorのテーブルと同じ列を持つSQLiteのテーブルと、登録するチャンク
+_CHUNK_TABLE_STATEMENTS = [
+    "CREATE TABLE langchain_pg_collection (uuid TEXT PRIMARY KEY, name TEXT)",
+    "CREATE TABLE langchain_pg_embedding (id TEXT PRIMARY KEY, collection_id TEXT, document TEXT, cmetadata JSON)",
+    "INSERT INTO langchain_pg_collection VALUES ('c1', 'tenant_a'), ('c2', 'tenant_b'), ('c3', 'shared')",
+    """
+        INSERT INTO langchain_pg_embedding VALUES
+            ('1', 'c1', 'バッテリーの交換手順', '{"chunk_index": 0}'),
+            ('2', 'c1', 'SKU-1234 のバッテリー保証期間は2年です', '{"chunk_index": 1}'),
+            ('3', 'c1', '在庫コード A1B2 の表記', '{}'),
+            ('4', 'c2', 'SKU-1234 の保証期間は1年です', '{}'),
+            ('5', 'c3', 'SKU-1234 の保証はセッション資料を参照', '{"tenant_id": "t1", "rag_scope": "s1"}'),
+            ('6', 'c3', 'SKU-1234 の保証は全社共通', '{"tenant_id": "t1", "rag_scope": "global"}'),
+            ('7', 'c3', 'SKU-1234 の保証は別セッション', '{"tenant_id": "t1", "rag_scope": "s2"}')
+    """,
+]
+
+
+@pytest_asyncio.fixture
+async def chunk_session_factory(async_engine):
+    """PGVectorのテーブルと同じ列を持つSQLiteのテーブルにチャンクを登録したセッションファクトリ"""
+    async with async_engine.begin() as conn:
+        for statement in _CHUNK_TABLE_STATEMENTS:
+            await conn.execute(text(statement))
+    yield sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+    async with async_engine.begin() as conn:
+        await conn.execute(text("DROP TABLE langchain_pg_embedding"))
+        await conn.execute(text("DROP TABLE langchain_pg_collection"))
+
+
+@pytest.mark.asyncio
+async def test_keyword_retriever_ranks_chunks_by_matched_keywords(chunk_session_factory):
+    """同じコレクションのチャンクを、一致したキーワードが多い順に返すことのテスト"""
+    retriever = PgKeywordRetriever(collection_name="tenant_a", session_factory=chunk_session_factory)
+
+    documents = await retriever.ainvoke("sku-1234のバッテリー保証は？")
+
+    assert [document.id for document in documents] == ["2", "1"]
+    assert documents[0].metadata == {"chunk_index": 1}
+    # LIKE の特殊文字（_ など）はエスケープされる
+    assert await retriever.ainvoke("a_b2") == []
+
+
+@pytest.mark.asyncio
+async def test_keyword_retriever_filters_by_metadata(chunk_session_factory):
+    """単一コレクション構成で、テナントと範囲（グローバル・セッション）のメタデータで絞り込むことのテスト"""
+    retriever = PgKeywordRetriever(
+        collection_name="shared",
+        metadata_filter={"tenant_id": ["t1"], "rag_scope": ["global", "s1"]},
+        session_factory=chunk_session_factory,
+    )
+
+    documents = await retriever.ainvoke("SKU-1234の保証")
+
+    assert sorted(document.id for document in documents) == ["5", "6"]
+
+
+def test_keyword_retriever_sync_invoke_runs_the_same_query():
+    """同期インターフェース（invoke）でも、同期セッションで同じキーワード検索を行うことのテスト"""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        for statement in _CHUNK_TABLE_STATEMENTS:
+            conn.execute(text(statement))
+    retriever = PgKeywordRetriever(
+        collection_name="shared",
+        metadata_filter={"tenant_id": ["t1"], "rag_scope": ["global", "s1"]},
+        sync_session_factory=sessionmaker(engine),
+    )
+    try:
+        documents = retriever.invoke("SKU-1234の保証")
+        assert retriever.invoke("これはなに？") == []
+    finally:
+        engine.dispose()
+
+    assert sorted(document.id for document in documents) == ["5", "6"]
@@ -0,0 +1,209 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models.ingestion_job import IngestionJob
+from app.models.knowledge import KnowledgeDocument
+from app.models.tenant import Tenant
+from app.services.file_service import FileService
+from app.services.ingestion_service import IngestionWorkerPool, chunk_id, ingest_document, retry_delay_seconds
+from app.services.rag_service import RagService
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    # ワーカーが並行してセッションを使うため、接続を共有するインメモリではなくファイルのSQLiteを使う
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ingestion.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await engine.dispose()
+
+
+@pytest.fixture
+def rag_service():
+    return AsyncMock(spec=RagService)
+
+
+async def _segments(*texts):
+    for text in texts:
+        yield text
+
+
+@pytest.fixture
+def file_service():
+    service = AsyncMock(spec=FileService)
+    service.iter_text_from_knowledge_document = lambda knowledge_doc: _segments("extracted text")
+    return service
+
+
+@pytest.fixture
+def make_pool(session_factory, rag_service, file_service):
+    def _make(**kwargs):
+        return IngestionWorkerPool(
+            session_factory=session_factory,
+            file_service_factory=lambda: file_service,
+            rag_service_factory=lambda tenant_id: rag_service,
+            **kwargs,
+        )
+    return _make
+
+
+async def _create_job(session_factory, session_id=None, max_attempts=3):
+    async with session_factory() as session:
+        tenant = Tenant(id=uuid4(), name=f"tenant-{uuid4()}")
+        session.add(tenant)
+        await session.flush()
+        document = KnowledgeDocument(
+            id=uuid4(), tenant_id=tenant.id, file_name="handbook.txt",
+            file_path=f"/uploads/{uuid4()}.txt", content_hash=uuid4().hex,
+        )
+        session.add(document)
+        await session.flush()
+        job = IngestionJob(
+            id=uuid4(), tenant_id=tenant.id, document_id=document.id,
+            session_id=session_id, max_attempts=max_attempts,
+        )
+        session.add(job)
+        await session.commit()
+        return job.id, document.id
+
+
+async def _get(session_factory, model, id):
+    async with session_factory() as session:
+        return await session.get(model, id)
+
+
+def test_retry_delay_grows_exponentially_up_to_limit():
+    """再実行までの待機秒数が失敗ごとに倍増し、上限で止まることのテスト"""
+    assert [retry_delay_seconds(n, 2.0, 10.0) for n in range(1, 6)] == [2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+@pytest.mark.asyncio
+async def test_ingest_document_adds_chunks_in_batches(file_service, rag_service, monkeypatch):
+    """テキストをチャンクに分割し、batch_size 件ずつベクトルストアに追加することのテスト"""
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 20)
+    monkeypatch.setattr(settings, "CHUNK_OVERLAP", 5)
+    file_service.iter_text_from_knowledge_document = lambda knowledge_doc: _segments("alpha beta gamma " * 10, "delta " * 10)
+    knowledge_doc = KnowledgeDocument(id=uuid4(), tenant_id=uuid4(), file_name="notes.txt", file_path="/uploads/notes.txt")
+
+    chunk_count = await ingest_document(file_service, rag_service, knowledge_doc, batch_size=4)
+
+    batches = [call.args[0] for call in rag_service.add_documents_to_global_rag.await_args_list]
+    assert chunk_count == sum(len(batch) for batch in batches) > 4
+    assert all(len(batch) <= 4 for batch in batches)
+    documents = [document for batch in batches for document in batch]
+    assert [document.metadata["chunk_index"] for document in documents] == list(range(chunk_count))
+    assert all(len(document.page_content) <= 20 for document in documents)
+
+
+@pytest.mark.asyncio
+async def test_ingest_document_retry_after_partial_failure_does_not_duplicate_chunks(file_service, rag_service, monkeypatch):
+    """途中のバッチで失敗したジョブを再実行しても、登録済みのチャンクは同じIDで上書きされ行数が増えないことのテスト"""
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 20)
+    monkeypatch.setattr(settings, "CHUNK_OVERLAP", 5)
+    file_service.iter_text_from_knowledge_document = lambda knowledge_doc: _segments("alpha beta gamma " * 10)
+    knowledge_doc = KnowledgeDocument(id=uuid4(), tenant_id=uuid4(), file_name="notes.txt", file_path="/uploads/notes.txt")
+    rows = {}  # langchain_pg_embedding を模した id -> 行（aadd_documents は id で upsert する）
+    calls = 0
+
+    async def add_documents(documents):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise RuntimeError("embedding API unavailable")
+        rows.update({document.id: document for document in documents})
+    rag_service.add_documents_to_global_rag.side_effect = add_documents
+
+    with pytest.raises(RuntimeError):
+        await ingest_document(file_service, rag_service, knowledge_doc, batch_size=4)
+    assert len(rows) == 4  # 1バッチ目のみ登録済み
+
+    chunk_count = await ingest_document(file_service, rag_service, knowledge_doc, batch_size=4)
+
+    assert chunk_count > 4
+    assert len(rows) == chunk_count
+    assert all(document.id == chunk_id(knowledge_doc, document.metadata["chunk_index"]) for document in rows.values())
+    assert chunk_id(knowledge_doc, 0, session_id=uuid4()) != chunk_id(knowledge_doc, 0)
+
+
+@pytest.mark.asyncio
+async def test_run_job_indexes_document_once(make_pool, session_factory, rag_service):
+    """ジョブがグローバルRAGに登録してドキュメントを登録済みにし、同じジョブを二重に実行しないことのテスト"""
+    job_id, document_id = await _create_job(session_factory)
+    pool = make_pool()
+
+    assert await pool.run_job(job_id) is True
+    assert await pool.run_job(job_id) is False
+
+    rag_service.add_documents_to_global_rag.assert_awaited_once()
+    documents = rag_service.add_documents_to_global_rag.await_args.args[0]
+    assert documents[0].page_content == "extracted text"
+    assert documents[0].metadata["document_id"] == str(document_id)
+    assert documents[0].metadata["chunk_index"] == 0
+    job = await _get(session_factory, IngestionJob, job_id)
+    assert (job.status, job.attempts, job.last_error) == ("succeeded", 1, None)
+    assert job.finished_at is not None
+    assert (await _get(session_factory, KnowledgeDocument, document_id)).is_global_indexed is True
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_with_backoff_then_marked_failed(make_pool, session_factory, rag_service):
+    """失敗したジョブは待機時間を置いて再実行され、最大回数に達したら failed になることのテスト"""
+    job_id, document_id = await _create_job(session_factory, max_attempts=2)
+    rag_service.add_documents_to_global_rag.side_effect = RuntimeError("embedding API timeout")
+    pool = make_pool(retry_backoff_seconds=60)
+
+    assert await pool.run_job(job_id) is True
+    job = await _get(session_factory, IngestionJob, job_id)
+    assert (job.status, job.attempts, job.last_error) == ("queued", 1, "embedding API timeout")
+    assert job.next_attempt_at is not None
+    # 実行予定時刻前は実行しない
+    assert await pool.run_job(job_id) is False
+
+    async with session_factory() as session:
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await session.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(next_attempt_at=past))
+        await session.commit()
+    assert await pool.run_job(job_id) is True
+
+    job = await _get(session_factory, IngestionJob, job_id)
+    assert (job.status, job.attempts) == ("failed", 2)
+    assert job.finished_at is not None
+    assert (await _get(session_factory, KnowledgeDocument, document_id)).is_global_indexed is False
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_processes_submitted_and_recovered_jobs(make_pool, session_factory, rag_service):
+    """起動前に登録されたジョブは起動時に積み直され、起動後に投入されたジョブと合わせてワーカーで実行されることのテスト"""
+    session_id = uuid4()
+    recovered_job_id, _ = await _create_job(session_factory)
+    pool = make_pool(concurrency=2)
+    pool.start()
+    try:
+        submitted_job_id, _ = await _create_job(session_factory, session_id=session_id)
+        await pool.submit(submitted_job_id)
+
+        for _ in range(100):
+            jobs = [await _get(session_factory, IngestionJob, id) for id in (recovered_job_id, submitted_job_id)]
+            if all(job.status == "succeeded" for job in jobs):
+                break
+            await asyncio.sleep(0.02)
+        assert [job.status for job in jobs] == ["succeeded", "succeeded"]
+    finally:
+        await pool.stop()
+
+    rag_service.add_documents_to_ephemeral_rag.assert_awaited_once()
+    assert rag_service.add_documents_to_ephemeral_rag.await_args.args[0] == session_id
+    assert not pool.running
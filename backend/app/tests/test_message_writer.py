@@ -0,0 +1,90 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models.chat import ChatMessage
+from app.services.message_writer import ChatMessageWriter
+
+
+@pytest.fixture
+def session_factory(async_engine):
+    return sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+
+
+@pytest.fixture
+def insert_statements(async_engine):
+    """chat_message テーブルへの INSERT 文の実行回数を記録するフィクスチャ"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT INTO T_CHAT_MESSAGE"):
+            statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+async def _messages(session_factory, session_id):
+    async with session_factory() as session:
+        result = await session.execute(
+            select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at)
+        )
+        return result.scalars().all()
+
+
+@pytest.mark.asyncio
+async def test_writer_batches_messages_into_single_insert(session_factory, insert_statements):
+    """まとめて積まれたメッセージが1回のINSERTで保存され、stopで全件書き込まれることのテスト"""
+    writer = ChatMessageWriter(session_factory=session_factory, batch_size=50, flush_interval_seconds=0.5)
+    writer.start()
+    session_id = uuid4()
+
+    for i in range(10):
+        await writer.enqueue({"session_id": session_id, "role": "assistant", "content": f"reply {i}"})
+    await writer.stop()
+
+    messages = await _messages(session_factory, session_id)
+    assert [m.content for m in messages] == [f"reply {i}" for i in range(10)]
+    assert len(insert_statements) == 1
+    assert not writer.running
+
+
+@pytest.mark.asyncio
+async def test_writer_applies_backpressure_when_queue_is_full(session_factory):
+    """キューが上限に達した場合、enqueueは保存が進むまで待機することのテスト"""
+    writer = ChatMessageWriter(session_factory=session_factory, batch_size=1, flush_interval_seconds=0, max_queue_size=1)
+    writer.start()
+    session_id = uuid4()
+    message = {"session_id": session_id, "role": "assistant", "content": "reply"}
+
+    await asyncio.gather(*[writer.enqueue(dict(message)) for _ in range(5)])
+    assert writer._queue.qsize() <= 1
+    await writer.stop()
+
+    assert len(await _messages(session_factory, session_id)) == 5
+
+
+@pytest.mark.asyncio
+async def test_writer_falls_back_to_row_inserts_when_batch_fails(session_factory):
+    """バッチ内に不正なメッセージがあっても、他のメッセージは保存されることのテスト"""
+    writer = ChatMessageWriter(session_factory=session_factory, batch_size=10, flush_interval_seconds=0.5)
+    writer.start()
+    session_id = uuid4()
+
+    await writer.enqueue({"session_id": session_id, "role": "assistant", "content": "ok"})
+    await writer.enqueue({"session_id": session_id, "role": "assistant", "content": None})  # NOT NULL違反
+    await writer.stop()
+
+    assert [m.content for m in await _messages(session_factory, session_id)] == ["ok"]
+
+
+@pytest.mark.asyncio
+async def test_enqueue_requires_running_writer(session_factory):
+    writer = ChatMessageWriter(session_factory=session_factory)
+    with pytest.raises(RuntimeError):
+        await writer.enqueue({"session_id": uuid4(), "role": "assistant", "content": "reply"})
@@ -2,17 +2,27 @@
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock, Mock
 from uuid import uuid4
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 from langchain_core.documents import Document
-from langchain_core.messages import AIMessageChunk
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_postgres.vectorstores import PGVector
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_core.output_parsers import StrOutputParser
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_core.retrievers import BaseRetriever
 
-from app.services.rag_service import RagService
+from app.services.hybrid_retrieval import FanOutRetriever
+from app.services.reranker import BM25Reranker, RerankingRetriever
+from app.services.vector_index import _query_embeddings
+from app.services.rag_service import RagService, RagServiceRegistry, purge_expired_ephemeral_collections
+from app.repositories.ephemeral_collection import EphemeralCollectionRepository
 from app.llm.mock_llm import MockLLMClient
 from app.core.config import settings
+from app.core.database import engine
+
+@pytest.fixture(autouse=True)
+def dense_retrieval_mode(monkeypatch):
+    """PGVectorをモックするテストでは、リトリーバーをベクトル検索のみにする（ハイブリッドは個別にテスト）"""
+    monkeypatch.setattr(settings, "RAG_RETRIEVAL_MODE", "dense")
 
 @pytest.fixture
 def mock_tenant_id():
@@ -25,9 +35,9 @@ def mock_llm_client():
 @pytest.fixture
 def mock_pgvector():
     """PGVectorクラスのモック"""
-    with patch('app.services.rag_service.PGVector', autospec=True) as MockPGVector:
+    with patch('app.services.rag_service.TunedPGVector', autospec=True) as MockPGVector:
         mock_instance = MockPGVector.return_value
-        mock_instance.as_retriever.return_value = AsyncMock() # .as_retriever()もモック
+        mock_instance.as_retriever.return_value = AsyncMock(spec=BaseRetriever) # .as_retriever()もモック
         yield MockPGVector
 
 @pytest.fixture
@@ -36,26 +46,18 @@ def mock_embeddings():
     with patch('app.services.rag_service.GoogleGenerativeAIEmbeddings', autospec=True) as MockEmbeddings:
         yield MockEmbeddings
 
-@pytest.fixture
-def mock_chat_google_generative_ai():
-    """ChatGoogleGenerativeAIのモック"""
-    with patch('app.services.rag_service.ChatGoogleGenerativeAI', autospec=True) as MockChatLLM:
-        yield MockChatLLM
-
 @pytest.fixture
 def rag_service(
     mock_tenant_id,
     mock_llm_client,
     mock_pgvector,
-    mock_embeddings,
-    mock_chat_google_generative_ai
+    mock_embeddings
 ):
     """RagServiceのフィクスチャ"""
     service = RagService(tenant_id=mock_tenant_id, llm_client=mock_llm_client)
     # 依存するオブジェクトがモックであることを確認
     # assert isinstance(service.global_vectorstore, (MagicMock, Mock)) # Flaky check
     # assert isinstance(service.embeddings, MagicMock) # Flaky check with NonCallableMagicMock
-    # assert isinstance(service.llm, MagicMock) 
     return service
 
 @pytest.mark.asyncio
@@ -63,8 +65,7 @@ async def test_rag_service_initialization(
     mock_tenant_id,
     mock_llm_client,
     mock_pgvector,
-    mock_embeddings,
-    mock_chat_google_generative_ai
+    mock_embeddings
 ):
     """RagServiceが正しく初期化されることをテスト"""
     service = RagService(tenant_id=mock_tenant_id, llm_client=mock_llm_client)
@@ -72,65 +73,310 @@ async def test_rag_service_initialization(
     mock_embeddings.assert_called_once_with(model="models/embedding-001")
     mock_pgvector.assert_called_once_with(
         collection_name=f"{settings.PG_COLLECTION_NAME}_{str(mock_tenant_id).replace('-', '_')}",
-        connection=settings.DATABASE_URL,
+        connection=engine, # アプリ共通の非同期エンジン（コネクションプール）を共有
         embeddings=mock_embeddings.return_value,
+        embedding_length=settings.EMBEDDING_DIMENSION,
     )
-    mock_chat_google_generative_ai.assert_called_once_with(model="gemini-pro")
     assert service.tenant_id == mock_tenant_id
     assert service.llm_client == mock_llm_client
     assert service.global_retriever == mock_pgvector.return_value.as_retriever.return_value
-    # assert isinstance(service.rag_chain, RunnablePassthrough) # LCELチェーンが構築されていることを確認
 
 @pytest.mark.asyncio
-async def test_query_rag(rag_service, mock_chat_google_generative_ai):
-    """query_ragメソッドのテスト"""
-    test_question = "What is RAG?"
-    expected_answer = "RAG is Retrieval Augmented Generation."
+async def test_add_documents(rag_service, mock_pgvector):
+    """add_documentsメソッドのテスト"""
+    test_documents = [Document(page_content="Test content")]
+    await rag_service.add_documents_to_global_rag(test_documents)
+    mock_pgvector.return_value.aadd_documents.assert_awaited_once_with(test_documents)
+
+def test_rag_service_registry_reuses_instance_per_tenant(
+    mock_llm_client,
+    mock_pgvector,
+    mock_embeddings
+):
+    """同じテナントには同じRagServiceを返し、Embeddingクライアントはテナント間で共有することのテスト"""
+    registry = RagServiceRegistry(max_tenants=4, collection_idle_ttl_seconds=60)
+    tenant_a, tenant_b = uuid4(), uuid4()
+
+    service_a = registry.get(tenant_a, mock_llm_client)
+    assert registry.get(tenant_a, mock_llm_client) is service_a
+
+    service_b = registry.get(tenant_b, mock_llm_client)
+    assert service_b is not service_a
+    assert service_b.embeddings is service_a.embeddings
+    mock_embeddings.assert_called_once_with(model="models/embedding-001")
+
+def test_rag_service_registry_evicts_least_recently_used_tenant(
+    mock_llm_client,
+    mock_pgvector,
+    mock_embeddings
+):
+    """上限を超えた場合に最も長く使われていないテナントが破棄されることのテスト"""
+    registry = RagServiceRegistry(max_tenants=2, collection_idle_ttl_seconds=60)
+    tenant_a, tenant_b, tenant_c = uuid4(), uuid4(), uuid4()
+
+    service_a = registry.get(tenant_a, mock_llm_client)
+    service_b = registry.get(tenant_b, mock_llm_client)
+    registry.get(tenant_a, mock_llm_client) # tenant_aを最近利用に更新
+    registry.get(tenant_c, mock_llm_client)
+
+    assert len(registry) == 2
+    assert registry.get(tenant_a, mock_llm_client) is service_a
+    assert registry.get(tenant_b, mock_llm_client) is not service_b
 
-    # LCELチェーン内のLLMのinvokeをモック
-    mock_chat_google_generative_ai.return_value.ainvoke.return_value = expected_answer
+def test_evict_idle_ephemeral_vectorstores(rag_service):
+    """アイドル状態のEphemeralストアのハンドルだけが破棄されることのテスト"""
+    idle_session_id, active_session_id = uuid4(), uuid4()
+    with patch('app.services.rag_service.time.monotonic', return_value=100.0):
+        rag_service.get_ephemeral_vectorstore(idle_session_id)
+    with patch('app.services.rag_service.time.monotonic', return_value=150.0):
+        rag_service.get_ephemeral_vectorstore(active_session_id)
 
-    # Retrieverのget_relevant_documentsもモック
-    rag_service.global_retriever.aget_relevant_documents.return_value = [
-        Document(page_content="RAG combines retrieval and generation.")
+    with patch('app.services.rag_service.time.monotonic', return_value=200.0):
+        evicted = rag_service.evict_idle_ephemeral_vectorstores(max_idle_seconds=60)
+
+    assert evicted == 1
+    assert idle_session_id not in rag_service._ephemeral_vectorstores
+    assert active_session_id in rag_service._ephemeral_vectorstores
+
+@pytest.fixture
+def session_factory(async_engine):
+    """Ephemeralコレクション登録情報の保存先となるSQLiteセッションファクトリ"""
+    return sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+
+@pytest.mark.asyncio
+async def test_ephemeral_collection_is_visible_across_service_instances(
+    mock_tenant_id,
+    mock_llm_client,
+    mock_pgvector,
+    mock_embeddings,
+    session_factory
+):
+    """アップロード時に登録したEphemeralコレクションが、別インスタンス（別リクエスト/ワーカー）から参照できることのテスト"""
+    session_id = uuid4()
+    uploader = RagService(tenant_id=mock_tenant_id, llm_client=mock_llm_client, session_factory=session_factory)
+    await uploader.add_documents_to_ephemeral_rag(session_id, [Document(page_content="Session doc")])
+
+    reader = RagService(tenant_id=mock_tenant_id, llm_client=mock_llm_client, session_factory=session_factory)
+    await reader._get_retriever_for_session(session_id)
+
+    assert session_id in reader._ephemeral_vectorstores
+    assert mock_pgvector.call_args.kwargs["collection_name"] == reader._get_ephemeral_collection_name(session_id)
+    # 別テナントからは参照できない
+    other_tenant = RagService(tenant_id=uuid4(), llm_client=mock_llm_client, session_factory=session_factory)
+    await other_tenant._get_retriever_for_session(session_id)
+    assert session_id not in other_tenant._ephemeral_vectorstores
+
+@pytest.mark.asyncio
+async def test_purge_ephemeral_session_deletes_vectors_and_registration(rag_service, session_factory):
+    """セッションリセット時にベクトルと登録情報がまとめて削除されることのテスト"""
+    rag_service._session_factory = session_factory
+    session_id = uuid4()
+    await rag_service.add_documents_to_ephemeral_rag(session_id, [Document(page_content="Session doc")])
+
+    with patch('app.services.rag_service.delete_vector_collections', new_callable=AsyncMock) as mock_delete:
+        await rag_service.purge_ephemeral_session(session_id)
+
+    mock_delete.assert_awaited_once()
+    assert mock_delete.call_args[0][1] == [rag_service._get_ephemeral_collection_name(session_id)]
+    assert await rag_service.has_active_ephemeral_collection(session_id) is False
+    assert session_id not in rag_service._ephemeral_vectorstores
+
+@pytest.mark.asyncio
+async def test_purge_expired_ephemeral_collections(mock_tenant_id, session_factory):
+    """有効期限切れのコレクションだけが一括削除されることのテスト"""
+    now = datetime.now(timezone.utc)
+    expired_session_id, active_session_id = uuid4(), uuid4()
+    async with session_factory() as session:
+        repo = EphemeralCollectionRepository(session, tenant_id=mock_tenant_id)
+        await repo.touch(expired_session_id, f"expired_{expired_session_id.hex}", now - timedelta(seconds=1))
+        await repo.touch(active_session_id, f"active_{active_session_id.hex}", now + timedelta(hours=1))
+
+    with patch('app.services.rag_service.delete_vector_collections', new_callable=AsyncMock) as mock_delete:
+        purged = await purge_expired_ephemeral_collections(session_factory=session_factory)
+
+    assert purged >= 1
+    assert f"expired_{expired_session_id.hex}" in mock_delete.call_args[0][1]
+    async with session_factory() as session:
+        repo = EphemeralCollectionRepository(session, tenant_id=mock_tenant_id)
+        assert await repo.get_by_session_id(expired_session_id) is None
+        assert await repo.get_active_by_session_id(active_session_id, now) is not None
+
+@pytest.mark.asyncio
+async def test_answer_cache_reuses_answer_for_similar_question_until_collection_changes(rag_service, session_factory):
+    """近い質問には保存した回答を返し、コレクションの更新後やEphemeralコレクションでは返さないことのテスト"""
+    rag_service._session_factory = session_factory
+    vectors = {"休暇の申請方法は?": [1.0, 0.0], "休暇の申請方法は？": [0.99, 0.05], "経費精算の締め日は?": [0.0, 1.0]}
+    rag_service.embeddings.aembed_query = AsyncMock(side_effect=lambda question: vectors[question])
+
+    lookup = await rag_service.lookup_cached_answer("休暇の申請方法は?")
+    assert lookup.answer is None
+    rag_service.store_answer(lookup, "answer 1")
+    assert (await rag_service.lookup_cached_answer("休暇の申請方法は？")).answer == "answer 1"
+    assert (await rag_service.lookup_cached_answer("経費精算の締め日は?")).answer is None
+
+    # セッションのEphemeralコレクションは別に扱い、グローバルの回答を使わない
+    session_id = uuid4()
+    await rag_service.add_documents_to_ephemeral_rag(session_id, [Document(page_content="Session doc")])
+    assert (await rag_service.lookup_cached_answer("休暇の申請方法は?", session_id=session_id)).answer is None
+
+    # 検索後にグローバルコレクションが更新された場合、その回答は保存せず、保存済みの回答も返さない
+    stale_lookup = await rag_service.lookup_cached_answer("経費精算の締め日は?")
+    await rag_service.add_documents_to_global_rag([Document(page_content="New policy")])
+    rag_service.store_answer(stale_lookup, "stale answer")
+    assert (await rag_service.lookup_cached_answer("経費精算の締め日は?")).answer is None
+    assert (await rag_service.lookup_cached_answer("休暇の申請方法は?")).answer is None
+
+
+@pytest.mark.asyncio
+async def test_answer_cache_disabled(rag_service):
+    """回答キャッシュが無効な場合は検索結果を返さず、埋め込みも計算しないことのテスト"""
+    rag_service.answer_cache = None
+    rag_service.embeddings.aembed_query = AsyncMock()
+
+    assert await rag_service.lookup_cached_answer("休暇の申請方法は?") is None
+    rag_service.embeddings.aembed_query.assert_not_awaited()
+
+def test_hybrid_retrieval_mode_fuses_vector_and_keyword_search(
+    mock_tenant_id, mock_llm_client, mock_pgvector, mock_embeddings, monkeypatch
+):
+    """hybrid モードでは、ベクトル検索と同じコレクションへの全文検索を組み合わせたリトリーバーを使うことのテスト"""
+    from langchain_core.retrievers import BaseRetriever
+    from app.services.hybrid_retrieval import HybridRetriever, PgKeywordRetriever
+
+    monkeypatch.setattr(settings, "RAG_RETRIEVAL_MODE", "hybrid")
+    vector_retriever = MagicMock(spec=BaseRetriever)
+    mock_pgvector.return_value.as_retriever.return_value = vector_retriever
+
+    service = RagService(tenant_id=mock_tenant_id, llm_client=mock_llm_client)
+
+    retriever = service.global_retriever
+    assert isinstance(retriever, HybridRetriever)
+    assert retriever.vector_retriever is vector_retriever
+    mock_pgvector.return_value.as_retriever.assert_called_with(search_kwargs={"k": settings.RAG_HYBRID_FETCH_K})
+    assert isinstance(retriever.keyword_retriever, PgKeywordRetriever)
+    assert retriever.keyword_retriever.collection_name == service.global_collection_name
+    assert retriever.k == settings.RAG_TOP_K
+
+@pytest.mark.asyncio
+async def test_single_collection_mode_filters_by_tenant_and_scope(
+    mock_tenant_id, mock_llm_client, mock_pgvector, mock_embeddings,
+    session_factory, monkeypatch
+):
+    """単一コレクション構成では、共通のコレクションにメタデータ付きで保存し、グローバルとセッションのチャンクを1回で検索することのテスト"""
+    monkeypatch.setattr(settings, "RAG_SINGLE_COLLECTION_ENABLED", True)
+    service = RagService(tenant_id=mock_tenant_id, llm_client=mock_llm_client, session_factory=session_factory)
+    vectorstore = mock_pgvector.return_value
+    session_id = uuid4()
+
+    assert mock_pgvector.call_args.kwargs["collection_name"] == settings.PG_COLLECTION_NAME
+    vectorstore.as_retriever.assert_called_with(search_kwargs={
+        "k": settings.RAG_TOP_K,
+        "filter": {"tenant_id": {"$in": [str(mock_tenant_id)]}, "rag_scope": {"$in": ["global"]}},
+    })
+
+    await service.add_documents_to_global_rag([Document(page_content="Policy", metadata={"file_name": "a.md"})])
+    await service.add_documents_to_ephemeral_rag(session_id, [Document(page_content="Session doc")])
+    added = [call.args[0][0] for call in vectorstore.aadd_documents.await_args_list]
+    assert added[0].metadata == {"file_name": "a.md", "tenant_id": str(mock_tenant_id), "rag_scope": "global"}
+    assert added[1].metadata["rag_scope"] == str(session_id)
+    assert service._ephemeral_vectorstores == {} # セッションごとのコレクションは作らない
+
+    await service._get_retriever_for_session(session_id)
+    vectorstore.as_retriever.assert_called_with(search_kwargs={
+        "k": settings.RAG_TOP_K,
+        "filter": {"tenant_id": {"$in": [str(mock_tenant_id)]}, "rag_scope": {"$in": ["global", str(session_id)]}},
+    })
+
+    with patch('app.services.rag_service.delete_vector_chunks_by_scope', new_callable=AsyncMock) as mock_delete:
+        await service.purge_ephemeral_session(session_id)
+    assert mock_delete.call_args[0][1] == [str(session_id)]
+
+@pytest.mark.asyncio
+async def test_session_retriever_fans_out_to_ephemeral_and_global(rag_service, session_factory):
+    """Ephemeral RAG利用中のセッションでは、セッションとテナントのコレクションを並行して検索することのテスト"""
+    rag_service._session_factory = session_factory
+    session_id = uuid4()
+    await rag_service.add_documents_to_ephemeral_rag(session_id, [Document(page_content="Session doc")])
+
+    retriever = await rag_service._get_retriever_for_session(session_id)
+
+    assert isinstance(retriever, FanOutRetriever)
+    assert retriever.retrievers[-1] is rag_service.global_retriever
+    assert retriever.timeout_seconds == settings.RAG_SOURCE_TIMEOUT_SECONDS
+    # Ephemeral RAG未使用のセッションはグローバルのみ
+    assert await rag_service._get_retriever_for_session(uuid4()) is rag_service.global_retriever
+
+
+def test_reranker_overfetches_candidates_and_wraps_retriever(
+    mock_tenant_id, mock_llm_client, mock_pgvector, mock_embeddings
+):
+    """リランカーが有効な場合、RAG_RERANK_FETCH_K 件の候補をリランクして RAG_TOP_K 件に絞ることのテスト"""
+    service = RagService(tenant_id=mock_tenant_id, llm_client=mock_llm_client, reranker=BM25Reranker())
+
+    mock_pgvector.return_value.as_retriever.assert_called_with(search_kwargs={"k": settings.RAG_RERANK_FETCH_K})
+    retriever = service._retriever_for(None)
+    assert isinstance(retriever, RerankingRetriever)
+    assert retriever.base_retriever is service.global_retriever
+    assert retriever.k == settings.RAG_TOP_K
+    assert retriever.max_context_tokens == settings.RAG_CONTEXT_MAX_TOKENS
+
+@pytest.mark.asyncio
+async def test_retrieve_context_formats_chunks(rag_service):
+    """retrieve_contextが検索したチャンクを結合して返すことのテスト"""
+    rag_service.global_retriever.ainvoke.return_value = [
+        Document(page_content="保証期間は2年間です。"),
+        Document(page_content="SKU-1234 はバッテリーを含みます。"),
     ]
 
-    answer = await rag_service.query_rag(test_question)
-    assert answer == expected_answer
-    
-    # retrieverが呼ばれたことを確認 (LCEL内部で発生)
-    # rag_service.global_retriever.aget_relevant_documents.assert_awaited_once() # Flaky with implementation details of LCEL
-    # LLMが呼ばれたことを確認 (LCEL内部で発生)
-    # mock_chat_google_generative_ai.return_value.ainvoke.assert_awaited_once() # これはRAGチェーン内で複雑なため、直接確認は難しい
+    context = await rag_service.retrieve_context("SKU-1234の保証期間は？")
+
+    assert context == "保証期間は2年間です。\n\nSKU-1234 はバッテリーを含みます。"
+    rag_service.global_retriever.ainvoke.assert_awaited_once_with("SKU-1234の保証期間は？")
 
 @pytest.mark.asyncio
-async def test_add_documents(rag_service, mock_pgvector):
-    """add_documentsメソッドのテスト"""
-    test_documents = [Document(page_content="Test content")]
-    await rag_service.add_documents_to_global_rag(test_documents)
-    mock_pgvector.return_value.aadd_documents.assert_awaited_once_with(test_documents)
+async def test_retrieve_context_applies_per_query_search_settings(rag_service, monkeypatch):
+    """retrieve_context で指定した ef_search / probes を、その検索のセッションにだけ SET LOCAL で適用することのテスト"""
+    from app.services.vector_index import apply_search_settings
+
+    monkeypatch.setattr(settings, "VECTOR_HNSW_EF_SEARCH", 40)
+    monkeypatch.setattr(settings, "VECTOR_IVFFLAT_PROBES", None)
+    statements = []
+
+    async def search(question):
+        # TunedPGVector がセッションの開始時に行う設定を、検索の中で実行する
+        session = AsyncMock()
+        await apply_search_settings(session)
+        statements.append([str(call.args[0]) for call in session.execute.await_args_list])
+        return [Document(page_content="chunk")]
+    rag_service.global_retriever.ainvoke.side_effect = search
+
+    await rag_service.retrieve_context("質問", ef_search=200, probes=10)
+    await rag_service.retrieve_context("質問")
+
+    assert statements == [
+        ["SET LOCAL hnsw.ef_search = 200", "SET LOCAL ivfflat.probes = 10"],
+        ["SET LOCAL hnsw.ef_search = 40"],
+    ]
 
 @pytest.mark.asyncio
-@pytest.mark.skip(reason="Flaky mock behavior for specific LangChain chaining, pending deep investigation")
-async def test_stream_rag_response(rag_service, mock_chat_google_generative_ai):
-    """stream_rag_responseメソッドのテスト"""
-    test_question = "Stream this."
-    stream_chunks = ["First", "Second", "Third"]
-
-    # LCELチェーン内のLLMのastreamをモック
-    async def mock_llm_stream(*args, **kwargs):
-        for chunk in stream_chunks:
-            yield AIMessageChunk(content=chunk)
-
-    # mock_chat_google_generative_ai.return_value.astream needs to return an async iterator
-    mock_chat_google_generative_ai.return_value.astream.side_effect = mock_llm_stream
-    
-    rag_service.global_retriever.aget_relevant_documents.return_value = [] # ダミー
+async def test_retrieve_context_reuses_answer_cache_lookup(rag_service, session_factory):
+    """回答キャッシュの確認結果を渡すと、セッションの解決と質問の埋め込みを繰り返さずに検索することのテスト"""
+    rag_service._session_factory = session_factory
+    rag_service.embeddings.aembed_query = AsyncMock(return_value=[1.0, 0.0])
+    lookup = await rag_service.lookup_cached_answer("休暇の申請方法は?")
+    rag_service.embeddings.aembed_query.reset_mock()
+    seen_vectors = []
+
+    async def search(question):
+        seen_vectors.append(_query_embeddings.get().get(question))
+        return [Document(page_content="chunk")]
+    rag_service.global_retriever.ainvoke.side_effect = search
 
-    received_chunks = []
-    async for chunk in rag_service.stream_rag_response(test_question):
-        received_chunks.append(chunk)
+    with patch.object(rag_service, "_resolve_ephemeral_session", wraps=rag_service._resolve_ephemeral_session) as resolve:
+        assert await rag_service.retrieve_context("休暇の申請方法は?", cache_lookup=lookup) == "chunk"
+        resolve.assert_not_awaited()
+        await rag_service.retrieve_context("休暇の申請方法は?")
+        resolve.assert_awaited_once()
 
-    assert received_chunks == stream_chunks
-    # rag_service.global_retriever.aget_relevant_documents.assert_awaited_once()
-    # mock_chat_google_generative_ai.return_value.astream.assert_awaited_once()
+    assert seen_vectors == [[1.0, 0.0], None]
+    rag_service.embeddings.aembed_query.assert_not_awaited()
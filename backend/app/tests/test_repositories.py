@@ -9,7 +9,13 @@ from app.repositories.tenant import TenantRepository
 from app.repositories.user import UserRepository
 from app.models.tenant import Tenant
 from app.models.user import User
+from app.models.chat import ChatMessage
+from app.models.ingestion_job import IngestionJob
+from app.repositories.chat import ChatMessageRepository
+from app.repositories.knowledge import KnowledgeDocumentRepository
 from app.core.database import Base
+from app.schemas.auth import AuthenticatedUser
+from app.services.auth_cache import token_user_cache
 
 @pytest.fixture
 def mock_session():
@@ -136,3 +142,157 @@ async def test_user_repository_get_by_email_no_tenant(user_repo_no_tenant, mock_
     actual_query = str(mock_session.execute.call_args[0][0])
     expected_query = str(select(User).where(User.email == test_email))
     assert actual_query == expected_query
+
+@pytest.mark.asyncio
+async def test_user_repository_deactivation_invalidates_auth_cache(user_repo_no_tenant):
+    """ユーザーを無効化すると、そのユーザーの検証済みトークンのキャッシュが破棄されることのテスト"""
+    user = User(id=uuid4(), tenant_id=uuid4(), email="user@example.com", hashed_password="x", is_active=True)
+    cached = AuthenticatedUser(id=user.id, tenant_id=user.tenant_id, email=user.email)
+    await token_user_cache.set("token-a", cached)
+    await token_user_cache.set("token-b", cached)
+
+    await user_repo_no_tenant.update(user, {"is_active": False})
+
+    assert await token_user_cache.get("token-a") is None
+    assert await token_user_cache.get("token-b") is None
+
+# バルク操作のテスト（SQLite）
+@pytest.mark.asyncio
+async def test_user_repository_bulk_deactivate_and_delete_invalidate_auth_cache(async_session):
+    """バルクでの無効化・削除でも、対象ユーザーの認証キャッシュだけが破棄されることのテスト"""
+    tenant = Tenant(id=uuid4(), name=f"t-{uuid4()}")
+    async_session.add(tenant)
+    await async_session.commit()
+    repo = UserRepository(async_session, tenant_id=tenant.id)
+    deactivated, deleted, untouched = await repo.bulk_create([
+        {"email": f"u{i}-{uuid4()}@example.com", "hashed_password": "x"} for i in range(3)
+    ])
+    for user in (deactivated, deleted, untouched):
+        await token_user_cache.set(f"token-{user.id}", AuthenticatedUser(id=user.id, tenant_id=tenant.id, email=user.email))
+
+    assert await repo.bulk_update({"is_active": False}, User.id == deactivated.id) == 1
+    assert await repo.bulk_delete_where(User.id == deleted.id) == 1
+
+    assert await token_user_cache.get(f"token-{deactivated.id}") is None
+    assert await token_user_cache.get(f"token-{deleted.id}") is None
+    assert await token_user_cache.get(f"token-{untouched.id}") is not None
+
+@pytest.mark.asyncio
+async def test_bulk_create_update_delete_keep_tenant_filter(async_session):
+    """バルク作成・更新・削除がテナントIDで自動的に絞り込まれることのテスト"""
+    tenant_a, tenant_b = Tenant(id=uuid4(), name=f"a-{uuid4()}"), Tenant(id=uuid4(), name=f"b-{uuid4()}")
+    async_session.add_all([tenant_a, tenant_b])
+    await async_session.commit()
+    repo_a = UserRepository(async_session, tenant_id=tenant_a.id)
+    repo_b = UserRepository(async_session, tenant_id=tenant_b.id)
+
+    created = await repo_a.bulk_create([
+        {"email": f"a{i}-{uuid4()}@example.com", "hashed_password": "x"} for i in range(3)
+    ])
+    assert len(created) == 3
+    assert all(user.tenant_id == tenant_a.id and user.id for user in created)
+    assert await repo_b.bulk_create(
+        [{"email": f"b-{uuid4()}@example.com", "hashed_password": "x"}], returning=False
+    ) == []
+
+    # tenant_b のリポジトリからは tenant_a のユーザーを更新・削除できない
+    assert await repo_b.bulk_update({"is_admin": True}, User.id.in_([u.id for u in created])) == 0
+    assert await repo_a.bulk_update({"is_admin": True}, User.id.in_([u.id for u in created[:2]])) == 2
+    assert await repo_b.bulk_delete_where(User.id == created[0].id) == 0
+    assert await repo_a.bulk_delete_where(User.id == created[0].id) == 1
+
+    remaining = (await async_session.execute(select(User).where(User.tenant_id == tenant_a.id))).scalars().all()
+    assert sorted(u.is_admin for u in remaining) == [False, True]
+    assert len((await async_session.execute(select(User).where(User.tenant_id == tenant_b.id))).scalars().all()) == 1
+
+@pytest.mark.asyncio
+async def test_bulk_operations_require_condition(user_repo_with_tenant):
+    """条件なしのバルク更新・削除（全件対象）はエラーになることのテスト"""
+    with pytest.raises(ValueError):
+        await user_repo_with_tenant.bulk_update({"is_admin": True})
+    with pytest.raises(ValueError):
+        await user_repo_with_tenant.bulk_delete_where()
+
+@pytest.mark.asyncio
+async def test_create_can_skip_refresh(base_repo_with_tenant, mock_session):
+    """refresh=False の場合、コミット後の再読み込みを行わないことのテスト"""
+    await base_repo_with_tenant.create({"email": "user@example.com", "hashed_password": "x"}, refresh=False)
+    mock_session.commit.assert_awaited_once()
+    mock_session.refresh.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_chat_message_keyset_pagination(async_session):
+    """(created_at, id) のキーセットで前後のページと最新N件を取得できることのテスト"""
+    from datetime import datetime, timedelta
+    repo = ChatMessageRepository(async_session)
+    session_id = uuid4()
+    base_time = datetime(2026, 1, 1)
+    # 同じ created_at のメッセージも id で一意に並ぶ
+    await repo.bulk_create([
+        {"session_id": session_id, "role": "user", "content": f"m{i}", "created_at": base_time + timedelta(seconds=i // 2)}
+        for i in range(7)
+    ], returning=False)
+    await repo.bulk_create([{"session_id": uuid4(), "role": "user", "content": "other", "created_at": base_time}], returning=False)
+    ordered = await repo.get_by_session_id(session_id)
+    ordered = sorted(ordered, key=lambda m: (m.created_at, str(m.id)))
+
+    latest = await repo.get_latest(session_id, 3)
+    assert [m.id for m in latest] == [m.id for m in ordered[-3:]]
+
+    older = await repo.get_page(session_id, limit=3, before=(latest[0].created_at, latest[0].id))
+    assert [m.id for m in older] == [m.id for m in ordered[1:4]]
+
+    newer = await repo.get_page(session_id, limit=10, after=(older[-1].created_at, older[-1].id))
+    assert [m.id for m in newer] == [m.id for m in ordered[4:]]
+
+    with pytest.raises(ValueError):
+        await repo.get_page(session_id, before=(latest[0].created_at, latest[0].id), after=(older[0].created_at, older[0].id))
+
+@pytest.mark.asyncio
+async def test_knowledge_document_content_hash_unique_per_tenant(async_session):
+    """同じ content_hash はテナント内で1件のみ登録でき、別テナントでは登録できることのテスト"""
+    from sqlalchemy.exc import IntegrityError
+    tenant_a, tenant_b = Tenant(id=uuid4(), name=f"a-{uuid4()}"), Tenant(id=uuid4(), name=f"b-{uuid4()}")
+    async_session.add_all([tenant_a, tenant_b])
+    await async_session.commit()
+    repo_a = KnowledgeDocumentRepository(async_session, tenant_id=tenant_a.id)
+    repo_b = KnowledgeDocumentRepository(async_session, tenant_id=tenant_b.id)
+    content_hash = "d" * 64
+
+    created = await repo_a.create({"file_name": "a.txt", "file_path": f"/a/{content_hash}.txt", "content_hash": content_hash})
+    await repo_b.create({"file_name": "b.txt", "file_path": f"/b/{content_hash}.txt", "content_hash": content_hash})
+    assert created.is_global_indexed is False
+    assert (await repo_a.get_by_content_hash(content_hash)).id == created.id
+    assert await repo_a.get_by_content_hash("e" * 64) is None
+
+    with pytest.raises(IntegrityError):
+        await repo_a.create({"file_name": "copy.txt", "file_path": f"/a/{content_hash}.md", "content_hash": content_hash})
+    await async_session.rollback()
+
+@pytest.mark.asyncio
+async def test_ingestion_job_one_active_global_job_per_document(async_session):
+    """待機中・実行中のグローバルRAG登録ジョブはドキュメントごとに1件のみ作成でき、完了後は再作成できることのテスト"""
+    from sqlalchemy.exc import IntegrityError
+    from app.models.ingestion_job import INGESTION_JOB_SUCCEEDED
+    from app.models.knowledge import KnowledgeDocument
+    from app.repositories.ingestion_job import IngestionJobRepository
+    tenant = Tenant(id=uuid4(), name=f"jobs-{uuid4()}")
+    async_session.add(tenant)
+    await async_session.commit()
+    document = await KnowledgeDocumentRepository(async_session, tenant_id=tenant.id).create(
+        {"file_name": "a.txt", "file_path": f"/a/{uuid4()}.txt", "content_hash": uuid4().hex}
+    )
+    repo = IngestionJobRepository(async_session, tenant_id=tenant.id)
+
+    document_id = document.id
+    job_id = (await repo.create({"document_id": document_id})).id
+    await repo.create({"document_id": document_id, "session_id": uuid4()}) # Ephemeral RAG のジョブは対象外
+    assert (await repo.get_active_global_job(document_id)).id == job_id
+
+    with pytest.raises(IntegrityError):
+        await repo.create({"document_id": document_id})
+    await async_session.rollback()
+
+    await repo.bulk_update({"status": INGESTION_JOB_SUCCEEDED}, IngestionJob.id == job_id)
+    assert await repo.get_active_global_job(document_id) is None
+    assert (await repo.create({"document_id": document_id})).id != job_id
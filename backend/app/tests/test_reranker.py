@@ -0,0 +1,94 @@
+import sys
+import threading
+from typing import List
+from unittest.mock import patch
+
+import pytest
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.tokens import estimate_tokens
+from app.services.reranker import (
+    BM25Reranker,
+    CrossEncoderReranker,
+    Reranker,
+    RerankingRetriever,
+    bm25_terms,
+    select_within_budget,
+)
+
+
+class StaticRetriever(BaseRetriever):
+    """固定の結果を返すリトリーバー"""
+    results: List[Document]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.results
+
+
+class RecordingReranker(Reranker):
+    """本文の長さで採点し、呼び出されたスレッドを記録するリランカー"""
+    def __init__(self):
+        self.threads = []
+
+    def score(self, query, texts):
+        self.threads.append(threading.current_thread().name)
+        return [float(len(text)) for text in texts]
+
+
+def test_bm25_terms_uses_words_and_cjk_bigrams():
+    """英数字は語単位、日本語は文字バイグラムで索引語にすることのテスト"""
+    assert bm25_terms("SKU-1234の保証期間") == ["sku-1234", "の保", "保証", "証期", "期間"]
+    assert bm25_terms("") == []
+
+
+def test_bm25_reranker_prefers_chunks_matching_rare_query_terms():
+    """質問の語（特に候補内で珍しい語）を多く含むチャンクほど高く採点されることのテスト"""
+    texts = [
+        "バッテリーの交換手順について説明します。",
+        "SKU-1234 のバッテリー保証期間は2年間です。",
+        "保証書の再発行は窓口で受け付けます。",
+    ]
+    scores = BM25Reranker().score("SKU-1234の保証期間は？", texts)
+
+    assert max(range(len(texts)), key=scores.__getitem__) == 1
+    assert BM25Reranker().score("これ", []) == []
+
+
+def test_select_within_budget_skips_chunks_over_the_budget():
+    """上位から順にトークン予算に収まるチャンクを選び、収まらないものは飛ばすことのテスト"""
+    long_doc = Document(page_content="長" * 50)
+    short_docs = [Document(page_content="短" * 10) for _ in range(3)]
+    documents = [short_docs[0], long_doc, short_docs[1], short_docs[2]]
+
+    selected = select_within_budget(documents, k=2, max_tokens=25)
+
+    assert selected == [short_docs[0], short_docs[1]]
+    assert sum(estimate_tokens(doc.page_content) for doc in selected) <= 25
+    assert select_within_budget(documents, k=3, max_tokens=None) == documents[:3]
+
+
+@pytest.mark.asyncio
+async def test_reranking_retriever_reranks_in_thread_pool_and_keeps_top_k():
+    """候補をスレッドプールでリランクし、採点結果を付与した上位 k 件を返すことのテスト"""
+    candidates = [Document(id=str(i), page_content="x" * length) for i, length in enumerate([3, 9, 1, 6])]
+    reranker = RecordingReranker()
+    retriever = RerankingRetriever(base_retriever=StaticRetriever(results=candidates), reranker=reranker, k=2)
+
+    documents = await retriever.ainvoke("質問")
+
+    assert [doc.id for doc in documents] == ["1", "3"]
+    assert [doc.metadata["rerank_score"] for doc in documents] == [9.0, 6.0]
+    assert reranker.threads[0].startswith("rerank")
+    # 元の候補のメタデータは変更しない
+    assert "rerank_score" not in candidates[1].metadata
+
+
+def test_cross_encoder_reranker_requires_optional_dependency():
+    """sentence-transformers が無い場合は、インストール方法を示すエラーになることのテスト"""
+    reranker = CrossEncoderReranker("dummy-model")
+    with patch.dict(sys.modules, {"sentence_transformers": None}):
+        with pytest.raises(RuntimeError, match="sentence-transformers"):
+            reranker.score("質問", ["本文"])
+    assert reranker.score("質問", []) == []
@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+from app.services.semantic_cache import SemanticAnswerCache
+
+
+def test_returns_closest_answer_above_threshold():
+    """しきい値以上で最も近い質問の回答を返し、しきい値未満や別コレクションでは返さないことのテスト"""
+    cache = SemanticAnswerCache(similarity_threshold=0.9)
+    cache.put(None, "q1", [1.0, 0.0, 0.0], "a1", cache.generation)
+    cache.put(None, "q2", [0.8, 0.6, 0.0], "a2", cache.generation)
+
+    assert cache.get(None, [2.0, 0.1, 0.0]) == "a1" # 長さは類似度に影響しない
+    assert cache.get(None, [0.7, 0.7, 0.0]) == "a2"
+    assert cache.get(None, [0.0, 0.0, 1.0]) is None
+    assert cache.get("session", [1.0, 0.0, 0.0]) is None
+
+
+def test_entries_are_bounded_by_size_and_ttl():
+    """コレクションごとの件数・コレクション数・有効期限で破棄されることのテスト"""
+    cache = SemanticAnswerCache(max_entries=2, max_collections=2, ttl_seconds=10)
+    with patch("app.services.semantic_cache.time.monotonic", return_value=100.0):
+        for index in range(3):
+            vector = [0.0] * 3
+            vector[index] = 1.0
+            cache.put("a", f"q{index}", vector, f"a{index}", cache.generation)
+        assert cache.get("a", [1.0, 0.0, 0.0]) is None
+        assert cache.get("a", [0.0, 0.0, 1.0]) == "a2"
+
+        cache.put("b", "q", [1.0, 0.0, 0.0], "b", cache.generation)
+        cache.put("c", "q", [1.0, 0.0, 0.0], "c", cache.generation)
+        assert cache.get("a", [0.0, 0.0, 1.0]) is None # 最も長く使われていないコレクションを破棄
+        assert len(cache) == 2
+
+    with patch("app.services.semantic_cache.time.monotonic", return_value=110.0):
+        assert cache.get("c", [1.0, 0.0, 0.0]) is None
+
+
+def test_invalidate_discards_answers_and_in_flight_generations():
+    """invalidate でコレクションの回答を破棄し、無効化前に生成を開始した回答は保存しないことのテスト"""
+    cache = SemanticAnswerCache()
+    cache.put(None, "q", [1.0, 0.0], "old", cache.generation)
+    generation = cache.generation
+
+    cache.invalidate(None)
+    cache.put(None, "q", [1.0, 0.0], "stale", generation)
+
+    assert cache.get(None, [1.0, 0.0]) is None
+    assert len(cache) == 0
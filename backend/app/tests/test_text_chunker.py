@@ -0,0 +1,89 @@
+import pytest
+
+from app.core.tokens import estimate_tokens
+from app.services.text_chunker import TextChunker
+
+SAMPLE_TEXT = (
+    "DOM Enterprise Gateway は社内ナレッジを検索して回答します。"
+    "アップロードされた文書は分割され、ベクトルとして保存されます。\n\n"
+    + "The gateway splits every uploaded document into overlapping chunks before embedding. " * 12
+    + "\n\n最後の段落です。"
+)
+
+
+def _pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("length_unit", ["chars", "tokens"])
+def test_chunks_respect_size_and_overlap_with_exact_offsets(length_unit):
+    """チャンクが上限以内で、オフセットが元のテキストの位置と一致し、隣り合うチャンクが重なることのテスト"""
+    chunker = TextChunker(chunk_size=60, chunk_overlap=10, length_unit=length_unit)
+    chunks = list(chunker.chunk(SAMPLE_TEXT))
+
+    measure = len if length_unit == "chars" else estimate_tokens
+    assert len(chunks) > 3
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert SAMPLE_TEXT[chunk.start:chunk.end] == chunk.text
+        assert measure(chunk.text) <= 60
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous.start < current.start < previous.end # オーバーラップ
+    assert chunks[0].start == 0
+    assert chunks[-1].end == len(SAMPLE_TEXT)
+
+
+def test_streamed_segments_produce_same_chunks():
+    """テキストを細切れで渡しても、一括で渡した場合と同じチャンクになることのテスト"""
+    chunker = TextChunker(chunk_size=80, chunk_overlap=15)
+    whole = [(c.text, c.start, c.end) for c in chunker.chunk(SAMPLE_TEXT)]
+    streamed = [(c.text, c.start, c.end) for c in chunker.iter_chunks(_pieces(SAMPLE_TEXT, 7))]
+    assert streamed == whole
+
+
+def test_chunks_prefer_paragraph_and_sentence_boundaries():
+    """上限内に段落・文の区切りがある場合、その直後で区切ることのテスト"""
+    text = "一つ目の文です。二つ目の文です。\n\n三つ目の段落はもう少し長い文章になっています。"
+    chunks = list(TextChunker(chunk_size=30, chunk_overlap=0).chunk(text))
+    assert chunks[0].text == "一つ目の文です。二つ目の文です。"
+    assert chunks[1].text.startswith("三つ目の段落")
+
+
+def test_markdown_mode_splits_at_headings_and_records_heading_path():
+    """Markdownモードでは見出しの前で区切り、見出しの階層を記録し、コードブロック内の#は見出しとしないことのテスト"""
+    text = (
+        "# Guide\n"
+        "Intro paragraph.\n"
+        "## Setup\n"
+        "Install the package.\n"
+        "```bash\n"
+        "# not a heading\n"
+        "pip install gateway\n"
+        "```\n"
+        "## Usage\n"
+        "Run the server.\n"
+        "# Appendix\n"
+        "Notes."
+    )
+    chunker = TextChunker(chunk_size=500, chunk_overlap=50, markdown=True)
+    chunks = list(chunker.iter_chunks(_pieces(text, 5)))
+
+    assert [chunk.headings for chunk in chunks] == [
+        ["Guide"],
+        ["Guide", "Setup"],
+        ["Guide", "Usage"],
+        ["Appendix"],
+    ]
+    assert "# not a heading" in chunks[1].text
+    assert chunks[2].text == "## Usage\nRun the server."
+    assert chunks[1].metadata()["headings"] == "Guide > Setup"
+    assert all(text[chunk.start:chunk.end] == chunk.text for chunk in chunks)
+
+
+def test_invalid_settings_are_rejected():
+    with pytest.raises(ValueError):
+        TextChunker(chunk_size=0)
+    with pytest.raises(ValueError):
+        TextChunker(chunk_size=100, chunk_overlap=100)
+    with pytest.raises(ValueError):
+        TextChunker(length_unit="bytes")
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from app.services.text_extraction import ExtractionProcessPool, ExtractionTimeoutError, extract_pages
+
+
+# 子プロセスから参照できるよう、ページ読み込み関数はモジュールのトップレベルに定義する
+def read_form_feed_pages(file_path, file_extension):
+    """改ページ（\\f）で区切られたテキストファイルをページとして読み込むテスト用のリーダー"""
+    # 解析の回数を数えるため、読み込むたびに隣のファイルに1行追記する
+    with open(f"{file_path}.reads", "a", encoding="utf-8") as reads:
+        reads.write("read\n")
+    return Path(file_path).read_text(encoding="utf-8").split("\f")
+
+
+def read_pages_waiting_for_files(file_path, file_extension):
+    """"WAIT:<パス>" のページでそのファイルが作成されるまで解析を止める、テスト用のリーダー"""
+    for page in Path(file_path).read_text(encoding="utf-8").split("\f"):
+        if page.startswith("WAIT:"):
+            deadline = time.monotonic() + 30
+            while not Path(page[len("WAIT:"):]).exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            continue
+        yield page
+
+
+def read_slowly(file_path, file_extension):
+    """解析が終わらないパーサーを模したテスト用のリーダー"""
+    time.sleep(30)
+    return []
+
+
+@pytest.mark.asyncio
+async def test_pages_are_streamed_in_order_from_worker_processes(tmp_path):
+    """子プロセスでファイルを1回だけ解析し、全ページをページ順に返すことのテスト"""
+    path = tmp_path / "report.pdf"
+    path.write_text("\f".join(f"page {i}" for i in range(20)), encoding="utf-8")
+    pool = ExtractionProcessPool(max_workers=1, timeout_seconds=60, page_reader=read_form_feed_pages)
+    try:
+        pages = [page async for page in pool.iter_pages(path, "pdf")]
+    finally:
+        pool.shutdown()
+
+    assert pages == [f"page {i}" for i in range(20)]
+    assert Path(f"{path}.reads").read_text(encoding="utf-8").count("read") == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_stops_worker_and_pool_recovers(tmp_path):
+    """制限時間を超えた抽出は子プロセスを停止して失敗し、次の抽出は新しいプールで実行されることのテスト"""
+    path = tmp_path / "report.pdf"
+    path.write_text("only page", encoding="utf-8")
+    pool = ExtractionProcessPool(max_workers=1, timeout_seconds=3, page_reader=read_slowly)
+    try:
+        started_at = time.monotonic()
+        with pytest.raises(ExtractionTimeoutError):
+            async for _ in pool.iter_pages(path, "pdf"):
+                pass
+        assert time.monotonic() - started_at < 15
+
+        pool.page_reader = read_form_feed_pages
+        pool.timeout_seconds = 60
+        assert [page async for page in pool.iter_pages(path, "pdf")] == ["only page"]
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_first_page_is_returned_before_parsing_finishes(tmp_path):
+    """解析の完了を待たずに最初のページを返し、途中で読むのをやめた場合はその子プロセスを停止することのテスト"""
+    path = tmp_path / "report.pdf"
+    path.write_text(f"page 0\fWAIT:{tmp_path / 'never'}\fpage 1", encoding="utf-8")
+    pool = ExtractionProcessPool(max_workers=1, timeout_seconds=60, page_reader=read_pages_waiting_for_files)
+    try:
+        pages = pool.iter_pages(path, "pdf")
+        assert await asyncio.wait_for(pages.__anext__(), 30) == "page 0"
+        (worker,) = pool._workers
+        await pages.aclose()
+
+        assert pool._workers == set() and pool._idle_workers == []
+        worker.process.join(10)
+        assert not worker.process.is_alive()
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_timeout_stops_only_the_timed_out_worker(tmp_path):
+    """制限時間を超えた抽出の子プロセスだけを停止し、同時に実行中の他の抽出は最後まで続くことのテスト"""
+    go = tmp_path / "go"
+    hanging = tmp_path / "hanging.pdf"
+    hanging.write_text(f"a0\fWAIT:{tmp_path / 'never'}", encoding="utf-8")
+    running = tmp_path / "running.pdf"
+    running.write_text(f"b0\fWAIT:{go}\fb1", encoding="utf-8")
+    pool = ExtractionProcessPool(max_workers=2, timeout_seconds=5, page_reader=read_pages_waiting_for_files)
+    hanging_failed = asyncio.Event()
+
+    async def extract_hanging():
+        with pytest.raises(ExtractionTimeoutError):
+            async for _ in pool.iter_pages(hanging, "pdf"):
+                pass
+        hanging_failed.set()
+
+    async def extract_running():
+        pages = pool.iter_pages(running, "pdf")
+        first = await pages.__anext__()
+        # もう一方の抽出がタイムアウトした後も、この子プロセスは解析を続けている
+        await hanging_failed.wait()
+        go.touch()
+        return [first] + [page async for page in pages]
+
+    try:
+        _, running_pages = await asyncio.gather(extract_hanging(), extract_running())
+    finally:
+        pool.shutdown()
+
+    assert running_pages == ["b0", "b1"]
+
+
+def test_extract_pages_rejects_unsupported_type(tmp_path):
+    with pytest.raises(ValueError):
+        extract_pages(str(tmp_path / "notes.txt"), "txt")
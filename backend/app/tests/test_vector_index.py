@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+
+from app.core.config import settings
+from langchain_postgres.vectorstores import PGVector
+
+from app.services.vector_index import (
+    TunedPGVector,
+    VectorIndexError,
+    VectorIndexManager,
+    apply_search_settings,
+    build_create_index_sql,
+    current_search_settings,
+    index_name_for,
+    precomputed_query_embedding,
+    vector_search_settings,
+)
+
+
+def test_build_create_index_sql_hnsw():
+    """HNSWの部分インデックスが CONCURRENTLY・コサイン距離・コレクション条件付きで作成されることをテスト"""
+    collection_id = uuid4()
+    index_name = index_name_for(collection_id, "hnsw")
+    sql = build_create_index_sql(index_name, collection_id, "hnsw", m=24, ef_construction=128)
+
+    assert index_name == f"ix_lpe_hnsw_{collection_id.hex}"
+    assert sql.startswith(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON langchain_pg_embedding")
+    assert "USING hnsw (embedding vector_cosine_ops) WITH (m = 24, ef_construction = 128)" in sql
+    assert sql.endswith(f"WHERE collection_id = '{collection_id}'")
+
+
+def test_build_create_index_sql_ivfflat_and_unsupported_method():
+    """IVFFlatは lists を指定して作成し、未対応の方式はエラーになることをテスト"""
+    collection_id = uuid4()
+    sql = build_create_index_sql("ix_lpe_ivfflat_x", collection_id, "ivfflat", lists=300)
+    assert "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 300)" in sql
+
+    with pytest.raises(VectorIndexError):
+        build_create_index_sql("ix_lpe_btree_x", collection_id, "btree")
+
+
+@pytest.mark.asyncio
+async def test_search_settings_are_applied_per_context(monkeypatch):
+    """設定の既定値をコンテキストの指定で上書きし、SET LOCAL で適用することをテスト"""
+    monkeypatch.setattr(settings, "VECTOR_HNSW_EF_SEARCH", 40)
+    monkeypatch.setattr(settings, "VECTOR_IVFFLAT_PROBES", None)
+    assert current_search_settings() == {"hnsw.ef_search": 40}
+
+    session = AsyncMock()
+    with vector_search_settings(ef_search=200, probes=10):
+        assert current_search_settings() == {"hnsw.ef_search": 200, "ivfflat.probes": 10}
+        await apply_search_settings(session)
+    # コンテキストを抜けると設定の既定値に戻る
+    assert current_search_settings() == {"hnsw.ef_search": 40}
+
+    statements = [str(call.args[0]) for call in session.execute.await_args_list]
+    assert statements == ["SET LOCAL hnsw.ef_search = 200", "SET LOCAL ivfflat.probes = 10"]
+
+
+@pytest.mark.asyncio
+async def test_start_build_rejects_missing_collection():
+    """コレクションが存在しない場合はインデックスの作成を開始しないことをテスト"""
+    manager = VectorIndexManager(engine=AsyncMock())
+    with patch.object(manager, "get_collection_id", AsyncMock(return_value=None)):
+        with pytest.raises(VectorIndexError):
+            await manager.start_build("missing", "hnsw")
+    assert manager._tasks == set()
+
+
+def _manager_with_index_status(status):
+    """DB上のインデックスの作成状態（pg_index から判定）が status のマネージャーを返します。"""
+    engine = MagicMock()
+    engine.connect.return_value.__aenter__.return_value = AsyncMock()
+    manager = VectorIndexManager(engine=engine)
+    manager.get_collection_id = AsyncMock(return_value=uuid4())
+    manager._embedding_dimension = AsyncMock(return_value=768)
+    manager._build_status = AsyncMock(return_value=status)
+    manager._build = AsyncMock()
+    return manager
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", ["running", "succeeded"])
+async def test_start_build_returns_database_status_without_rebuilding(status):
+    """他のプロセスで作成中・作成済みのインデックスは、DBの状態を返して作成を開始しないことをテスト"""
+    manager = _manager_with_index_status(status)
+    build = await manager.start_build("tenant_a", "hnsw")
+
+    assert build.status == status
+    manager._build.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status,drop_invalid", [(None, False), ("failed", True)])
+async def test_start_build_rebuilds_missing_or_failed_index(status, drop_invalid):
+    """インデックスが無い場合は作成し、失敗して残った無効なインデックスは削除してから作り直すことをテスト"""
+    manager = _manager_with_index_status(status)
+    build = await manager.start_build("tenant_a", "hnsw")
+    await asyncio.gather(*manager._tasks)
+
+    assert build.status == "running"
+    assert manager._build.await_args.kwargs == {"drop_invalid": drop_invalid}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index_name", ["ix_other", "ix_lpe_hnsw_x; DROP TABLE users", "pk_langchain_pg_embedding"])
+async def test_drop_index_rejects_unmanaged_names(index_name):
+    """管理対象外（接頭辞が異なる・不正な文字を含む）のインデックスは削除しないことをテスト"""
+    engine = AsyncMock()
+    manager = VectorIndexManager(engine=engine)
+    with pytest.raises(VectorIndexError):
+        await manager.drop_index(index_name)
+    engine.connect.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_search_indexes_are_created_with_the_embedding_table():
+    """PGVectorがテーブルを作成する際に、キーワード検索・メタデータ絞り込み用のインデックスも作成することをテスト"""
+    conn = AsyncMock()
+    engine = MagicMock()
+    engine.begin.return_value.__aenter__.return_value = conn
+    store = TunedPGVector.__new__(TunedPGVector)
+    store._async_engine = engine
+
+    with patch.object(PGVector, "acreate_tables_if_not_exists", AsyncMock()) as create_tables:
+        await store.acreate_tables_if_not_exists()
+
+    create_tables.assert_awaited_once()
+    sql = str(conn.execute.await_args.args[0])
+    for index_name in (
+        "ix_langchain_pg_embedding_document_trgm",
+        "ix_langchain_pg_embedding_tenant_id_rag_scope",
+        "ix_langchain_pg_embedding_rag_scope",
+    ):
+        assert f"CREATE INDEX IF NOT EXISTS {index_name}" in sql
+
+
+@pytest.mark.asyncio
+async def test_precomputed_query_embedding_skips_embedding_call():
+    """埋め込みを渡されたクエリは埋め込みを計算せずにベクトルで検索し、それ以外は通常どおり検索することのテスト"""
+    store = TunedPGVector.__new__(TunedPGVector)
+    store.asimilarity_search_by_vector = AsyncMock(return_value=[])
+
+    with patch.object(PGVector, "asimilarity_search", AsyncMock(return_value=[])) as embed_and_search:
+        with precomputed_query_embedding("質問", [1.0, 0.0]):
+            await store.asimilarity_search("質問", k=3, filter={"rag_scope": "global"})
+            await store.asimilarity_search("別の質問", k=3)
+        await store.asimilarity_search("質問", k=3)
+
+    store.asimilarity_search_by_vector.assert_awaited_once_with([1.0, 0.0], k=3, filter={"rag_scope": "global"})
+    assert [call.args[0] for call in embed_and_search.await_args_list] == ["別の質問", "質問"]
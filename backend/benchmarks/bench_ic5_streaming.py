@@ -0,0 +1,88 @@
+"""
+IC-5ライト整形の初回トークンまでの時間（TTFT）を比較するベンチマーク。
+
+- before: 全トークンを収集してから compose_ic5_light_response で一括整形（従来方式）
+- after : stream_composed_ic5_light_response で逐次整形（現在の DomOrchestratorService）
+
+実行方法（backend ディレクトリで）:
+    python -m benchmarks.bench_ic5_streaming --token-delay 0.01 --runs 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import AsyncGenerator, List, Tuple
+
+from app.llm.mock_llm import MockLLMClient
+from app.services.answer_composer import AnswerComposerService
+
+
+async def _collect_mock_tokens() -> List[str]:
+    """MockLLMClientの応答トークン列を遅延なしで取得します。"""
+    tokens = []
+    async for token in MockLLMClient().stream_chat_response("benchmark"):
+        if token == "[END]":
+            break
+        tokens.append(token)
+    return tokens
+
+
+async def _token_stream(tokens: List[str], delay: float) -> AsyncGenerator[str, None]:
+    for token in tokens:
+        await asyncio.sleep(delay)
+        yield token
+
+
+async def _run_batch(composer: AnswerComposerService, tokens: List[str], delay: float) -> Tuple[float, float, str]:
+    start = time.perf_counter()
+    first = None
+    output = ""
+    full_llm_output = ""
+    async for token in _token_stream(tokens, delay):
+        full_llm_output += token
+    composed = await composer.compose_ic5_light_response(full_llm_output.strip())
+    for key in ("Decision", "Why", "Next 3 Actions"):
+        if composed[key]:
+            if first is None:
+                first = time.perf_counter() - start
+            output += f"**{key}**\n{composed[key]}\n\n"
+    return first or 0.0, time.perf_counter() - start, output
+
+
+async def _run_stream(composer: AnswerComposerService, tokens: List[str], delay: float) -> Tuple[float, float, str]:
+    start = time.perf_counter()
+    first = None
+    output = ""
+    async for chunk in composer.stream_composed_ic5_light_response(_token_stream(tokens, delay)):
+        if first is None:
+            first = time.perf_counter() - start
+        output += chunk
+    return first or 0.0, time.perf_counter() - start, output
+
+
+async def main(token_delay: float, runs: int):
+    composer = AnswerComposerService()
+    tokens = await _collect_mock_tokens()
+    results = {"before (batch)": [], "after (stream)": []}
+
+    for _ in range(runs):
+        batch = await _run_batch(composer, tokens, token_delay)
+        stream = await _run_stream(composer, tokens, token_delay)
+        if batch[2] != stream[2]:
+            raise AssertionError("Streaming output differs from batch output.")
+        results["before (batch)"].append(batch)
+        results["after (stream)"].append(stream)
+
+    print(f"tokens={len(tokens)} token_delay={token_delay}s runs={runs}")
+    for name, samples in results.items():
+        ttft = statistics.median(sample[0] for sample in samples) * 1000
+        total = statistics.median(sample[1] for sample in samples) * 1000
+        print(f"{name:16s} ttft_median={ttft:8.1f}ms total_median={total:8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="トークン間の擬似遅延（秒）")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.token_delay, args.runs))
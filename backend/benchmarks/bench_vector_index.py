@@ -0,0 +1,159 @@
+"""
+pgvector のANNインデックス（HNSW / IVFFlat）と全件走査（exact）の recall@k・検索レイテンシ・
+作成時間・インデックスサイズを、合成ベクトル（10k / 100k / 1M 件）で比較するベンチマーク。
+
+本番のチャンクテーブルには触れず、ベンチマーク用のテーブル（bench_vector_index）を作成して使用し、終了時に削除します。
+pgvector 拡張が有効な Postgres（DATABASE_URL）が必要です。
+ベクトルはクラスタ構造を持つ正規化済みの乱数で、クエリはコーパスの点に雑音を加えたものです。
+正解は exact（インデックスを使わない全件走査）の上位 k 件で、ef_search / probes を変えたときの
+再現率と速度のトレードオフを確認し、VECTOR_HNSW_EF_SEARCH / VECTOR_IVFFLAT_PROBES の決定に使用します。
+
+実行方法（backend ディレクトリで）:
+    python -m benchmarks.bench_vector_index --sizes 10000 100000 --dim 768 --queries 200
+    python -m benchmarks.bench_vector_index --sizes 1000000 --ef-search 40 100 200 --probes 10 30
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Sequence
+
+import asyncpg
+import numpy as np
+
+from app.core.config import settings
+
+TABLE = "bench_vector_index"
+INSERT_BATCH_SIZE = 10000
+
+
+def _dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def make_corpus(size: int, dim: int, seed: int, clusters: int = 100) -> np.ndarray:
+    """クラスタ構造を持つ正規化済みのベクトルを返します（埋め込みの分布に近づけるため）。"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    queries = corpus[rng.integers(0, len(corpus), count)] + 0.1 * rng.standard_normal((count, corpus.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{value:.6f}" for value in vector) + "]"
+
+
+async def load_corpus(conn: asyncpg.Connection, corpus: np.ndarray):
+    await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    await conn.execute(f"CREATE TABLE {TABLE} (id integer PRIMARY KEY, embedding vector({corpus.shape[1]}))")
+    # real[] で COPY してから vector に変換する（asyncpg は vector 型のコーデックを持たないため）
+    await conn.execute(f"CREATE TEMP TABLE {TABLE}_staging (id integer, embedding real[])")
+    for start in range(0, len(corpus), INSERT_BATCH_SIZE):
+        batch = corpus[start:start + INSERT_BATCH_SIZE]
+        await conn.copy_records_to_table(
+            f"{TABLE}_staging", records=[(start + i, row.tolist()) for i, row in enumerate(batch)]
+        )
+    await conn.execute(f"INSERT INTO {TABLE} SELECT id, embedding::vector FROM {TABLE}_staging")
+    await conn.execute(f"DROP TABLE {TABLE}_staging")
+    await conn.execute(f"ANALYZE {TABLE}")
+
+
+async def search(
+    conn: asyncpg.Connection, queries: np.ndarray, k: int, settings_sql: Sequence[str]
+) -> Dict[str, object]:
+    """各クエリの上位 k 件のIDとレイテンシを返します。"""
+    results: List[List[int]] = []
+    latencies_ms: List[float] = []
+    async with conn.transaction():
+        for statement in settings_sql:
+            await conn.execute(statement)
+        for query in queries:
+            literal = _literal(query)
+            start = time.perf_counter()
+            rows = await conn.fetch(
+                f"SELECT id FROM {TABLE} ORDER BY embedding <=> $1::vector LIMIT {int(k)}", literal
+            )
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            results.append([row["id"] for row in rows])
+    latencies_ms.sort()
+    return {
+        "ids": results,
+        "p50_ms": statistics.median(latencies_ms),
+        "p95_ms": latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))],
+    }
+
+
+def recall_at_k(results: List[List[int]], truth: List[List[int]]) -> float:
+    return statistics.mean(len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth))
+
+
+async def build_index(conn: asyncpg.Connection, method: str, options: str) -> Dict[str, float]:
+    await conn.execute(f"DROP INDEX IF EXISTS {TABLE}_ann")
+    start = time.perf_counter()
+    await conn.execute(f"CREATE INDEX {TABLE}_ann ON {TABLE} USING {method} (embedding vector_cosine_ops) WITH ({options})")
+    seconds = time.perf_counter() - start
+    size = await conn.fetchval(f"SELECT pg_relation_size('{TABLE}_ann')")
+    return {"build_s": seconds, "size_mb": size / 1024 / 1024}
+
+
+def _print_row(name: str, result: Dict[str, object], recall: float, build: str = ""):
+    print(f"  {name:<28} recall@k={recall:.3f} p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms {build}")
+
+
+async def run_size(conn: asyncpg.Connection, size: int, args):
+    corpus = make_corpus(size, args.dim, args.seed)
+    queries = make_queries(corpus, args.queries, args.seed)
+    await load_corpus(conn, corpus)
+    print(f"size={size} dim={args.dim} queries={args.queries} k={args.k}")
+
+    # 正解: インデックスを使わない全件走査
+    exact = await search(conn, queries, args.k, ["SET LOCAL enable_indexscan = off"])
+    _print_row("exact", exact, 1.0)
+
+    lists = args.lists or max(10, int(size / 1000) if size <= 1_000_000 else int(size ** 0.5))
+    for method, options, knob, values in (
+        ("hnsw", f"m = {args.m}, ef_construction = {args.ef_construction}", "hnsw.ef_search", args.ef_search),
+        ("ivfflat", f"lists = {lists}", "ivfflat.probes", args.probes),
+    ):
+        build = await build_index(conn, method, options)
+        build_info = f"build={build['build_s']:.1f}s size={build['size_mb']:.1f}MB ({options})"
+        for value in values:
+            result = await search(conn, queries, args.k, [f"SET LOCAL {knob} = {int(value)}"])
+            _print_row(f"{method} {knob}={value}", result, recall_at_k(result["ids"], exact["ids"]), build_info)
+            build_info = ""
+    await conn.execute(f"DROP TABLE {TABLE}")
+
+
+async def main(args):
+    conn = await asyncpg.connect(_dsn(args.database_url))
+    try:
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        await conn.execute(f"SET maintenance_work_mem = '{args.maintenance_work_mem}'")
+        for size in args.sizes:
+            await run_size(conn, size, args)
+    finally:
+        await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=settings.EMBEDDING_DIMENSION)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40, 100, 200])
+    parser.add_argument("--lists", type=int, default=None, help="IVFFlatのクラスタ数（既定: 行数/1000、100万行超は√行数）")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 10, 30])
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="インデックス作成時のメモリ（HNSWはグラフが収まると高速）")
+    asyncio.run(main(parser.parse_args()))
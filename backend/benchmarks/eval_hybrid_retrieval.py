@@ -0,0 +1,161 @@
+"""
+ベクトル検索のみ（dense）・キーワード検索のみ（keyword）・RRFによるハイブリッド検索（hybrid）の
+recall@k と検索レイテンシを、固定のコーパス（fixtures/retrieval_corpus.json）で比較するオフライン評価。
+
+Postgres や埋め込みAPIを使わずに実行できるよう、以下の構成を使用します。
+- dense  : 文字バイグラムのハッシュによる埋め込み + InMemoryVectorStore
+- keyword: 本番の PgKeywordRetriever（_statement のSQL）を、PGVectorと同じ列を持つインメモリのSQLiteのテーブルに対して実行
+- hybrid : 上の2つを app.services.hybrid_retrieval.HybridRetriever で統合（本番と同じ実装）
+コーパスには、数文字だけ異なる製品コードや固有名詞を持つほぼ同じ文面のチャンクが含まれており、
+埋め込みの近さだけでは取りこぼす質問に対するキーワード検索の効果を確認できます。
+RRFの k や重みを変えたときの傾向の確認に使用します（絶対値は本番の埋め込みモデルとは異なります）。
+
+実行方法（backend ディレクトリで）:
+    python -m benchmarks.eval_hybrid_retrieval --k 1 3 5 --rrf-k 60 --keyword-weight 1.0
+"""
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import InMemoryVectorStore
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.services.hybrid_retrieval import HybridRetriever, PgKeywordRetriever
+
+DEFAULT_CORPUS = Path(__file__).parent / "fixtures" / "retrieval_corpus.json"
+COLLECTION_NAME = "eval_hybrid_retrieval"
+
+
+class CharBigramEmbeddings(Embeddings):
+    """文字バイグラムを固定次元にハッシュする、決定的なオフライン用の埋め込み。"""
+    def __init__(self, size: int = 512):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        normalized = text.lower()
+        for i in range(len(normalized) - 1):
+            vector[zlib.crc32(normalized[i:i + 2].encode("utf-8")) % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+async def load_chunk_tables(engine: AsyncEngine, documents: List[Document]):
+    """PGVectorのコレクション・チャンクのテーブルと同じ列を持つテーブルを作成し、コーパスを登録します。"""
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE langchain_pg_collection (uuid TEXT PRIMARY KEY, name TEXT)"))
+        await conn.execute(text(
+            "CREATE TABLE langchain_pg_embedding (id TEXT PRIMARY KEY, collection_id TEXT, document TEXT, cmetadata JSON)"
+        ))
+        await conn.execute(
+            text("INSERT INTO langchain_pg_collection VALUES ('c1', :name)"), {"name": COLLECTION_NAME}
+        )
+        await conn.execute(
+            text("INSERT INTO langchain_pg_embedding VALUES (:id, 'c1', :document, '{}')"),
+            [{"id": document.id, "document": document.page_content} for document in documents],
+        )
+
+
+def _recall(retrieved: List[Document], relevant: List[str]) -> float:
+    return len({document.id for document in retrieved} & set(relevant)) / len(relevant)
+
+
+async def _evaluate(retriever: BaseRetriever, queries: List[Dict], ks: Sequence[int]) -> Dict[str, object]:
+    recalls: Dict[int, List[float]] = {k: [] for k in ks}
+    misses: Dict[int, List[str]] = {k: [] for k in ks}
+    latencies_ms: List[float] = []
+    for entry in queries:
+        start = time.perf_counter()
+        retrieved = await retriever.ainvoke(entry["query"])
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        for k in ks:
+            recall = _recall(retrieved[:k], entry["relevant"])
+            recalls[k].append(recall)
+            if recall < 1.0:
+                misses[k].append(entry["query"])
+    latencies_ms.sort()
+    return {
+        "recall": {k: statistics.mean(values) for k, values in recalls.items()},
+        "misses": misses,
+        "p50_ms": statistics.median(latencies_ms),
+        "p95_ms": latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))],
+    }
+
+
+async def main(args):
+    corpus = json.loads(Path(args.corpus).read_text(encoding="utf-8"))
+    documents = [Document(id=entry["id"], page_content=entry["text"]) for entry in corpus["documents"]]
+    queries = corpus["queries"]
+    ks = sorted(set(args.k))
+    max_k = ks[-1]
+
+    vectorstore = InMemoryVectorStore(CharBigramEmbeddings())
+    await vectorstore.aadd_documents(documents)
+    # インメモリのSQLiteを1つの接続で共有し、作成したテーブルを検索でも参照できるようにする
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    await load_chunk_tables(engine, documents)
+    session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    def keyword_retriever(k: int) -> PgKeywordRetriever:
+        return PgKeywordRetriever(collection_name=COLLECTION_NAME, k=k, session_factory=session_factory)
+
+    retrievers = {
+        "dense": vectorstore.as_retriever(search_kwargs={"k": max_k}),
+        "keyword": keyword_retriever(max_k),
+        "hybrid": HybridRetriever(
+            vector_retriever=vectorstore.as_retriever(search_kwargs={"k": args.fetch_k}),
+            keyword_retriever=keyword_retriever(args.fetch_k),
+            k=max_k,
+            rrf_k=args.rrf_k,
+            vector_weight=args.vector_weight,
+            keyword_weight=args.keyword_weight,
+        ),
+    }
+
+    print(f"documents={len(documents)} queries={len(queries)} fetch_k={args.fetch_k} rrf_k={args.rrf_k}")
+    recall_columns = " ".join(f"{f'recall@{k}':>10}" for k in ks)
+    print(f"{'mode':<8} {recall_columns} {'p50 ms':>8} {'p95 ms':>8}")
+    results = {}
+    try:
+        for name, retriever in retrievers.items():
+            results[name] = result = await _evaluate(retriever, queries, ks)
+            recall_values = " ".join(f"{result['recall'][k]:>10.3f}" for k in ks)
+            print(f"{name:<8} {recall_values} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}")
+    finally:
+        await engine.dispose()
+
+    if args.show_misses:
+        for name, result in results.items():
+            for k in ks:
+                for query in result["misses"][k]:
+                    print(f"miss {name} @{k}: {query}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="評価用コーパス（documents / queries のJSON）")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="評価する上位件数（複数指定可）")
+    parser.add_argument("--fetch-k", type=int, default=20, help="hybrid で各検索から取得する候補数")
+    parser.add_argument("--rrf-k", type=int, default=60)
+    parser.add_argument("--vector-weight", type=float, default=1.0)
+    parser.add_argument("--keyword-weight", type=float, default=1.0)
+    parser.add_argument("--show-misses", action="store_true", help="正解を取りこぼした質問を表示する")
+    asyncio.run(main(parser.parse_args()))